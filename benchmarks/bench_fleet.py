@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Fleet aggregator poll time against local stand-in nodes.
+
+Serves N stand-in nodes from a few local HTTP servers and times full polls
+of all of them at several concurrency limits, with servers that close each
+connection (as the Flask development server does) and with servers that
+keep connections alive, where the pool reuses them.
+
+Usage:
+  python benchmarks/bench_fleet.py
+  python benchmarks/bench_fleet.py --nodes 500 --delay-ms 20
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from chicken_gate.fleet import ConnectionPool, FleetAggregator, Node  # noqa: E402
+
+BODY = json.dumps(
+    {
+        "gates": [
+            {
+                "id": "gate",
+                "position": 100,
+                "target_position": 100,
+                "is_opening": False,
+                "is_closing": False,
+                "open_disabled": False,
+                "schedule_enabled": True,
+                "errors": [],
+                "last_updated": "2026-01-01T00:00:00",
+            }
+        ]
+    }
+).encode()
+
+
+async def stand_in(delay, keep_alive):
+    """A server answering every GET with BODY after `delay` s"""
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                await reader.readuntil(b"\r\n\r\n")
+                await asyncio.sleep(delay)
+                connection = b"keep-alive" if keep_alive else b"close"
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: %d\r\nConnection: %s\r\n\r\n%s"
+                    % (len(BODY), connection, BODY)
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0, backlog=1024)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def run(args, concurrency, keep_alive):
+    servers = [await stand_in(args.delay_ms / 1000, keep_alive) for _ in range(4)]
+    nodes = [
+        Node(f"coop{i}", f"http://127.0.0.1:{servers[i % 4][1]}/coop{i}")
+        for i in range(args.nodes)
+    ]
+    pool = ConnectionPool(max_connections=concurrency, max_idle_per_host=concurrency)
+    fleet = FleetAggregator(nodes, interval=60, timeout=10, pool=pool)
+    durations = []
+    for _ in range(args.polls):
+        snapshot = await fleet.poll()
+        assert snapshot["summary"]["states"]["online"] == args.nodes
+        durations.append(fleet.last_poll_duration)
+    await pool.close()
+    await asyncio.sleep(0.1)  # let the servers see the connections close
+    for server, _ in servers:
+        server.close()
+    return min(durations), pool.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--nodes", type=int, default=300)
+    parser.add_argument("--polls", type=int, default=3)
+    parser.add_argument(
+        "--delay-ms", type=float, default=10.0, help="node response time"
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{args.nodes} nodes, {args.delay_ms:g} ms per response, best of {args.polls}"
+    )
+    for keep_alive in (False, True):
+        for concurrency in (1, 16, 64, 256):
+            duration, stats = asyncio.run(run(args, concurrency, keep_alive))
+            print(
+                f"{'keep-alive' if keep_alive else 'close':10s}"
+                f" concurrency {concurrency:4d}: poll {duration * 1000:8.1f} ms"
+                f"  connections {stats['connections_opened']:5d}"
+                f" for {stats['requests']} requests"
+            )
+
+
+if __name__ == "__main__":
+    main()
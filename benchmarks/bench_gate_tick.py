@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the scalar Gate state machine.
+
+Times Gate.tick() for an idle gate and for a gate travelling between open
+and closed (driven by a simulated closed switch, like the mock driver), and
+measures the memory each Gate instance takes when many are alive at once.
+
+Usage:
+  python benchmarks/bench_gate_tick.py
+  python benchmarks/bench_gate_tick.py --ticks 500000 --instances 100000
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from unittest.mock import patch
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from chicken_gate.gate.gate import Gate  # noqa: E402
+
+
+def idle_ticks_per_second(ticks):
+    gate = Gate(init_posn=100)
+    gate.set_closed_switch(True)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        gate.tick()
+    return ticks / (time.perf_counter() - start)
+
+
+def moving_ticks_per_second(ticks):
+    """Open/close cycles of 100 ticks each way, switch simulated at 95%"""
+    gate = Gate(init_posn=100, open_time=10, close_time=10)
+    start = time.perf_counter()
+    for i in range(ticks):
+        if i % 200 == 0:
+            gate.open()
+        elif i % 200 == 100:
+            gate.close()
+        gate.set_closed_switch(gate.get_posn() >= 95)
+        gate.tick()
+    return ticks / (time.perf_counter() - start)
+
+
+def bytes_per_instance(instances):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    gates = [Gate() for _ in range(instances)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / len(gates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--ticks", type=int, default=200000)
+    parser.add_argument("--instances", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3, help="best of N")
+    args = parser.parse_args()
+
+    with patch("chicken_gate.gate.gate.logger"):
+        idle = max(idle_ticks_per_second(args.ticks) for _ in range(args.repeat))
+        moving = max(moving_ticks_per_second(args.ticks) for _ in range(args.repeat))
+    size = bytes_per_instance(args.instances)
+
+    print(f"idle tick:    {idle / 1e6:6.2f} M ticks/s ({1e9 / idle:6.0f} ns)")
+    print(f"moving tick:  {moving / 1e6:6.2f} M ticks/s ({1e9 / moving:6.0f} ns)")
+    print(f"per instance: {size:6.0f} bytes ({args.instances} gates)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Cost of a logging call on the control thread.
+
+Logs gate diagnostics-style records (template, two arguments, structured
+fields) while the output handler is slow, as journald or a full stdout pipe
+can be, and reports the per-call latency seen by the caller: through the
+queue pipeline (shared.logs), and with the handler called synchronously as
+logging.basicConfig does. Also times calls dropped by the rate limit.
+
+Usage:
+  python benchmarks/bench_logging.py
+  python benchmarks/bench_logging.py --calls 20000 --sink-ms 2
+"""
+
+import argparse
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from chicken_gate.shared import logs  # noqa: E402
+
+
+class SlowSink(logging.Handler):
+    """Formats each record, then takes `delay` seconds to write it"""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.setFormatter(logs.Formatter(logs.FORMAT))
+        self.delay = delay
+
+    def emit(self, record):
+        self.format(record)
+        time.sleep(self.delay)
+
+
+def time_calls(log, calls):
+    """Per-call latencies in ns"""
+    latencies = []
+    fields = {"code": "position_reset", "position": 42.0}
+    for i in range(calls):
+        start = time.perf_counter_ns()
+        log.info("position reset to %s (%d)", 42.0, i, extra=fields)
+        latencies.append(time.perf_counter_ns() - start)
+    return latencies
+
+
+def summary(name, latencies):
+    latencies = sorted(latencies)
+    p = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name:22s} p50 {p[49] / 1000:8.1f} us  p99 {p[98] / 1000:8.1f} us"
+        f"  max {latencies[-1] / 1000:8.1f} us"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--sink-ms", type=float, default=1.0, help="write latency")
+    args = parser.parse_args()
+    delay = args.sink_ms / 1000
+    log = logging.getLogger("chicken-gate")
+    root = logging.getLogger()
+
+    # queue pipeline - the sink never runs on this thread
+    pipeline = logs.setup_logging(targets=[SlowSink(delay)], burst=args.calls * 2)
+    summary("queued", time_calls(log, args.calls))
+    print(f"{'':22s} {pipeline.stats()['queued']} records still queued")
+
+    # rate-limited repeats are dropped before the queue
+    pipeline.rate_limit.configure(10, 60.0)
+    summary("queued, rate limited", time_calls(log, args.calls))
+    print(f"{'':22s} {pipeline.stats()['suppressed']} suppressed")
+    logs.stop_logging()
+
+    # synchronous handler on the calling thread (logging.basicConfig)
+    sync_calls = min(args.calls, int(2.0 / delay) if delay else args.calls)
+    root.addHandler(SlowSink(delay))
+    root.setLevel(logging.INFO)
+    latencies = time_calls(log, sync_calls)
+    root.handlers.clear()
+    summary("synchronous", latencies)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
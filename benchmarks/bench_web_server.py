@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Web app throughput and latency: Flask's development server against the
+production WSGIServer.
+
+Serves the web app (backed by an in-process status, as with
+chicken-gate-main --web) from a child process and drives it from client
+threads, each on one HTTP/1.1 connection that it reuses when the server
+allows. Reports requests per second, p50/p99 latency and bytes per
+response for the status API and the dashboard page.
+
+Usage:
+  python benchmarks/bench_web_server.py
+  python benchmarks/bench_web_server.py --seconds 5 --clients 1 8 32
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+PATHS = ("/api/status", "/")
+
+
+def serve(kind, ports):
+    """Child process: run the web app under `kind` ("dev" or "production")"""
+    from chicken_gate.gate.embedded import EmbeddedBackend
+    from chicken_gate.web.app import app
+
+    backend = EmbeddedBackend()
+    backend.snapshot.publish(
+        {"gate_id": "gate", "position": 100, "errors": [], "schedule": {}}
+    )
+    app.config["GATE_BACKEND"] = backend
+    if kind == "dev":
+        import logging
+
+        from werkzeug.serving import make_server
+
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)  # no access log
+
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+    else:
+        from chicken_gate.web.server import WSGIServer
+
+        server = WSGIServer(app, "127.0.0.1", 0)
+    ports.put(server.port)
+    server.serve_forever()
+
+
+def client(port, path, stop, latencies, sizes):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    headers = {"Accept-Encoding": "gzip"}
+    while not stop.is_set():
+        start = time.perf_counter()
+        conn.request("GET", path, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        latencies.append(time.perf_counter() - start)
+        sizes.append(len(body))
+        if response.getheader("Connection") == "close":
+            conn.close()  # reconnects on the next request
+    conn.close()
+
+
+def run(port, path, clients, seconds):
+    stop = threading.Event()
+    latencies, sizes = [], []
+    threads = [
+        threading.Thread(target=client, args=(port, path, stop, latencies, sizes))
+        for _ in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return (
+        len(latencies) / seconds,
+        latencies[len(latencies) // 2],
+        latencies[int(len(latencies) * 0.99)],
+        sum(sizes) / len(sizes),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--seconds", type=float, default=3.0, help="per run")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    for kind in ("dev", "production"):
+        ports = context.Queue()
+        process = context.Process(target=serve, args=(kind, ports), daemon=True)
+        process.start()
+        port = ports.get(timeout=30)
+        try:
+            for path in PATHS:
+                for clients in args.clients:
+                    rate, p50, p99, size = run(port, path, clients, args.seconds)
+                    print(
+                        f"{kind:10s} {path:11s} {clients:3d} clients:"
+                        f" {rate:7.0f} req/s  p50 {p50 * 1000:6.1f} ms"
+                        f"  p99 {p99 * 1000:6.1f} ms  {size:7.0f} B"
+                    )
+        finally:
+            process.terminate()
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Hot-path benchmark suite, checked against stored per-machine baselines.
+
+Times the calls the gate controller and the web app make on every tick or
+request - Gate.tick() and get_status(), the status and command files, the
+sun times and schedule info, and the /api/status and /api/command routes
+through the Flask test client - and reports operations per second and the
+memory each call allocates (peak bytes traced by tracemalloc). Everything
+runs offline in a temporary directory with the mock driver.
+
+Baselines live in hot_paths_baseline.json next to this script, keyed by a
+machine tag (OS, architecture, CPU and Python version): timings from one
+machine say nothing about another. A case is a regression when it is more
+than --threshold percent slower, or allocates that much more, than its
+baseline. Exits 1 on any regression. Re-record with --update after a
+deliberate change, or to add this machine.
+
+Usage:
+  python benchmarks/hot_paths.py
+  python benchmarks/hot_paths.py --threshold 15 --case status
+  python benchmarks/hot_paths.py --update
+"""
+
+import argparse
+import contextlib
+import hashlib
+import itertools
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from datetime import date
+from pathlib import Path
+
+# Add src to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+BASELINE_FILE = Path(__file__).parent / "hot_paths_baseline.json"
+
+# Percent slower (or more allocation) than the baseline that fails the run
+THRESHOLD = 25.0
+
+# Allocation differences below this many bytes are noise, not regressions
+ALLOC_SLACK = 256
+
+# Calls traced by tracemalloc per case (the median is reported)
+ALLOC_SAMPLES = 25
+
+
+def machine_tag():
+    """Identifies the machine baselines are comparable on"""
+    cpu = platform.processor() or platform.machine()
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    cpu = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    digest = hashlib.sha256(f"{cpu} {os.cpu_count()}".encode()).hexdigest()[:8]
+    version = "{}.{}".format(*sys.version_info[:2])
+    return f"{platform.system().lower()}-{platform.machine()}-{digest}-py{version}"
+
+
+def cases(stack, workdir):
+    """
+    (name, callable) for each hot path, set up in `workdir`. `stack` (an
+    ExitStack) undoes the setup.
+    """
+    from chicken_gate.gate import main
+    from chicken_gate.gate.gate import Gate
+    from chicken_gate.gate.schedule import Schedule
+    from chicken_gate.gate.suntimes import SunTimes
+    from chicken_gate.web.app import app, read_gate_status
+
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    stack.callback(os.chdir, previous_cwd)
+    logging.disable(logging.CRITICAL)
+    stack.callback(logging.disable, logging.NOTSET)
+
+    Gate_drv = main.load_driver(mock=True)
+    idle = Gate(init_posn=100)
+    idle.set_closed_switch(True)
+    moving = Gate(init_posn=100, open_time=10, close_time=10)
+    driver = Gate_drv(moving, initial_closed_switch=True)
+    ticks = itertools.count()
+
+    def driver_tick():
+        """Open/close cycles of 100 ticks each way"""
+        tick = next(ticks)
+        if tick % 200 == 0:
+            moving.open()
+        elif tick % 200 == 100:
+            moving.close()
+        driver.tick()
+
+    settings = Path(workdir) / "chicken-gate.toml"
+    settings.write_text("")
+    schedule = Schedule(settings_path=settings, use_apscheduler=False)
+    stack.callback(schedule.shutdown)
+    suntimes = SunTimes()
+    statuses = {"gate": main.build_gate_status(idle, schedule, True)}
+    main.write_gate_status(statuses, "gate")
+
+    backend = app.config.pop("GATE_BACKEND", None)
+    if backend is not None:
+        stack.callback(app.config.__setitem__, "GATE_BACKEND", backend)
+    client = app.test_client()
+
+    return [
+        ("Gate.tick (idle)", idle.tick),
+        ("mock driver tick (moving)", driver_tick),
+        ("Gate.get_status", idle.get_status),
+        ("main.write_gate_status", lambda: main.write_gate_status(statuses, "gate")),
+        ("main.check_command_file (none)", main.check_command_file),
+        ("web.app.read_gate_status", read_gate_status),
+        ("SunTimes.get_dawn", suntimes.get_dawn),
+        ("SunTimes.get_dusk", suntimes.get_dusk),
+        ("SunTimes.get_sunrise", suntimes.get_sunrise),
+        ("SunTimes.get_sunset", suntimes.get_sunset),
+        ("SunTimes.get_times", suntimes.get_times),
+        ("SunTimes.get_zone", suntimes.get_zone),
+        ("Schedule.get_schedule_info", schedule.get_schedule_info),
+        ("GET /api/status", lambda: client.get("/api/status")),
+        (
+            "POST /api/command",
+            lambda: client.post("/api/command", json={"command": "open"}),
+        ),
+    ]
+
+
+def ops_per_second(fn, repeat):
+    """Best of `repeat` runs, each long enough (~0.2 s) to time reliably"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return number / min(timer.repeat(repeat, number))
+
+
+def alloc_bytes(fn, samples=ALLOC_SAMPLES):
+    """Median peak memory allocated by one call (bytes)"""
+    fn()  # warm caches first - they are not per-call cost
+    peaks = []
+    for _ in range(samples):
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            fn()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        finally:
+            tracemalloc.stop()
+    return round(statistics.median(peaks))
+
+
+def measure(selected=None, repeat=5):
+    """{case: {"ops_per_sec", "alloc_bytes"}} for cases matching `selected`"""
+    results = {}
+    with contextlib.ExitStack() as stack:
+        workdir = stack.enter_context(tempfile.TemporaryDirectory())
+        for name, fn in cases(stack, workdir):
+            if selected and not any(s.lower() in name.lower() for s in selected):
+                continue
+            results[name] = {
+                "alloc_bytes": alloc_bytes(fn),
+                "ops_per_sec": round(ops_per_second(fn, repeat)),
+            }
+    return results
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """
+    Regressions of `results` against `baseline` (both as returned by
+    measure()): one message per case slower or allocating more than
+    `threshold` percent beyond its baseline
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        floor = base["ops_per_sec"] * (1 - threshold / 100)
+        if result["ops_per_sec"] < floor:
+            slower = 100 * (1 - result["ops_per_sec"] / base["ops_per_sec"])
+            regressions.append(
+                f"{name}: {result['ops_per_sec']} ops/s is {slower:.0f}% slower"
+                f" than {base['ops_per_sec']}"
+            )
+        ceiling = base["alloc_bytes"] * (1 + threshold / 100) + ALLOC_SLACK
+        if result["alloc_bytes"] > ceiling:
+            regressions.append(
+                f"{name}: allocates {result['alloc_bytes']} B per call,"
+                f" baseline {base['alloc_bytes']} B"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="percent slower or more allocation that counts as a regression",
+    )
+    parser.add_argument(
+        "--case", nargs="+", help="only the cases whose names contain these"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="best of N")
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="record this run as the baseline for this machine",
+    )
+    args = parser.parse_args()
+
+    tag = machine_tag()
+    baselines = json.loads(BASELINE_FILE.read_text()) if BASELINE_FILE.exists() else {}
+    baseline = baselines.get(tag, {}).get("cases", {})
+    results = measure(args.case, args.repeat)
+
+    print(f"machine {tag}")
+    for name, result in results.items():
+        line = (
+            f"{name:32s} {result['ops_per_sec']:>10,} ops/s"
+            f" {result['alloc_bytes']:>8,} B/call"
+        )
+        base = baseline.get(name)
+        if base is not None:
+            change = 100 * (result["ops_per_sec"] / base["ops_per_sec"] - 1)
+            line += f"  ({change:+.0f}% vs {base['ops_per_sec']:,})"
+        print(line)
+
+    if args.update:
+        entry = baselines.setdefault(tag, {"cases": {}})
+        entry["recorded"] = date.today().isoformat()
+        entry["python"] = platform.python_version()
+        entry["cases"].update(results)
+        BASELINE_FILE.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline for {tag} written to {BASELINE_FILE}")
+        return 0
+    if not baseline:
+        print(f"No baseline for {tag} - record one with --update")
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for problem in regressions:
+        print(f"REGRESSION: {problem}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Load test of the web API against a live web server and simulated gate.
+
+Starts chicken-gate-main with the mock driver and chicken-gate-web (the
+production server) in a temporary directory, as on the Pi, then sends a mix
+of status polls, commands and camera snapshots at a target rate from a pool
+of client threads. Reports throughput, p50/p95/p99 latency and error rate
+per request kind, and how many of the commands the web app accepted the
+gate actually applied: a command overwritten in the gate_cmd.txt slot
+before the gate read it is lost. --embedded runs the web app inside the
+gate process instead (commands go through a queue, not the file).
+
+Requests are sent on a fixed schedule whether or not earlier ones have been
+answered, and latency is measured from when a request was due: a stalled
+server shows up as latency, not as a quietly lower request rate.
+
+Usage:
+  python benchmarks/load_test.py
+  python benchmarks/load_test.py --rate 200 --seconds 20 --mix status=80 command=15 camera=5
+  python benchmarks/load_test.py --embedded --clients 32
+"""
+
+import argparse
+import collections
+import http.client
+import itertools
+import json
+import os
+import queue
+import socket
+import subprocess  # nosec B404
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+# Request kinds: (method, path)
+REQUESTS = {
+    "status": ("GET", "/api/status"),
+    "command": ("POST", "/api/command"),
+    "camera": ("GET", "/api/camera/snapshot"),
+}
+
+# Gate log messages (chicken-gate logger, see runtime.apply_command) -> command
+APPLIED = {
+    "cmd to open gate": "OPEN",
+    "cmd to close gate": "CLOSE",
+    "cmd to stop gate": "STOP",
+    "cmd to enable schedule": "ENABLE_SCHEDULE",
+    "cmd to disable schedule": "DISABLE_SCHEDULE",
+    "shell cmd to clear errors": "CLEAR_ERRORS",
+}
+
+# How long the gate gets to apply the last commands after the load stops
+SETTLE = 1.0
+
+
+def parse_mix(items):
+    """["status=90", "command=10"] -> {"status": 0.9, "command": 0.1}"""
+    weights = {}
+    for item in items:
+        kind, _, weight = item.partition("=")
+        if kind not in REQUESTS:
+            raise ValueError(f"unknown request kind {kind!r} (one of {list(REQUESTS)})")
+        weights[kind] = float(weight or 1)
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("the mix needs a positive weight")
+    return {kind: weight / total for kind, weight in weights.items() if weight > 0}
+
+
+def schedule(mix, count):
+    """`count` request kinds interleaved in proportion to `mix`"""
+    kinds, credit = [], dict.fromkeys(mix, 0.0)
+    for _ in range(count):
+        for kind, share in mix.items():
+            credit[kind] += share
+        kind = max(credit, key=credit.get)
+        credit[kind] -= 1
+        kinds.append(kind)
+    return kinds
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def count_applied(lines):
+    """Commands the gate applied, by command, from its log lines"""
+    applied = collections.Counter()
+    for line in lines:
+        _, _, message = line.rstrip().partition(": ")
+        command = APPLIED.get(message)
+        if command is not None:
+            applied[command] += 1
+    return applied
+
+
+def command_accounting(accepted, applied):
+    """(lost, duplicated) commands: accepted by the web app vs applied"""
+    lost = sum(max(0, n - applied[command]) for command, n in accepted.items())
+    duplicated = sum(max(0, n - accepted[command]) for command, n in applied.items())
+    return lost, duplicated
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Target:
+    """The gate and web processes, running in a temporary directory"""
+
+    def __init__(self, embedded=False):
+        self.embedded = embedded
+        self.port = free_port()
+        self.__tmp = tempfile.TemporaryDirectory()
+        cwd = self.__tmp.name
+        settings = Path(cwd) / "chicken-gate.toml"
+        # every applied command must reach the log to be counted
+        settings.write_text("[logging]\nrate_burst = 1000000000\n")
+        env = dict(os.environ, CHICKEN_GATE_CONFIG=str(settings), PYTHONUNBUFFERED="1")
+        env.pop("JOURNAL_STREAM", None)  # log to stdout, not the journal
+        src = str(PROJECT_ROOT / "src")
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+
+        gate = [sys.executable, "-m", "chicken_gate.gate.main", "--mock"]
+        web = [sys.executable, "-m", "chicken_gate.web.app", "--port", str(self.port)]
+        if embedded:
+            gate += ["--web", "--port", str(self.port), "--production"]
+        self.__processes = []
+        self.gate = self.__start(gate, cwd, env, subprocess.PIPE)
+        if not embedded:
+            self.__start(web + ["--production"], cwd, env, subprocess.DEVNULL)
+        self.log = []
+        self.__reader = threading.Thread(target=self.__read_log, daemon=True)
+        self.__reader.start()
+
+    def __start(self, args, cwd, env, stdout):
+        process = subprocess.Popen(  # nosec B603
+            args,
+            cwd=cwd,
+            env=env,
+            stdout=stdout,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        self.__processes.append(process)
+        return process
+
+    def __read_log(self):
+        for line in self.gate.stdout:
+            self.log.append(line)
+
+    def wait_ready(self, timeout=30.0):
+        """Until the web app serves the status the gate wrote"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=2)
+                conn.request("GET", "/api/status")
+                response = conn.getresponse()
+                status = json.loads(response.read())
+                conn.close()
+                if response.status == 200 and status.get("schedule"):
+                    return
+            except (OSError, ValueError, http.client.HTTPException):
+                pass
+            if any(p.poll() is not None for p in self.__processes):
+                raise RuntimeError("a gate or web process exited during startup")
+            time.sleep(0.1)
+        raise RuntimeError("the web app never served the gate's status")
+
+    def stop(self):
+        for process in self.__processes:
+            process.terminate()
+        for process in self.__processes:
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self.__reader.join(5)
+        self.__tmp.cleanup()
+
+
+def client(port, jobs, results, next_command):
+    """Send the jobs (due time, kind) on one kept-alive connection"""
+    conn = None
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        due, kind = job
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        method, path = REQUESTS[kind]
+        body, headers, command = None, {}, None
+        if kind == "command":
+            command = next_command()
+            body = json.dumps({"command": command})
+            headers["Content-Type"] = "application/json"
+        ok = False
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+            ok = response.status == 200
+            if command is not None:
+                ok = ok and json.loads(data).get("success") is True
+            if response.getheader("Connection") == "close":
+                conn.close()
+                conn = None
+        except (OSError, ValueError, http.client.HTTPException):
+            if conn is not None:
+                conn.close()
+            conn = None
+        results.append((kind, time.perf_counter() - due, ok, command))
+    if conn is not None:
+        conn.close()
+
+
+def run(port, mix, rate, seconds, clients, commands):
+    """Send rate * seconds requests on schedule; [(kind, latency, ok, command)]"""
+    count = max(1, int(rate * seconds))
+    jobs = queue.Queue()
+    results = []
+    command_cycle = itertools.cycle(commands)
+    lock = threading.Lock()
+
+    def next_command():
+        with lock:
+            return next(command_cycle)
+
+    threads = [
+        threading.Thread(target=client, args=(port, jobs, results, next_command))
+        for _ in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter() + 0.1
+    for i, kind in enumerate(schedule(mix, count)):
+        jobs.put((start + i / rate, kind))
+    for _ in threads:
+        jobs.put(None)
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+def report(results, elapsed):
+    print(
+        f"{'kind':8s} {'requests':>8s} {'req/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s}"
+        f" {'p99 ms':>8s} {'errors':>7s}"
+    )
+    by_kind = collections.defaultdict(list)
+    for result in results:
+        by_kind[result[0]].append(result)
+    for kind in list(by_kind) + ["all"]:
+        rows = results if kind == "all" else by_kind[kind]
+        latencies = sorted(row[1] * 1000 for row in rows)
+        errors = sum(1 for row in rows if not row[2])
+        print(
+            f"{kind:8s} {len(rows):8d} {len(rows) / elapsed:8.1f}"
+            f" {percentile(latencies, 0.50):8.1f} {percentile(latencies, 0.95):8.1f}"
+            f" {percentile(latencies, 0.99):8.1f} {100 * errors / len(rows):6.1f}%"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--rate", type=float, default=50.0, help="requests/s")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=16, help="client threads")
+    parser.add_argument(
+        "--mix",
+        nargs="+",
+        default=["status=90", "command=5", "camera=5"],
+        help="kind=weight for kinds " + ", ".join(REQUESTS),
+    )
+    parser.add_argument(
+        "--commands",
+        nargs="+",
+        default=["OPEN", "STOP", "CLOSE", "STOP"],
+        help="commands sent in turn",
+    )
+    parser.add_argument(
+        "--embedded",
+        action="store_true",
+        help="serve the web app from the gate process (chicken-gate-main --web)",
+    )
+    args = parser.parse_args()
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    unknown = [c for c in args.commands if c.upper() not in APPLIED.values()]
+    if unknown:
+        parser.error(f"commands not counted in the gate log: {unknown}")
+    commands = [c.upper() for c in args.commands]
+
+    target = Target(args.embedded)
+    try:
+        target.wait_ready()
+        print(
+            f"{'embedded' if args.embedded else 'web + gate'} on port {target.port}:"
+            f" {args.rate:g} req/s for {args.seconds:g} s from {args.clients} clients"
+        )
+        results, elapsed = run(
+            target.port, mix, args.rate, args.seconds, args.clients, commands
+        )
+        time.sleep(SETTLE)
+    finally:
+        target.stop()
+
+    report(results, elapsed)
+    accepted = collections.Counter(row[3] for row in results if row[3] and row[2])
+    sent = sum(1 for row in results if row[3])
+    applied = count_applied(target.log)
+    lost, duplicated = command_accounting(accepted, applied)
+    print(
+        f"commands: {sent} sent, {sum(accepted.values())} accepted,"
+        f" {sum(applied.values())} applied, {lost} lost, {duplicated} duplicated"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
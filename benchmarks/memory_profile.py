@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Measure peak and steady-state RSS of each service configuration.
+
+Starts the gate controller (mock driver) and the web interface in the full
+and low-memory profiles, exercises the web routes that load optional
+subsystems, and samples each process's RSS from /proc. Steady state is the
+median RSS over the second half of the run. Every gate + web combination is
+then checked against a memory budget for the two services together.
+
+Linux only (reads /proc/<pid>/status).
+
+Usage:
+  python benchmarks/memory_profile.py
+  python benchmarks/memory_profile.py --seconds 30 --budget-mb 90 --json mem.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess  # nosec B404
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+# Web routes requested while sampling - the camera ones load PIL/OpenCV
+WEB_ROUTES = ["/", "/api/status", "/api/camera/snapshot", "/api/history"]
+
+
+def _env():
+    env = dict(os.environ)
+    src = str(PROJECT_ROOT / "src")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+    env["INVOCATION_ID"] = "memory-profile"  # keep Flask's debug reloader off
+    env["CHICKEN_GATE_CONFIG"] = os.devnull  # measure the flags, not local settings
+    return env
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def configurations():
+    """(name, command, web port or None) for each service configuration"""
+    gate = [sys.executable, "-m", "chicken_gate.gate.main", "--mock"]
+    web = [sys.executable, "-m", "chicken_gate.web.app", "--port"]
+    web_port, web_low_port = _free_port(), _free_port()
+    return [
+        ("gate/full", gate, None),
+        ("gate/low", gate + ["--low-memory"], None),
+        ("web/full", web + [str(web_port)], web_port),
+        ("web/low", web + [str(web_low_port), "--low-memory"], web_low_port),
+    ]
+
+
+def read_status_kb(pid):
+    """(VmRSS, VmHWM) of a process in kB"""
+    values = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                values[key] = int(rest.split()[0])
+    return values.get("VmRSS", 0), values.get("VmHWM", 0)
+
+
+def exercise(port):
+    for route in WEB_ROUTES:
+        try:
+            with urllib.request.urlopen(  # nosec B310
+                f"http://127.0.0.1:{port}{route}", timeout=5
+            ) as response:
+                response.read()
+        except OSError:
+            pass  # not listening yet
+
+
+def measure(command, port, seconds, interval):
+    """Run one configuration; return its RSS figures in kB"""
+    with tempfile.TemporaryDirectory() as cwd:
+        proc = subprocess.Popen(  # nosec B603
+            command,
+            cwd=cwd,
+            env=_env(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        samples = []
+        peak = 0
+        try:
+            end = time.monotonic() + seconds
+            while time.monotonic() < end and proc.poll() is None:
+                if port is not None:
+                    exercise(port)
+                rss, hwm = read_status_kb(proc.pid)
+                samples.append(rss)
+                peak = max(peak, hwm)
+                time.sleep(interval)
+        finally:
+            proc.terminate()
+            proc.wait()
+    if not samples:
+        raise RuntimeError(f"{' '.join(command)} exited immediately")
+    return {
+        "peak_rss_kb": peak,
+        "steady_rss_kb": int(statistics.median(samples[len(samples) // 2 :])),
+        "samples": len(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10.0, help="per config")
+    parser.add_argument("--interval", type=float, default=0.25, help="sample period")
+    parser.add_argument(
+        "--budget-mb", type=float, default=100.0, help="gate + web memory budget"
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for name, command, port in configurations():
+        results[name] = measure(command, port, args.seconds, args.interval)
+        r = results[name]
+        print(
+            f"{name:10s} peak {r['peak_rss_kb'] / 1024:6.1f} MB"
+            f"  steady {r['steady_rss_kb'] / 1024:6.1f} MB"
+        )
+
+    print(f"\nGate + web against a {args.budget_mb:.0f} MB budget (peak RSS):")
+    combos = []
+    for gate in ("gate/full", "gate/low"):
+        for web in ("web/full", "web/low"):
+            peak_mb = (
+                results[gate]["peak_rss_kb"] + results[web]["peak_rss_kb"]
+            ) / 1024
+            fits = peak_mb <= args.budget_mb
+            combos.append({"gate": gate, "web": web, "peak_mb": peak_mb, "fits": fits})
+            print(f"  {gate} + {web}: {peak_mb:6.1f} MB {'ok' if fits else 'OVER'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {"budget_mb": args.budget_mb, "services": results, "combos": combos},
+                f,
+                indent=2,
+            )
+    return 0 if any(c["fits"] for c in combos) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the entry points, checked against a stored budget.
+
+For each entry point the cumulative import time of its module is taken from
+`python -X importtime` (best of several fresh interpreters), and the modules
+it must not load at import time are checked. For the gate controller the
+time from spawning `chicken-gate-main --mock` to its first driver tick is
+measured too. Exits 1 if anything is over budget.
+
+Budgets live in startup_budget.json next to this script. They are wall-clock
+numbers for the machine they were recorded on - re-record them with --update
+after a deliberate change, or on a new reference machine.
+
+Usage:
+  python benchmarks/startup.py
+  python benchmarks/startup.py --runs 10 --update
+"""
+
+import argparse
+import compileall
+import json
+import os
+import subprocess  # nosec B404
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+BUDGET_FILE = Path(__file__).parent / "startup_budget.json"
+
+# Message chicken-gate-main logs once the driver has ticked
+FIRST_TICK_MESSAGE = "Gate driver ready"
+
+# Headroom applied to measured times by --update
+HEADROOM = 1.5
+
+
+def _env():
+    env = dict(os.environ)
+    src = str(PROJECT_ROOT / "src")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+    env["PYTHONUNBUFFERED"] = "1"
+    env.pop("JOURNAL_STREAM", None)  # log to stdout, not the journal
+    return env
+
+
+def import_time_ms(module):
+    """Cumulative import time of a module in a fresh interpreter (ms)"""
+    result = subprocess.run(  # nosec B603
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=_env(),
+        check=True,
+    )
+    for line in reversed(result.stderr.splitlines()):
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative_us, name = line.split("|")
+        if name.strip() == module:
+            return int(cumulative_us) / 1000
+    raise RuntimeError(f"{module} not found in -X importtime output")
+
+
+def loaded_modules(module, candidates):
+    """Which of `candidates` are in sys.modules after importing `module`"""
+    code = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {list(candidates)!r} if m in sys.modules))"
+    )
+    result = subprocess.run(  # nosec B603
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        env=_env(),
+        check=True,
+    )
+    return [m for m in result.stdout.strip().split(",") if m]
+
+
+def time_to_first_tick_ms(timeout=30.0):
+    """Spawn the gate controller with the mock driver, time its first tick (ms)"""
+    with tempfile.TemporaryDirectory() as cwd:
+        start = time.perf_counter()
+        proc = subprocess.Popen(  # nosec B603
+            [sys.executable, "-m", "chicken_gate.gate.main", "--mock"],
+            cwd=cwd,
+            env=_env(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        try:
+            for line in proc.stdout:
+                if line.rstrip().endswith(FIRST_TICK_MESSAGE):  # "<logger>: ..."
+                    return (time.perf_counter() - start) * 1000
+                if time.perf_counter() - start > timeout:
+                    break
+            raise RuntimeError("gate controller never reported its first tick")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5, help="take the best of N")
+    parser.add_argument(
+        "--update", action="store_true", help="re-record the budgets from this run"
+    )
+    args = parser.parse_args()
+
+    budget = json.loads(BUDGET_FILE.read_text())
+    over = []
+    # time the imports as installed, from bytecode - not recompiling sources
+    # edited since the last run (PYTHONDONTWRITEBYTECODE stops the refresh)
+    compileall.compile_dir(PROJECT_ROOT / "src", quiet=1)
+
+    for name, entry in budget["entry_points"].items():
+        module = entry["module"]
+        ms = min(import_time_ms(module) for _ in range(args.runs))
+        loaded = loaded_modules(module, entry["not_loaded"])
+        print(f"{name}: import {module} {ms:.1f} ms (budget {entry['import_ms']} ms)")
+        if loaded:
+            print(f"  loaded at import: {', '.join(loaded)}")
+            over.append(f"{name} loads {', '.join(loaded)}")
+        if args.update:
+            entry["import_ms"] = round(ms * HEADROOM)
+        elif ms > entry["import_ms"]:
+            over.append(f"{name} import {ms:.1f} ms > {entry['import_ms']} ms")
+
+    first_tick = budget["first_tick"]
+    ms = min(time_to_first_tick_ms() for _ in range(args.runs))
+    print(
+        f"chicken-gate-main --mock: first tick {ms:.0f} ms (budget {first_tick['ms']} ms)"
+    )
+    if args.update:
+        first_tick["ms"] = round(ms * HEADROOM)
+    elif ms > first_tick["ms"]:
+        over.append(f"first tick {ms:.0f} ms > {first_tick['ms']} ms")
+
+    if args.update:
+        BUDGET_FILE.write_text(json.dumps(budget, indent=2) + "\n")
+        print(f"Budgets written to {BUDGET_FILE}")
+        return 0
+    for problem in over:
+        print(f"OVER BUDGET: {problem}")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,76 +4,45 @@ Script to send commands to the chicken gate process.
 Usage:
   python send_gate_cmd.py OPEN
   python send_gate_cmd.py CLOSE
+  python send_gate_cmd.py STOP
   python send_gate_cmd.py RESET
   python send_gate_cmd.py RESET:50
+
+Kept for existing scripts, with its send_command(): the command is written
+to gate_cmd.txt in the current directory and the script returns at once,
+without waiting for the gate. A command the gate has not taken yet is not
+replaced - the script says so and exits 1. chicken-gate-ctl sends every
+command, and can wait for it to take effect, follow the status and run
+batches.
 """
 
+import os
 import sys
 
+# Run from a checkout without installing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "src"))
 
-def send_command(command):
-    """Send a command to the gate process by writing to a file."""
-    valid_commands = ["OPEN", "CLOSE", "RESET"]
+from chicken_gate.gate.cli import CliError, FileTransport, send  # noqa: E402
+from chicken_gate.gate.runtime import check_command  # noqa: E402
 
-    # Handle RESET commands (RESET or RESET:position)
-    if command.upper().startswith("RESET"):
-        parts = command.upper().split(":")
-        if len(parts) == 1:
-            # Simple RESET command
-            cmd_to_send = "RESET"
-        elif len(parts) == 2:
-            # RESET with position (RESET:50)
-            try:
-                position = int(parts[1])
-                if 0 <= position <= 100:
-                    cmd_to_send = f"RESET:{position}"
-                else:
-                    print(
-                        f"Invalid position: {position}. Position must be between 0 and 100."
-                    )
-                    return False
-            except ValueError:
-                print(
-                    f"Invalid position format: {parts[1]}. Position must be a number."
-                )
-                return False
-        else:
-            print(f"Invalid RESET command format: {command}")
-            print("Valid formats: RESET or RESET:position (e.g., RESET:50)")
-            return False
-    else:
-        # Regular OPEN/CLOSE commands
-        if command.upper() not in valid_commands:
-            print(f"Invalid command: {command}")
-            print(f"Valid commands: {', '.join(valid_commands)}, RESET:position")
-            return False
-        cmd_to_send = command.upper()
 
-    cmd_file = "gate_cmd.txt"
+def send_command(command, directory="."):
+    """Send a command to the gate process by writing to a file; True if sent"""
+    transport = FileTransport(directory)
     try:
-        with open(cmd_file, "w") as f:
-            f.write(cmd_to_send)
-        print(f"Command '{cmd_to_send}' sent to gate process")
-        return True
-    except IOError as e:
-        print(f"Error writing command file: {e}")
+        command = check_command(command)
+        send(transport, command, timeout=0)  # never wait for the gate
+    except (CliError, ValueError, OSError) as e:
+        print(e)
         return False
+    finally:
+        transport.close()
+    print(f"Command '{command}' sent to gate process")
+    return True
 
 
-def main():
+if __name__ == "__main__":
     if len(sys.argv) != 2:
-        print("Usage:")
-        print("  python send_gate_cmd.py OPEN")
-        print("  python send_gate_cmd.py CLOSE")
-        print("  python send_gate_cmd.py RESET")
-        print("  python send_gate_cmd.py RESET:position")
-        print("Example: python send_gate_cmd.py RESET:50")
+        print(__doc__.strip())
         sys.exit(1)
-
-    command = sys.argv[1]
-    success = send_command(command)
-    sys.exit(0 if success else 1)
-
-
-if __name__ == "__main__":
-    main()
+    sys.exit(0 if send_command(sys.argv[1]) else 1)
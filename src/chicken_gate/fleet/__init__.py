@@ -0,0 +1,10 @@
+"""
+Fleet module: one view of many chicken-gate-web nodes.
+
+Polls their status APIs concurrently and serves the merged fleet view.
+"""
+
+from .aggregator import FleetAggregator, Node, parse_nodes
+from .client import ConnectionPool, FetchError
+
+__all__ = ["FleetAggregator", "Node", "parse_nodes", "ConnectionPool", "FetchError"]
@@ -0,0 +1,346 @@
+"""
+Fleet view of many chicken-gate-web nodes.
+
+Every poll interval each due node's /api/gates is fetched concurrently
+through one ConnectionPool (nodes older than /api/gates are read through
+/api/status instead). A node that fails is retried with exponential
+backoff - after 1, 2, 4... polls, up to backoff_max seconds - instead of
+on every poll. The results are merged into one snapshot, replaced as a
+whole after each poll, so the fleet API reads it from another thread
+without locking.
+
+A node is "online" while its last good poll is recent. It turns "stale"
+after stale_after seconds without one, or when its gates' last_updated has
+not moved for that long - the web server answers but its gate process has
+stopped - and "offline" after offline_after seconds (or before it has ever
+answered, once it has failed). Alerts roll up offline and stale nodes and
+every gate that reports errors or has opening disabled.
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from ..shared.config import DEFAULT_GATE_ID
+from .client import ConnectionPool, FetchError
+
+# Seconds between polls
+POLL_INTERVAL = 10.0
+
+# Longest wait for one node's response (seconds)
+NODE_TIMEOUT = 3.0
+
+# Most time between retries of a failing node (seconds)
+BACKOFF_MAX = 300.0
+
+# Node requests in flight at once
+CONCURRENCY = 64
+
+logger = logging.getLogger("chicken-gate-fleet")
+
+Node = namedtuple("Node", ["name", "url"])
+Node.__doc__ = "A chicken-gate-web instance: display name and base URL"
+
+NODE_STATES = ("pending", "online", "stale", "offline")
+
+
+def parse_nodes(entries):
+    """
+    Nodes from [[fleet.nodes]] tables ({"url": ..., "name": ...}) or plain
+    URLs. The name defaults to the URL's host[:port]. Raises ValueError.
+    """
+    nodes = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"url": entry}
+        unknown = set(entry) - {"url", "name"}
+        if unknown:
+            raise ValueError(f"unknown [[fleet.nodes]] keys: {sorted(unknown)}")
+        url = str(entry.get("url", "")).rstrip("/")
+        if not url.startswith(("http://", "https://")):
+            raise ValueError(f"node url must be http(s)://...: {url!r}")
+        name = str(entry.get("name") or url.split("://", 1)[1])
+        if name in (n.name for n in nodes):
+            raise ValueError(f"node name {name!r} is used twice")
+        nodes.append(Node(name, url))
+    return nodes
+
+
+def gate_state(status):
+    """open / closed / opening / closing / partial from a gate's status"""
+    if status.get("is_opening"):
+        return "opening"
+    if status.get("is_closing"):
+        return "closing"
+    position = status.get("position", 0)
+    if position >= 100:
+        return "closed"
+    if position <= 0:
+        return "open"
+    return "partial"
+
+
+def _iso(epoch):
+    return None if epoch is None else datetime.fromtimestamp(epoch).isoformat()
+
+
+class _NodeState:
+    __slots__ = (
+        "node",
+        "gates",
+        "legacy",
+        "last_ok",
+        "last_ok_wall",
+        "last_change",
+        "gates_updated",
+        "failures",
+        "last_error",
+        "next_poll",
+        "latency",
+    )
+
+    def __init__(self, node):
+        self.node = node
+        self.gates = []  # last gates reported
+        self.legacy = False  # no /api/gates: read /api/status
+        self.last_ok = None  # monotonic time of the last good poll
+        self.last_ok_wall = None
+        self.last_change = None  # monotonic time last_updated last moved
+        self.gates_updated = None  # the gates' last_updated values then
+        self.failures = 0  # consecutive
+        self.last_error = None
+        self.next_poll = 0  # first poll number it is due in
+        self.latency = None
+
+
+class FleetAggregator:
+    """Polls many nodes and keeps a merged fleet snapshot"""
+
+    def __init__(
+        self,
+        nodes,
+        interval=POLL_INTERVAL,
+        timeout=NODE_TIMEOUT,
+        concurrency=CONCURRENCY,
+        backoff_max=BACKOFF_MAX,
+        stale_after=None,
+        offline_after=None,
+        pool=None,
+        clock=time.monotonic,
+    ):
+        self.interval = interval
+        self.timeout = timeout
+        self.backoff_max = backoff_max
+        self.stale_after = 3 * interval if stale_after is None else stale_after
+        self.offline_after = 10 * interval if offline_after is None else offline_after
+        self.pool = pool or ConnectionPool(max_connections=concurrency)
+        self.__clock = clock
+        self.__nodes = [_NodeState(node) for node in nodes]
+        self.__stop = None
+        self.polls = 0
+        self.last_poll_duration = None
+        self.__snapshot = self.__build(clock())
+
+    @property
+    def nodes(self):
+        return [state.node for state in self.__nodes]
+
+    def snapshot(self):
+        """The fleet view after the last poll (safe from any thread)"""
+        return self.__snapshot
+
+    def node(self, name):
+        """One node's entry of the snapshot, or None"""
+        for entry in self.__snapshot["nodes"]:
+            if entry["name"] == name:
+                return entry
+        return None
+
+    async def poll(self):
+        """Fetch every node that is due, concurrently; returns the snapshot"""
+        start = self.__clock()
+        due = [state for state in self.__nodes if state.next_poll <= self.polls]
+        await asyncio.gather(*(self.__poll_node(state) for state in due))
+        now = self.__clock()
+        self.polls += 1
+        self.last_poll_duration = now - start
+        self.__snapshot = self.__build(now)
+        if self.last_poll_duration > self.interval:
+            logger.warning(
+                "Fleet poll of %d nodes took %.1f s, longer than the %.0f s interval",
+                len(due),
+                self.last_poll_duration,
+                self.interval,
+            )
+        return self.__snapshot
+
+    async def run(self):
+        """Poll every interval until stop()"""
+        self.__stop = asyncio.Event()
+        try:
+            while not self.__stop.is_set():
+                started = self.__clock()
+                await self.poll()
+                delay = max(0.0, self.interval - (self.__clock() - started))
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self.__stop.wait(), delay)
+        finally:
+            await self.pool.close()
+
+    def stop(self):
+        """Make run() return after the current poll (from the loop's thread)"""
+        if self.__stop is not None:
+            self.__stop.set()
+
+    async def __poll_node(self, state):
+        url = state.node.url
+        start = self.__clock()
+        try:
+            if not state.legacy:
+                try:
+                    data = await self.pool.get_json(url + "/api/gates", self.timeout)
+                    gates = data["gates"]
+                except FetchError as e:
+                    if e.status != 404:
+                        raise
+                    state.legacy = True
+            if state.legacy:
+                status = await self.pool.get_json(url + "/api/status", self.timeout)
+                gates = [dict(status, id=status.get("gate_id", DEFAULT_GATE_ID))]
+            if not isinstance(gates, list) or not all(
+                isinstance(gate, dict) for gate in gates
+            ):
+                raise FetchError("gates is not a list of objects")
+        except (FetchError, KeyError, TypeError, ValueError) as e:
+            self.__failed(state, e)
+            return
+        now = self.__clock()
+        state.latency = now - start
+        state.gates = gates
+        state.last_ok = now
+        state.last_ok_wall = time.time()
+        updated = [gate.get("last_updated") for gate in gates]
+        if updated != state.gates_updated or None in updated:
+            state.gates_updated = updated
+            state.last_change = now
+        if state.failures:
+            logger.info(
+                "Node %s is back after %d failed polls",
+                state.node.name,
+                state.failures,
+            )
+        state.failures = 0
+        state.last_error = None
+        state.next_poll = 0
+
+    def __failed(self, state, error):
+        state.failures += 1
+        state.last_error = str(error) or type(error).__name__
+        max_skip = max(1, int(self.backoff_max / self.interval))
+        state.next_poll = self.polls + min(2 ** (state.failures - 1), max_skip)
+        if state.failures == 1:
+            logger.warning("Node %s failed: %s", state.node.name, state.last_error)
+
+    def __node_state(self, state, now):
+        if state.last_ok is None:
+            return "offline" if state.failures else "pending"
+        age = now - state.last_ok
+        if age >= self.offline_after:
+            return "offline"
+        if age >= self.stale_after or now - state.last_change >= self.stale_after:
+            return "stale"
+        return "online"
+
+    def __build(self, now):
+        counts = dict.fromkeys(NODE_STATES, 0)
+        gate_counts = {}
+        alerts = []
+        entries = []
+        for state in self.__nodes:
+            name = state.node.name
+            node_state = self.__node_state(state, now)
+            counts[node_state] += 1
+            gates = []
+            for status in state.gates:
+                gate = {
+                    "id": status.get("id"),
+                    "state": gate_state(status),
+                    "position": status.get("position"),
+                    "target_position": status.get("target_position"),
+                    "schedule_enabled": status.get("schedule_enabled", True),
+                    "open_disabled": status.get("open_disabled", False),
+                    "errors": status.get("errors", []),
+                    "last_updated": status.get("last_updated"),
+                }
+                gates.append(gate)
+                gate_counts[gate["state"]] = gate_counts.get(gate["state"], 0) + 1
+                if gate["errors"]:
+                    alerts.append(
+                        {
+                            "node": name,
+                            "gate": gate["id"],
+                            "kind": "gate_error",
+                            "message": gate["errors"][-1],
+                        }
+                    )
+                if gate["open_disabled"]:
+                    alerts.append(
+                        {
+                            "node": name,
+                            "gate": gate["id"],
+                            "kind": "open_disabled",
+                            "message": "opening is disabled",
+                        }
+                    )
+            if node_state in ("stale", "offline") and (
+                state.failures or state.last_ok is not None
+            ):
+                alerts.append(
+                    {
+                        "node": name,
+                        "gate": None,
+                        "kind": f"node_{node_state}",
+                        "message": state.last_error
+                        or "gate status has not been updated",
+                    }
+                )
+            entries.append(
+                {
+                    "name": name,
+                    "url": state.node.url,
+                    "state": node_state,
+                    "last_ok": _iso(state.last_ok_wall),
+                    "age": None if state.last_ok is None else now - state.last_ok,
+                    "failures": state.failures,
+                    "last_error": state.last_error,
+                    "latency_ms": None
+                    if state.latency is None
+                    else round(state.latency * 1000, 1),
+                    "gates": gates,
+                }
+            )
+        by_kind = {}
+        for alert in alerts:
+            by_kind[alert["kind"]] = by_kind.get(alert["kind"], 0) + 1
+        return {
+            "generated_at": datetime.now().isoformat(),
+            "summary": {
+                "nodes": len(entries),
+                "states": counts,
+                "gates": gate_counts,
+                "alerts": by_kind,
+            },
+            "poll": {
+                "interval": self.interval,
+                "polls": self.polls,
+                "duration_ms": None
+                if self.last_poll_duration is None
+                else round(self.last_poll_duration * 1000, 1),
+                "pool": self.pool.stats(),
+            },
+            "nodes": entries,
+            "alerts": alerts,
+        }
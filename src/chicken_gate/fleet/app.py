@@ -0,0 +1,157 @@
+"""
+Fleet API: one view of many chicken-gate-web nodes.
+
+    GET /api/fleet                  summary, poll figures, every node, alerts
+    GET /api/fleet?state=offline    only nodes in that state
+    GET /api/fleet/nodes/<name>     one node and its gates
+    GET /api/fleet/alerts           the alert roll-up
+
+chicken-gate-fleet runs the FleetAggregator's poll loop on the main thread
+and serves the API from a daemon thread, reading the aggregator's latest
+snapshot.
+"""
+
+import argparse
+import contextlib
+import logging
+import threading
+
+from flask import Flask, jsonify, request
+
+from .aggregator import (
+    CONCURRENCY,
+    NODE_STATES,
+    NODE_TIMEOUT,
+    POLL_INTERVAL,
+    FleetAggregator,
+    parse_nodes,
+)
+
+FLEET_PORT = 5050
+
+app = Flask(__name__)
+
+logger = logging.getLogger("chicken-gate-fleet")
+
+
+def aggregator():
+    return app.config["FLEET_AGGREGATOR"]
+
+
+@app.route("/api/fleet")
+def api_fleet():
+    """The fleet snapshot; ?state=<online|stale|offline|pending> filters nodes"""
+    snapshot = aggregator().snapshot()
+    state = request.args.get("state")
+    if state is None:
+        return jsonify(snapshot)
+    if state not in NODE_STATES:
+        return jsonify({"message": f"state must be one of {NODE_STATES}"}), 400
+    nodes = [node for node in snapshot["nodes"] if node["state"] == state]
+    return jsonify(dict(snapshot, nodes=nodes))
+
+
+@app.route("/api/fleet/nodes/<name>")
+def api_fleet_node(name):
+    """One node's entry of the snapshot"""
+    node = aggregator().node(name)
+    if node is None:
+        return jsonify({"message": f"Unknown node: {name}"}), 404
+    return jsonify(node)
+
+
+@app.route("/api/fleet/alerts")
+def api_fleet_alerts():
+    """Every alert, and their count by kind"""
+    snapshot = aggregator().snapshot()
+    return jsonify(
+        {
+            "generated_at": snapshot["generated_at"],
+            "alerts": snapshot["alerts"],
+            "by_kind": snapshot["summary"]["alerts"],
+        }
+    )
+
+
+def start_api(fleet, port):
+    """Serve the fleet API from a daemon thread"""
+    app.config["FLEET_AGGREGATOR"] = fleet
+    thread = threading.Thread(
+        target=app.run,
+        kwargs={
+            "host": "0.0.0.0",  # nosec B104
+            "port": port,
+            "threaded": True,
+            "use_reloader": False,
+        },
+        name="fleet-api",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Poll many chicken-gate-web nodes and serve a fleet view"
+    )
+    parser.add_argument(
+        "--node",
+        action="append",
+        default=[],
+        metavar="URL",
+        help="node base URL, e.g. http://coop1:5000 (repeat; adds to [fleet] nodes)",
+    )
+    parser.add_argument("--port", type=int, help=f"API port (default {FLEET_PORT})")
+    parser.add_argument("--interval", type=float, help="seconds between polls")
+    parser.add_argument("--timeout", type=float, help="seconds to wait for a node")
+    parser.add_argument("--concurrency", type=int, help="node requests at once")
+    args = parser.parse_args(argv)
+
+    import asyncio
+    import atexit
+
+    from ..shared import logs
+    from ..shared.config import load_settings
+
+    logs.setup_logging()
+    atexit.register(logs.stop_logging)
+
+    try:
+        settings = load_settings().get("fleet", {})
+    except ValueError as e:
+        logger.error("%s - using defaults", e)
+        settings = {}
+    try:
+        nodes = parse_nodes(list(settings.get("nodes", [])) + args.node)
+    except ValueError as e:
+        parser.error(str(e))
+    if not nodes:
+        parser.error("no nodes: add [[fleet.nodes]] to the settings or pass --node")
+
+    def setting(name, default):
+        value = getattr(args, name)
+        return settings.get(name, default) if value is None else value
+
+    fleet = FleetAggregator(
+        nodes,
+        interval=setting("interval", POLL_INTERVAL),
+        timeout=setting("timeout", NODE_TIMEOUT),
+        concurrency=setting("concurrency", CONCURRENCY),
+        stale_after=settings.get("stale_after"),
+        offline_after=settings.get("offline_after"),
+    )
+    port = setting("port", FLEET_PORT)
+    start_api(fleet, port)
+    logger.info(
+        "Polling %d nodes every %.0f s; fleet API on port %d",
+        len(nodes),
+        fleet.interval,
+        port,
+    )
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(fleet.run())
+
+
+if __name__ == "__main__":
+    main()
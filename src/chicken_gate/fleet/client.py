@@ -0,0 +1,243 @@
+"""
+Pooled HTTP/1.1 GET client on asyncio streams.
+
+The aggregator fetches the same small JSON document from every node on every
+poll, so connections are kept alive and reused: each host keeps up to
+max_idle_per_host idle connections, and at most max_connections requests are
+in flight at once. A reused connection that the server has closed in the
+meantime is retried once on a new one. Responses may be sent with a
+Content-Length, chunked or up to the end of the connection, and gzipped.
+"""
+
+import asyncio
+import json
+import time
+import zlib
+from urllib.parse import urlsplit
+
+# Largest response body read (bytes)
+MAX_BODY = 1 << 20
+
+# Idle connections older than this are closed rather than reused (seconds)
+IDLE_TIMEOUT = 30.0
+
+USER_AGENT = "chicken-gate-fleet"
+
+
+class FetchError(Exception):
+    """A request that failed: connection, timeout, protocol or HTTP status"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class _Connection:
+    __slots__ = ("reader", "writer", "idle_since", "requests")
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.idle_since = None
+        self.requests = 0
+
+    def usable(self, now, idle_timeout):
+        return (
+            not self.writer.is_closing()
+            and not self.reader.at_eof()
+            and now - self.idle_since < idle_timeout
+        )
+
+    def close(self):
+        self.writer.close()
+
+
+def split_url(url):
+    """(scheme, host, port, path with query) of an http(s) URL"""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"not an http(s) URL: {url!r}")
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    return parts.scheme, parts.hostname, port, path
+
+
+async def _read_headers(reader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionResetError("connection closed before the response")
+    try:
+        version, status, *_ = line.decode("latin-1").split(None, 2)
+        status = int(status)
+    except ValueError:
+        raise FetchError(f"bad status line {line[:40]!r}") from None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return version, status, headers
+
+
+async def _read_body(reader, headers):
+    """(body, whether the connection can be reused)"""
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        size = 0
+        while True:
+            line = await reader.readline()
+            try:
+                length = int(line.split(b";")[0], 16)
+            except ValueError:
+                raise FetchError(f"bad chunk size {line[:20]!r}") from None
+            if length == 0:
+                # trailers, then the blank line
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks), True
+            size += length
+            if size > MAX_BODY:
+                raise FetchError("response too large")
+            chunks.append(await reader.readexactly(length))
+            await reader.readexactly(2)
+    if "content-length" in headers:
+        length = int(headers["content-length"])
+        if length > MAX_BODY:
+            raise FetchError("response too large")
+        return await reader.readexactly(length), True
+    body = await reader.read(MAX_BODY + 1)
+    if len(body) > MAX_BODY:
+        raise FetchError("response too large")
+    return body, False
+
+
+class ConnectionPool:
+    """Keep-alive connections to many hosts, shared by concurrent GETs"""
+
+    def __init__(
+        self, max_connections=64, max_idle_per_host=2, idle_timeout=IDLE_TIMEOUT
+    ):
+        self.max_connections = max_connections
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self.__idle = {}  # (scheme, host, port) -> [_Connection]
+        self.__slots = None  # semaphore, made in the running loop
+        self.requests = 0
+        self.connections_opened = 0
+        self.reused = 0
+
+    async def get(self, url, timeout=5.0, headers=None):
+        """(status, headers, body) of a GET; raises FetchError"""
+        scheme, host, port, path = split_url(url)
+        if self.__slots is None:
+            self.__slots = asyncio.Semaphore(self.max_connections)
+        async with self.__slots:
+            try:
+                return await asyncio.wait_for(
+                    self.__request((scheme, host, port), path, headers or {}), timeout
+                )
+            except asyncio.TimeoutError:
+                raise FetchError(f"timed out after {timeout} s") from None
+            except (OSError, asyncio.IncompleteReadError) as e:
+                raise FetchError(f"{type(e).__name__}: {e}") from None
+
+    async def get_json(self, url, timeout=5.0, headers=None):
+        """Decoded JSON of a 200 response; raises FetchError"""
+        status, _, body = await self.get(url, timeout, headers)
+        if status != 200:
+            raise FetchError(f"HTTP {status}", status)
+        try:
+            return json.loads(body)
+        except ValueError as e:
+            raise FetchError(f"bad JSON: {e}") from None
+
+    async def close(self):
+        """Close all idle connections"""
+        for connections in self.__idle.values():
+            for conn in connections:
+                conn.close()
+        self.__idle.clear()
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "reused": self.reused,
+            "idle": sum(len(c) for c in self.__idle.values()),
+        }
+
+    async def __request(self, key, path, headers):
+        conn = self.__take_idle(key)
+        if conn is not None:
+            try:
+                return await self.__exchange(key, conn, path, headers)
+            except (OSError, asyncio.IncompleteReadError):
+                # closed by the server while idle - once more on a new one
+                conn.close()
+        conn = await self.__connect(key)
+        return await self.__exchange(key, conn, path, headers)
+
+    def __take_idle(self, key):
+        connections = self.__idle.get(key)
+        now = time.monotonic()
+        while connections:
+            conn = connections.pop()
+            if conn.usable(now, self.idle_timeout):
+                self.reused += 1
+                return conn
+            conn.close()
+        return None
+
+    async def __connect(self, key):
+        scheme, host, port = key
+        reader, writer = await asyncio.open_connection(
+            host, port, ssl=True if scheme == "https" else None
+        )
+        self.connections_opened += 1
+        return _Connection(reader, writer)
+
+    async def __exchange(self, key, conn, path, headers):
+        host = key[1] if key[2] in (80, 443) else f"{key[1]}:{key[2]}"
+        lines = [
+            f"GET {path} HTTP/1.1",
+            f"Host: {host}",
+            f"User-Agent: {USER_AGENT}",
+            "Accept: application/json",
+            "Accept-Encoding: gzip",
+        ]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        try:
+            conn.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+            await conn.writer.drain()
+            version, status, response_headers = await _read_headers(conn.reader)
+            body, reusable = await _read_body(conn.reader, response_headers)
+        except BaseException:
+            conn.close()
+            raise
+        self.requests += 1
+        conn.requests += 1
+        connection = response_headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            reusable = reusable and connection == "keep-alive"
+        else:
+            reusable = reusable and connection != "close"
+        idle = self.__idle.setdefault(key, [])
+        if reusable and len(idle) < self.max_idle_per_host:
+            conn.idle_since = time.monotonic()
+            idle.append(conn)
+        else:
+            conn.close()
+        if response_headers.get("content-encoding", "").lower() == "gzip":
+            try:
+                body = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(
+                    body, MAX_BODY + 1
+                )
+            except zlib.error as e:
+                raise FetchError(f"bad gzip body: {e}") from None
+            if len(body) > MAX_BODY:
+                raise FetchError("response too large")
+        return status, response_headers, body
@@ -0,0 +1,254 @@
+"""
+Year-long schedule backtester.
+
+Replays a year of the gate schedule at a location without starting
+APScheduler. Sun times for every day are precomputed into a SunTable, each
+day's open/close rules are compiled into events the same way Schedule does,
+and the midnight timeline updates are replayed to check that every event
+fires exactly once. Reported anomalies:
+
+- dst_gap / dst_overlap: a clock time in the rules does not exist or happens
+  twice that day (moved past the gap / first occurrence used)
+- no_<event>: a sun event the rules use does not happen (polar day/night)
+- other_day: an event lands on a different calendar day than its rules
+- never / twice: an event that would not fire, or would fire more than once
+
+Usage:
+  chicken-gate-backtest --year 2026
+  chicken-gate-backtest --close "min(dusk + 15min, 21:00)" --anomalies
+  chicken-gate-backtest --config chicken-gate.toml
+"""
+
+import argparse
+import json
+import sys
+import time as tm
+from datetime import date, datetime, time, timedelta
+
+from astral import LocationInfo
+from astral import sun as astral_sun
+from dateutil import tz
+
+from ..shared.config import load_settings
+from .rules import SUN_EVENTS, RuleError, ScheduleRules, Timeline
+from .suntimes import LATITUDE, LOCATION_NAME, LOCATION_REGION, LONGITUDE
+
+
+class SunTable:
+    """Sun event times for every day of a year at one location"""
+
+    def __init__(self, year, latitude=LATITUDE, longitude=LONGITUDE, zone=None):
+        self.year = year
+        self.zone = zone if zone is not None else tz.gettz()
+        self.__observer = LocationInfo(
+            LOCATION_NAME, LOCATION_REGION, "", latitude, longitude
+        ).observer
+
+        first = date(year, 1, 1)
+        n_days = (date(year + 1, 1, 1) - first).days
+        self.days = [first + timedelta(days=i) for i in range(n_days)]
+        self.times = [self.__sun_times(day) for day in self.days]
+
+    def __len__(self):
+        return len(self.days)
+
+    def __iter__(self):
+        return zip(self.days, self.times)
+
+    def __sun_times(self, day):
+        """All sun events for a day; events that do not occur are None"""
+        try:
+            times = astral_sun.sun(self.__observer, date=day, tzinfo=self.zone)
+            return {event: times[event] for event in SUN_EVENTS}
+        except ValueError:
+            # Polar day or night - work out which events are missing
+            times = {}
+            for event in SUN_EVENTS:
+                try:
+                    times[event] = getattr(astral_sun, event)(
+                        self.__observer, date=day, tzinfo=self.zone
+                    )
+                except ValueError:
+                    times[event] = None
+            return times
+
+
+def backtest(table, rules=None):
+    """
+    Replay a year of scheduling over a SunTable.
+
+    Returns a dict with one entry per day under "days", summary statistics
+    under "stats" and the list of "anomalies".
+    """
+    rules = rules if rules is not None else ScheduleRules()
+    anomalies = []
+    day_events = [
+        rules.compile_day(day, sun_times, table.zone, anomalies)
+        for day, sun_times in table
+    ]
+
+    # Each midnight Schedule compiles yesterday..tomorrow and fires every
+    # event after the update until the next one
+    fires = {}
+    midnights = [_midnight(day, table.zone) for day in table.days]
+    midnights.append(_midnight(table.days[-1] + timedelta(days=1), table.zone))
+    for i in range(len(table)):
+        timeline = Timeline(
+            event for events in day_events[max(0, i - 1) : i + 2] for event in events
+        )
+        for event in timeline.events_between(
+            midnights[i].timestamp(), midnights[i + 1].timestamp()
+        ):
+            fires.setdefault((event.day, event.job), []).append(event.when)
+
+    days = []
+    for day, events in zip(table.days, day_events):
+        record = {"date": day.isoformat(), "open_fires": [], "close_fires": []}
+        for event in events:
+            record[event.job] = event.when
+            record[event.job + "_fires"] = fired = fires.get((day, event.job), [])
+            if event.when.date() != day:
+                anomalies.append(_anomaly(day, event, "other_day"))
+            if not fired and day != table.days[-1]:
+                anomalies.append(_anomaly(day, event, "never"))
+            elif len(fired) > 1:
+                anomalies.append(_anomaly(day, event, "twice"))
+        days.append(record)
+
+    return {"days": days, "stats": _stats(days, table), "anomalies": anomalies}
+
+
+def _midnight(day, zone):
+    """When the midnight update runs (a missing 00:00 runs after the gap)"""
+    return tz.resolve_imaginary(datetime.combine(day, time(0, 0), tzinfo=zone))
+
+
+def _anomaly(day, event, kind):
+    return {
+        "date": day.isoformat(),
+        "job": event.job,
+        "kind": kind,
+        "time": event.when.isoformat(),
+    }
+
+
+def _stats(days, table):
+    """Summary statistics over the days where both jobs fired exactly once"""
+    open_minutes = []
+    close_minutes = []
+    hours_open = []
+    morning_lost = 0.0
+    evening_lost = 0.0
+    after_dark = 0.0
+
+    for record, (_, sun_times) in zip(days, table):
+        if len(record["open_fires"]) != 1 or len(record["close_fires"]) != 1:
+            continue
+        opened = record["open_fires"][0]
+        closed = record["close_fires"][0]
+        open_minutes.append(opened.hour * 60 + opened.minute)
+        close_minutes.append(closed.hour * 60 + closed.minute)
+        hours_open.append(_hours_between(opened, closed))
+
+        dawn, dusk = sun_times["dawn"], sun_times["dusk"]
+        if dawn is not None:
+            morning_lost += max(0.0, _hours_between(dawn, opened))
+        if dusk is not None:
+            evening_lost += max(0.0, _hours_between(closed, dusk))
+            after_dark += max(0.0, _hours_between(dusk, closed))
+
+    if not hours_open:
+        return {"days_scheduled": 0}
+
+    return {
+        "days_scheduled": len(hours_open),
+        "open_earliest": _hhmm(min(open_minutes)),
+        "open_latest": _hhmm(max(open_minutes)),
+        "open_mean": _hhmm(sum(open_minutes) / len(open_minutes)),
+        "close_earliest": _hhmm(min(close_minutes)),
+        "close_latest": _hhmm(max(close_minutes)),
+        "close_mean": _hhmm(sum(close_minutes) / len(close_minutes)),
+        "hours_open_min": round(min(hours_open), 2),
+        "hours_open_max": round(max(hours_open), 2),
+        "hours_open_mean": round(sum(hours_open) / len(hours_open), 2),
+        "daylight_lost_morning_hours": round(morning_lost, 1),
+        "daylight_lost_evening_hours": round(evening_lost, 1),
+        "open_after_dusk_hours": round(after_dark, 1),
+    }
+
+
+def _hours_between(start, end):
+    """Elapsed hours between two aware datetimes, across DST changes"""
+    return (end.astimezone(tz.UTC) - start.astimezone(tz.UTC)).total_seconds() / 3600
+
+
+def _hhmm(minutes):
+    minutes = int(round(minutes))
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def main(argv=None):
+    """Command-line entry point for the schedule backtester"""
+    parser = argparse.ArgumentParser(
+        description="Backtest a year of gate open/close scheduling"
+    )
+    parser.add_argument("--year", type=int, default=date.today().year)
+    parser.add_argument("--lat", type=float, default=LATITUDE)
+    parser.add_argument("--lon", type=float, default=LONGITUDE)
+    parser.add_argument("--tz", default=None, help="IANA zone (default: local)")
+    parser.add_argument("--config", help="take the rules from a settings file")
+    parser.add_argument("--open", help="open rule, e.g. 'max(sunrise + 10min, 06:30)'")
+    parser.add_argument("--close", help="close rule, e.g. 'dusk + 15min'")
+    parser.add_argument("--anomalies", action="store_true", help="list anomalies")
+    parser.add_argument("--json", action="store_true", help="print JSON report")
+    args = parser.parse_args(argv)
+
+    zone = tz.gettz(args.tz) if args.tz else tz.gettz()
+    if zone is None:
+        print(f"Unknown time zone: {args.tz}")
+        return 1
+
+    try:
+        rules = ScheduleRules.from_settings(
+            load_settings(args.config) if args.config else {}
+        )
+        if args.open or args.close:
+            rules = ScheduleRules(
+                args.open or rules.open_rule,
+                args.close or rules.close_rule,
+                rules.overrides,
+            )
+    except (RuleError, ValueError) as e:
+        print(f"Invalid rules: {e}")
+        return 1
+
+    start = tm.perf_counter()
+    table = SunTable(args.year, args.lat, args.lon, zone)
+    result = backtest(table, rules)
+    elapsed = tm.perf_counter() - start
+
+    if args.json:
+        print(
+            json.dumps(
+                {"stats": result["stats"], "anomalies": result["anomalies"]}, indent=2
+            )
+        )
+        return 0
+
+    print(
+        f"Backtest {args.year} at ({args.lat}, {args.lon}): "
+        f"open = {rules.open_rule}, close = {rules.close_rule}"
+        f" ({len(rules.overrides)} override(s))"
+    )
+    for key, value in result["stats"].items():
+        print(f"  {key:30s} {value}")
+    print(f"  {'anomalies':30s} {len(result['anomalies'])}")
+    if args.anomalies:
+        for anomaly in result["anomalies"]:
+            print(f"    {anomaly}")
+    print(f"Computed in {elapsed * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+"""
+Crash-safe checkpoint of the gate state, restored on start.
+
+The checkpoint is a small append-only file of records, one per line:
+an 8 hex digit CRC-32 of the JSON body, a space and the body. A record is
+appended only when the state changes - the position while moving at most
+every position_interval seconds - so an idle gate writes nothing. Each
+append goes straight to the OS, which is all a process crash or a systemd
+restart needs; the fsync that protects against power loss is batched, at
+most one per fsync_interval, to spare the SD card. After COMPACT_RECORDS
+appends the file is rewritten (temporary file, fsync, rename) with just the
+latest record. With a writer (shared.writer.BackgroundWriter) the file
+operations run on its thread, so update() from an AsyncGate publisher never
+waits for the disk.
+
+Loading takes the last record whose CRC matches and cuts off a torn tail
+left by a crash in the middle of a write.
+"""
+
+import json
+import logging
+import os
+import time
+import zlib
+
+CHECKPOINT_FILE = "gate_state.wal"
+
+# Longest a written record waits for its fsync (seconds)
+FSYNC_INTERVAL = 5.0
+
+# Least time between records that only move the position (seconds)
+POSITION_INTERVAL = 2.0
+
+# Appends before the file is rewritten with just the latest record
+COMPACT_RECORDS = 256
+
+VERSION = 1
+
+logger = logging.getLogger("chicken-gate-checkpoint")
+
+
+def encode_record(record):
+    """A record as a checksummed line"""
+    body = json.dumps(record, separators=(",", ":"), sort_keys=True).encode()
+    return b"%08x %s\n" % (zlib.crc32(body), body)
+
+
+def decode_record(line):
+    """Record from a line without its newline, or None if damaged"""
+    crc, _, body = line.partition(b" ")
+    try:
+        if len(crc) != 8 or int(crc, 16) != zlib.crc32(body):
+            return None
+        record = json.loads(body)
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) else None
+
+
+def read_records(data):
+    """(valid records, length of the valid prefix) of a checkpoint file's bytes"""
+    records = []
+    valid = 0
+    while valid < len(data):
+        end = data.find(b"\n", valid)
+        if end < 0:
+            break  # torn final write
+        record = decode_record(data[valid:end])
+        if record is None:
+            break
+        records.append(record)
+        valid = end + 1
+    return records, valid
+
+
+def checkpoint_path(gate_id=None):
+    """CHECKPOINT_FILE, or a file of its own for each gate of several"""
+    if gate_id is None:
+        return CHECKPOINT_FILE
+    return f"gate_state.{gate_id}.wal"
+
+
+def _state_key(state):
+    return {k: v for k, v in state.items() if k != "position"}
+
+
+class Checkpointer:
+    """Appends changed gate state to the checkpoint file"""
+
+    def __init__(
+        self,
+        path=CHECKPOINT_FILE,
+        fsync_interval=FSYNC_INTERVAL,
+        position_interval=POSITION_INTERVAL,
+        compact_records=COMPACT_RECORDS,
+        clock=time.monotonic,
+        writer=None,
+    ):
+        """writer runs the file operations (None: inline, in the caller)"""
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.position_interval = position_interval
+        self.compact_records = compact_records
+        self.__clock = clock
+        self.__writer = writer
+        self.__file = None  # used by the writer's thread only
+        self.__records = 0  # records in the file
+        self.__last = None  # last state written
+        self.__last_key = None  # ...without the position
+        self.__last_write = float("-inf")
+        self.__unsynced_since = None  # first write not yet fsynced
+        self.writes = 0
+        self.fsyncs = 0
+        self.bytes_written = 0
+        self.compactions = 0
+        self.torn_bytes = 0  # damaged tail cut off by load()
+
+    def configure(self, fsync_interval=None, position_interval=None):
+        """Change the intervals (e.g. from settings loaded after start-up)"""
+        if fsync_interval is not None:
+            self.fsync_interval = fsync_interval
+        if position_interval is not None:
+            self.position_interval = position_interval
+
+    def load(self):
+        """The last intact record, or None; a damaged tail is cut off"""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        records, valid = read_records(data)
+        if valid < len(data):
+            self.torn_bytes = len(data) - valid
+            logger.warning(
+                "Checkpoint %s: discarding %d damaged bytes at the end",
+                self.path,
+                self.torn_bytes,
+            )
+            os.truncate(self.path, valid)
+        self.__records = len(records)
+        if not records:
+            return None
+        record = records[-1]
+        state = {k: v for k, v in record.items() if k not in ("saved_at", "version")}
+        self.__last = state
+        self.__last_key = _state_key(state)
+        return record
+
+    def update(self, state, now=None):
+        """
+        Record `state` (a dict with a "position") if it changed, and fsync if
+        one is due. Returns True if a record was written.
+        """
+        now = self.__clock() if now is None else now
+        written = False
+        key = _state_key(state)
+        if key != self.__last_key or (
+            state["position"] != self.__last["position"]
+            and now - self.__last_write >= self.position_interval
+        ):
+            self.__write(state, now)
+            written = True
+        self.flush(now)
+        return written
+
+    def flush(self, now=None, force=False):
+        """fsync written records once the oldest has waited fsync_interval"""
+        if self.__unsynced_since is None:
+            return
+        now = self.__clock() if now is None else now
+        if force or now - self.__unsynced_since >= self.fsync_interval:
+            self.__io(self.__fsync)
+            self.fsyncs += 1
+            self.__unsynced_since = None
+
+    def close(self):
+        """fsync anything outstanding and close the file"""
+        self.flush(force=True)
+        self.__io(self.__close_file)
+
+    def stats(self):
+        return {
+            "writes": self.writes,
+            "fsyncs": self.fsyncs,
+            "bytes_written": self.bytes_written,
+            "compactions": self.compactions,
+        }
+
+    def __write(self, state, now):
+        record = dict(state, saved_at=time.time(), version=VERSION)
+        data = encode_record(record)
+        if self.__records >= self.compact_records:
+            self.__io(self.__compact, data)
+            self.fsyncs += 2
+            self.compactions += 1
+            self.__records = 1
+            self.__unsynced_since = None
+        else:
+            self.__io(self.__append, data)
+            self.__records += 1
+            if self.__unsynced_since is None:
+                self.__unsynced_since = now
+        self.writes += 1
+        self.bytes_written += len(data)
+        self.__last = dict(state)
+        self.__last_key = _state_key(state)
+        self.__last_write = now
+
+    # -- file operations: on the writer's thread if there is one -------------
+
+    def __io(self, operation, *args):
+        if self.__writer is None:
+            operation(*args)
+        else:
+            self.__writer.submit(operation, *args)
+
+    def __append(self, data):
+        if self.__file is None:
+            self.__file = open(self.path, "ab")  # noqa: SIM115 - kept open
+        self.__file.write(data)
+        self.__file.flush()  # to the OS: survives the process
+
+    def __fsync(self):
+        if self.__file is not None:
+            os.fsync(self.__file.fileno())
+
+    def __close_file(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def __compact(self, data):
+        """Replace the file with one holding just `data`"""
+        self.__close_file()
+        temp = self.path + ".tmp"
+        with open(temp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path)
+        directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+def reconcile(state, switch_pressed):
+    """
+    Make checkpointed gate state agree with the closed switch read now.
+    Returns (state, note), note describing a disagreement or None.
+    """
+    state = dict(state)
+    position = state["position"]
+    if switch_pressed and position < 90:
+        # the switch is the only sensor - the gate is closed
+        state["position"] = 100
+        return state, f"closed switch pressed but checkpoint position was {position}"
+    if not switch_pressed and position >= 100 and state.get("motion") == "STOP":
+        # said closed, but no longer is: fall back to the driver's guess
+        state["position"] = 0
+        state["target_position"] = 0
+        return state, "checkpoint says closed but the closed switch is not pressed"
+    return state, None
+
+
+def restore(checkpointer, gate, switch_pressed):
+    """
+    Load the checkpoint into `gate`, reconciled with the closed switch.
+    Returns the record (with "schedule_enabled" and "saved_at") or None.
+    """
+    start = time.perf_counter()
+    try:
+        record = checkpointer.load()
+    except OSError as e:
+        logger.error("Cannot read checkpoint %s: %s", checkpointer.path, e)
+        return None
+    if record is None:
+        return None
+    try:
+        saved_at = float(record["saved_at"])
+        state, note = reconcile(record, switch_pressed)
+        gate.restore_state(state)
+    except (KeyError, TypeError, ValueError) as e:
+        logger.error("Ignoring checkpoint %s: %s", checkpointer.path, e)
+        return None
+    if note is not None:
+        logger.warning("Checkpoint reconciled: %s", note)
+    logger.info(
+        "Restored gate state in %.1f ms (saved %s)",
+        (time.perf_counter() - start) * 1000,
+        time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(saved_at)),
+        extra={"position": gate.get_posn()},
+    )
+    return record
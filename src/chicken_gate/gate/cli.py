@@ -0,0 +1,579 @@
+"""
+chicken-gate-ctl: send commands to the gate process and watch its status.
+
+    chicken-gate-ctl send open --wait
+    chicken-gate-ctl send reset:50 --gate side
+    chicken-gate-ctl status --follow
+    chicken-gate-ctl batch maintenance.txt --wait
+    chicken-gate-ctl export --from 2026-01-01 --format csv -o 2026.csv
+
+Every command chicken-gate-main understands can be sent (OPEN, CLOSE, STOP,
+RESET[:position], CLEAR_ERRORS, CLEAR_DIAGNOSTICS, ENABLE_SCHEDULE,
+DISABLE_SCHEDULE). They go through the command file and status is read from
+the status file in the gate process's working directory (--dir), or through
+the web API of chicken-gate-web or chicken-gate-main --web (--url).
+
+The command file holds one command at a time, so a command is only written
+once the gate has taken the previous one. --wait then blocks until a status
+written after the command shows it took effect (the gate open, the schedule
+disabled, the errors cleared...). status --follow prints the gate's status
+each time it changes: the status file is watched for changes (inotify on
+Linux), not re-read in a loop.
+
+A batch file has one command per line, optionally addressed to a gate as
+"<gate id> <command>", and "sleep <seconds>" lines; # starts a comment. The
+whole file is checked before the first command is sent.
+
+export streams the gate history (events and samples) from the history
+directory (--dir) or from /api/export (--url) to a file or standard output.
+--resume continues an interrupted NDJSON or CSV export from the cursor of
+its last complete row.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from ..shared.config import (
+    COMMAND_FILE,
+    DIAGNOSTICS_FILE,
+    HISTORY_DIR,
+    STATUS_FILE,
+    merge_diagnostics,
+)
+from ..shared.export import ExportError
+from .runtime import ALL_GATES, check_command, gate_state, split_gate_id
+
+# Seconds to wait for the gate to take a command and for it to take effect
+DEFAULT_TIMEOUT = 120.0
+
+# Seconds between status requests when following the web API
+HTTP_POLL_INTERVAL = 1.0
+
+# A status older than this (seconds) is flagged: the gate publishes every second
+STALE_AFTER = 10.0
+
+
+class CliError(Exception):
+    """A command that could not be sent, or did not take effect"""
+
+
+def took_effect(command, status):
+    """Whether `status` shows `command` (as check_command() returns it) done"""
+    name, _, arg = command.partition(":")
+    if name in ("OPEN", "CLOSE"):
+        return gate_state(status) == ("open" if name == "OPEN" else "closed")
+    if name == "STOP":
+        return not status["is_moving"]
+    if name == "RESET":
+        if arg:
+            return status["position"] == int(arg) and not status["is_moving"]
+        return not status["is_moving"]
+    if name == "CLEAR_ERRORS":
+        return not status["errors"]
+    if name == "CLEAR_DIAGNOSTICS":
+        return not status.get("diagnostic_messages")
+    return status["schedule_enabled"] == (name == "ENABLE_SCHEDULE")
+
+
+def describe(status):
+    """One line about a gate's status"""
+    if status is None:
+        return "no status (is chicken-gate-main running?)"
+    text = f"{gate_state(status)} at {status['position']:.0f}%"
+    if status.get("is_moving"):
+        text += f" -> {status['target_position']:.0f}%"
+    if not status.get("schedule_enabled", True):
+        text += ", schedule disabled"
+    if status.get("errors"):
+        text += ", errors: " + "; ".join(status["errors"])
+    return text
+
+
+def updated_at(status):
+    """When the gate wrote `status` (datetime.min if it does not say)"""
+    try:
+        return datetime.fromisoformat(status["last_updated"])
+    except (KeyError, TypeError, ValueError):
+        return datetime.min
+
+
+class FileTransport:
+    """The command and status files in the gate process's working directory"""
+
+    def __init__(self, directory="."):
+        from ..shared.watch import FileWatcher
+
+        directory = os.path.abspath(directory)
+        self.command_file = os.path.join(directory, COMMAND_FILE)
+        self.status_file = os.path.join(directory, STATUS_FILE)
+        self.diagnostics_file = os.path.join(directory, DIAGNOSTICS_FILE)
+        self.history_dir = os.path.join(directory, HISTORY_DIR)
+        self.__watcher = FileWatcher([self.command_file, self.status_file])
+
+    def __wait_for_free_slot(self, deadline):
+        while os.path.exists(self.command_file):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.__watcher.wait(remaining)
+        return True
+
+    def send(self, command, gate_id, deadline):
+        """Write the command once the gate has taken the previous one"""
+        if not self.__wait_for_free_slot(deadline):
+            raise CliError(
+                f"the gate has not taken the command in {self.command_file}"
+                " (is chicken-gate-main running in this directory?)"
+            )
+        text = command if gate_id is None else f"{gate_id} {command}"
+        temp_file = self.command_file + ".tmp"
+        try:
+            with open(temp_file, "w") as f:
+                f.write(text)
+            os.replace(temp_file, self.command_file)  # never read half-written
+        except OSError as e:
+            raise CliError(f"cannot write {self.command_file}: {e}") from e
+
+    def taken(self, deadline):
+        """Whether the gate took the command before `deadline`"""
+        return self.__wait_for_free_slot(deadline)
+
+    def status(self, gate_id=None):
+        """A gate's status (default: the default gate), or None"""
+        try:
+            with open(self.status_file) as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if gate_id is not None and gate_id != status.get("gate_id"):
+            status = status.get("gates", {}).get(gate_id)
+        return merge_diagnostics(status, self.diagnostics_file)
+
+    def gate_ids(self):
+        status = self.status(None)
+        if status is None:
+            return []
+        return list(status.get("gates", {})) or [status.get("gate_id")]
+
+    def wait_for_change(self, timeout=None):
+        """Until the status file changes (or the timeout passes)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            if self.status_file in self.__watcher.wait(remaining):
+                return True
+
+    def export(self, query):
+        """Byte chunks of a history export (query as for /api/export)"""
+        from ..shared.export import export_stream
+        from ..shared.history import HistoryStore, parse_time
+
+        return export_stream(
+            HistoryStore(self.history_dir),
+            query.get("format", "ndjson"),
+            start=parse_time(query["from"]) if "from" in query else None,
+            end=parse_time(query["to"]) if "to" in query else None,
+            kind=query.get("kind"),
+            gate_id=query.get("gate"),
+            cursor=query.get("cursor"),
+            limit=query.get("limit"),
+        )
+
+    def close(self):
+        self.__watcher.close()
+
+
+class HttpTransport:
+    """The web API of chicken-gate-web, or of chicken-gate-main --web"""
+
+    def __init__(self, url, poll_interval=HTTP_POLL_INTERVAL):
+        self.url = url.rstrip("/")
+        self.poll_interval = poll_interval
+
+    def __request(self, path, body=None):
+        import urllib.error
+        import urllib.request
+
+        data = None if body is None else json.dumps(body).encode()
+        request = urllib.request.Request(
+            self.url + path, data=data, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:  # nosec B310
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            try:
+                return json.load(e)
+            except ValueError:
+                raise CliError(f"{self.url}{path}: HTTP {e.code}") from e
+        except (OSError, ValueError) as e:
+            raise CliError(f"{self.url}{path}: {e}") from e
+
+    def send(self, command, gate_id, deadline):
+        body = {"command": command}
+        if gate_id is not None:
+            body["gate"] = gate_id
+        result = self.__request("/api/command", body)
+        if not result.get("success"):
+            raise CliError(result.get("message") or result.get("error") or "refused")
+
+    def taken(self, deadline):
+        return True  # queued by the web app
+
+    def status(self, gate_id=None):
+        path = "/api/status" if gate_id is None else f"/api/gates/{gate_id}/status"
+        try:
+            status = self.__request(path)
+        except CliError:
+            return None
+        return status if "position" in status else None
+
+    def gate_ids(self):
+        return [gate["id"] for gate in self.__request("/api/gates")["gates"]]
+
+    def export(self, query):
+        """Byte chunks of /api/export, gzip-compressed on the way"""
+        import urllib.error
+        import urllib.parse
+        import urllib.request
+
+        url = f"{self.url}/api/export?{urllib.parse.urlencode(query)}"
+        request = urllib.request.Request(url, headers={"Accept-Encoding": "gzip"})
+        try:
+            response = urllib.request.urlopen(request, timeout=30)  # nosec B310
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.load(e)["message"]
+            except (ValueError, KeyError):
+                message = f"HTTP {e.code}"
+            raise CliError(f"{url}: {message}") from e
+        except OSError as e:
+            raise CliError(f"{url}: {e}") from e
+        return self.__chunks(response)
+
+    @staticmethod
+    def __chunks(response):
+        import zlib
+
+        with response:
+            gzipped = response.headers.get("Content-Encoding") == "gzip"
+            decompressor = zlib.decompressobj(31) if gzipped else None
+            for chunk in iter(lambda: response.read(64 * 1024), b""):
+                yield decompressor.decompress(chunk) if gzipped else chunk
+            if gzipped:
+                yield decompressor.flush()
+
+    def wait_for_change(self, timeout=None):
+        """The web API has no notification: wait for the next poll"""
+        time.sleep(
+            self.poll_interval if timeout is None else min(self.poll_interval, timeout)
+        )
+        return True
+
+    def close(self):
+        pass
+
+
+def send(transport, command, gate_id=None, wait=False, timeout=DEFAULT_TIMEOUT):
+    """
+    Send a command (as check_command() returns it); with `wait`, return the
+    status showing it took effect. CliError if it could not be sent in
+    `timeout` seconds, or did not take effect in that time.
+    """
+    if wait and gate_id == ALL_GATES:
+        raise CliError("--wait needs one gate, not all of them")
+    deadline = time.monotonic() + timeout
+    sent_at = datetime.now()  # a status from before cannot show the command
+    transport.send(command, gate_id, deadline)
+    if not wait:
+        return None
+    if not transport.taken(deadline):
+        raise CliError(f"the gate did not take {command} within {timeout:g} s")
+    status = None
+    while True:
+        status = transport.status(gate_id)
+        if (
+            status is not None
+            and updated_at(status) >= sent_at
+            and took_effect(command, status)
+        ):
+            return status
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise CliError(
+                f"{command} did not take effect within {timeout:g} s"
+                f" (gate {describe(status)})"
+            )
+        transport.wait_for_change(remaining)
+
+
+def follow(transport, gate_id=None, count=None, out=None):
+    """Print the gate's status, then each change (`count` lines in all)"""
+    out = sys.stdout if out is None else out
+    last = None
+    printed = 0
+    while True:
+        line = describe(transport.status(gate_id))
+        if line != last:
+            print(f"{datetime.now():%H:%M:%S} {line}", file=out, flush=True)
+            last = line
+            printed += 1
+            if count is not None and printed >= count:
+                break
+        transport.wait_for_change()
+
+
+def parse_batch(lines, source="batch"):
+    """
+    [(line number, gate id, command)] of a batch file, with "sleep" lines as
+    (line number, None, seconds as a float); CliError naming every bad line
+    """
+    steps, problems = [], []
+    for number, line in enumerate(lines, 1):
+        text = line.split("#", 1)[0].strip()
+        if not text:
+            continue
+        words = text.split()
+        try:
+            if words[0].lower() == "sleep":
+                if len(words) != 2:
+                    raise ValueError("sleep takes a number of seconds")
+                seconds = float(words[1])
+                if not seconds >= 0:
+                    raise ValueError("sleep takes a number of seconds")
+                steps.append((number, None, seconds))
+                continue
+            if len(words) > 2:
+                raise ValueError(f"expected [gate id] command, got {text!r}")
+            gate_id, command = split_gate_id(text)
+            steps.append((number, gate_id, check_command(command.replace("-", "_"))))
+        except ValueError as e:
+            problems.append(f"{source}:{number}: {e}")
+    if problems:
+        raise CliError("\n".join(problems))
+    return steps
+
+
+def run_batch(
+    transport, steps, gate_id=None, wait=False, timeout=DEFAULT_TIMEOUT, out=None
+):
+    """
+    Run parse_batch() steps in order (`gate_id` for commands that name no
+    gate); stops at the first failure
+    """
+    out = sys.stdout if out is None else out
+    for number, step_gate, command in steps:
+        if isinstance(command, float):
+            print(f"line {number}: sleep {command:g} s", file=out, flush=True)
+            time.sleep(command)
+            continue
+        step_gate = step_gate or gate_id
+        target = f"{step_gate} {command}" if step_gate else command
+        try:
+            status = send(transport, command, step_gate, wait, timeout)
+        except CliError as e:
+            raise CliError(f"line {number}: {target}: {e}") from e
+        done = f" - {describe(status)}" if status is not None else ""
+        print(f"line {number}: {target} sent{done}", file=out, flush=True)
+
+
+def export(transport, query, output="-", resume=False, out=None):
+    """
+    Write a history export to `output` (- for standard output), after the
+    last complete row of an existing one with `resume`. Returns the number
+    of bytes written.
+    """
+    from ..shared.export import last_cursor
+
+    fmt = query.get("format", "ndjson")
+    mode = "wb"
+    if resume and output != "-" and os.path.exists(output):
+        cursor = last_cursor(output, fmt)
+        if cursor is not None:
+            query = dict(query, cursor=cursor)
+            mode = "ab"
+    chunks = transport.export(query)
+    if mode == "ab" and fmt == "csv":
+        chunks = _without_header(chunks)
+    if output == "-":
+        f = (sys.stdout if out is None else out).buffer
+    else:
+        f = open(output, mode)  # noqa: SIM115 - closed below
+    written = 0
+    try:
+        for chunk in chunks:
+            f.write(chunk)
+            written += len(chunk)
+    finally:
+        if output == "-":
+            f.flush()
+        else:
+            f.close()
+    return written
+
+
+def _without_header(chunks):
+    """CSV chunks without their header line, to append to an export"""
+    head = b""
+    for chunk in chunks:
+        if head is not None:
+            head += chunk
+            if b"\n" not in head:
+                continue
+            chunk = head.split(b"\n", 1)[1]
+            head = None
+        if chunk:
+            yield chunk
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="chicken-gate-ctl",
+        description="Send commands to the chicken gate and watch its status",
+    )
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument(
+        "--dir",
+        default=".",
+        help="working directory of chicken-gate-main (command and status files)",
+    )
+    where.add_argument(
+        "--url", help="web interface to use instead, e.g. http://chicken-gate:5000"
+    )
+    commands = parser.add_subparsers(dest="action", required=True)
+
+    send_parser = commands.add_parser("send", help="send a command")
+    send_parser.add_argument(
+        "command",
+        help="open, close, stop, reset[:position], clear-errors,"
+        " clear-diagnostics, enable-schedule or disable-schedule",
+    )
+    batch_parser = commands.add_parser("batch", help="send the commands in a file")
+    batch_parser.add_argument("file", help="batch file (- for standard input)")
+    for sub in (send_parser, batch_parser):
+        sub.add_argument("--gate", help=f"gate id ({ALL_GATES} for every gate)")
+        sub.add_argument(
+            "--wait", action="store_true", help="wait until each command took effect"
+        )
+        sub.add_argument(
+            "--timeout",
+            type=float,
+            default=DEFAULT_TIMEOUT,
+            help="seconds to wait for each command",
+        )
+
+    status_parser = commands.add_parser("status", help="show the gate status")
+    status_parser.add_argument("--gate", help="gate id (default: every gate)")
+    status_parser.add_argument(
+        "--follow", "-f", action="store_true", help="print each change"
+    )
+    status_parser.add_argument(
+        "--count", type=int, help="with --follow, stop after this many lines"
+    )
+    status_parser.add_argument("--json", action="store_true", help="raw status")
+
+    export_parser = commands.add_parser("export", help="export the gate history")
+    export_parser.add_argument(
+        "--from", dest="start", help="first time (ISO 8601 or epoch seconds)"
+    )
+    export_parser.add_argument("--to", dest="end", help="time to stop before")
+    export_parser.add_argument(
+        "--format", choices=("ndjson", "csv", "parquet"), default="ndjson"
+    )
+    export_parser.add_argument("--kind", choices=("event", "sample"))
+    export_parser.add_argument("--gate", help="gate id (default: every gate)")
+    export_parser.add_argument("--cursor", help="start after this cursor")
+    export_parser.add_argument("--limit", type=int, help="at most this many rows")
+    export_parser.add_argument(
+        "--output", "-o", default="-", help="file to write (default: standard output)"
+    )
+    export_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue an interrupted NDJSON or CSV export in --output",
+    )
+    return parser
+
+
+def show_status(transport, gate_id, as_json, out=None):
+    """Print each gate's status (or `gate_id`'s); 1 if any is missing"""
+    out = sys.stdout if out is None else out
+    gate_ids = [gate_id] if gate_id is not None else transport.gate_ids() or [None]
+    statuses = {g: transport.status(g) for g in gate_ids}
+    if as_json:
+        single = len(statuses) == 1
+        json.dump(next(iter(statuses.values())) if single else statuses, out, indent=2)
+        print(file=out)
+    else:
+        for g, status in statuses.items():
+            prefix = f"{g}: " if len(statuses) > 1 else ""
+            line = prefix + describe(status)
+            age = (datetime.now() - updated_at(status)).total_seconds() if status else 0
+            if age > STALE_AFTER:
+                line += f" (last updated {updated_at(status):%Y-%m-%d %H:%M:%S})"
+            print(line, file=out)
+            if status is not None and len(statuses) == 1:
+                event = status.get("schedule", {}).get("next_event")
+                if event:
+                    at = datetime.fromisoformat(event["time"]).astimezone()
+                    print(f"next: {event['command']} at {at:%Y-%m-%d %H:%M}", file=out)
+    return 0 if all(s is not None for s in statuses.values()) else 1
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    transport = HttpTransport(args.url) if args.url else FileTransport(args.dir)
+    try:
+        if args.action == "status":
+            if args.follow:
+                follow(transport, args.gate, args.count)
+                return 0
+            return show_status(transport, args.gate, args.json)
+
+        if args.action == "export":
+            query = {
+                name: value
+                for name, value in (
+                    ("from", args.start),
+                    ("to", args.end),
+                    ("format", args.format),
+                    ("kind", args.kind),
+                    ("gate", args.gate),
+                    ("cursor", args.cursor),
+                    ("limit", args.limit),
+                )
+                if value is not None
+            }
+            export(transport, query, args.output, args.resume)
+            return 0
+
+        if args.action == "send":
+            command = check_command(args.command.replace("-", "_"))
+            status = send(transport, command, args.gate, args.wait, args.timeout)
+            print(f"{command} sent" + (f" - {describe(status)}" if status else ""))
+        else:
+            if args.file == "-":
+                lines = sys.stdin.read().splitlines()
+            else:
+                with open(args.file) as f:
+                    lines = f.read().splitlines()
+            steps = parse_batch(lines, args.file)
+            run_batch(transport, steps, args.gate, args.wait, args.timeout)
+        return 0
+    except (CliError, ExportError, ValueError, OSError) as e:
+        print(f"chicken-gate-ctl: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        transport.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
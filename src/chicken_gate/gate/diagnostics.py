@@ -0,0 +1,107 @@
+"""
+Gate diagnostics as structured records in a fixed-size ring buffer.
+
+A record is (monotonic time, code, params). Appending one is a slot store
+and two integer updates; the text is only built when a reader asks for the
+messages, and then once per generation - the generation number changes on
+every append or clear, so unchanged diagnostics are neither re-formatted
+nor re-sent to a client that already has them.
+"""
+
+import time
+
+# Message templates by code (%-style, so log calls format lazily too)
+MESSAGES = {
+    "open_received": "gate open command received",
+    "open_rejected": "gate open command rejected - errors present",
+    "close_received": "gate close command received",
+    "stop_received": "gate stop command received - manual stop engaged",
+    "position_reset": "position reset to %s",
+    "state_restored": "state restored from checkpoint - position %s, target %s",
+    "cleared_errors": "cleared %d error(s) - gate opening re-enabled",
+    "entering_open": "gate entering OPEN state",
+    "entering_close": "gate entering CLOSE state",
+    "entering_stop": "gate entering STOP state",
+    "manual_stop": "gate entering STOP state (manual stop)",
+    "error": "ERROR: %s",
+    "travel_trend": "%s travel time trending %+.0f%% from its mean (%.0f s, mean %.0f s)",
+}
+
+# Messages kept per gate
+DEFAULT_CAPACITY = 20
+
+
+def format_message(code, params=()):
+    """Text of a diagnostic without its timestamp"""
+    return MESSAGES[code] % params
+
+
+class DiagnosticLog:
+    """Preallocated ring buffer of diagnostic records"""
+
+    __slots__ = (
+        "capacity",
+        "generation",
+        "__records",
+        "__next",
+        "__count",
+        "__wall_offset",
+        "__messages",
+        "__messages_generation",
+    )
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        # Start from the clock so a restarted process does not repeat the
+        # generation numbers a web client already saw
+        self.generation = int(time.time() * 1000)
+        self.__records = [None] * capacity
+        self.__next = 0
+        self.__count = 0
+        self.__wall_offset = time.time() - time.monotonic()
+        self.__messages = []
+        self.__messages_generation = self.generation
+
+    def __len__(self):
+        return self.__count
+
+    def append(self, code, params=()):
+        """Record a diagnostic (O(1), overwrites the oldest when full)"""
+        self.__records[self.__next] = (time.monotonic(), code, params)
+        self.__next = (self.__next + 1) % self.capacity
+        if self.__count < self.capacity:
+            self.__count += 1
+        self.generation += 1
+
+    def clear(self):
+        self.__records = [None] * self.capacity
+        self.__next = 0
+        self.__count = 0
+        self.generation += 1
+
+    def records(self):
+        """(monotonic time, code, params) records, oldest first"""
+        start = (self.__next - self.__count) % self.capacity
+        return [
+            self.__records[(start + i) % self.capacity] for i in range(self.__count)
+        ]
+
+    def wall_time(self, monotonic):
+        """Epoch time of a record timestamp"""
+        return monotonic + self.__wall_offset
+
+    def messages(self):
+        """
+        "HH:MM:SS: text" strings, oldest first. Formatted once per
+        generation; the same list is returned until the next change, so
+        treat it as read-only.
+        """
+        if self.__messages_generation != self.generation:
+            self.__messages = [
+                time.strftime("%H:%M:%S", time.localtime(self.wall_time(t)))
+                + ": "
+                + format_message(code, params)
+                for t, code, params in self.records()
+            ]
+            self.__messages_generation = self.generation
+        return self.__messages
@@ -0,0 +1,359 @@
+"""
+Doorway occupancy check before a scheduled close.
+
+A DoorwayGuard is AsyncGate's close check: when the schedule would close a
+gate it grabs a few frames from that gate's camera on a worker thread and
+holds the close while a DoorwayDetector sees a hen in the doorway, asking
+again every retry_delay seconds. After max_retries occupied checks the gate
+closes anyway (it has to close some time), with a warning. With several
+gates each checked gate has its own camera and doorway region ([[gates]]
+doorway_url and doorway_roi); the others close without a check.
+
+Most of a check's CPU goes to the camera, not to the analysis: grab_frames
+decodes the RTSP stream without a break for frames x frame_interval
+seconds (about 2 s by default, every frame the camera sends), since the
+stream cannot be skipped through without decoding. Only the frames kept
+are converted to BGR. The analysis works on a small grayscale grid: each
+frame is sampled down to `grid` cells (k x k pixels averaged per cell, luma
+taken as the green channel), so a 1280x720 frame costs well under a
+millisecond of NumPy and the analysis of a check a few milliseconds
+(benchmarks/bench_doorway.py, whose --url option times the grab too).
+Inside the doorway region (`roi`, fractions of the frame: left, top, right,
+bottom) it looks for
+
+    motion     cells changing by more than diff_threshold between
+               consecutive frames
+    presence   cells differing from the background model by more than
+               background_threshold, after removing the frame-wide
+               brightness change (dusk, clouds, the IR light)
+
+The background is the running average of frames from checks that found
+the doorway clear - before the first one, only motion counts.
+
+Needs NumPy (pip install chicken-gate[doorway]) and OpenCV to grab frames.
+"""
+
+import logging
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger("chicken-gate")
+
+# Defaults of the [doorway] settings
+FRAMES = 5  # frames per check
+FRAME_INTERVAL = 0.4  # seconds between them
+GRID = (36, 64)  # rows, columns of the downsampled frame
+ROI = (0.0, 0.0, 1.0, 1.0)  # doorway: left, top, right, bottom (fractions)
+DIFF_THRESHOLD = 12.0  # gray levels between frames
+MOTION_FRACTION = 0.02  # of doorway cells
+BACKGROUND_THRESHOLD = 25.0  # gray levels from the background
+PRESENCE_FRACTION = 0.05  # of doorway cells
+BACKGROUND_ALPHA = 0.3  # weight of a clear check in the background
+RETRY_DELAY = 60.0  # seconds
+MAX_RETRIES = 5
+
+SAMPLES = 4  # pixels sampled per cell in each direction
+
+# Seconds the close is held while a check runs
+CHECK_POLL = 0.5
+
+Occupancy = namedtuple("Occupancy", "occupied motion presence")
+
+
+def grab_frames(url, count=FRAMES, interval=FRAME_INTERVAL):
+    """`count` frames `interval` seconds apart from an RTSP stream (needs OpenCV)"""
+    import cv2
+
+    capture = cv2.VideoCapture(url)
+    try:
+        if not capture.isOpened():
+            raise OSError(f"cannot open the camera stream {url.split('@')[-1]}")
+        frames = []
+        next_frame = time.monotonic()
+        while len(frames) < count:
+            # keep reading: RTSP buffers frames. grab() decodes; only the
+            # frames kept pay for retrieve()'s conversion to BGR
+            ok = capture.grab()
+            if ok and time.monotonic() >= next_frame:
+                ok, frame = capture.retrieve()
+                if ok:
+                    frames.append(frame)
+                    next_frame += interval
+            if not ok:
+                raise OSError("no frame from the camera")
+        return frames
+    finally:
+        capture.release()
+
+
+class DoorwayDetector:
+    """Motion and presence in the doorway from a short sequence of frames"""
+
+    SETTINGS = (
+        "grid",
+        "roi",
+        "diff_threshold",
+        "motion_fraction",
+        "background_threshold",
+        "presence_fraction",
+        "background_alpha",
+    )
+
+    def __init__(
+        self,
+        grid=GRID,
+        roi=ROI,
+        diff_threshold=DIFF_THRESHOLD,
+        motion_fraction=MOTION_FRACTION,
+        background_threshold=BACKGROUND_THRESHOLD,
+        presence_fraction=PRESENCE_FRACTION,
+        background_alpha=BACKGROUND_ALPHA,
+    ):
+        rows, columns = grid
+        left, top, right, bottom = roi
+        if rows < 2 or columns < 2:
+            raise ValueError(f"grid {grid} too small")
+        if not (0 <= left < right <= 1 and 0 <= top < bottom <= 1):
+            raise ValueError(f"roi {roi} is not (left, top, right, bottom) in 0..1")
+        if not 0 < background_alpha <= 1:
+            raise ValueError("background_alpha must be in (0, 1]")
+        self.grid = (rows, columns)
+        self.window = (
+            slice(int(top * rows), max(int(top * rows) + 1, round(bottom * rows))),
+            slice(
+                int(left * columns),
+                max(int(left * columns) + 1, round(right * columns)),
+            ),
+        )
+        self.diff_threshold = diff_threshold
+        self.motion_fraction = motion_fraction
+        self.background_threshold = background_threshold
+        self.presence_fraction = presence_fraction
+        self.background_alpha = background_alpha
+        self.background = None
+        self.__indices = {}  # frame shape -> (row, column) sample indices
+
+    def downsample(self, frame):
+        """A frame (H x W gray or H x W x 3 BGR) as a float32 grid of cell means"""
+        import numpy as np
+
+        frame = np.asarray(frame)
+        if frame.ndim == 3:
+            frame = frame[:, :, 1]  # green: most of the luma, and free
+        shape = frame.shape
+        indices = self.__indices.get(shape)
+        if indices is None:
+            rows, columns = self.grid
+            height, width = shape
+            if height < rows or width < columns:
+                raise ValueError(f"frame {shape} smaller than the grid {self.grid}")
+            # SAMPLES evenly spaced pixels per cell in each direction
+            k = SAMPLES
+            y = (np.arange(rows * k) * height) // (rows * k)
+            x = (np.arange(columns * k) * width) // (columns * k)
+            indices = self.__indices[shape] = np.ix_(y, x)
+        rows, columns = self.grid
+        samples = frame[indices].astype(np.float32)
+        k = SAMPLES
+        return samples.reshape(rows, k, columns, k).mean(axis=(1, 3))
+
+    def check(self, frames):
+        """Occupancy of the doorway in a sequence of frames (at least two)"""
+        import numpy as np
+
+        if len(frames) < 2:
+            raise ValueError("need at least two frames")
+        grids = np.stack([self.downsample(frame) for frame in frames])
+        doorway = grids[(slice(None),) + self.window]
+        cells = doorway[0].size
+
+        # motion: cells that changed between any two consecutive frames
+        changed = np.abs(np.diff(doorway, axis=0)) > self.diff_threshold
+        motion = np.count_nonzero(changed.any(axis=0)) / cells
+
+        # presence: the doorway against the background, brightness change removed
+        presence = 0.0
+        latest = grids[-1]
+        if self.background is not None:
+            deviation = latest - self.background
+            deviation -= np.median(deviation)
+            away = np.abs(deviation[self.window]) > self.background_threshold
+            presence = np.count_nonzero(away) / cells
+
+        occupied = motion >= self.motion_fraction or presence >= self.presence_fraction
+        if not occupied:
+            self.learn(np.median(grids, axis=0))
+        return Occupancy(
+            bool(occupied), round(float(motion), 4), round(float(presence), 4)
+        )
+
+    def learn(self, grid):
+        """Blend a grid of the empty doorway into the background"""
+        if self.background is None:
+            self.background = grid.copy()
+        else:
+            self.background += self.background_alpha * (grid - self.background)
+
+
+class DoorwayGuard:
+    """AsyncGate close check: holds a scheduled close while the doorway is occupied"""
+
+    SETTINGS = (
+        "enabled",
+        "frames",
+        "frame_interval",
+        "retry_delay",
+        "max_retries",
+        "url",
+    ) + DoorwayDetector.SETTINGS
+
+    def __init__(
+        self,
+        grab=None,
+        detector=None,
+        frames=FRAMES,
+        frame_interval=FRAME_INTERVAL,
+        retry_delay=RETRY_DELAY,
+        max_retries=MAX_RETRIES,
+        cameras=None,
+    ):
+        """
+        `grab(count, interval)` returns `count` frames from the camera that
+        watches every gate; `cameras` maps gate ids to their own (grab,
+        detector) instead. Gates without a camera close unchecked.
+        """
+        if frames < 2:
+            raise ValueError("frames must be at least 2")
+        if retry_delay <= 0 or max_retries < 0:
+            raise ValueError("retry_delay must be positive, max_retries not negative")
+        self.detector = None if grab is None else detector or DoorwayDetector()
+        self.frames = frames
+        self.frame_interval = frame_interval
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.last = None  # Occupancy of the last check
+        self.__default = None if grab is None else (grab, self.detector)
+        self.__cameras = {
+            gate_id: (grab_, detector_ or DoorwayDetector())
+            for gate_id, (grab_, detector_) in (cameras or {}).items()
+        }
+        self.__checks = {}  # gate id -> {"result", "retries", "thread"}
+        self.__lock = threading.Lock()  # one check at a time: one decode
+
+    @classmethod
+    def from_settings(cls, settings, specs=None):
+        """
+        Guard for a [doorway] settings table, or None unless enabled. With
+        several gates (`specs`) only those whose [[gates]] table sets
+        doorway_roi or doorway_url are checked, each with its own camera.
+        """
+        from ..shared.captures import rtsp_url
+
+        unknown = set(settings) - set(cls.SETTINGS)
+        if unknown:
+            raise ValueError(f"unknown [doorway] keys: {sorted(unknown)}")
+        settings = dict(settings)
+        if not settings.pop("enabled", False):
+            return None
+        detector_settings = {
+            key: settings.pop(key)
+            for key in DoorwayDetector.SETTINGS
+            if key in settings
+        }
+        for key in ("grid", "roi"):  # TOML arrays
+            if key in detector_settings:
+                detector_settings[key] = tuple(detector_settings[key])
+        url = settings.pop("url", None) or rtsp_url()
+
+        def camera(spec=None):
+            roi = getattr(spec, "doorway_roi", None)
+            detector = DoorwayDetector(
+                **dict(detector_settings, **({"roi": roi} if roi else {}))
+            )
+            camera_url = getattr(spec, "doorway_url", None) or url
+
+            def grab(count, interval):
+                return grab_frames(camera_url, count, interval)
+
+            return grab, detector
+
+        specs = list(specs or ())
+        if len(specs) <= 1:
+            return cls(*camera(specs[0] if specs else None), **settings)
+        # one picture for every gate would hold them all for a hen at one door
+        cameras = {
+            spec.gate_id: camera(spec)
+            for spec in specs
+            if spec.doorway_roi is not None or spec.doorway_url is not None
+        }
+        if not cameras:
+            raise ValueError(
+                "with several gates, set doorway_roi or doorway_url in the"
+                " [[gates]] tables of the doorways to check"
+            )
+        return cls(cameras=cameras, **settings)
+
+    def __call__(self, gate_id):
+        """True to close now, or seconds to hold the close"""
+        camera = self.__cameras.get(gate_id, self.__default)
+        if camera is None:
+            return True  # no camera on this doorway
+        check = self.__checks.get(gate_id)
+        if check is None:
+            check = self.__checks[gate_id] = {"result": None, "retries": 0}
+        result = check["result"]
+        if result is None:
+            if "thread" not in check:
+                self.__start(check, camera)
+            return CHECK_POLL
+        retries = check["retries"]
+        if isinstance(result, Exception):
+            del self.__checks[gate_id]
+            logger.warning("Doorway check failed: %s - closing", result)
+            return True
+        if not result.occupied:
+            del self.__checks[gate_id]
+            if retries:
+                logger.info("Doorway clear after %d checks - closing", retries + 1)
+            return True
+        if retries >= self.max_retries:
+            del self.__checks[gate_id]
+            logger.warning(
+                "Doorway still occupied after %d checks (motion %.0f%%, presence"
+                " %.0f%%) - closing anyway",
+                retries + 1,
+                result.motion * 100,
+                result.presence * 100,
+            )
+            return True
+        logger.info(
+            "Doorway occupied (motion %.0f%%, presence %.0f%%) - holding the %s"
+            " close %.0f s",
+            result.motion * 100,
+            result.presence * 100,
+            gate_id,
+            self.retry_delay,
+        )
+        # check again once the delay is up
+        self.__checks[gate_id] = {"result": None, "retries": retries + 1}
+        return self.retry_delay
+
+    def __start(self, check, camera):
+        """Run a check on a worker thread; its result lands in check["result"]"""
+        grab, detector = camera
+
+        def run():
+            try:
+                with self.__lock:
+                    frames = grab(self.frames, self.frame_interval)
+                    result = detector.check(frames)
+                self.last = result
+            except Exception as e:  # OpenCV and RTSP fail in many ways
+                result = e
+            check["result"] = result
+
+        check["thread"] = thread = threading.Thread(
+            target=run, name="doorway", daemon=True
+        )
+        thread.start()
@@ -0,0 +1,119 @@
+"""
+Single-process mode: the web interface on a worker thread of the gate process.
+
+The gate runtime publishes a complete status dict on every change by
+swapping one reference, so web requests read it without taking a lock the loop could
+wait on. Commands from the web go into an in-process deque that the loop
+drains when the web thread wakes it. Both are single atomic operations under
+the GIL, so a slow or stalled HTTP client can hold up its own request thread
+but never Gate_drv.tick().
+"""
+
+import threading
+from collections import deque
+
+from ..shared.config import DEFAULT_GATE_ID
+
+# Commands waiting for the gate loop; more than this and the web gets an error
+MAX_PENDING_COMMANDS = 32
+
+
+class StatusSnapshot:
+    """Latest gate status, replaced wholesale by the gate loop"""
+
+    def __init__(self):
+        self.__status = None
+
+    def publish(self, status):
+        # a single reference store - readers see the old or the new dict
+        self.__status = status
+
+    def get(self):
+        return self.__status
+
+
+class EmbeddedBackend:
+    """
+    Status and commands for the web app when it runs inside the gate process.
+    Each gate has its own snapshot; `snapshot` is the default gate's.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING_COMMANDS, default_gate=DEFAULT_GATE_ID):
+        self.snapshot = StatusSnapshot()
+        self.default_gate = default_gate
+        self.__snapshots = {default_gate: self.snapshot}
+        self.__commands = deque()
+        self.__max_pending = max_pending
+        self.__waker = None
+
+    def set_waker(self, waker):
+        """`waker()` is called (from the web thread) after a command is queued"""
+        self.__waker = waker
+
+    def snapshot_for(self, gate_id):
+        """The snapshot a gate's status is published to (created on first use)"""
+        snapshot = self.__snapshots.get(gate_id)
+        if snapshot is None:
+            snapshot = self.__snapshots[gate_id] = StatusSnapshot()
+        return snapshot
+
+    def gate_ids(self):
+        """Ids of the gates, the default gate first"""
+        return list(self.__snapshots)
+
+    def get_status(self, gate_id=None):
+        """Copy of a gate's latest status (None before the first tick)"""
+        snapshot = self.__snapshots.get(
+            self.default_gate if gate_id is None else gate_id
+        )
+        status = snapshot.get() if snapshot is not None else None
+        return dict(status) if status is not None else None
+
+    def send_command(self, command, gate_id=None):
+        """Queue a command for the gate loop; False if too many are waiting"""
+        if len(self.__commands) >= self.__max_pending:
+            return False
+        self.__commands.append(command if gate_id is None else (gate_id, command))
+        if self.__waker is not None:
+            self.__waker()
+        return True
+
+    def pending_commands(self):
+        """
+        Take the queued commands, oldest first (called by the gate loop):
+        command strings for the default gate, (gate id, command) otherwise
+        """
+        commands = self.__commands
+        while commands:
+            yield commands.popleft()
+
+
+def start_web(backend, port, profile="full", server_settings=None):
+    """
+    Serve the web app from a daemon thread, backed by `backend`: with the
+    production WSGIServer when given its [web] settings table (stopped
+    gracefully at exit), otherwise with Flask's development server
+    """
+    from ..web.app import app
+
+    app.config["GATE_BACKEND"] = backend
+    app.config["MEMORY_PROFILE"] = profile
+    if server_settings is not None:
+        import atexit
+
+        from ..web.server import WSGIServer
+
+        server = WSGIServer.from_settings(app, server_settings, port=port)
+        atexit.register(server.shutdown)
+        target, kwargs = server.serve_forever, {}
+    else:
+        target = app.run
+        kwargs = {
+            "host": "0.0.0.0",  # nosec B104
+            "port": port,
+            "threaded": True,
+            "use_reloader": False,
+        }
+    thread = threading.Thread(target=target, kwargs=kwargs, name="web", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,276 @@
+"""
+Vectorized fleet simulator.
+
+Struct-of-arrays re-implementation of the Gate.tick() state machine. Every
+per-gate attribute of Gate (position, target, motion command, switch inputs,
+flags and errors) is held in a NumPy array so that thousands of gates can be
+advanced with one set of array operations per tick.
+
+The arithmetic mirrors Gate.tick() operation for operation, so a FleetSim fed
+the same inputs as a list of Gate objects produces bit-identical positions and
+the same command transitions, errors and alerts.
+
+NumPy is an optional dependency: pip install -e .[sim]
+"""
+
+import numpy as np
+
+from .gate_cmd import Cmd
+
+STOP = Cmd.STOP.value
+CLOSE = Cmd.CLOSE.value
+OPEN = Cmd.OPEN.value
+
+# Closed switch activates at ~95% closed (same model as the mock driver)
+CLOSED_SWITCH_POSN = 95
+
+# Error bit flags - one per error raised by Gate.tick()
+ERR_SWITCH_BELOW_90 = 1
+ERR_CLOSE_NO_SWITCH = 2
+ERR_OPEN_SWITCH_PRESSED = 4
+
+ERROR_MESSAGES = {
+    ERR_SWITCH_BELOW_90: "gate position is below 90 but closed switch is pressed",
+    ERR_CLOSE_NO_SWITCH: "gate finished closing but closed switch is not pressed",
+    ERR_OPEN_SWITCH_PRESSED: "gate finished opening but closed switch is still pressed",
+}
+
+SECONDS_PER_DAY = 86400
+
+# Re-gather the moving subset of the fleet at least this often (in ticks)
+COMPACT_EVERY = 64
+BUSY_CHECK_EVERY = 8
+
+# Per-gate arrays, in the order they are declared in FleetSim.__init__
+_STATE = (
+    "posn",
+    "posn_cmd",
+    "open_rate",
+    "close_rate",
+    "motion_cmd",
+    "closed_switch",
+    "open_switch",
+    "open_disabled",
+    "manual_stop",
+    "errors",
+    "alert_count",
+    "transition_count",
+)
+
+
+class FleetSim:
+    """N gates advanced together, one array element per gate"""
+
+    def __init__(self, n, init_posn=100, open_time=310, close_time=420):
+        self.n = n
+        self.posn = np.full(n, init_posn, dtype=np.float64)
+        self.posn_cmd = np.full(n, 100, dtype=np.float64)
+        self.open_rate = 100 / np.broadcast_to(
+            np.asarray(open_time, dtype=np.float64), (n,)
+        )
+        self.close_rate = 100 / np.broadcast_to(
+            np.asarray(close_time, dtype=np.float64), (n,)
+        )
+        self.motion_cmd = np.full(n, STOP, dtype=np.int8)
+        self.closed_switch = np.zeros(n, dtype=bool)
+        self.open_switch = np.zeros(n, dtype=bool)
+        self.open_disabled = np.zeros(n, dtype=bool)
+        self.manual_stop = np.zeros(n, dtype=bool)
+        self.errors = np.zeros(n, dtype=np.uint8)
+
+        # Counters standing in for Gate's side effects
+        self.alert_count = np.zeros(n, dtype=np.int32)  # send_email() calls
+        self.transition_count = np.zeros(n, dtype=np.int32)  # motion cmd changes
+
+        self.__step_cache = {}
+
+    # -- inputs -------------------------------------------------------------
+
+    def set_closed_switch(self, pressed, mask=None):
+        self.closed_switch[self.__select(mask)] = pressed
+
+    def set_open_switch(self, pressed, mask=None):
+        self.open_switch[self.__select(mask)] = pressed
+
+    def simulate_switches(self):
+        """Drive the closed switch from position, like the mock driver does"""
+        np.greater_equal(self.posn, CLOSED_SWITCH_POSN, out=self.closed_switch)
+
+    # -- commands (same semantics as the Gate methods) ----------------------
+
+    def open(self, mask=None):
+        sel = self.__select(mask)
+        self.manual_stop[sel] = False
+        accepted = np.zeros(self.n, dtype=bool)
+        accepted[sel] = True
+        accepted &= ~self.open_disabled
+        self.posn_cmd[accepted] = 0
+
+    def close(self, mask=None):
+        sel = self.__select(mask)
+        self.manual_stop[sel] = False
+        self.posn_cmd[sel] = 100
+
+    def stop(self, mask=None):
+        sel = self.__select(mask)
+        self.manual_stop[sel] = True
+        self.__set_cmd(sel, STOP)
+
+    def reset_posn_to(self, posn, mask=None):
+        sel = self.__select(mask)
+        self.posn[sel] = np.clip(posn, 0, 100)
+        self.posn_cmd[sel] = self.posn[sel]
+
+    def clear_errors(self, mask=None):
+        sel = self.__select(mask)
+        self.errors[sel] = 0
+        self.open_disabled[sel] = False
+
+    # -- state machine ------------------------------------------------------
+
+    def tick(self, elapsed_time=0.1):
+        """Advance every gate by one Gate.tick()"""
+        posn = self.posn
+        cmd = self.motion_cmd
+
+        # update position based on movement
+        np.maximum(posn, 90, out=posn, where=self.closed_switch)
+        close_step, open_step = self.__steps(elapsed_time)
+        step = np.where(cmd == OPEN, open_step, close_step)
+        np.copyto(step, 0.0, where=cmd == STOP)
+        moved = posn + step
+        np.clip(moved, 0, 100, out=moved)
+        np.copyto(moved, 0.0, where=self.open_switch)
+        np.copyto(posn, moved)
+
+        # update state
+        want_open = self.posn_cmd < posn
+        want_close = self.posn_cmd > posn
+        active = ~self.manual_stop
+
+        opening = want_open & ~self.open_disabled & active
+        fault = opening & (posn < 90) & self.closed_switch
+        if fault.any():
+            opening &= ~fault
+            self.open_disabled |= fault
+            self.__raise(fault, ERR_SWITCH_BELOW_90)
+
+        stopping = (cmd != STOP) & ~(want_open | want_close) & active
+        if stopping.any():
+            self.__raise(
+                stopping & (cmd == CLOSE) & ~self.closed_switch, ERR_CLOSE_NO_SWITCH
+            )
+            self.__raise(
+                stopping & (cmd == OPEN) & self.closed_switch, ERR_OPEN_SWITCH_PRESSED
+            )
+
+        new_cmd = opening.view(np.int8) * np.int8(OPEN)
+        new_cmd |= (want_close & active).view(np.int8) * np.int8(CLOSE)
+
+        self.transition_count += new_cmd != cmd
+        np.copyto(cmd, new_cmd)
+
+    def is_busy(self):
+        """True if a tick could change any gate, i.e. some gate still has to move"""
+        return bool(np.any(self.__busy_mask()))
+
+    def __busy_mask(self):
+        pending = (self.posn_cmd > self.posn) | (
+            (self.posn_cmd < self.posn) & ~self.open_disabled
+        )
+        return (self.motion_cmd != STOP) | (pending & ~self.manual_stop)
+
+    def run_days(self, open_s, close_s, days=1, elapsed_time=1.0, switches=True):
+        """
+        Simulate whole days of scheduled operation.
+
+        open_s / close_s are seconds since midnight of each gate's scheduled
+        open and close, either per gate (shape (n,)) or per day and gate
+        (shape (days, n)). An idle gate's tick leaves its state unchanged and
+        gates do not interact, so between events only the gates that are
+        still moving are ticked. Returns the number of gate-ticks executed.
+        """
+        open_s = np.broadcast_to(np.asarray(open_s, dtype=np.float64), (days, self.n))
+        close_s = np.broadcast_to(np.asarray(close_s, dtype=np.float64), (days, self.n))
+        ticks_per_day = int(round(SECONDS_PER_DAY / elapsed_time))
+        gate_ticks = 0
+
+        for day in range(days):
+            open_tick = np.rint(open_s[day] / elapsed_time).astype(np.int64)
+            close_tick = np.rint(close_s[day] / elapsed_time).astype(np.int64)
+            now = 0
+            for event in np.unique(np.concatenate((open_tick, close_tick))):
+                gate_ticks += self.__advance(int(event) - now, elapsed_time, switches)
+                now = int(event)
+                self.close(close_tick == event)
+                self.open(open_tick == event)
+            gate_ticks += self.__advance(ticks_per_day - now, elapsed_time, switches)
+
+        return gate_ticks
+
+    def __advance(self, ticks, elapsed_time, switches):
+        """Tick the busy gates for up to `ticks` ticks, compacting as they settle"""
+        gate_ticks = 0
+        while ticks > 0:
+            busy = np.flatnonzero(self.__busy_mask())
+            if busy.size == 0:
+                break
+            sub = self.__take(busy)
+            batch = min(ticks, COMPACT_EVERY)
+            ran = 0
+            # idle ticks are no-ops, so checking for idleness every few ticks
+            # is exact and saves the check on most ticks
+            while ran < batch and (ran % BUSY_CHECK_EVERY or sub.is_busy()):
+                if switches:
+                    sub.simulate_switches()
+                sub.tick(elapsed_time)
+                ran += 1
+            self.__put(busy, sub)
+            gate_ticks += ran * busy.size
+            ticks -= ran
+            if ran < batch:
+                break
+        if switches:
+            self.simulate_switches()
+        return gate_ticks
+
+    # -- helpers ------------------------------------------------------------
+
+    def error_messages(self, i):
+        """Error messages for gate i, as Gate.get_errors() would list them"""
+        return [msg for bit, msg in ERROR_MESSAGES.items() if self.errors[i] & bit]
+
+    def __raise(self, mask, bit):
+        np.bitwise_or(self.errors, bit, out=self.errors, where=mask)
+        self.alert_count += mask
+
+    def __steps(self, elapsed_time):
+        """Position deltas per tick while closing and while opening"""
+        steps = self.__step_cache.get(elapsed_time)
+        if steps is None:
+            steps = (elapsed_time * self.close_rate, -(elapsed_time * self.open_rate))
+            self.__step_cache[elapsed_time] = steps
+        return steps
+
+    def __set_cmd(self, sel, value):
+        changed = np.zeros(self.n, dtype=bool)
+        changed[sel] = True
+        changed &= self.motion_cmd != value
+        self.transition_count += changed
+        self.motion_cmd[changed] = value
+
+    def __take(self, idx):
+        sub = FleetSim.__new__(FleetSim)
+        sub.n = len(idx)
+        sub.__step_cache = {}
+        for name in _STATE:
+            setattr(sub, name, getattr(self, name)[idx])
+        return sub
+
+    def __put(self, idx, sub):
+        for name in _STATE:
+            getattr(self, name)[idx] = getattr(sub, name)
+
+    @staticmethod
+    def __select(mask):
+        return slice(None) if mask is None else mask
@@ -1,16 +1,206 @@
 import logging
+from collections import namedtuple
 
-from .email_me import send_email
+from .diagnostics import MESSAGES, DiagnosticLog, format_message
 from .gate_cmd import Cmd
 
-# Configure logging for system journal
-logging.basicConfig(level=logging.INFO, format="%(name)s: %(message)s")
+# System journal logging - configured by shared.logs.setup_logging()
 logger = logging.getLogger("chicken-gate")
 
 
+def send_email(body, subject="Chicken Gate Notification"):
+    """Send an alert email; email_me (toml, smtplib, ssl) loads on first use"""
+    from . import email_me
+
+    return email_me.send_email(body, subject)
+
+
+# Alerts raised by the state machine: an "ERROR:" diagnostic, an email and an
+# entry in the error list
+SWITCH_BELOW_90 = "gate position is below 90 but closed switch is pressed"
+CLOSED_WITHOUT_SWITCH = "gate finished closing but closed switch is not pressed"
+OPENED_WITH_SWITCH = "gate finished opening but closed switch is still pressed"
+
+# A transition: the next motion command, its side effects in order - each a
+# (diagnostic code, params, alert or None) triple - and whether it disables
+# opening
+Transition = namedtuple("Transition", ["motion", "effects", "disable_open"])
+
+
+def _diag(code):
+    return (code, (), None)
+
+
+def _alert(msg):
+    return ("error", (msg,), msg)
+
+
+_MOVING = (Cmd.OPEN, Cmd.CLOSE)
+
+# Control rules, first match wins. Conditions are on the current motion, the
+# way the position command lies from the position ("target": OPEN, CLOSE or
+# STOP when there), the closed switch, the open_disabled and manual_stop
+# flags, and whether the position is below 90. A condition is a value or a
+# tuple of accepted values; a missing one matches anything.
+TRANSITION_RULES = (
+    (
+        {"manual_stop": True, "motion": _MOVING},
+        Transition(Cmd.STOP, (_diag("manual_stop"),), False),
+    ),
+    ({"manual_stop": True}, Transition(Cmd.STOP, (), False)),
+    # don't allow opening if disabled due to error
+    ({"target": Cmd.OPEN, "open_disabled": True}, Transition(Cmd.STOP, (), False)),
+    (
+        {
+            "target": Cmd.OPEN,
+            "closed_switch": True,
+            "below_90": True,
+            "motion": Cmd.OPEN,
+        },
+        Transition(Cmd.STOP, (_alert(SWITCH_BELOW_90),), True),
+    ),
+    (
+        {"target": Cmd.OPEN, "closed_switch": True, "below_90": True},
+        Transition(
+            Cmd.STOP,
+            (_diag("entering_open"), _alert(SWITCH_BELOW_90)),
+            True,
+        ),
+    ),
+    ({"target": Cmd.OPEN, "motion": Cmd.OPEN}, Transition(Cmd.OPEN, (), False)),
+    (
+        {"target": Cmd.OPEN},
+        Transition(Cmd.OPEN, (_diag("entering_open"),), False),
+    ),
+    ({"target": Cmd.CLOSE, "motion": Cmd.CLOSE}, Transition(Cmd.CLOSE, (), False)),
+    (
+        {"target": Cmd.CLOSE},
+        Transition(Cmd.CLOSE, (_diag("entering_close"),), False),
+    ),
+    ({"target": Cmd.STOP, "motion": Cmd.STOP}, Transition(Cmd.STOP, (), False)),
+    (
+        {"target": Cmd.STOP, "motion": Cmd.CLOSE, "closed_switch": False},
+        Transition(
+            Cmd.STOP,
+            (_diag("entering_stop"), _alert(CLOSED_WITHOUT_SWITCH)),
+            False,
+        ),
+    ),
+    (
+        {"target": Cmd.STOP, "motion": Cmd.OPEN, "closed_switch": True},
+        Transition(
+            Cmd.STOP,
+            (_diag("entering_stop"), _alert(OPENED_WITH_SWITCH)),
+            False,
+        ),
+    ),
+    (
+        {"target": Cmd.STOP},
+        Transition(Cmd.STOP, (_diag("entering_stop"),), False),
+    ),
+)
+
+# Key fields and their values, most significant first
+KEY_FIELDS = (
+    ("motion", (Cmd.STOP, Cmd.CLOSE, Cmd.OPEN)),
+    ("target", (Cmd.STOP, Cmd.CLOSE, Cmd.OPEN)),
+    ("closed_switch", (False, True)),
+    ("open_disabled", (False, True)),
+    ("manual_stop", (False, True)),
+    ("below_90", (False, True)),
+)
+
+
+def table_index(motion, target, closed_switch, open_disabled, manual_stop, below_90):
+    """Index into the transition table (Cmd values, bools)"""
+    return (
+        motion * 48
+        + target * 16
+        + closed_switch * 8
+        + open_disabled * 4
+        + manual_stop * 2
+        + below_90
+    )
+
+
+def iter_keys():
+    """Every state machine key as a dict of KEY_FIELDS values"""
+    keys = [{}]
+    for name, values in KEY_FIELDS:
+        keys = [dict(key, **{name: value}) for key in keys for value in values]
+    return keys
+
+
+def _matches(when, key):
+    for name, accepted in when.items():
+        accepted = accepted if isinstance(accepted, tuple) else (accepted,)
+        if key[name] not in accepted:
+            return False
+    return True
+
+
+def compile_transitions(rules=TRANSITION_RULES):
+    """
+    Flatten the rules into a tuple indexed by table_index(). Each entry is
+    (motion Cmd, motion value, effects, disable_open). Raises ValueError if
+    a key matches no rule.
+    """
+    table = [None] * (3 * 3 * 2 * 2 * 2 * 2)
+    for key in iter_keys():
+        for when, transition in rules:  # noqa: B007 - used after the break
+            if _matches(when, key):
+                break
+        else:
+            raise ValueError(f"No transition rule matches {key}")
+        index = table_index(
+            key["motion"].value,
+            key["target"].value,
+            key["closed_switch"],
+            key["open_disabled"],
+            key["manual_stop"],
+            key["below_90"],
+        )
+        table[index] = (
+            transition.motion,
+            transition.motion.value,
+            transition.effects,
+            transition.disable_open,
+        )
+    return tuple(table)
+
+
+_TRANSITIONS = compile_transitions()
+
+_OPEN = Cmd.OPEN.value
+_CLOSE = Cmd.CLOSE.value
+_STOP = Cmd.STOP.value
+
+
 class Gate:
-    def __init__(self, init_posn=100, open_time=310, close_time=420):
+    __slots__ = (
+        "__motion_cmd",
+        "__motion",
+        "__closed_switch_pressed",
+        "__open_switch_pressed",
+        "__posn",
+        "__posn_cmd",
+        "__open_rate",
+        "__close_rate",
+        "__errors",
+        "__open_disabled",
+        "__diagnostics",
+        "__manual_stop",
+        "__gate_id",
+        "__clock",
+        "__travel",
+        "__alert",
+    )
+
+    def __init__(
+        self, init_posn=100, open_time=310, close_time=420, gate_id=None, travel=None
+    ):
         self.__motion_cmd = Cmd.STOP
+        self.__motion = _STOP  # value of __motion_cmd, for the table index
         self.__closed_switch_pressed = False
         self.__open_switch_pressed = False
         self.__posn: float = init_posn
@@ -19,8 +209,53 @@ class Gate:
         self.__close_rate: float = 100 / close_time
         self.__errors = []  # List to store error messages
         self.__open_disabled = False  # Flag to disable opening when error occurs
-        self.__diagnostic_messages = []  # List to store diagnostic/status messages
+        self.__diagnostics = DiagnosticLog()  # recent diagnostic/status records
         self.__manual_stop = False  # Flag for manual stop command
+        self.__gate_id = gate_id  # GATE_ID of log records (None: the default)
+        self.__clock = 0.0  # elapsed time of the ticks spent moving
+        self.__travel = None  # TravelMonitor timing the travels, if any
+        self.__alert = None  # sends the alert emails (None: send_email)
+        if travel is not None:
+            self.set_travel_monitor(travel)
+
+    @property
+    def gate_id(self):
+        return self.__gate_id
+
+    @property
+    def travel(self):
+        """The TravelMonitor attached by set_travel_monitor(), or None"""
+        return self.__travel
+
+    def set_travel_monitor(self, travel):
+        """
+        Time the travels with `travel` (a travel.TravelMonitor); the current
+        open and close times are its nominal ones
+        """
+        travel.nominal = {
+            "open": 100 / self.__open_rate,
+            "close": 100 / self.__close_rate,
+        }
+        self.__travel = travel
+        self.__calibrate()
+
+    def set_alert_sink(self, sink):
+        """
+        Send the alert emails with `sink(body)` instead of send_email() - which
+        blocks tick() until the mail server answers. None sends them inline.
+        """
+        self.__alert = sink
+
+    def get_travel_times(self):
+        """(open seconds, close seconds) of a full travel, as now estimated"""
+        return 100 / self.__open_rate, 100 / self.__close_rate
+
+    def set_travel_times(self, open_time=None, close_time=None):
+        """Change the full travel times the position estimate uses"""
+        if open_time is not None:
+            self.__open_rate = 100 / open_time
+        if close_time is not None:
+            self.__close_rate = 100 / close_time
 
     def get_cmd(self) -> Cmd:
         return self.__motion_cmd
@@ -50,21 +285,31 @@ class Gate:
         self.__errors.clear()
         self.__open_disabled = False
         if error_count > 0:
-            self.__add_diagnostic(
-                f"cleared {error_count} error(s) - gate opening re-enabled"
-            )
+            self.__add_diagnostic("cleared_errors", error_count)
 
     def get_diagnostic_messages(self) -> list:
         """Returns list of recent diagnostic messages for website display"""
-        return self.__diagnostic_messages.copy()
+        return list(self.__diagnostics.messages())
+
+    def get_diagnostic_records(self) -> list:
+        """Recent diagnostics as (monotonic time, code, params), oldest first"""
+        return self.__diagnostics.records()
+
+    def get_diagnostics_generation(self) -> int:
+        """Changes whenever a diagnostic is added or the list is cleared"""
+        return self.__diagnostics.generation
 
     def clear_diagnostic_messages(self):
         """Clear diagnostic messages"""
-        self.__diagnostic_messages.clear()
-
-    def get_status(self) -> dict:
-        """Returns comprehensive status for website API"""
-        return {
+        self.__diagnostics.clear()
+
+    def get_status(self, diagnostics=True) -> dict:
+        """
+        Returns comprehensive status for website API. With diagnostics=False
+        the formatted messages are left out; diagnostics_generation still
+        says whether they changed.
+        """
+        status = {
             "position": self.__posn,
             "target_position": self.__posn_cmd,
             "is_opening": self.is_opening(),
@@ -74,80 +319,110 @@ class Gate:
             "closed_switch_pressed": self.__closed_switch_pressed,
             "open_switch_pressed": self.__open_switch_pressed,
             "errors": self.get_errors(),
-            "diagnostic_messages": self.get_diagnostic_messages(),
+            "diagnostics_generation": self.__diagnostics.generation,
         }
+        if diagnostics:
+            # shared until the next change - not copied per status
+            status["diagnostic_messages"] = self.__diagnostics.messages()
+        return status
+
+    def get_state(self) -> dict:
+        """State to carry across a restart (see checkpoint.py)"""
+        state = {
+            "position": self.__posn,
+            "target_position": self.__posn_cmd,
+            "motion": self.__motion_cmd.name,
+            "open_disabled": self.__open_disabled,
+            "manual_stop": self.__manual_stop,
+            "errors": list(self.__errors),
+        }
+        if self.__travel is not None:
+            state["travel"] = self.__travel.get_state()
+        return state
+
+    def restore_state(self, state):
+        """
+        Restore get_state() output. The gate starts stopped; motion towards
+        the restored target resumes on the next tick.
+        """
+        posn, posn_cmd = state["position"], state["target_position"]
+        self.__posn = Gate.__clamp(posn, 0, 100)
+        self.__posn_cmd = Gate.__clamp(posn_cmd, 0, 100)
+        self.__motion_cmd = Cmd.STOP
+        self.__motion = _STOP
+        self.__open_disabled = bool(state.get("open_disabled", False))
+        self.__manual_stop = bool(state.get("manual_stop", False))
+        self.__errors = list(state.get("errors", ()))
+        if self.__travel is not None:
+            self.__travel.restore_state(state.get("travel", {}))
+            self.__calibrate()
+        self.__add_diagnostic("state_restored", self.__posn, self.__posn_cmd)
 
     def tick(self, elapsed_time=0.1):
         # update position based on movement
-        if self.__closed_switch_pressed:
-            self.__posn = max(90, self.__posn)
+        posn = self.__posn
+        if self.__closed_switch_pressed and posn <= 90:
+            posn = 90
 
         if self.__open_switch_pressed:
-            self.__posn = 0
+            posn = 0
         else:
-            if self.__motion_cmd == Cmd.OPEN:
-                self.__posn -= elapsed_time * self.__open_rate
-            if self.__motion_cmd == Cmd.CLOSE:
-                self.__posn += elapsed_time * self.__close_rate
-
-            self.__posn = Gate.__clamp(self.__posn, 0, 100)
-
-        # update target position (rx cmds)
-
-        # Check for manual stop first - overrides all other control
-        if self.__manual_stop:
-            if self.__motion_cmd != Cmd.STOP:
-                self.__add_diagnostic("gate entering STOP state (manual stop)")
-            self.__motion_cmd = Cmd.STOP
-            return  # Skip normal control logic
-
-        # update state
-        if self.__posn_cmd < self.__posn:
-            # Don't allow opening if disabled due to error
-            if self.__open_disabled:
-                self.__motion_cmd = Cmd.STOP
-            else:
-                if self.__motion_cmd is not Cmd.OPEN:
-                    self.__add_diagnostic("gate entering OPEN state")
-                self.__motion_cmd = Cmd.OPEN
-
-                if self.get_posn() < 90 and self.__closed_switch_pressed:
-                    msg: str = "gate position is below 90 but closed switch is pressed"
-                    self.__add_diagnostic(f"ERROR: {msg}")
-                    send_email(msg)
-                    self.__add_error(msg)
-                    self.__open_disabled = True  # Disable opening
-                    self.__motion_cmd = Cmd.STOP  # Stop immediately
-        elif self.__posn_cmd > self.__posn:
-            if self.__motion_cmd is not Cmd.CLOSE:
-                self.__add_diagnostic("gate entering CLOSE state")
-            self.__motion_cmd = Cmd.CLOSE
+            if self.__motion == _OPEN:
+                posn -= elapsed_time * self.__open_rate
+                self.__clock += elapsed_time
+            elif self.__motion == _CLOSE:
+                posn += elapsed_time * self.__close_rate
+                self.__clock += elapsed_time
+
+            if posn < 0:
+                posn = 0
+            elif posn > 100:
+                posn = 100
+        self.__posn = posn
+
+        # update state from the transition table
+        motion = self.__motion
+        posn_cmd = self.__posn_cmd
+        if posn_cmd < posn:
+            target = _OPEN
+        elif posn_cmd > posn:
+            target = _CLOSE
         else:
-            if self.__motion_cmd is not Cmd.STOP:
-                self.__add_diagnostic("gate entering STOP state")
-
-                # alert if finished closing but closed switch is not pressed
-                if self.__motion_cmd == Cmd.CLOSE and not self.__closed_switch_pressed:
-                    msg: str = "gate finished closing but closed switch is not pressed"
-                    self.__add_diagnostic(f"ERROR: {msg}")
-                    send_email(msg)
-                    self.__add_error(msg)
-
-                # alert if finished opening but closed switch is still pressed
-                if self.__motion_cmd == Cmd.OPEN and self.__closed_switch_pressed:
-                    msg: str = (
-                        "gate finished opening but closed switch is still pressed"
-                    )
-                    self.__add_diagnostic(f"ERROR: {msg}")
-                    send_email(msg)
-                    self.__add_error(msg)
-
-            self.__motion_cmd = Cmd.STOP
+            target = _STOP
+        self.__motion_cmd, self.__motion, effects, disable_open = _TRANSITIONS[
+            motion * 48
+            + target * 16
+            + self.__closed_switch_pressed * 8
+            + self.__open_disabled * 4
+            + self.__manual_stop * 2
+            + (posn < 90)
+        ]
+        if self.__motion != motion and self.__travel is not None:
+            self.__travel_motion(motion)
+        for code, params, alert in effects:
+            self.__add_diagnostic(code, *params)
+            if alert is not None:
+                self.__send_alert(alert)
+                self.__add_error(alert)
+        if disable_open:
+            self.__open_disabled = True  # disable opening
 
     def set_closed_switch(self, gate_closed_switch):
+        if (
+            gate_closed_switch
+            and not self.__closed_switch_pressed
+            and self.__travel is not None
+        ):
+            self.__travel_end("close")
         self.__closed_switch_pressed = gate_closed_switch
 
     def set_open_switch(self, gate_open_switch):
+        if (
+            gate_open_switch
+            and not self.__open_switch_pressed
+            and self.__travel is not None
+        ):
+            self.__travel_end("open")
         self.__open_switch_pressed = gate_open_switch
 
     def open(self):
@@ -155,45 +430,84 @@ class Gate:
         self.__manual_stop = False  # Clear manual stop
         if not self.__open_disabled:
             self.__posn_cmd = 0
-            self.__add_diagnostic("gate open command received")
+            self.__add_diagnostic("open_received")
         else:
-            self.__add_diagnostic("gate open command rejected - errors present")
+            self.__add_diagnostic("open_rejected")
 
     def close(self):
         self.__manual_stop = False  # Clear manual stop
         self.__posn_cmd = 100
-        self.__add_diagnostic("gate close command received")
+        self.__add_diagnostic("close_received")
 
     def reset_posn_to(self, posn):
         self.__posn = Gate.__clamp(posn, 0, 100)
         self.__posn_cmd = self.__posn
-        self.__add_diagnostic(f"position reset to {self.__posn}")
+        if self.__travel is not None:
+            self.__travel.abort()  # the start position was wrong
+        self.__add_diagnostic("position_reset", self.__posn)
 
     def stop(self):
         """Stop gate movement immediately and hold position"""
         self.__manual_stop = True
         self.__motion_cmd = Cmd.STOP
-        self.__add_diagnostic("gate stop command received - manual stop engaged")
+        self.__motion = _STOP
+        if self.__travel is not None:
+            self.__travel.abort()
+        self.__add_diagnostic("stop_received")
+
+    def __travel_motion(self, previous):
+        """The motion changed: a travel starts, or one ends short of a switch"""
+        if self.__motion == _STOP:
+            if previous == _CLOSE and self.__posn >= 100:
+                self.__travel_end("close", reached=False)  # ran out
+            else:
+                self.__travel.abort()
+        else:
+            direction = "open" if self.__motion == _OPEN else "close"
+            self.__travel.start(direction, self.__clock, self.__posn)
+
+    def __travel_end(self, direction, reached=True):
+        """A switch was reached (or not): count the travel and act on it"""
+        travel = self.__travel.finish(direction, self.__clock, reached)
+        if travel is None:
+            return
+        if travel.trend is not None:
+            self.__add_diagnostic("travel_trend", *travel.trend)
+            self.__send_alert(format_message("travel_trend", travel.trend))
+        self.__calibrate()
+
+    def __calibrate(self):
+        """With calibrate on, take the travel times from the statistics"""
+        if not self.__travel.calibrate:
+            return
+        open_time = self.__travel.calibrated_time("open")
+        close_time = self.__travel.calibrated_time("close")
+        if open_time is None and close_time is None:
+            return
+        self.set_travel_times(open_time, close_time)
+        logger.debug(
+            "Travel times calibrated: open %.1f s, close %.1f s",
+            *self.get_travel_times(),
+            extra={"gate_id": self.__gate_id},
+        )
+
+    def __send_alert(self, body):
+        """Email an alert, through the alert sink if one is set"""
+        (self.__alert or send_email)(body)
 
     def __add_error(self, error_msg: str):
         """Add an error message to the error list"""
         if error_msg not in self.__errors:
             self.__errors.append(error_msg)
 
-    def __add_diagnostic(self, diagnostic_msg: str):
-        """Add a diagnostic message to the diagnostic list (keep last 20) and log to system"""
-        from datetime import datetime
-
-        timestamped_msg = f"{datetime.now().strftime('%H:%M:%S')}: {diagnostic_msg}"
-        self.__diagnostic_messages.append(timestamped_msg)
-
-        # Keep only the last 20 messages to prevent memory buildup
-        if len(self.__diagnostic_messages) > 20:
-            self.__diagnostic_messages.pop(0)
-
-        # Print to console and log to system journal
-        print(timestamped_msg)
-        logger.info(diagnostic_msg)
+    def __add_diagnostic(self, code, *params):
+        """Record a diagnostic (see diagnostics.MESSAGES) and log it to the system"""
+        self.__diagnostics.append(code, params)
+        logger.info(
+            MESSAGES[code],
+            *params,
+            extra={"code": code, "position": self.__posn, "gate_id": self.__gate_id},
+        )
 
     @staticmethod
     def __clamp(n, min, max):
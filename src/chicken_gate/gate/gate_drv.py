@@ -1,19 +1,38 @@
+import logging
+import time
+
 import RPi.GPIO as GPIO
 
 from .gate import Gate
 from .gate_cmd import Cmd
+from .switch import DEFAULT_DEBOUNCE, SwitchDebouncer
+
+logger = logging.getLogger("chicken-gate-drv")
+
+# Default GPIO pins (BCM numbering)
+CLOSED_SWITCH_PIN = 2  # physical pin 3, GPIO 2
+RELAY_PINS = (4, 17)  # physical pins 7 and 11
 
 
 class Gate_drv:
-    def __init__(self, gate: Gate):
+    # Switch changes arrive as edge callbacks, so an idle gate only needs an
+    # occasional tick as a guard against a missed edge
+    IDLE_POLL = 1.0
+
+    def __init__(
+        self,
+        gate: Gate,
+        debounce=DEFAULT_DEBOUNCE,
+        closed_switch_pin=CLOSED_SWITCH_PIN,
+        relay_pins=RELAY_PINS,
+    ):
         # Set up GPIO mode
         GPIO.setmode(GPIO.BCM)
         GPIO.setwarnings(False)
 
         # GPIO pin assignments
-        self.CLOSED_SWITCH_PIN = 2  # physical pin 3, GPIO 2
-        self.RELAY1_PIN = 4  # physical pin 7, GPIO 4
-        self.RELAY2_PIN = 17  # physical pin 11, GPIO 17
+        self.CLOSED_SWITCH_PIN = closed_switch_pin
+        self.RELAY1_PIN, self.RELAY2_PIN = relay_pins
 
         # Set up switch input with pull-up (normally closed switch)
         GPIO.setup(self.CLOSED_SWITCH_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
@@ -26,11 +45,49 @@ class Gate_drv:
         self.cmd = Cmd.STOP
         self.__prev_cmd = Cmd.NONE
 
+        # Timestamp switch transitions in the edge callback and debounce them
+        self.__switch = SwitchDebouncer(debounce, self.__read_switch())
+        self.__listener = None
+        GPIO.add_event_detect(
+            self.CLOSED_SWITCH_PIN, GPIO.BOTH, callback=self.__on_switch_edge
+        )
+
         # reset gate position to 100 if closed switch is pressed, else 0
         # For normally closed switch: pressed = True when button reads HIGH
         self.reset_posn_to(100 if self.is_switch_pressed() else 0)
 
     def is_switch_pressed(self):
+        """Debounced closed switch state"""
+        return self.__switch.level
+
+    def on_switch_event(self, listener):
+        """`listener()` is called from the GPIO thread after each switch edge"""
+        self.__listener = listener
+
+    def switch_deadline(self):
+        """Monotonic time a pending switch change settles, or None"""
+        return self.__switch.deadline()
+
+    def set_switch_debounce(self, seconds):
+        """Change the debounce time (e.g. from settings loaded after start-up)"""
+        self.__switch.debounce = seconds
+
+    def update_switch(self, now=None):
+        """Apply a settled switch change; True if the debounced state changed"""
+        return self.__switch.update(time.monotonic() if now is None else now)
+
+    @property
+    def switch_stats(self):
+        """Raw edges seen and edges discarded as bounce"""
+        return {"edges": self.__switch.edges, "filtered": self.__switch.filtered}
+
+    def __on_switch_edge(self, channel):
+        # The callback does not say which way the pin went - read it
+        changed = self.__switch.edge(self.__read_switch(), time.monotonic())
+        if changed and self.__listener is not None:
+            self.__listener()
+
+    def __read_switch(self):
         """
         Helper method to handle normally closed switch logic.
         Normally closed switch with pull-up:
@@ -44,35 +101,53 @@ class Gate_drv:
         return GPIO.input(self.CLOSED_SWITCH_PIN) == GPIO.HIGH
 
     def tick(self):
+        self.read_inputs()
+        self.gate.tick()
+        self.write_relays(self.relay_changes())
+
+    def read_inputs(self):
+        """Pass the switch state to the gate (first step of a tick)"""
+        # guard against a missed edge, then take the debounced switch state
+        self.__on_switch_edge(self.CLOSED_SWITCH_PIN)
+        self.update_switch()
+
         # set gate inputs - using helper method for clarity
         self.gate.set_closed_switch(self.is_switch_pressed())
         # todo: add when switch is installed
         self.gate.set_open_switch(False)
 
-        # tick gate
-        self.gate.tick()
-
-        # get gate output
+    def relay_changes(self):
+        """
+        (pin, level) writes for the gate's new motion command - none unless it
+        changed (last step of a tick, after gate.tick())
+        """
         self.cmd = self.gate.get_cmd()
-
-        # only update outputs on change
-        if self.cmd != self.__prev_cmd:
-            self.__prev_cmd = self.cmd
-
-            # drive gate according to gate output
-            if self.cmd == Cmd.OPEN:
-                self.__turn_ccw()
-            elif self.cmd == Cmd.CLOSE:
-                self.__turn_cw()
-            else:
-                self.__stop()
+        if self.cmd == self.__prev_cmd:
+            return []
+        self.__prev_cmd = self.cmd
+
+        # drive gate according to gate output
+        if self.cmd == Cmd.OPEN:  # counter-clockwise
+            levels = (GPIO.LOW, GPIO.HIGH)
+        elif self.cmd == Cmd.CLOSE:  # clockwise
+            levels = (GPIO.HIGH, GPIO.LOW)
+        else:
+            levels = (GPIO.LOW, GPIO.LOW)
+        return list(zip((self.RELAY1_PIN, self.RELAY2_PIN), levels))
+
+    @staticmethod
+    def write_relays(changes):
+        """Write (pin, level) pairs - from any number of gates - in one call"""
+        if changes:
+            pins, levels = zip(*changes)
+            GPIO.output(list(pins), list(levels))
 
     def get_posn(self):
         return self.gate.get_posn()
 
     def reset_posn_to(self, posn):
         if posn is not None:
-            print(f"position reset to {posn}")
+            logger.info("position reset to %s", posn, extra={"position": posn})
             self.gate.reset_posn_to(posn)
 
     def open(self):
@@ -84,18 +159,7 @@ class Gate_drv:
     def stop(self):
         self.gate.stop()
 
-    def __turn_cw(self):
-        GPIO.output(self.RELAY1_PIN, GPIO.HIGH)
-        GPIO.output(self.RELAY2_PIN, GPIO.LOW)
-
-    def __turn_ccw(self):
-        GPIO.output(self.RELAY1_PIN, GPIO.LOW)
-        GPIO.output(self.RELAY2_PIN, GPIO.HIGH)
-
-    def __stop(self):
-        GPIO.output(self.RELAY1_PIN, GPIO.LOW)
-        GPIO.output(self.RELAY2_PIN, GPIO.LOW)
-
     def cleanup(self):
-        """Clean up GPIO resources when shutting down"""
-        GPIO.cleanup()
+        """Clean up this gate's GPIO pins when shutting down"""
+        GPIO.remove_event_detect(self.CLOSED_SWITCH_PIN)
+        GPIO.cleanup([self.CLOSED_SWITCH_PIN, self.RELAY1_PIN, self.RELAY2_PIN])
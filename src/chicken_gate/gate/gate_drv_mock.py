@@ -4,9 +4,11 @@ This replaces the RPi.GPIO dependency with a simulated interface.
 """
 
 import logging
+import time
 
 from .gate import Gate
 from .gate_cmd import Cmd
+from .switch import SwitchDebouncer
 
 logger = logging.getLogger("chicken-gate-mock")
 
@@ -14,17 +16,23 @@ logger = logging.getLogger("chicken-gate-mock")
 class Gate_drv:
     """Mock gate driver that simulates hardware without RPi.GPIO dependency"""
 
+    # Switch changes are emulated edge callbacks - no idle polling needed
+    IDLE_POLL = None
+
     def __init__(
         self,
         gate: Gate,
         initial_closed_switch=False,
         initial_open_switch=False,
         auto_reset_position=True,
+        debounce=0.0,
+        clock=time.monotonic,
+        closed_switch_pin=2,
+        relay_pins=(4, 17),
     ):
         # Simulate GPIO pin assignments (no actual GPIO setup)
-        self.CLOSED_SWITCH_PIN = 2
-        self.RELAY1_PIN = 4
-        self.RELAY2_PIN = 17
+        self.CLOSED_SWITCH_PIN = closed_switch_pin
+        self.RELAY1_PIN, self.RELAY2_PIN = relay_pins
 
         self.gate = gate
         self.cmd = Cmd.STOP
@@ -34,6 +42,11 @@ class Gate_drv:
         self._closed_switch_state = initial_closed_switch
         # Note: initial_open_switch parameter kept for compatibility but not used
 
+        # Emulated edge callbacks feed the same debounce filter as the real driver
+        self.__clock = clock
+        self.__switch = SwitchDebouncer(debounce, initial_closed_switch)
+        self.__listener = None
+
         # Track relay states for testing
         self._relay1_state = False
         self._relay2_state = False
@@ -46,14 +59,50 @@ class Gate_drv:
         logger.info("Mock Gate_drv initialized")
 
     def is_switch_pressed(self):
-        """Mock version of switch reading"""
-        return self._closed_switch_state
+        """Debounced closed switch state"""
+        return self.__switch.level
+
+    def on_switch_event(self, listener):
+        """`listener()` is called after each emulated switch edge"""
+        self.__listener = listener
+
+    def switch_deadline(self):
+        """Clock time a pending switch change settles, or None"""
+        return self.__switch.deadline()
+
+    def set_switch_debounce(self, seconds):
+        """Change the debounce time (e.g. from settings loaded after start-up)"""
+        self.__switch.debounce = seconds
+
+    def update_switch(self, now=None):
+        """Apply a settled switch change; True if the debounced state changed"""
+        return self.__switch.update(self.__clock() if now is None else now)
+
+    def emit_edge(self, level, at=None):
+        """Test helper: the raw switch input changes, as a GPIO edge callback would"""
+        self._closed_switch_state = level
+        at = self.__clock() if at is None else at
+        if self.__switch.edge(level, at):
+            self.__switch.update(at)  # settles at once with no debounce
+            if self.__listener is not None:
+                self.__listener()
+
+    def bounce(self, levels, start=None, interval=0.001):
+        """Test helper: a burst of edges `interval` apart, e.g. contact bounce"""
+        start = self.__clock() if start is None else start
+        for i, level in enumerate(levels):
+            self.emit_edge(level, start + i * interval)
+
+    @property
+    def switch_stats(self):
+        """Raw edges seen and edges discarded as bounce"""
+        return {"edges": self.__switch.edges, "filtered": self.__switch.filtered}
 
     def set_switch_state(self, closed_pressed=None, open_pressed=None):
         """Test helper to simulate switch state changes"""
         if closed_pressed is not None:
-            self._closed_switch_state = closed_pressed
             self._manual_switch_override = True
+            self.emit_edge(closed_pressed)
         # open_pressed parameter kept for compatibility but ignored (no open switch in real hardware)
 
     def get_relay_states(self):
@@ -61,47 +110,70 @@ class Gate_drv:
         return {"relay1": self._relay1_state, "relay2": self._relay2_state}
 
     def tick(self):
+        self.read_inputs()
+        self.gate.tick()
+        self.write_relays(self.relay_changes())
+
+    def read_inputs(self):
+        """Pass the switch state to the gate (first step of a tick)"""
         # Auto-simulate closed switch activation BEFORE calling gate.tick() (unless manually overridden)
         if not hasattr(self, "_manual_switch_override"):
             gate_position = self.gate.get_posn()
             # Closed switch activates at ~95% closed (position >= 95)
             # This simulates the physical switch being pressed when gate is almost fully closed
-            self._closed_switch_state = gate_position >= 95
+            self.emit_edge(gate_position >= 95)
+        self.update_switch()
 
         # Set gate inputs using mock states
         self.gate.set_closed_switch(self.is_switch_pressed())
         # No open switch in real hardware - gate uses only closed switch feedback
         self.gate.set_open_switch(False)  # Always False since no open switch exists
 
-        # Update gate logic
-        self.gate.tick()
-
-        # Get command from gate
+    def relay_changes(self):
+        """(pin, level) writes for a changed motion command (after gate.tick())"""
         self.cmd = self.gate.get_cmd()
+        if self.cmd == self.__prev_cmd:
+            return []
+        self.__prev_cmd = self.cmd
 
         # Handle relay control (mock version)
         if self.cmd == Cmd.OPEN:
-            if self.__prev_cmd != Cmd.OPEN:
-                logger.info("Mock: Starting to open gate (RELAY1=ON, RELAY2=OFF)")
-                self._relay1_state = True
-                self._relay2_state = False
+            logger.info("Mock: Starting to open gate (RELAY1=ON, RELAY2=OFF)")
+            self._relay1_state = True
+            self._relay2_state = False
         elif self.cmd == Cmd.CLOSE:
-            if self.__prev_cmd != Cmd.CLOSE:
-                logger.info("Mock: Starting to close gate (RELAY1=OFF, RELAY2=ON)")
-                self._relay1_state = False
-                self._relay2_state = True
+            logger.info("Mock: Starting to close gate (RELAY1=OFF, RELAY2=ON)")
+            self._relay1_state = False
+            self._relay2_state = True
         else:  # STOP
-            if self.__prev_cmd != Cmd.STOP:
-                logger.info("Mock: Stopping gate (RELAY1=OFF, RELAY2=OFF)")
-                self._relay1_state = False
-                self._relay2_state = False
+            logger.info("Mock: Stopping gate (RELAY1=OFF, RELAY2=OFF)")
+            self._relay1_state = False
+            self._relay2_state = False
+        return [
+            (self.RELAY1_PIN, int(self._relay1_state)),
+            (self.RELAY2_PIN, int(self._relay2_state)),
+        ]
 
-        self.__prev_cmd = self.cmd
+    @staticmethod
+    def write_relays(changes):
+        """No hardware to write - relay states are tracked by relay_changes()"""
+
+    def get_posn(self):
+        return self.gate.get_posn()
+
+    def open(self):
+        self.gate.open()
+
+    def close(self):
+        self.gate.close()
+
+    def stop(self):
+        self.gate.stop()
 
     def reset_posn_to(self, position):
         """Reset gate position - delegates to gate object"""
         self.gate.reset_posn_to(position)
-        logger.info(f"Mock: Gate position reset to {position}")
+        logger.info("Mock: Gate position reset to %s", position)
 
     def cleanup(self):
         """Mock cleanup - no actual GPIO cleanup needed"""
@@ -1,38 +1,118 @@
+import argparse
 import json
+import logging
 import os
 import time
 from datetime import datetime
 
+from ..shared import memory
+from ..shared.config import DIAGNOSTICS_FILE, STATUS_FILE
 from .gate import Gate
-from .gate_cmd import Cmd
-from .gate_drv import Gate_drv
-from .schedule import Schedule
 
-# File paths for web interface communication
-STATUS_FILE = "gate_status.json"
+# Refresh the memory figures in the status every 10 s
+MEMORY_REPORT_INTERVAL = 10.0
 
+# How often to look for shell commands in the command file (seconds)
+COMMAND_FILE_POLL = 0.1
+
+logger = logging.getLogger("chicken-gate-main")
+
+
+def build_gate_status(gate, schedule, schedule_enabled, memory_usage=None):
+    """Gate status with schedule information, as served to the web interface"""
+    status = gate.get_status()
+    if gate.gate_id is not None:
+        status["gate_id"] = gate.gate_id
+    # Add timestamp
+    status["last_updated"] = datetime.now().isoformat()
+
+    # Add schedule information
+    status["schedule"] = schedule.get_schedule_info()
+
+    # Add schedule enabled status
+    status["schedule_enabled"] = schedule_enabled
+
+    if memory_usage is not None:
+        status["memory"] = memory_usage
+
+    if gate.travel is not None:
+        open_time, close_time = gate.get_travel_times()
+        status["travel"] = dict(
+            gate.travel.to_dict(),
+            open_time=round(open_time, 1),
+            close_time=round(close_time, 1),
+        )
+
+    from ..shared import logs
+
+    log_stats = logs.get_stats()
+    if log_stats is not None:
+        status["logging"] = log_stats
+    return status
+
+
+def make_travel_monitor(settings):
+    """A TravelMonitor for a gate if there is a [travel] table, else None"""
+    travel_settings = settings.get("travel")
+    if not travel_settings:
+        return None
+    from .travel import TravelMonitor
 
-def write_gate_status(gate, schedule, schedule_enabled):
-    """Write gate status to JSON file atomically"""
     try:
-        status = gate.get_status()
-        # Add timestamp
-        status["last_updated"] = datetime.now().isoformat()
+        return TravelMonitor.from_settings(travel_settings)
+    except (TypeError, ValueError) as e:
+        logger.error("Invalid [travel] settings: %s - travel times not measured", e)
+        return None
+
+
+def write_gate_status(statuses, default_gate, writer=None):
+    """
+    Write gate status to JSON file atomically: the default gate's status,
+    and with several gates each one's by id under "gates". Serialized here;
+    with a writer (shared.writer.BackgroundWriter) written on its thread
+    """
+    try:
+        status = dict(statuses[default_gate])
+        if len(statuses) > 1:
+            status["gates"] = statuses
+        data = json.dumps(status, indent=2)
+    except Exception as e:
+        logger.error("Error writing status file: %s", e)
+        return
+    _write(STATUS_FILE, data, "status", writer)
+
+
+def write_gate_diagnostics(diagnostics, writer=None):
+    """
+    Write each gate's diagnostic messages and their generation to a JSON
+    file atomically - main() calls it only when a generation changes, so the
+    messages are not serialized again with every status
+    """
+    try:
+        data = json.dumps(diagnostics, indent=2)
+    except Exception as e:
+        logger.error("Error writing diagnostics file: %s", e)
+        return
+    _write(DIAGNOSTICS_FILE, data, "diagnostics", writer)
 
-        # Add schedule information
-        status["schedule"] = schedule.get_schedule_info()
 
-        # Add schedule enabled status
-        status["schedule_enabled"] = schedule_enabled
+def _write(path, data, what, writer):
+    if writer is None:
+        replace_file(path, data, what)
+    else:
+        writer.submit(replace_file, path, data, what)
 
-        # Write to temporary file first
-        temp_file = STATUS_FILE + ".tmp"
+
+def replace_file(path, data, what):
+    """Replace the file at `path` with the text `data`: temporary file, rename"""
+    try:
+        temp_file = path + ".tmp"
         with open(temp_file, "w") as f:
-            json.dump(status, f, indent=2)
+            f.write(data)
         # Atomic rename
-        os.rename(temp_file, STATUS_FILE)
-    except Exception as e:
-        print(f"Error writing status file: {e}")
+        os.rename(temp_file, path)
+    except OSError as e:
+        logger.error("Error writing %s file: %s", what, e)
 
 
 def check_command_file():
@@ -49,85 +129,373 @@ def check_command_file():
     return None
 
 
-def main():
-    global tick_100ms
-    gate = Gate()
-    gate_drv = Gate_drv(gate)
-    schedule = Schedule()
-
-    # Add schedule control flag here in main.py
-    schedule_enabled = True  # Default to enabled
-
-    print("Started chicken gate")
-
-    tick_100ms = 0
-    next_tick = time.perf_counter()
-
-    while True:
-        now = time.perf_counter()
-        if now >= next_tick:
-            next_tick += 0.1
-            tick_100ms += 1
-
-        while tick_100ms > 0:
-            tick_100ms -= 1
-
-            # push scheduled commands to driver (only if schedule is enabled)
-            if schedule_enabled:
-                sched_cmd = schedule.get_gate_cmd()
-                if sched_cmd == Cmd.OPEN:
-                    print("sched cmd to open gate")
-                    gate_drv.open()
-                elif sched_cmd == Cmd.CLOSE:
-                    print("sched cmd to close gate")
-                    gate_drv.close()
-
-            # push shell & web commands to driver
-            gate_cmd = check_command_file()
-            if gate_cmd == "OPEN":
-                print("cmd to open gate")
-                gate_drv.open()
-            elif gate_cmd == "CLOSE":
-                print("cmd to close gate")
-                gate_drv.close()
-            elif gate_cmd == "STOP":
-                print("cmd to stop gate")
-                gate_drv.stop()
-            elif gate_cmd == "ENABLE_SCHEDULE":
-                print("cmd to enable schedule")
-                schedule_enabled = True
-            elif gate_cmd == "DISABLE_SCHEDULE":
-                print("cmd to disable schedule")
-                schedule_enabled = False
-            elif gate_cmd == "CLEAR_ERRORS":
-                print("shell cmd to clear errors")
-                gate_drv.gate.clear_errors()
-            elif gate_cmd == "CLEAR_DIAGNOSTICS":
-                print("shell cmd to clear diagnostics")
-                gate_drv.gate.clear_diagnostic_messages()
-            elif gate_cmd and gate_cmd.startswith("RESET"):
-                # Handle reset commands: RESET or RESET:position
-                parts = gate_cmd.split(":")
-                if len(parts) == 1:
-                    # RESET - reset to current switch position (100 if closed, 0 if open)
-                    reset_pos = 100 if gate_drv.is_switch_pressed() else 0
-                    print(f"shell cmd to reset gate position to {reset_pos}")
-                    gate_drv.reset_posn_to(reset_pos)
-                elif len(parts) == 2:
-                    # RESET:position - reset to specific position
-                    try:
-                        reset_pos = int(parts[1])
-                        print(f"shell cmd to reset gate position to {reset_pos}")
-                        gate_drv.reset_posn_to(reset_pos)
-                    except ValueError:
-                        print(f"Invalid reset position: {parts[1]}")
-                else:
-                    print(f"Invalid reset command format: {gate_cmd}")
-
-            gate_drv.tick()
-
-            # Write status for web interface - pass the gate object, not gate_drv
-            write_gate_status(gate_drv.gate, schedule, schedule_enabled)
+def apply_missed_event(schedule, gate_drv, since, now=None, policy="follow"):
+    """
+    Apply the last scheduled open or close between `since` (when the state
+    was checkpointed) and now - the process was down when it was due - if
+    the gate's schedule policy takes it. Returns the event or None.
+    """
+    from .bank import policy_allows
+    from .runtime import apply_command
+
+    event = schedule.missed_event(since, now)
+    if event is None or not policy_allows(policy, event.cmd):
+        return None
+    gate_id = gate_drv.gate.gate_id
+    logger.warning(
+        "Missed scheduled %s at %s while stopped - applying it now",
+        event.job,
+        event.when.strftime("%Y-%m-%d %H:%M:%S"),
+        extra={"command": event.cmd.name, "gate_id": gate_id},
+    )
+    apply_command(event.cmd.name, gate_drv, True, gate_id)
+    return event
+
+
+def load_driver(mock=False):
+    """Driver class for the hardware, or the simulated one (no RPi.GPIO needed)"""
+    if mock:
+        from .gate_drv_mock import Gate_drv
+    else:
+        from .gate_drv import Gate_drv
+    return Gate_drv
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chicken gate controller")
+    parser.add_argument(
+        "--mock", action="store_true", help="use the simulated gate driver"
+    )
+    parser.add_argument(
+        "--low-memory",
+        action="store_true",
+        help="leave optional subsystems (APScheduler) unloaded",
+    )
+    parser.add_argument(
+        "--web",
+        action="store_true",
+        help="serve the web interface from this process (single-process mode)",
+    )
+    parser.add_argument("--port", type=int, default=5000, help="web port (--web)")
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        help="serve --web with the production server (thread pool, keep-alive, gzip)",
+    )
+    args = parser.parse_args(argv)
+
+    import atexit
+
+    # Log through a queue drained by a background thread, so journald or a
+    # slow stdout can never hold up a tick
+    from ..shared import logs
+    from ..shared.config import DEFAULT_GATE_ID
+
+    # records that name no gate are the default gate's (GATE_ID)
+    log_pipeline = logs.setup_logging(gate_id=DEFAULT_GATE_ID)
+    atexit.register(logs.stop_logging)
+
+    # Settings first: they say which gates to drive, on which pins
+    from ..shared.config import load_settings
+    from .bank import DEFAULT_SPEC, DriverBank, load_gate_specs
+
+    try:
+        settings = load_settings()
+    except ValueError as e:
+        logger.error("%s - using defaults", e)
+        settings = {}
+    try:
+        specs = load_gate_specs(settings)
+    except ValueError as e:
+        logger.error("Invalid [[gates]] settings: %s - using the default gate", e)
+        specs = [DEFAULT_SPEC]
+
+    # File writes of the publishers - checkpoint, energy counters, history,
+    # status and diagnostics - go to a thread: the loop never waits for the
+    # SD card. Registered first, so it stops last, after their close()
+    from ..shared.writer import BackgroundWriter
+
+    writer = BackgroundWriter()
+    atexit.register(writer.stop)
+
+    # Pick up where the last run left off: position, target, errors and flags
+    # from each gate's checkpoint, checked against its closed switch
+    from . import checkpoint
+
+    Gate_drv = load_driver(args.mock)
+    drivers = {}
+    checkpointers = {}
+    restored = {}
+    for spec in specs:
+        gate = Gate(
+            open_time=spec.open_time,
+            close_time=spec.close_time,
+            gate_id=spec.gate_id,
+            travel=make_travel_monitor(settings),
+        )
+        with memory.account("driver"):
+            drivers[spec.gate_id] = gate_drv = Gate_drv(
+                gate,
+                closed_switch_pin=spec.closed_switch_pin,
+                relay_pins=spec.relay_pins,
+            )
+        checkpointer = checkpoint.Checkpointer(
+            checkpoint.checkpoint_path(spec.gate_id if len(specs) > 1 else None),
+            writer=writer,
+        )
+        checkpointers[spec.gate_id] = checkpointer
+        restored[spec.gate_id] = checkpoint.restore(
+            checkpointer, gate, gate_drv.is_switch_pressed()
+        )
+        atexit.register(checkpointer.close)
+
+    # Tick the drivers once before loading the scheduler (APScheduler, astral)
+    # so the relays are in a known state as early as possible
+    DriverBank(drivers.values()).tick()
+    logger.info("Gate driver ready")  # benchmarks/startup.py waits for it
+
+    try:
+        profile = memory.get_profile(settings, args.low_memory)
+    except ValueError as e:
+        logger.error("%s - using the full profile", e)
+        profile = "full"
+    logger.info("Memory profile: %s", profile)
+    if len(specs) > 1:
+        logger.info("Gates: %s", ", ".join(spec.gate_id for spec in specs))
+
+    log_settings = settings.get("logging", {})
+    log_pipeline.rate_limit.configure(
+        log_settings.get("rate_burst", logs.RATE_BURST),
+        log_settings.get("rate_period", logs.RATE_PERIOD),
+    )
+
+    debounce_ms = settings.get("switch", {}).get("debounce_ms")
+    if debounce_ms is not None:
+        for gate_drv in drivers.values():
+            gate_drv.set_switch_debounce(debounce_ms / 1000)
+        logger.info("Closed switch debounce: %s ms", debounce_ms)
+
+    temperature_file = settings.get("travel", {}).get("temperature_file")
+    monitors = [d.gate.travel for d in drivers.values() if d.gate.travel is not None]
+    if temperature_file and monitors:
+        from .travel import start_temperature_reader
+
+        start_temperature_reader(temperature_file, monitors)
+        logger.info("Travel times by temperature from %s", temperature_file)
+
+    checkpoint_settings = settings.get("checkpoint", {})
+    for checkpointer in checkpointers.values():
+        checkpointer.configure(
+            checkpoint_settings.get("fsync_interval"),
+            checkpoint_settings.get("position_interval"),
+        )
+
+    with memory.account("schedule"):
+        from .schedule import Schedule
+
+        schedule = Schedule(
+            use_apscheduler=memory.subsystem_enabled(profile, "apscheduler")
+        )
+    default_gate = specs[0].gate_id
+    web = None
+    if args.web:
+        from .embedded import EmbeddedBackend, start_web
+
+        with memory.account("web"):
+            web = EmbeddedBackend(default_gate=default_gate)
+            for spec in specs:
+                web.snapshot_for(spec.gate_id)
+            server_settings = settings.get("web", {}) if args.production else None
+            try:
+                start_web(web, args.port, profile, server_settings)
+            except ValueError as e:
+                logger.error("Invalid [web] settings: %s - using the defaults", e)
+                start_web(web, args.port, profile, {})
+        logger.info("Serving the web interface in-process on port %d", args.port)
+
+    import asyncio
+
+    from .runtime import AsyncGate
+
+    # one loop and one schedule for all gates
+    first, *others = specs
+    runtime = AsyncGate(
+        drivers[first.gate_id],
+        schedule,
+        gate_id=first.gate_id,
+        schedule_policy=first.schedule,
+        schedule_delay=first.schedule_delay,
+    )
+    for spec in others:
+        runtime.add_gate(
+            drivers[spec.gate_id], spec.gate_id, spec.schedule, spec.schedule_delay
+        )
+    for spec in specs:
+        record = restored[spec.gate_id]
+        if record is None:
+            continue
+        enabled = bool(record.get("schedule_enabled", True))
+        runtime.set_schedule_enabled(enabled, spec.gate_id)
+        if enabled:
+            apply_missed_event(
+                schedule,
+                drivers[spec.gate_id],
+                record["saved_at"],
+                policy=spec.schedule,
+            )
+    # relay on-time, motor starts and energy, before the status is built
+    from ..shared.energy import EnergyMeter
+
+    try:
+        energy = EnergyMeter.from_settings(settings.get("energy", {}), writer=writer)
+    except (TypeError, ValueError) as e:
+        logger.error("Invalid [energy] settings: %s - using the defaults", e)
+        energy = EnergyMeter(writer=writer)
+    runtime.add_publisher(energy.publish)
+    atexit.register(energy.save)
+
+    # events and samples for /api/history and /api/export
+    if memory.subsystem_enabled(profile, "history"):
+        with memory.account("history"):
+            from ..shared.history import HistoryRecorder
+
+            try:
+                recorder = HistoryRecorder.from_settings(
+                    settings.get("history", {}), writer=writer
+                )
+            except (TypeError, ValueError) as e:
+                logger.error("Invalid [history] settings: %s - using the defaults", e)
+                recorder = HistoryRecorder.from_settings({}, writer=writer)
+        if recorder is not None:
+            recorder.attach(runtime)
+            atexit.register(recorder.close)
+
+    # pictures of the coop on gate and schedule events, and a timelapse
+    capture_settings = settings.get("capture", {})
+    if capture_settings.get("enabled") and memory.subsystem_enabled(profile, "camera"):
+        from ..shared.captures import CaptureService
+
+        try:
+            capture = CaptureService.from_settings(capture_settings)
+        except (TypeError, ValueError) as e:
+            logger.error("Invalid [capture] settings: %s - not capturing", e)
+            capture = None
+        if capture is not None:
+            capture.attach(runtime)
+            capture.start()
+            atexit.register(capture.stop)
+
+    # hold a scheduled close while a hen stands in the doorway
+    doorway_settings = settings.get("doorway", {})
+    if doorway_settings.get("enabled") and memory.subsystem_enabled(profile, "camera"):
+        from .doorway import DoorwayGuard
+
+        try:
+            guard = DoorwayGuard.from_settings(doorway_settings, specs)
+        except (TypeError, ValueError) as e:
+            logger.error("Invalid [doorway] settings: %s - not checking", e)
+            guard = None
+        if guard is not None:
+            runtime.set_close_check(guard)
+
+    memory_usage = [memory.report(profile), time.monotonic()]
+    statuses = {}  # gate id -> status as served to the web interface
+    diagnostics = {}  # gate id -> {"generation", "messages"} as last written
+
+    def publish(status):
+        # Refresh the memory figures every MEMORY_REPORT_INTERVAL seconds
+        if time.monotonic() - memory_usage[1] >= MEMORY_REPORT_INTERVAL:
+            memory_usage[:] = [memory.report(profile), time.monotonic()]
+
+        # Status for web interface - pass the gate object, not gate_drv
+        gate_id = status["gate_id"]
+        gate = drivers[gate_id].gate
+        full_status = build_gate_status(
+            gate, schedule, status["schedule_enabled"], memory_usage[0]
+        )
+        full_status["energy"] = energy.summary(gate_id)
+        if web is not None:
+            web.snapshot_for(gate_id).publish(full_status)
+        else:
+            # the messages go to their own file, written when they change
+            messages = full_status.pop("diagnostic_messages")
+            generation = full_status["diagnostics_generation"]
+            if diagnostics.get(gate_id, {}).get("generation") != generation:
+                diagnostics[gate_id] = {"generation": generation, "messages": messages}
+                write_gate_diagnostics(diagnostics, writer)
+            statuses[gate_id] = full_status
+            if len(statuses) == len(drivers):
+                write_gate_status(statuses, default_gate, writer)
+
+        checkpointers[gate_id].update(
+            dict(gate.get_state(), schedule_enabled=status["schedule_enabled"])
+        )
+
+    runtime.add_publisher(publish)
+    if web is not None:
+        runtime.add_command_source(web.pending_commands)
+        web.set_waker(runtime.wake_threadsafe)
+
+    integrations = []
+    mqtt_settings = settings.get("mqtt")
+    if mqtt_settings:
+        from .mqtt import MqttBridge
+
+        try:
+            bridge = MqttBridge.from_settings(mqtt_settings, schedule)
+        except (TypeError, ValueError) as e:
+            logger.error("Invalid [mqtt] settings: %s - MQTT disabled", e)
+        else:
+            bridge.attach(runtime)
+            integrations.append(bridge)
+            logger.info(
+                "Publishing to MQTT broker %s:%d under %s/",
+                bridge.host,
+                bridge.port,
+                bridge.prefix,
+            )
+
+    logger.info("Started chicken gate")
+    asyncio.run(serve(runtime, integrations))
+
+
+async def serve(runtime, integrations=()):
+    """
+    Run the gate runtime with the shell command file as a command source
+    ("<command>" for the default gate, "<gate id> <command>" for another),
+    and integrations (e.g. the MQTT bridge) as tasks in the same loop.
+    SIGTERM (systemctl stop) shuts the runtime down, so the atexit cleanup -
+    the checkpoint's last fsync among it - still runs.
+    """
+    import asyncio
+    import signal
+
+    from .runtime import split_gate_id
+
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, runtime.shutdown)
+        on_sigterm = True
+    except (NotImplementedError, RuntimeError):  # not the main thread
+        on_sigterm = False
+    task = asyncio.ensure_future(runtime.run())
+    others = [asyncio.ensure_future(integration.run()) for integration in integrations]
+    while not task.done():
+        # push shell commands to the runtime
+        gate_cmd = check_command_file()
+        if gate_cmd:
+            try:
+                gate_id, command = split_gate_id(gate_cmd)
+                runtime.submit(command, gate_id)
+            except ValueError as e:
+                logger.warning("Ignoring command file: %s", e)
+        await asyncio.wait([task], timeout=COMMAND_FILE_POLL)
+    for integration in integrations:
+        integration.stop()
+    await asyncio.gather(*others, return_exceptions=True)
+    if on_sigterm:
+        loop.remove_signal_handler(signal.SIGTERM)
+    await task
 
 
 if __name__ == "__main__":
@@ -0,0 +1,495 @@
+"""
+MQTT bridge for home-automation stacks.
+
+A minimal MQTT 3.1.1 client on asyncio streams, run as a task in the
+AsyncGate loop. It publishes each gate's status as retained topics, and only
+when a value changes:
+
+    <prefix>/availability             online / offline (offline is the will)
+    <prefix>/<gate id>/position       0 (open) - 100 (closed)
+    <prefix>/<gate id>/state          open, closed, opening, closing, stopped
+    <prefix>/<gate id>/errors         JSON list of error messages
+    <prefix>/<gate id>/schedule       JSON: enabled, open and close times, next event
+
+and subscribes to command topics, whose payloads (OPEN, CLOSE, STOP,
+RESET:50, ENABLE_SCHEDULE, ...) go to AsyncGate.submit() like web and shell
+commands:
+
+    <prefix>/command                  the default gate
+    <prefix>/<gate id>/command        one gate
+
+The runtime publisher (publish()) only stores the status, so the tick loop
+never waits on the network. Outbound messages are held per topic, latest
+value wins, so while the broker is down the buffer holds at most one message
+per topic (and never more than max_pending). Status is sent at QoS 1;
+after a reconnect every topic is sent again, as the broker may have
+restarted without its retained messages. Retained command messages are
+ignored, so an old command is not replayed on every reconnect.
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import socket
+import struct
+import time
+from collections import OrderedDict
+
+PREFIX = "chicken-gate"
+PORT = 1883
+
+# Seconds between PINGREQs when idle (the broker drops us after 1.5x)
+KEEPALIVE = 60
+
+# Most messages waiting for the broker; the oldest topic is dropped beyond it
+MAX_PENDING = 256
+
+# Longest wait for a connection and its CONNACK (seconds)
+CONNECT_TIMEOUT = 10.0
+
+# Reconnect delay doubles from RECONNECT_MIN up to RECONNECT_MAX (seconds)
+RECONNECT_MIN = 1.0
+RECONNECT_MAX = 60.0
+
+# Schedule info is re-read this often at most (seconds)
+SCHEDULE_REFRESH = 60.0
+
+# Packet types
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+CONNACK_ERRORS = {
+    1: "unacceptable protocol version",
+    2: "client id rejected",
+    3: "server unavailable",
+    4: "bad user name or password",
+    5: "not authorised",
+}
+
+logger = logging.getLogger("chicken-gate-mqtt")
+
+
+class MqttError(Exception):
+    """Protocol error or refused connection"""
+
+
+# -- packets ------------------------------------------------------------------
+
+
+def encode_length(length):
+    """MQTT variable-length remaining length"""
+    out = bytearray()
+    while True:
+        length, digit = divmod(length, 128)
+        out.append(digit | (0x80 if length else 0))
+        if not length:
+            return bytes(out)
+
+
+def encode_string(text):
+    data = text.encode("utf-8") if isinstance(text, str) else text
+    return struct.pack("!H", len(data)) + data
+
+
+def decode_string(data, offset=0):
+    """(text, offset after it)"""
+    (length,) = struct.unpack_from("!H", data, offset)
+    end = offset + 2 + length
+    return data[offset + 2 : end].decode("utf-8"), end
+
+
+def packet(kind, body=b"", flags=0):
+    return bytes([kind << 4 | flags]) + encode_length(len(body)) + body
+
+
+def connect_packet(client_id, keepalive, will=None, username=None, password=None):
+    """CONNECT with a clean session; will is (topic, payload) sent retained at QoS 1"""
+    flags = 0x02
+    payload = encode_string(client_id)
+    if will is not None:
+        flags |= 0x04 | 1 << 3 | 0x20
+        payload += encode_string(will[0]) + encode_string(will[1])
+    if username is not None:
+        flags |= 0x80
+        payload += encode_string(username)
+        if password is not None:
+            flags |= 0x40
+            payload += encode_string(password)
+    header = encode_string("MQTT") + bytes([4, flags]) + struct.pack("!H", keepalive)
+    return packet(CONNECT, header + payload)
+
+
+def publish_packet(topic, payload, qos=0, retain=False, packet_id=None):
+    body = encode_string(topic)
+    if qos:
+        body += struct.pack("!H", packet_id)
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return packet(PUBLISH, body + payload, qos << 1 | int(retain))
+
+
+def parse_publish(flags, body):
+    """(topic, payload bytes, qos, retain, packet id or None) of a PUBLISH"""
+    qos = flags >> 1 & 3
+    topic, offset = decode_string(body)
+    packet_id = None
+    if qos:
+        (packet_id,) = struct.unpack_from("!H", body, offset)
+        offset += 2
+    return topic, body[offset:], qos, bool(flags & 1), packet_id
+
+
+def subscribe_packet(packet_id, topics, qos=0):
+    body = struct.pack("!H", packet_id)
+    for topic in topics:
+        body += encode_string(topic) + bytes([qos])
+    return packet(SUBSCRIBE, body, 0x02)
+
+
+async def read_packet(reader):
+    """(type, flags, body) of the next packet"""
+    first = await reader.readexactly(1)
+    length = 0
+    for shift in range(0, 28, 7):
+        (digit,) = await reader.readexactly(1)
+        length |= (digit & 0x7F) << shift
+        if not digit & 0x80:
+            break
+    else:
+        raise MqttError("malformed remaining length")
+    body = await reader.readexactly(length) if length else b""
+    return first[0] >> 4, first[0] & 0x0F, body
+
+
+# -- topics -------------------------------------------------------------------
+
+
+def status_topics(prefix, status, schedule_info=None):
+    """{topic: payload} for a runtime status (see AsyncGate.status())"""
+    base = f"{prefix}/{status['gate_id']}"
+    schedule = {"enabled": status.get("schedule_enabled", True)}
+    if schedule_info:
+        schedule.update(
+            open=schedule_info.get("gate_open_time"),
+            close=schedule_info.get("gate_close_time"),
+            next_event=schedule_info.get("next_event"),
+        )
+    return {
+        f"{base}/position": str(round(status["position"])),
+        f"{base}/state": status["state"],
+        f"{base}/errors": json.dumps(status.get("errors", [])),
+        f"{base}/schedule": json.dumps(schedule, sort_keys=True),
+    }
+
+
+def command_gate_id(prefix, topic):
+    """
+    Gate id a command topic addresses: None for <prefix>/command, the id
+    for <prefix>/<id>/command. Raises ValueError for any other topic.
+    """
+    if topic == f"{prefix}/command":
+        return None
+    head, _, rest = topic.partition(f"{prefix}/")
+    gate_id, _, tail = rest.partition("/")
+    if head or tail != "command" or not gate_id:
+        raise ValueError(f"not a command topic: {topic}")
+    return gate_id
+
+
+# -- bridge -------------------------------------------------------------------
+
+
+class MqttBridge:
+    """Publishes gate status to an MQTT broker and takes commands from it"""
+
+    def __init__(
+        self,
+        host,
+        port=PORT,
+        prefix=PREFIX,
+        client_id=None,
+        username=None,
+        password=None,
+        keepalive=KEEPALIVE,
+        max_pending=MAX_PENDING,
+        schedule=None,
+        connect_timeout=CONNECT_TIMEOUT,
+        reconnect_min=RECONNECT_MIN,
+        reconnect_max=RECONNECT_MAX,
+    ):
+        self.host = host
+        self.port = port
+        self.prefix = prefix.rstrip("/")
+        self.client_id = client_id or f"chicken-gate-{socket.gethostname()}"[:23]
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.max_pending = max_pending
+        self.schedule = schedule
+        self.connect_timeout = connect_timeout
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.availability_topic = f"{self.prefix}/availability"
+
+        self.__runtime = None
+        self.__statuses = {}  # gate id -> latest status not yet turned into topics
+        self.__values = {}  # topic -> latest payload
+        self.__pending = OrderedDict()  # topics to send, oldest first
+        self.__inflight = {}  # packet id -> topic
+        self.__packet_id = 0
+        self.__schedule_info = None
+        self.__schedule_read = float("-inf")
+        self.__wake = None
+        self.__stopping = False
+        self.connected = False
+        self.published = 0
+        self.dropped = 0
+        self.commands = 0
+        self.connects = 0
+
+    @classmethod
+    def from_settings(cls, settings, schedule=None):
+        """Bridge for an [mqtt] settings table (host is required)"""
+        known = (
+            "host",
+            "port",
+            "prefix",
+            "client_id",
+            "username",
+            "password",
+            "keepalive",
+            "max_pending",
+        )
+        unknown = set(settings) - set(known)
+        if unknown:
+            raise ValueError(f"unknown [mqtt] keys: {sorted(unknown)}")
+        if not settings.get("host"):
+            raise ValueError("[mqtt] needs a host")
+        return cls(schedule=schedule, **settings)
+
+    def attach(self, runtime):
+        """Publish `runtime`'s gates and send it the commands received"""
+        self.__runtime = runtime
+        runtime.add_publisher(self.publish)
+
+    def publish(self, status):
+        """AsyncGate publisher: note the status; the bridge task sends it"""
+        self.__statuses[status["gate_id"]] = status
+        if self.__wake is not None:
+            self.__wake.set()
+
+    def stop(self):
+        """Disconnect and make run() return (from the loop's thread)"""
+        self.__stopping = True
+        if self.__wake is not None:
+            self.__wake.set()
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "published": self.published,
+            "pending": len(self.__pending),
+            "inflight": len(self.__inflight),
+            "dropped": self.dropped,
+            "commands": self.commands,
+            "connects": self.connects,
+        }
+
+    async def run(self):
+        """Stay connected, reconnecting with backoff, until stop()"""
+        self.__wake = asyncio.Event()
+        delay = self.reconnect_min
+        while not self.__stopping:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    self.__connect(), self.connect_timeout
+                )
+            except (OSError, asyncio.TimeoutError, MqttError) as e:
+                logger.warning(
+                    "Cannot connect to MQTT broker %s:%d: %s - retrying in %.0f s",
+                    self.host,
+                    self.port,
+                    str(e) or type(e).__name__,
+                    delay,
+                )
+            else:
+                delay = self.reconnect_min
+                try:
+                    await self.__session(reader, writer)
+                except (
+                    OSError,
+                    asyncio.IncompleteReadError,
+                    asyncio.TimeoutError,
+                    MqttError,
+                ) as e:
+                    logger.warning(
+                        "MQTT connection lost: %s", str(e) or type(e).__name__
+                    )
+                finally:
+                    self.connected = False
+                    self.__inflight.clear()
+                    writer.close()
+                if self.__stopping:
+                    break
+            self.__collect()  # keep the buffer current while down
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self.__stopped(), delay)
+            delay = min(delay * 2, self.reconnect_max)
+
+    async def __stopped(self):
+        while not self.__stopping:
+            self.__wake.clear()
+            await self.__wake.wait()
+            self.__collect()
+
+    async def __connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(
+                connect_packet(
+                    self.client_id,
+                    self.keepalive,
+                    will=(self.availability_topic, "offline"),
+                    username=self.username,
+                    password=self.password,
+                )
+            )
+            await writer.drain()
+            kind, _, body = await read_packet(reader)
+            if kind != CONNACK or len(body) != 2:
+                raise MqttError(f"expected CONNACK, got packet type {kind}")
+            if body[1]:
+                raise MqttError(CONNACK_ERRORS.get(body[1], f"refused ({body[1]})"))
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    async def __session(self, reader, writer):
+        self.connected = True
+        self.connects += 1
+        logger.info("Connected to MQTT broker %s:%d", self.host, self.port)
+        # the broker may have lost the retained values: send them all again
+        for topic in self.__values:
+            self.__pending[topic] = None
+        self.__send(writer, self.availability_topic, "online")
+        writer.write(
+            subscribe_packet(
+                self.__next_id(),
+                [f"{self.prefix}/command", f"{self.prefix}/+/command"],
+            )
+        )
+        received = asyncio.ensure_future(self.__receive(reader, writer))
+        last_sent = time.monotonic()
+        try:
+            while not self.__stopping:
+                self.__collect()
+                while self.__pending:
+                    topic, _ = self.__pending.popitem(last=False)
+                    self.__send(writer, topic, self.__values[topic])
+                    last_sent = time.monotonic()
+                # a broker that stops reading ends the connection, not the task
+                await asyncio.wait_for(writer.drain(), self.keepalive)
+                self.__wake.clear()
+                waker = asyncio.ensure_future(self.__wake.wait())
+                ping_in = max(0.0, last_sent + self.keepalive / 2 - time.monotonic())
+                done, _ = await asyncio.wait(
+                    [waker, received],
+                    timeout=ping_in,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                waker.cancel()
+                if received in done:
+                    received.result()  # raises what ended the connection
+                    raise MqttError("connection closed by the broker")
+                if not done:
+                    writer.write(packet(PINGREQ))
+                    last_sent = time.monotonic()
+            # stopping: say so, then leave cleanly (no will)
+            self.__send(writer, self.availability_topic, "offline")
+            writer.write(packet(DISCONNECT))
+            with contextlib.suppress(OSError):
+                await asyncio.wait_for(writer.drain(), self.connect_timeout)
+        finally:
+            received.cancel()
+
+    async def __receive(self, reader, writer):
+        """Handle packets from the broker until the connection ends"""
+        while True:
+            kind, flags, body = await asyncio.wait_for(
+                read_packet(reader), self.keepalive * 1.5
+            )
+            if kind == PUBACK:
+                self.__inflight.pop(struct.unpack("!H", body)[0], None)
+            elif kind == PUBLISH:
+                topic, payload, qos, retain, packet_id = parse_publish(flags, body)
+                if qos == 1:
+                    writer.write(packet(PUBACK, struct.pack("!H", packet_id)))
+                self.__command(topic, payload, retain)
+            elif kind == SUBACK and b"\x80" in body[2:]:
+                logger.error("MQTT broker refused the command subscription")
+
+    def __command(self, topic, payload, retain):
+        if retain:
+            logger.warning("Ignoring retained MQTT command on %s", topic)
+            return
+        try:
+            gate_id = command_gate_id(self.prefix, topic)
+            command = payload.decode("utf-8").strip().upper()
+            if self.__runtime is None:
+                raise ValueError("no gate runtime attached")
+            self.__runtime.submit(command, gate_id)
+        except (ValueError, UnicodeDecodeError) as e:
+            logger.warning("Ignoring MQTT command %r on %s: %s", payload, topic, e)
+            return
+        self.commands += 1
+        logger.info(
+            "MQTT command %s", command, extra={"command": command, "gate_id": gate_id}
+        )
+
+    def __collect(self):
+        """Turn new statuses into pending topics whose payload changed"""
+        if not self.__statuses:
+            return
+        statuses, self.__statuses = self.__statuses, {}
+        info = self.__read_schedule()
+        for status in statuses.values():
+            for topic, payload in status_topics(self.prefix, status, info).items():
+                if self.__values.get(topic) == payload:
+                    continue
+                self.__values[topic] = payload
+                self.__pending[topic] = None
+                self.__pending.move_to_end(topic)
+        while len(self.__pending) > self.max_pending:
+            self.__pending.popitem(last=False)
+            self.dropped += 1
+
+    def __read_schedule(self):
+        if self.schedule is None:
+            return None
+        now = time.monotonic()
+        if now - self.__schedule_read >= SCHEDULE_REFRESH:
+            self.__schedule_read = now
+            try:
+                self.__schedule_info = self.schedule.get_schedule_info()
+            except Exception as e:
+                logger.warning("Cannot read schedule info: %s", e)
+        return self.__schedule_info
+
+    def __send(self, writer, topic, payload):
+        packet_id = self.__next_id()
+        self.__inflight[packet_id] = topic
+        writer.write(publish_packet(topic, payload, 1, True, packet_id))
+        self.published += 1
+
+    def __next_id(self):
+        self.__packet_id = self.__packet_id % 0xFFFF + 1
+        return self.__packet_id
@@ -0,0 +1,431 @@
+"""
+Declarative schedule rules.
+
+Open and close times are written as small expressions over the day's sun
+events, clock times and durations, for example:
+
+    open = "max(sunrise + 10min, 06:30)"
+    close = "dusk + 15min"
+
+Supported syntax:
+  sun events   dawn, sunrise, noon, sunset, dusk
+  clock times  06:30, 17:45 (local time on the scheduled day)
+  durations    10min, 1h, 30s (also 10m)
+  operators    time + duration, time - duration, duration + duration
+  functions    max(...), min(...), clamp(value, earliest, latest)
+
+Rules are parsed once per distinct source string and compiled per day into
+events, which a Timeline keeps sorted for O(log n) next-event lookup.
+"""
+
+import re
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+
+from dateutil import tz
+
+from .gate_cmd import Cmd
+
+SUN_EVENTS = ("dawn", "sunrise", "noon", "sunset", "dusk")
+
+# Same events Schedule has always used
+DEFAULT_OPEN_RULE = "sunrise"
+DEFAULT_CLOSE_RULE = "dusk"
+
+DAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+SEASONS = {
+    "winter": (12, 1, 2),
+    "spring": (3, 4, 5),
+    "summer": (6, 7, 8),
+    "autumn": (9, 10, 11),
+}
+OVERRIDE_KEYS = {"days", "months", "season", "start", "end", "open", "close"}
+
+DURATION_UNITS = {"h": 3600, "min": 60, "m": 60, "s": 1}
+
+TOKEN_RE = re.compile(
+    r"\s*(?:"
+    r"(?P<clock>\d{1,2}:\d{2})"
+    r"|(?P<duration>\d+(?:\.\d+)?)(?P<unit>min|h|m|s)\b"
+    r"|(?P<name>[a-z_]+)"
+    r"|(?P<op>[-+(),])"
+    r")"
+)
+
+Event = namedtuple("Event", ["at", "when", "cmd", "job", "day"])
+Event.__doc__ = "A scheduled gate command (at is the epoch time of when)"
+
+
+class RuleError(ValueError):
+    """Raised for rule expressions or rule settings that are not valid"""
+
+
+class MissingSunEvent(Exception):
+    """A rule refers to a sun event that does not happen on that day"""
+
+    def __init__(self, event):
+        super().__init__(event)
+        self.event = event
+
+
+# -- expressions ----------------------------------------------------------
+
+
+class Expression:
+    """A parsed rule; evaluate() returns the time for one day"""
+
+    def __init__(self, source, node):
+        self.source = source
+        self.__node = node
+
+    def evaluate(self, day, sun_times, zone, notes=None):
+        """
+        Time the rule gives on `day`.
+
+        sun_times maps sun event names to aware datetimes (None or missing
+        if the event does not happen). Clock times that fall into a DST gap
+        or overlap are resolved and reported into `notes` if given. Raises
+        MissingSunEvent if a referenced sun event does not happen.
+        """
+        return self.__node(_Context(day, sun_times, zone, notes))
+
+    def __repr__(self):
+        return f"Expression({self.source!r})"
+
+
+class _Context:
+    __slots__ = ("day", "sun_times", "zone", "notes")
+
+    def __init__(self, day, sun_times, zone, notes):
+        self.day = day
+        self.sun_times = sun_times
+        self.zone = zone
+        self.notes = notes
+
+
+@lru_cache(maxsize=64)
+def compile_expression(source):
+    """Parse a rule expression; identical sources are only parsed once"""
+    parser = _Parser(source)
+    kind, node = parser.parse()
+    if kind != "time":
+        raise RuleError(f"rule must give a time of day, not a duration: {source!r}")
+    return Expression(source, node)
+
+
+class _Parser:
+    """Recursive-descent parser producing (kind, evaluator) pairs"""
+
+    def __init__(self, source):
+        self.source = source
+        self.tokens = self.__tokenize(source)
+        self.pos = 0
+
+    def parse(self):
+        result = self.__expr()
+        if self.pos != len(self.tokens):
+            self.__fail(f"unexpected {self.tokens[self.pos][1]!r}")
+        return result
+
+    def __tokenize(self, source):
+        tokens = []
+        pos = 0
+        text = source.strip().lower()
+        while pos < len(text):
+            match = TOKEN_RE.match(text, pos)
+            if not match or match.end() == pos:
+                raise RuleError(f"cannot parse {text[pos:]!r} in rule {source!r}")
+            pos = match.end()
+            for kind in ("clock", "duration", "name", "op"):
+                if match.group(kind) is not None:
+                    value = match.group(kind)
+                    if kind == "duration":
+                        value = float(value) * DURATION_UNITS[match.group("unit")]
+                    tokens.append((kind, value))
+                    break
+        return tokens
+
+    def __peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def __take(self, op=None):
+        token = self.__peek()
+        if token[0] is None:
+            self.__fail("unexpected end of rule")
+        if op is not None and token != ("op", op):
+            self.__fail(f"expected {op!r}")
+        self.pos += 1
+        return token
+
+    def __fail(self, message):
+        raise RuleError(f"{message} in rule {self.source!r}")
+
+    def __expr(self):
+        kind, node = self.__unary()
+        while self.__peek() in (("op", "+"), ("op", "-")):
+            _, op = self.__take()
+            rhs_kind, rhs = self.__unary()
+            kind, node = self.__binary(op, kind, node, rhs_kind, rhs)
+        return kind, node
+
+    def __unary(self):
+        if self.__peek() == ("op", "-"):
+            self.__take()
+            kind, node = self.__unary()
+            if kind != "duration":
+                self.__fail("only durations can be negated")
+            return kind, lambda ctx: -node(ctx)
+        return self.__atom()
+
+    def __binary(self, op, lkind, lhs, rkind, rhs):
+        if rkind != "duration":
+            self.__fail("only durations can be added to or subtracted from times")
+        sign = 1 if op == "+" else -1
+        if lkind == "duration":
+            return "duration", lambda ctx: lhs(ctx) + sign * rhs(ctx)
+        return "time", lambda ctx: _shift(lhs(ctx), sign * rhs(ctx))
+
+    def __atom(self):
+        kind, value = self.__take()
+        if kind == "clock":
+            hour, minute = (int(part) for part in value.split(":"))
+            if hour > 23 or minute > 59:
+                self.__fail(f"invalid clock time {value}")
+            return "time", lambda ctx: _clock(ctx, time(hour, minute))
+        if kind == "duration":
+            delta = timedelta(seconds=value)
+            return "duration", lambda ctx: delta
+        if kind == "name":
+            if self.__peek() == ("op", "("):
+                return self.__call(value)
+            if value not in SUN_EVENTS:
+                self.__fail(f"unknown sun event {value!r}")
+            return "time", lambda ctx: _sun_event(ctx, value)
+        if value == "(":
+            result = self.__expr()
+            self.__take(")")
+            return result
+        self.__fail(f"unexpected {value!r}")
+
+    def __call(self, name):
+        self.__take("(")
+        args = [self.__expr()]
+        while self.__peek() == ("op", ","):
+            self.__take()
+            args.append(self.__expr())
+        self.__take(")")
+
+        kinds = {kind for kind, _ in args}
+        if len(kinds) != 1:
+            self.__fail(f"{name}() arguments must all be times or all durations")
+        kind = kinds.pop()
+        nodes = [node for _, node in args]
+
+        if name in ("max", "min"):
+            pick = max if name == "max" else min
+            return kind, lambda ctx: pick(node(ctx) for node in nodes)
+        if name == "clamp":
+            if len(nodes) != 3:
+                self.__fail("clamp() takes (value, earliest, latest)")
+            value, low, high = nodes
+            return kind, lambda ctx: min(max(value(ctx), low(ctx)), high(ctx))
+        self.__fail(f"unknown function {name!r}")
+
+
+def _sun_event(ctx, name):
+    when = ctx.sun_times.get(name)
+    if when is None:
+        raise MissingSunEvent(name)
+    return when
+
+
+def _shift(when, delta):
+    """Add elapsed time to an aware datetime (not wall-clock time)"""
+    zone = when.tzinfo
+    return (when.astimezone(tz.UTC) + delta).astimezone(zone)
+
+
+def _clock(ctx, clock_time):
+    """Clock time on the rule's day, resolving DST gaps and overlaps"""
+    when = datetime.combine(ctx.day, clock_time, tzinfo=ctx.zone)
+    if not tz.datetime_exists(when):
+        resolved = tz.resolve_imaginary(when)
+        _note(ctx, "dst_gap", when, resolved)
+        return resolved
+    if tz.datetime_ambiguous(when):
+        # first occurrence only, so the event cannot fire twice
+        _note(ctx, "dst_overlap", when, when)
+        return when.replace(fold=0)
+    return when
+
+
+def _note(ctx, kind, wall, resolved):
+    if ctx.notes is not None:
+        ctx.notes.append(
+            {
+                "kind": kind,
+                "wall_time": wall.strftime("%H:%M"),
+                "resolved": resolved.isoformat(),
+            }
+        )
+
+
+# -- rule sets ------------------------------------------------------------
+
+
+class Override:
+    """Replacement open and/or close rule for matching days"""
+
+    def __init__(self, settings):
+        unknown = set(settings) - OVERRIDE_KEYS
+        if unknown:
+            raise RuleError(f"unknown schedule override keys: {sorted(unknown)}")
+        self.settings = dict(settings)
+        self.open = settings.get("open")
+        self.close = settings.get("close")
+        if self.open is None and self.close is None:
+            raise RuleError("schedule override needs an open or close rule")
+
+        self.days = None
+        if "days" in settings:
+            days = [d.lower()[:3] for d in settings["days"]]
+            if any(d not in DAY_NAMES for d in days):
+                raise RuleError(f"invalid override days: {settings['days']}")
+            self.days = {DAY_NAMES.index(d) for d in days}
+
+        self.months = None
+        if "months" in settings:
+            self.months = {int(m) for m in settings["months"]}
+        if "season" in settings:
+            season = settings["season"].lower()
+            if season not in SEASONS:
+                raise RuleError(f"invalid season {settings['season']!r}")
+            self.months = (self.months or set()) | set(SEASONS[season])
+
+        self.span = None
+        if "start" in settings or "end" in settings:
+            self.span = (
+                _month_day(settings.get("start", "01-01")),
+                _month_day(settings.get("end", "12-31")),
+            )
+
+        # validate the expressions up front
+        for source in (self.open, self.close):
+            if source is not None:
+                compile_expression(source)
+
+    def matches(self, day):
+        if self.days is not None and day.weekday() not in self.days:
+            return False
+        if self.months is not None and day.month not in self.months:
+            return False
+        if self.span is not None:
+            start, end = self.span
+            today = (day.month, day.day)
+            if start <= end:
+                return start <= today <= end
+            return today >= start or today <= end  # wraps over new year
+        return True
+
+
+def _month_day(text):
+    try:
+        month, day = (int(part) for part in str(text).split("-"))
+        date(2000, month, day)
+    except ValueError as e:
+        raise RuleError(f"invalid MM-DD date {text!r}") from e
+    return month, day
+
+
+class ScheduleRules:
+    """Open/close rules with weekday and seasonal overrides"""
+
+    def __init__(
+        self, open_rule=DEFAULT_OPEN_RULE, close_rule=DEFAULT_CLOSE_RULE, overrides=()
+    ):
+        self.open_rule = open_rule
+        self.close_rule = close_rule
+        self.overrides = [
+            o if isinstance(o, Override) else Override(o) for o in overrides
+        ]
+        compile_expression(open_rule)
+        compile_expression(close_rule)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build rules from the [schedule] section of the settings file"""
+        schedule = settings.get("schedule", {})
+        return cls(
+            open_rule=schedule.get("open", DEFAULT_OPEN_RULE),
+            close_rule=schedule.get("close", DEFAULT_CLOSE_RULE),
+            overrides=schedule.get("override", []),
+        )
+
+    def fingerprint(self):
+        """Value that changes whenever any rule or override changes"""
+        return (
+            self.open_rule,
+            self.close_rule,
+            tuple(repr(sorted(o.settings.items())) for o in self.overrides),
+        )
+
+    def rules_for(self, day):
+        """(open rule, close rule) sources in effect on a day; later overrides win"""
+        open_rule, close_rule = self.open_rule, self.close_rule
+        for override in self.overrides:
+            if override.matches(day):
+                open_rule = override.open or open_rule
+                close_rule = override.close or close_rule
+        return open_rule, close_rule
+
+    def compile_day(self, day, sun_times, zone, notes=None):
+        """
+        Events for one day, sorted by time.
+
+        A rule that refers to a sun event missing that day produces no event
+        and a "no_<event>" note. Notes carry the day and job they belong to.
+        """
+        events = []
+        for job, cmd, source in zip(
+            ("open", "close"), (Cmd.OPEN, Cmd.CLOSE), self.rules_for(day)
+        ):
+            day_notes = []
+            try:
+                when = compile_expression(source).evaluate(
+                    day, sun_times, zone, day_notes
+                )
+                events.append(Event(when.timestamp(), when, cmd, job, day))
+            except MissingSunEvent as e:
+                day_notes.append({"kind": f"no_{e.event}"})
+            if notes is not None:
+                for note in day_notes:
+                    notes.append({"date": day.isoformat(), "job": job, **note})
+        events.sort(key=lambda e: e.at)
+        return events
+
+
+class Timeline:
+    """Events sorted by time with O(log n) next-event lookup"""
+
+    def __init__(self, events=()):
+        self.__events = sorted(events, key=lambda e: e.at)
+        self.__keys = [e.at for e in self.__events]
+
+    def __len__(self):
+        return len(self.__events)
+
+    def __iter__(self):
+        return iter(self.__events)
+
+    def next_event(self, now):
+        """First event strictly after epoch time `now`, or None"""
+        i = bisect_right(self.__keys, now)
+        return self.__events[i] if i < len(self.__events) else None
+
+    def events_between(self, start, end):
+        """Events with start < at <= end (epoch times)"""
+        lo = bisect_right(self.__keys, start)
+        hi = bisect_right(self.__keys, end)
+        return self.__events[lo:hi]
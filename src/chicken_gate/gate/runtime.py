@@ -0,0 +1,619 @@
+"""
+Asyncio gate runtime.
+
+AsyncGate drives a gate driver from an event loop. Commands, schedule
+deadlines, status publishing and (with a driver that reports them) switch
+edges are events: the loop ticks the driver every TICK_INTERVAL while the
+gate moves, and otherwise sleeps until the next event instead of polling.
+
+    gate = AsyncGate(Gate_drv(Gate()), Schedule())
+    asyncio.create_task(gate.run())
+    await gate.open()
+    await gate.wait_for_state("open", timeout=600)
+    async for status in gate.watch():
+        ...
+
+Several gates run in one loop: add_gate() registers more drivers, the
+ticks read all switches and write all relays in one pass (bank.DriverBank),
+and commands, status and watch() take a gate_id (default: the first gate).
+
+    gates = AsyncGate(front_drv, schedule, gate_id="front")
+    gates.add_gate(side_drv, "side", schedule_policy="close")
+    await gates.open("side")
+
+Other integrations (MQTT, sockets, timers) can run as tasks in the same
+loop. Threads hand commands over with submit_threadsafe(). Nothing in the
+loop may block: the gates' alert emails go out on an executor thread.
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+from collections import deque
+
+from ..shared.config import DEFAULT_GATE_ID
+from . import gate as gate_module
+from .bank import SCHEDULE_POLICIES, DriverBank, policy_allows
+from .gate_cmd import Cmd
+
+# Tick period while the gate is moving (seconds)
+TICK_INTERVAL = 0.1
+
+# Publishers are called on every status change and at least this often
+PUBLISH_INTERVAL = 1.0
+
+COMMANDS = (
+    "OPEN",
+    "CLOSE",
+    "STOP",
+    "RESET",
+    "CLEAR_ERRORS",
+    "CLEAR_DIAGNOSTICS",
+    "ENABLE_SCHEDULE",
+    "DISABLE_SCHEDULE",
+)
+
+STATES = ("open", "closed", "opening", "closing", "stopped")
+
+# gate_id that sends a command to every gate
+ALL_GATES = "*"
+
+# idle_poll default: ask the driver
+_FROM_DRIVER = object()
+
+logger = logging.getLogger("chicken-gate")
+
+
+def gate_state(status):
+    """One of STATES for a status dict"""
+    if status["is_opening"]:
+        return "opening"
+    if status["is_closing"]:
+        return "closing"
+    if status["position"] <= 0:
+        return "open"
+    if status["position"] >= 100:
+        return "closed"
+    return "stopped"
+
+
+def apply_command(gate_cmd, gate_drv, schedule_enabled, gate_id=None):
+    """Apply a shell or web command; returns the new schedule enabled flag"""
+    fields = {"command": gate_cmd, "gate_id": gate_id}
+    if gate_cmd == "OPEN":
+        logger.info("cmd to open gate", extra=fields)
+        gate_drv.open()
+    elif gate_cmd == "CLOSE":
+        logger.info("cmd to close gate", extra=fields)
+        gate_drv.close()
+    elif gate_cmd == "STOP":
+        logger.info("cmd to stop gate", extra=fields)
+        gate_drv.stop()
+    elif gate_cmd == "ENABLE_SCHEDULE":
+        logger.info("cmd to enable schedule", extra=fields)
+        schedule_enabled = True
+    elif gate_cmd == "DISABLE_SCHEDULE":
+        logger.info("cmd to disable schedule", extra=fields)
+        schedule_enabled = False
+    elif gate_cmd == "CLEAR_ERRORS":
+        logger.info("shell cmd to clear errors", extra=fields)
+        gate_drv.gate.clear_errors()
+    elif gate_cmd == "CLEAR_DIAGNOSTICS":
+        logger.info("shell cmd to clear diagnostics", extra=fields)
+        gate_drv.gate.clear_diagnostic_messages()
+    elif gate_cmd and gate_cmd.startswith("RESET"):
+        # Handle reset commands: RESET or RESET:position
+        parts = gate_cmd.split(":")
+        if len(parts) == 1:
+            # RESET - reset to current switch position (100 if closed, 0 if open)
+            reset_pos = 100 if gate_drv.is_switch_pressed() else 0
+            logger.info(
+                "shell cmd to reset gate position to %s", reset_pos, extra=fields
+            )
+            gate_drv.reset_posn_to(reset_pos)
+        elif len(parts) == 2:
+            # RESET:position - reset to specific position
+            try:
+                reset_pos = int(parts[1])
+                logger.info(
+                    "shell cmd to reset gate position to %s", reset_pos, extra=fields
+                )
+                gate_drv.reset_posn_to(reset_pos)
+            except ValueError:
+                logger.warning("Invalid reset position: %s", parts[1], extra=fields)
+        else:
+            logger.warning("Invalid reset command format: %s", gate_cmd, extra=fields)
+    return schedule_enabled
+
+
+def split_gate_id(text):
+    """
+    (gate id, command) of command text addressed as "<gate id> <command>";
+    the gate id is None for a bare command (the default gate)
+    """
+    parts = text.split()
+    if len(parts) == 2:
+        return parts[0], parts[1]
+    return None, text
+
+
+def check_command(command):
+    """Normalised command text; ValueError if it is not a gate command"""
+    command = command.strip().upper()
+    name, _, arg = command.partition(":")
+    if name not in COMMANDS or (arg and name != "RESET"):
+        raise ValueError(f"Unknown command: {command}")
+    if arg:
+        try:
+            position = int(arg)
+        except ValueError:
+            raise ValueError("Invalid position format") from None
+        if not 0 <= position <= 100:
+            raise ValueError("Position must be between 0 and 100")
+    return command
+
+
+def _log_alert_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Alert email failed: %s", future.exception())
+
+
+class _Member:
+    """A gate run by AsyncGate: its driver, schedule policy and latest status"""
+
+    __slots__ = (
+        "gate_id",
+        "drv",
+        "gate",
+        "policy",
+        "delay",
+        "schedule_enabled",
+        "delayed",
+        "status",
+        "version",
+    )
+
+    def __init__(self, gate_id, drv, policy, delay):
+        self.gate_id = gate_id
+        self.drv = drv
+        self.gate = drv.gate
+        self.policy = policy
+        self.delay = delay
+        self.schedule_enabled = True
+        self.delayed = deque()  # (epoch time, Cmd) scheduled commands due later
+        self.status = None
+        self.version = 0
+
+
+class AsyncGate:
+    """Event-driven gate runtime with an awaitable command and status API"""
+
+    def __init__(
+        self,
+        gate_drv,
+        schedule=None,
+        tick_interval=TICK_INTERVAL,
+        publish_interval=PUBLISH_INTERVAL,
+        idle_poll=_FROM_DRIVER,
+        gate_id=DEFAULT_GATE_ID,
+        schedule_policy="follow",
+        schedule_delay=0.0,
+    ):
+        """
+        idle_poll is how often to tick the driver while the gate is idle, so a
+        polling driver still sees switch changes. It defaults to the driver's
+        IDLE_POLL attribute, or tick_interval; None never ticks while idle.
+
+        gate_drv is the default gate - the one addressed when a call passes
+        no gate_id. add_gate() adds more.
+        """
+        self.gate_drv = gate_drv
+        self.gate = gate_drv.gate
+        self.schedule = schedule
+        self.ticks = 0
+
+        self.__tick_interval = tick_interval
+        self.__publish_interval = publish_interval
+        self.__idle_poll = idle_poll
+        self.__members = {}
+        self.__default = self.add_gate(
+            gate_drv, gate_id, schedule_policy, schedule_delay
+        )
+        self.__commands = deque()  # (gate id, command, future or None)
+        self.__sources = []
+        self.__publishers = []
+        self.__schedule_listeners = []
+        self.__close_check = None
+        self.__version = 0
+        self.__loop = None
+        self.__wake = None
+        self.__changed = None
+        self.__shutdown = False
+
+    def add_gate(self, gate_drv, gate_id, schedule_policy="follow", schedule_delay=0.0):
+        """
+        Run another gate in the same loop (before run()). schedule_policy is
+        one of bank.SCHEDULE_POLICIES; schedule_delay shifts its scheduled
+        commands by that many seconds.
+        """
+        if gate_id in self.__members or gate_id == ALL_GATES:
+            raise ValueError(f"Gate id {gate_id!r} is already in use")
+        if schedule_policy not in SCHEDULE_POLICIES:
+            raise ValueError(f"Unknown schedule policy {schedule_policy!r}")
+        member = _Member(gate_id, gate_drv, schedule_policy, schedule_delay)
+        self.__members[gate_id] = member
+        return member
+
+    # -- public API -----------------------------------------------------------
+
+    @property
+    def gate_ids(self):
+        """Ids of the gates, the default gate first"""
+        return list(self.__members)
+
+    @property
+    def schedule_enabled(self):
+        """Whether the default gate follows the schedule"""
+        return self.__default.schedule_enabled
+
+    @schedule_enabled.setter
+    def schedule_enabled(self, enabled):
+        self.__default.schedule_enabled = enabled
+
+    def is_schedule_enabled(self, gate_id=None):
+        return self.__member(gate_id).schedule_enabled
+
+    def set_schedule_enabled(self, enabled, gate_id=None):
+        """Set the flag directly (e.g. restored from a checkpoint)"""
+        for member in self.__targets(gate_id):
+            member.schedule_enabled = enabled
+
+    def driver(self, gate_id=None):
+        return self.__member(gate_id).drv
+
+    async def open(self, gate_id=None):
+        return await self.command("OPEN", gate_id)
+
+    async def close(self, gate_id=None):
+        return await self.command("CLOSE", gate_id)
+
+    async def stop(self, gate_id=None):
+        return await self.command("STOP", gate_id)
+
+    async def reset(self, position=None, gate_id=None):
+        return await self.command(
+            "RESET" if position is None else f"RESET:{position}", gate_id
+        )
+
+    async def clear_errors(self, gate_id=None):
+        return await self.command("CLEAR_ERRORS", gate_id)
+
+    async def clear_diagnostics(self, gate_id=None):
+        return await self.command("CLEAR_DIAGNOSTICS", gate_id)
+
+    async def enable_schedule(self, enabled=True, gate_id=None):
+        return await self.command(
+            "ENABLE_SCHEDULE" if enabled else "DISABLE_SCHEDULE", gate_id
+        )
+
+    async def command(self, command, gate_id=None):
+        """
+        Run a command on a gate (default: the default gate; ALL_GATES: every
+        gate); returns that gate's status after the tick that applied it.
+        """
+        return await self.submit(command, gate_id)
+
+    def submit(self, command, gate_id=None):
+        """Queue a command from the loop's thread; returns a future for its status"""
+        command = check_command(command)
+        self.__targets(gate_id)
+        self.__bind()
+        future = self.__loop.create_future()
+        self.__commands.append((gate_id, command, future))
+        self.__wake.set()
+        return future
+
+    def submit_threadsafe(self, command, gate_id=None):
+        """Queue a command from another thread (no result)"""
+        command = check_command(command)
+        self.__targets(gate_id)
+        self.__commands.append((gate_id, command, None))
+        self.wake_threadsafe()
+
+    def wake_threadsafe(self):
+        """Wake the loop from another thread, e.g. after a command source fills"""
+        if self.__loop is not None:
+            self.__loop.call_soon_threadsafe(self.__wake.set)
+
+    def add_command_source(self, source):
+        """
+        `source()` returns queued commands - strings for the default gate or
+        (gate id, command) pairs; drained on every wake-up
+        """
+        self.__sources.append(source)
+
+    def add_publisher(self, publish):
+        """
+        `publish(status)` is called with a gate's status when it changes, and
+        for every gate each publish interval; status["gate_id"] says which
+        """
+        self.__publishers.append(publish)
+
+    def add_schedule_listener(self, listener):
+        """
+        `listener(gate_id, command)` is called when the schedule fires for a
+        gate, with the command name (OPEN or CLOSE), before it takes effect
+        """
+        self.__schedule_listeners.append(listener)
+
+    def set_close_check(self, check):
+        """
+        `check(gate_id)` is asked before a scheduled close of a gate that is
+        not closed: True closes now, a number of seconds holds the close and
+        asks again then. It is called from the loop and must not block.
+        """
+        self.__close_check = check
+
+    def status(self, gate_id=None):
+        """
+        Latest status of a gate (gate status, gate_id, schedule_enabled and
+        state). Diagnostic messages are left out - use diagnostics_generation
+        to see they changed and gate.get_diagnostic_messages() to read them.
+        """
+        member = self.__member(gate_id)
+        return member.status if member.status is not None else self.__snapshot(member)
+
+    def statuses(self):
+        """Latest status of every gate by id"""
+        return {gate_id: self.status(gate_id) for gate_id in self.__members}
+
+    async def watch(self, gate_id=None):
+        """Yield a gate's current status, then every changed status"""
+        self.__bind()
+        member = self.__member(gate_id)
+        version = None
+        while True:
+            changed = self.__changed
+            if version != member.version:
+                version = member.version
+                yield self.status(gate_id)
+            else:
+                await changed.wait()
+
+    async def wait_for_state(self, state, timeout=None, gate_id=None):
+        """
+        Wait until a gate reaches a state ("open", "closed", "opening",
+        "closing", "stopped") or a predicate on its status is true. Returns
+        the status; raises asyncio.TimeoutError after `timeout` seconds.
+        """
+        if callable(state):
+            predicate = state
+        elif state in STATES:
+
+            def predicate(status):
+                return status["state"] == state
+
+        else:
+            raise ValueError(f"Unknown state {state!r}, expected one of {STATES}")
+
+        async def first_match():
+            async for status in self.watch(gate_id):
+                if predicate(status):
+                    return status
+
+        return await asyncio.wait_for(first_match(), timeout)
+
+    def shutdown(self):
+        """Make run() return after the current iteration (or at once if not started)"""
+        self.__shutdown = True
+        if self.__wake is not None:
+            self.__wake.set()
+
+    # -- event loop -----------------------------------------------------------
+
+    async def run(self):
+        """Drive the gates until shutdown()"""
+        self.__bind()
+        clock = time.monotonic
+        members = list(self.__members.values())
+        for member in members:
+            member.gate.set_alert_sink(self.__send_alert)
+        bank = DriverBank(member.drv for member in members)
+        edges = [m.drv for m in members if hasattr(m.drv, "on_switch_event")]
+        for drv in edges:
+            drv.on_switch_event(self.wake_threadsafe)
+        idle_poll = self.__idle_poll
+        if idle_poll is _FROM_DRIVER:
+            polls = [getattr(m.drv, "IDLE_POLL", self.__tick_interval) for m in members]
+            polls = [poll for poll in polls if poll is not None]
+            idle_poll = min(polls) if polls else None
+        next_tick = clock()
+        next_idle_tick = None if idle_poll is None else next_tick
+        next_publish = clock()
+        pending = []  # (future, member) waiting for the next tick
+        first = True  # always tick once on start
+
+        while not self.__shutdown:
+            self.__wake.clear()
+            now = clock()
+
+            # commands from sources, the API and the schedule
+            for source in self.__sources:
+                for command in source():
+                    if isinstance(command, tuple):
+                        self.__commands.append((*command, None))
+                    else:
+                        self.__commands.append((None, command, None))
+            applied = bool(self.__commands)
+            while self.__commands:
+                gate_id, command, future = self.__commands.popleft()
+                try:
+                    targets = self.__targets(gate_id)
+                except ValueError as e:
+                    logger.warning("Ignoring command %s: %s", command, e)
+                    continue
+                for member in targets:
+                    member.schedule_enabled = apply_command(
+                        command, member.drv, member.schedule_enabled, member.gate_id
+                    )
+                if future is not None:
+                    pending.append((future, targets[0]))
+            polled = self.schedule is not None and any(
+                m.schedule_enabled and m.policy != "manual" for m in members
+            )
+            if polled:
+                scheduled = self.schedule.get_gate_cmd(time.time())
+                for member in members:
+                    if member.schedule_enabled and policy_allows(
+                        member.policy, scheduled
+                    ):
+                        member.delayed.append((time.time() + member.delay, scheduled))
+            wall = time.time()
+            for member in members:
+                while member.delayed and member.delayed[0][0] <= wall:
+                    _, scheduled = member.delayed.popleft()
+                    if not member.schedule_enabled:
+                        continue
+                    hold = self.__hold_close(member, scheduled)
+                    if hold is not None:
+                        self.__delay(member, wall + hold, scheduled)
+                        continue
+                    self.__apply_scheduled(member, scheduled)
+                    applied = True
+
+            # a debounced switch change is an input for the gate like a command
+            for drv in edges:
+                if drv.update_switch():
+                    applied = True
+
+            # tick at a fixed rate while a gate moves; idle gates tick at once
+            # on a command or switch change and otherwise only on the idle poll
+            moving = any(m.gate.get_cmd() != Cmd.STOP for m in members)
+            due = moving and next_tick <= now
+            idle_due = next_idle_tick is not None and now >= next_idle_tick
+            if not moving and (applied or first or idle_due):
+                next_tick = now
+                due = True
+            first = False
+            if due:
+                while next_tick <= now:
+                    bank.tick()
+                    self.ticks += 1
+                    next_tick += self.__tick_interval
+                for future, member in pending:
+                    if not future.done():
+                        future.set_result(self.__snapshot(member))
+                pending.clear()
+                if idle_poll is not None:
+                    next_idle_tick = now + idle_poll
+
+            # publish on change and on the heartbeat
+            heartbeat = now >= next_publish
+            for member in members:
+                status = self.__snapshot(member)
+                if status != member.status:
+                    self.__set_status(member, status)
+                    if not heartbeat:
+                        for publish in self.__publishers:
+                            publish(status)
+                if heartbeat:
+                    for publish in self.__publishers:
+                        publish(member.status)
+            if heartbeat:
+                next_publish = now + self.__publish_interval
+
+            # sleep until the next event
+            deadlines = [next_publish]
+            if any(m.gate.get_cmd() != Cmd.STOP for m in members) or pending:
+                deadlines.append(next_tick)
+            elif next_idle_tick is not None:
+                deadlines.append(next_idle_tick)
+            for drv in edges:
+                settle = drv.switch_deadline()
+                if settle is not None:
+                    deadlines.append(settle)
+            wall = time.time()
+            if polled:
+                deadlines.append(now + self.schedule.next_deadline() - wall)
+            for member in members:
+                if member.delayed:
+                    deadlines.append(now + member.delayed[0][0] - wall)
+            timeout = max(0.0, min(deadlines) - clock())
+            if timeout > 0 and not self.__commands:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self.__wake.wait(), timeout)
+            else:
+                await asyncio.sleep(0)
+
+    # -- helpers --------------------------------------------------------------
+
+    def __member(self, gate_id):
+        if gate_id is None:
+            return self.__default
+        try:
+            return self.__members[gate_id]
+        except KeyError:
+            raise ValueError(f"Unknown gate id {gate_id!r}") from None
+
+    def __targets(self, gate_id):
+        """Members a command for `gate_id` goes to"""
+        if gate_id == ALL_GATES:
+            return list(self.__members.values())
+        return [self.__member(gate_id)]
+
+    def __hold_close(self, member, cmd):
+        """Seconds the close check holds a scheduled close for, or None"""
+        if cmd != Cmd.CLOSE or self.__close_check is None:
+            return None
+        if member.status is not None and member.status["state"] == "closed":
+            return None
+        hold = self.__close_check(member.gate_id)
+        return None if hold is True else max(hold, self.__tick_interval)
+
+    @staticmethod
+    def __delay(member, at, cmd):
+        """Queue a scheduled command for epoch time `at`, in time order"""
+        i = len(member.delayed)
+        while i and member.delayed[i - 1][0] > at:
+            i -= 1
+        member.delayed.insert(i, (at, cmd))
+
+    def __apply_scheduled(self, member, cmd):
+        fields = {"command": cmd.name, "gate_id": member.gate_id}
+        if cmd == Cmd.OPEN:
+            logger.info("sched cmd to open gate", extra=fields)
+            member.drv.open()
+        elif cmd == Cmd.CLOSE:
+            logger.info("sched cmd to close gate", extra=fields)
+            member.drv.close()
+        else:
+            return
+        for listener in self.__schedule_listeners:
+            listener(member.gate_id, cmd.name)
+
+    def __send_alert(self, body):
+        """Alert emails go out on an executor thread: SMTP must not stall the loop"""
+        future = self.__loop.run_in_executor(None, gate_module.send_email, body)
+        future.add_done_callback(_log_alert_failure)
+
+    def __bind(self):
+        """Create the loop-bound events on first use inside the event loop"""
+        if self.__loop is None:
+            self.__loop = asyncio.get_running_loop()
+            self.__wake = asyncio.Event()
+            self.__changed = asyncio.Event()
+
+    def __snapshot(self, member):
+        status = member.gate.get_status(diagnostics=False)
+        status["gate_id"] = member.gate_id
+        status["schedule_enabled"] = member.schedule_enabled
+        status["state"] = gate_state(status)
+        return status
+
+    def __set_status(self, member, status):
+        member.status = status
+        member.version += 1
+        self.__version += 1
+        changed, self.__changed = self.__changed, asyncio.Event()
+        changed.set()
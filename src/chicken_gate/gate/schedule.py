@@ -1,22 +1,54 @@
+import logging
 import subprocess  # nosec B404
+import threading
+import time
+from datetime import date, datetime, timedelta
 
-from apscheduler.schedulers.background import BackgroundScheduler
-
+from ..shared.config import get_settings_file_path, load_settings
 from .gate_cmd import Cmd
+from .rules import RuleError, ScheduleRules, Timeline
 from .suntimes import SunTimes
 
+# How often to look for changes to the settings file (seconds)
+RULES_CHECK_INTERVAL = 5.0
+
+# missed_event() looks back at most this many days
+MISSED_EVENT_DAYS = 2
+
+logger = logging.getLogger("chicken-gate-schedule")
+
 
 class Schedule:
-    def __init__(self):
+    def __init__(self, settings_path=None, use_apscheduler=True):
         self.__open_time = None
         self.__close_time = None
-        self.__lift_job = None
-        self.__lower_job = None
         self.gate_cmd = Cmd.NONE
         self.__add_to_log("Program started")
 
-        # create schedule, add job to update dawn / dusk times, and start the scheduler
+        # schedule rules from the settings file, re-read when it changes
+        self.__settings_path = settings_path or get_settings_file_path()
+        self.__settings_mtime = None
+        self.__next_rules_check = 0.0
+        self.__rules = ScheduleRules()
+        self.__load_rules()
+
+        # compiled events per (day, open rule, close rule), and the timeline
+        # with the next event to fire - swapped together as one tuple
+        self.__day_events = {}
+        self.__cursor = (Timeline(), None)
+        self.__update_lock = threading.Lock()
+        self.__next_midnight = None
         self.__suntime = SunTimes()
+
+        if not use_apscheduler:
+            # low-memory profile: get_gate_cmd() recompiles after midnight
+            self.__sched = None
+            self.__update_schedule()
+            return
+
+        # create schedule, add job to recompile the timeline, and start the scheduler
+        from apscheduler.schedulers.background import BackgroundScheduler
+
         self.__sched = BackgroundScheduler()
         self.__update_sched_job = self.__sched.add_job(
             func=self.__update_schedule,
@@ -29,13 +61,72 @@ class Schedule:
         self.__update_schedule()
         self.__sched.start()
 
-    def get_gate_cmd(self):
+    def get_gate_cmd(self, now=None):
+        """Returns the scheduled command due at epoch time `now` (default: now)"""
         gate_cmd = self.gate_cmd
         self.gate_cmd = None
+
+        now = time.time() if now is None else now
+        if now >= self.__next_rules_check:
+            self.__next_rules_check = now + RULES_CHECK_INTERVAL
+            if self.__load_rules():
+                self.__update_schedule(now)
+        if self.__sched is None and now >= self.__next_midnight:
+            self.__update_schedule(now)
+
+        timeline, event = self.__cursor
+        if event is not None and now >= event.at:
+            # after a clock jump over several events only the latest counts
+            passed = timeline.events_between(event.at, now)
+            if passed:
+                logger.warning(
+                    "Clock jumped past %d scheduled events - executing the latest",
+                    len(passed) + 1,
+                )
+                event = passed[-1]
+            self.__cursor = (timeline, timeline.next_event(now))
+            return self.__open() if event.cmd == Cmd.OPEN else self.__close()
         return gate_cmd
 
+    def next_deadline(self):
+        """Epoch time by which get_gate_cmd() next needs to be called"""
+        _, event = self.__cursor
+        deadline = self.__next_rules_check
+        if event is not None:
+            deadline = min(deadline, event.at)
+        if self.__sched is None:
+            deadline = min(deadline, self.__next_midnight)
+        return deadline
+
+    def missed_event(self, since, now=None):
+        """
+        The latest event with since < at <= now (epoch times) - the one that
+        counts if the process was not running across it - or None.
+        """
+        now = time.time() if now is None else now
+        if since >= now:
+            return None
+        today = date.fromtimestamp(now)
+        # the day before `since` too, for events that land past midnight
+        day = max(
+            date.fromtimestamp(since) - timedelta(days=1),
+            today - timedelta(days=MISSED_EVENT_DAYS + 1),
+        )
+        events = []
+        while day <= today:
+            events.extend(
+                self.__rules.compile_day(
+                    day, self.__suntime.get_times(day), self.__suntime.get_zone()
+                )
+            )
+            day += timedelta(days=1)
+        missed = Timeline(events).events_between(since, now)
+        return missed[-1] if missed else None
+
     def get_schedule_info(self):
         """Get comprehensive schedule information for the web interface"""
+        _, event = self.__cursor
+        open_rule, close_rule = self.__rules.rules_for(date.today())
         return {
             "dawn": self.__suntime.get_dawn().isoformat(),
             "dusk": self.__suntime.get_dusk().isoformat(),
@@ -47,11 +138,24 @@ class Schedule:
             "gate_close_time": self.__close_time.strftime("%H:%M")
             if self.__close_time
             else "Unknown",
+            "open_rule": open_rule,
+            "close_rule": close_rule,
+            "next_event": {
+                "time": event.when.isoformat(),
+                "command": event.cmd.name,
+            }
+            if event
+            else None,
             "next_update": "00:00 (midnight)",
         }
 
-    def __add_to_log(self, entry):
-        print(entry)
+    def shutdown(self):
+        """Stop the background scheduler"""
+        if self.__sched is not None:
+            self.__sched.shutdown(wait=False)
+
+    def __add_to_log(self, entry, *args, **fields):
+        logger.info(entry, *args, extra=fields)
 
     def __restart_service(self):
         # restart the service to pick up any changes
@@ -63,49 +167,85 @@ class Schedule:
                 capture_output=True,
             )
         except subprocess.CalledProcessError as e:
-            print(f"Failed to restart service: {e}")
+            logger.error("Failed to restart service: %s", e)
         except FileNotFoundError:
-            print("systemctl not found - not running on systemd system")
+            logger.warning("systemctl not found - not running on systemd system")
 
-    def __update_schedule(self):
-        self.__update_open_and_close_times()
-        self.__schedule_close()
-        self.__schedule_open()
-
-        self.__sched.print_jobs()
+    def __load_rules(self):
+        """Re-read the rules if the settings file changed; True if they did"""
+        try:
+            mtime = self.__settings_path.stat().st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self.__settings_mtime:
+            return False
+        self.__settings_mtime = mtime
 
-    def __update_open_and_close_times(self):
-        self.__open_time = self.__suntime.get_sunrise()
-        self.__close_time = self.__suntime.get_dusk()
+        try:
+            rules = ScheduleRules.from_settings(load_settings(self.__settings_path))
+        except (RuleError, ValueError) as e:
+            self.__add_to_log("Invalid schedule rules, keeping previous rules: %s", e)
+            return False
+
+        if rules.fingerprint() == self.__rules.fingerprint():
+            return False
+        self.__rules = rules
+        self.__add_to_log(
+            "Schedule rules: open = %s, close = %s (%d override(s))",
+            rules.open_rule,
+            rules.close_rule,
+            len(rules.overrides),
+        )
+        return True
+
+    def __update_schedule(self, now=None):
+        with self.__update_lock:
+            self.__update_open_and_close_times(now)
+
+    def __update_open_and_close_times(self, now=None):
+        # Yesterday to tomorrow, so events that land past midnight still fire
+        # after the midnight update. Days whose rules did not change reuse
+        # their compiled events.
+        now = time.time() if now is None else now
+        today = date.fromtimestamp(now)
+        days = [today + timedelta(days=offset) for offset in (-1, 0, 1)]
+        self.__next_midnight = datetime.combine(
+            days[2], datetime.min.time()
+        ).timestamp()
+
+        day_events = {}
+        events = []
+        for day in days:
+            key = (day, *self.__rules.rules_for(day))
+            compiled = self.__day_events.get(key)
+            if compiled is None:
+                compiled = self.__rules.compile_day(
+                    day, self.__suntime.get_times(day), self.__suntime.get_zone()
+                )
+            day_events[key] = compiled
+            events.extend(compiled)
+        self.__day_events = day_events
+
+        timeline = Timeline(events)
+        self.__cursor = (timeline, timeline.next_event(now))
+
+        todays = {e.job: e.when for e in events if e.day == today}
+        self.__open_time = todays.get("open")
+        self.__close_time = todays.get("close")
+
+        for event in timeline:
+            if event.at > now:
+                self.__add_to_log(
+                    "Scheduled %s at %s",
+                    event.job,
+                    event.when.strftime("%Y-%m-%d %H:%M:%S"),
+                    command=event.cmd.name,
+                )
 
     def __close(self):
-        self.__add_to_log("Executing scheduled close job...")
-        self.gate_cmd = Cmd.CLOSE
+        self.__add_to_log("Executing scheduled close job...", command="CLOSE")
+        return Cmd.CLOSE
 
     def __open(self):
-        self.__add_to_log("Executing scheduled open job...")
-        self.gate_cmd = Cmd.OPEN
-
-    def __schedule_close(self):
-        if self.__lift_job is not None:
-            self.__lift_job.remove()
-        self.__lift_job = self.__sched.add_job(
-            func=self.__close,
-            trigger="cron",
-            replace_existing=True,
-            id="1",
-            hour=self.__close_time.hour,
-            minute=self.__close_time.minute,
-        )
-
-    def __schedule_open(self):
-        if self.__lower_job is not None:
-            self.__lower_job.remove()
-        self.__lower_job = self.__sched.add_job(
-            func=self.__open,
-            trigger="cron",
-            replace_existing=True,
-            id="2",
-            hour=self.__open_time.hour,
-            minute=self.__open_time.minute,
-        )
+        self.__add_to_log("Executing scheduled open job...", command="OPEN")
+        return Cmd.OPEN
@@ -1,29 +1,57 @@
-from astral import LocationInfo
-from astral.sun import sun
+from datetime import date
+
 from dateutil import tz
 
+# Gate location
+LOCATION_NAME = "Nanaimo"
+LOCATION_REGION = "Canada"
+LATITUDE = 49.164379
+LONGITUDE = -123.936661
+
+# Days of sun times kept by SunTimes.get_times()
+CACHE_DAYS = 8
+
 
 class SunTimes:
     def __init__(self):
-        self.__latitude = 49.164379
-        self.__longitude = -123.936661
+        from astral import LocationInfo
+
+        self.__latitude = LATITUDE
+        self.__longitude = LONGITUDE
         self.__loc_info = LocationInfo(
-            "Nanaimo", "Canada", "pst", self.__latitude, self.__longitude
+            LOCATION_NAME, LOCATION_REGION, "pst", self.__latitude, self.__longitude
         )
+        self.__cache = {}  # day -> sun events, shared by every gate's status
+
+    def get_zone(self):
+        """Time zone the sun times are reported in (local time)"""
+        return tz.gettz()
+
+    def get_times(self, day=None):
+        """All sun events (dawn, sunrise, noon, sunset, dusk) for a day, default today"""
+        day = date.today() if day is None else day
+        times = self.__cache.get(day)
+        if times is None:
+            from astral.sun import sun
+
+            times = sun(self.__loc_info.observer, date=day, tzinfo=tz.gettz())
+            if len(self.__cache) >= CACHE_DAYS:
+                self.__cache.clear()
+            self.__cache[day] = times
+        return times
 
     def get_dawn(self):
-        print(tz.gettz())
-        loc_times = sun(self.__loc_info.observer, tzinfo=tz.gettz())
+        loc_times = self.get_times()
         return loc_times["dawn"]
 
     def get_dusk(self):
-        loc_times = sun(self.__loc_info.observer, tzinfo=tz.gettz())
+        loc_times = self.get_times()
         return loc_times["dusk"]
 
     def get_sunrise(self):
-        loc_times = sun(self.__loc_info.observer, tzinfo=tz.gettz())
+        loc_times = self.get_times()
         return loc_times["sunrise"]
 
     def get_sunset(self):
-        loc_times = sun(self.__loc_info.observer, tzinfo=tz.gettz())
+        loc_times = self.get_times()
         return loc_times["sunset"]
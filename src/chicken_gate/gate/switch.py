@@ -0,0 +1,56 @@
+"""
+Debounce filter for the closed switch.
+
+The drivers feed it timestamped edges from the GPIO edge callback (or the
+mock's emulated one). A new level only becomes the debounced level once the
+input has stayed there for the debounce time, so contact bounce never
+reaches the gate. Nothing polls the pin: the runtime asks for the time the
+pending level would settle and updates the filter then.
+"""
+
+import threading
+
+# Default debounce time (seconds)
+DEFAULT_DEBOUNCE = 0.05
+
+
+class SwitchDebouncer:
+    """Stable-time debounce filter fed with timestamped edges"""
+
+    def __init__(self, debounce=DEFAULT_DEBOUNCE, level=False):
+        self.debounce = debounce
+        self.level = level  # debounced level
+        self.edges = 0  # raw transitions seen
+        self.filtered = 0  # transitions that never settled (bounce)
+        self.last_change = None  # time the debounced level last changed
+        self.__raw = level
+        self.__last_edge = None
+        self.__lock = threading.Lock()  # edges arrive on the GPIO thread
+
+    def edge(self, level, now):
+        """Record the input level after an edge; False if it did not change"""
+        with self.__lock:
+            if level == self.__raw:
+                return False
+            if self.__raw != self.level:
+                self.filtered += 1  # pending level abandoned before settling
+            self.__raw = level
+            self.__last_edge = now
+            self.edges += 1
+            return True
+
+    def deadline(self):
+        """When the pending level settles, or None if nothing is pending"""
+        with self.__lock:
+            if self.__raw == self.level:
+                return None
+            return self.__last_edge + self.debounce
+
+    def update(self, now):
+        """Settle the pending level if it has been stable; True if level changed"""
+        with self.__lock:
+            if self.__raw == self.level or now < self.__last_edge + self.debounce:
+                return False
+            self.level = self.__raw
+            self.last_change = now
+            return True
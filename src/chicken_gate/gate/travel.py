@@ -0,0 +1,452 @@
+"""
+Motor travel-time statistics, measured against the switches.
+
+The gate estimates its position from fixed open and close times, so a motor
+that slows with age, cold or a sticking hinge makes the estimate drift. A
+TravelMonitor attached to a Gate times each travel from where the motion
+started to a switch edge - the closed switch pressing while closing, the
+open switch (if one is fitted) while opening - and scales it to a full
+travel. Travels shorter than min_distance percent, or cut short by a stop
+or a reversal, are not counted. A close that runs its estimated time out
+before the switch (the motor is slower than the gate thinks) counts as an
+overrun, at the least time it could have taken.
+
+Statistics are kept per direction, overall and per temperature bucket, in
+constant memory: Welford's running mean and variance, an exponentially
+weighted moving average (EWMA) of recent travels, and P-square estimates of
+the median, 90th and 95th percentiles. Times are in gate time - the elapsed
+time passed to Gate.tick() while moving - which is what the position
+estimate uses.
+
+With calibrate on, the gate's rates follow the EWMA once min_samples travels
+are in (that temperature bucket's if it has enough, else the direction's),
+within max_adjust_percent of the configured times. When a direction's EWMA
+moves more than trend_percent from its long-run mean the gate raises a
+"travel_trend" diagnostic and an email, once until it comes back.
+"""
+
+import logging
+import math
+import threading
+from bisect import insort
+from collections import namedtuple
+
+logger = logging.getLogger("chicken-gate")
+
+DIRECTIONS = ("open", "close")
+
+# Defaults of the [travel] settings
+CALIBRATE = False
+TREND_PERCENT = 20.0
+BUCKET_WIDTH = 10.0  # degrees C per temperature bucket
+EWMA_ALPHA = 0.2
+MIN_SAMPLES = 5
+MIN_DISTANCE = 25.0  # percent of a full travel
+MAX_ADJUST_PERCENT = 50.0
+CLOSED_SWITCH_POSITION = 95.0  # where closing presses the closed switch
+TEMPERATURE_INTERVAL = 60.0  # seconds between temperature_file reads
+
+# A counted travel: its direction, temperature bucket (None if unknown),
+# seconds scaled to a full travel, and the trend it raised - (direction,
+# percent, EWMA, mean) - or None
+Travel = namedtuple("Travel", ["direction", "bucket", "seconds", "trend"])
+
+
+class P2Quantile:
+    """
+    Streaming estimate of one quantile (Jain & Chlamtac's P-square
+    algorithm): five markers, adjusted by parabolic interpolation
+    """
+
+    __slots__ = ("p", "heights", "positions", "desired", "increments")
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []  # the first five samples, sorted, then the markers
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        q = self.heights
+        if len(q) < 5:
+            insort(q, x)
+            return
+        n = self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        desired = self.desired
+        for i in range(5):
+            desired[i] += self.increments[i]
+        for i in (1, 2, 3):
+            d = desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self.__parabolic(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def __parabolic(self, i, d):
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        """The estimate (None before the first sample)"""
+        q = self.heights
+        if not q:
+            return None
+        if len(q) == 5 and self.positions[4] > 4:
+            return q[2]
+        # few samples: interpolate between them
+        index = self.p * (len(q) - 1)
+        low = int(index)
+        high = min(low + 1, len(q) - 1)
+        return q[low] + (q[high] - q[low]) * (index - low)
+
+    def get_state(self):
+        return [list(self.heights), list(self.positions), list(self.desired)]
+
+    def restore_state(self, state):
+        heights, positions, desired = state
+        self.heights = [float(h) for h in heights]
+        self.positions = [int(n) for n in positions]
+        self.desired = [float(d) for d in desired]
+
+
+class TravelStats:
+    """Running statistics of travel times, in constant memory"""
+
+    __slots__ = (
+        "alpha",
+        "count",
+        "overruns",
+        "mean",
+        "m2",
+        "ewma",
+        "min",
+        "max",
+        "quantiles",
+    )
+
+    QUANTILES = (0.5, 0.9, 0.95)
+
+    def __init__(self, alpha=EWMA_ALPHA):
+        self.alpha = alpha
+        self.count = 0
+        self.overruns = 0  # travels that did not reach the switch
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared differences from the mean (Welford)
+        self.ewma = None
+        self.min = None
+        self.max = None
+        self.quantiles = [P2Quantile(p) for p in self.QUANTILES]
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.ewma = x if self.ewma is None else self.ewma + self.alpha * (x - self.ewma)
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+        for quantile in self.quantiles:
+            quantile.add(x)
+
+    @property
+    def variance(self):
+        """Sample variance (0 below two samples)"""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self):
+        return math.sqrt(self.variance)
+
+    def quantile(self, p):
+        for quantile in self.quantiles:
+            if quantile.p == p:
+                return quantile.value()
+        raise KeyError(p)
+
+    def to_dict(self):
+        """Summary for the status, in seconds"""
+
+        def rounded(x):
+            return None if x is None else round(x, 1)
+
+        summary = {
+            "count": self.count,
+            "overruns": self.overruns,
+            "mean": rounded(self.mean if self.count else None),
+            "stdev": rounded(self.stdev),
+            "ewma": rounded(self.ewma),
+            "min": rounded(self.min),
+            "max": rounded(self.max),
+        }
+        for quantile in self.quantiles:
+            summary[f"p{round(quantile.p * 100)}"] = rounded(quantile.value())
+        return summary
+
+    def get_state(self):
+        return {
+            "count": self.count,
+            "overruns": self.overruns,
+            "mean": self.mean,
+            "m2": self.m2,
+            "ewma": self.ewma,
+            "min": self.min,
+            "max": self.max,
+            "quantiles": [quantile.get_state() for quantile in self.quantiles],
+        }
+
+    def restore_state(self, state):
+        self.count = int(state["count"])
+        self.overruns = int(state.get("overruns", 0))
+        self.mean = float(state["mean"])
+        self.m2 = float(state["m2"])
+        self.ewma = state["ewma"]
+        self.min = state["min"]
+        self.max = state["max"]
+        for quantile, quantile_state in zip(self.quantiles, state["quantiles"]):
+            quantile.restore_state(quantile_state)
+
+
+def bucket_of(temperature, width):
+    """Lower bound of the temperature's bucket, or None if unknown"""
+    if temperature is None:
+        return None
+    return int(math.floor(temperature / width) * width)
+
+
+def read_temperature(path):
+    """
+    Degrees C from a sensor file: a 1-wire w1_slave file ("... t=21375"),
+    or a sysfs temperature in millidegrees (or degrees, if it has a point)
+    """
+    with open(path) as f:
+        text = f.read()
+    if "t=" in text:
+        if "YES" not in text:
+            raise ValueError(f"{path}: bad CRC")
+        return int(text.rsplit("t=", 1)[1]) / 1000
+    value = text.strip()
+    return float(value) if "." in value else int(value) / 1000
+
+
+class TravelMonitor:
+    """Times a gate's travels and keeps statistics per direction and bucket"""
+
+    SETTINGS = (
+        "calibrate",
+        "trend_percent",
+        "bucket_width",
+        "ewma_alpha",
+        "min_samples",
+        "min_distance",
+        "max_adjust_percent",
+        "closed_switch_position",
+    )
+
+    def __init__(
+        self,
+        calibrate=CALIBRATE,
+        trend_percent=TREND_PERCENT,
+        bucket_width=BUCKET_WIDTH,
+        ewma_alpha=EWMA_ALPHA,
+        min_samples=MIN_SAMPLES,
+        min_distance=MIN_DISTANCE,
+        max_adjust_percent=MAX_ADJUST_PERCENT,
+        closed_switch_position=CLOSED_SWITCH_POSITION,
+    ):
+        if not 0 < ewma_alpha <= 1:
+            raise ValueError("ewma_alpha must be in (0, 1]")
+        if bucket_width <= 0 or trend_percent <= 0 or max_adjust_percent < 0:
+            raise ValueError(
+                "bucket_width and trend_percent must be positive, "
+                "max_adjust_percent not negative"
+            )
+        if not 0 < closed_switch_position <= 100:
+            raise ValueError("closed_switch_position must be in (0, 100]")
+        self.calibrate = bool(calibrate)
+        self.trend_percent = trend_percent
+        self.bucket_width = bucket_width
+        self.ewma_alpha = ewma_alpha
+        self.min_samples = max(1, int(min_samples))
+        self.min_distance = min_distance
+        self.max_adjust_percent = max_adjust_percent
+        self.closed_switch_position = closed_switch_position
+        self.temperature = None  # degrees C, from set_temperature()
+        self.nominal = {}  # direction -> configured full travel seconds
+        self.__stats = {}  # (direction, bucket) -> TravelStats
+        self.__trending = set()  # directions with a trend alert raised
+        self.__current = None  # (direction, start time, start position, bucket)
+        self.__state = None  # get_state() until the statistics change
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Monitor for a [travel] settings table (but its temperature_file)"""
+        unknown = set(settings) - set(cls.SETTINGS) - {"temperature_file"}
+        if unknown:
+            raise ValueError(f"unknown [travel] keys: {sorted(unknown)}")
+        settings = {k: v for k, v in settings.items() if k != "temperature_file"}
+        return cls(**settings)
+
+    def set_temperature(self, celsius):
+        """The temperature the next travels are filed under (None: unknown)"""
+        self.temperature = celsius
+
+    def stats(self, direction, bucket=None):
+        """TravelStats of a direction (one bucket's, or all), or None"""
+        return self.__stats.get((direction, bucket))
+
+    def start(self, direction, now, position):
+        """Motion towards `direction` began (replacing any travel under way)"""
+        bucket = bucket_of(self.temperature, self.bucket_width)
+        self.__current = (direction, now, position, bucket)
+
+    def abort(self):
+        """The travel under way ended without reaching a switch"""
+        self.__current = None
+
+    def finish(self, direction, now, reached=True):
+        """
+        A switch was reached moving towards `direction` - or, with reached
+        False, the motion ran its full estimated time without reaching it.
+        That overrun counts at the time to the switch it would have taken at
+        the very least, so a slowing motor still pulls the statistics up.
+        Returns the counted Travel, or None if there was none to count.
+        """
+        current, self.__current = self.__current, None
+        if current is None or current[0] != direction:
+            return None
+        _, start, position, bucket = current
+        if direction == "close":
+            distance = self.closed_switch_position - position
+        else:
+            distance = position
+        if distance < self.min_distance or now <= start:
+            return None
+        seconds = (now - start) * 100 / distance
+        self.__add(direction, None, seconds, reached)
+        if bucket is not None:
+            self.__add(direction, bucket, seconds, reached)
+        return Travel(direction, bucket, seconds, self.__trend(direction))
+
+    def __add(self, direction, bucket, seconds, reached):
+        stats = self.__stats.get((direction, bucket))
+        if stats is None:
+            stats = self.__stats[direction, bucket] = TravelStats(self.ewma_alpha)
+        stats.add(seconds)
+        if not reached:
+            stats.overruns += 1
+        self.__state = None
+
+    def __trend(self, direction):
+        """(direction, percent, EWMA, mean) if its EWMA left its mean just now"""
+        stats = self.__stats[direction, None]
+        if stats.count < self.min_samples:
+            return None
+        percent = (stats.ewma - stats.mean) * 100 / stats.mean
+        if abs(percent) <= self.trend_percent / 2:
+            if direction in self.__trending:
+                self.__trending.discard(direction)
+                self.__state = None
+        elif abs(percent) > self.trend_percent and direction not in self.__trending:
+            self.__trending.add(direction)
+            self.__state = None
+            return (direction, percent, stats.ewma, stats.mean)
+        return None
+
+    def calibrated_time(self, direction):
+        """
+        Full travel seconds to use for `direction`: the EWMA of the current
+        temperature bucket (or of all travels) within max_adjust_percent of
+        the nominal time, or None without enough travels
+        """
+        bucket = bucket_of(self.temperature, self.bucket_width)
+        stats = self.__stats.get((direction, bucket))
+        if stats is None or stats.count < self.min_samples:
+            stats = self.__stats.get((direction, None))
+            if stats is None or stats.count < self.min_samples:
+                return None
+        seconds = stats.ewma
+        nominal = self.nominal.get(direction)
+        if nominal is not None:
+            limit = self.max_adjust_percent / 100
+            seconds = min(max(seconds, nominal * (1 - limit)), nominal * (1 + limit))
+        return seconds
+
+    def to_dict(self):
+        """Statistics for the status: {direction: {"all"|bucket: summary}}"""
+        summary = {}
+        for (direction, bucket), stats in sorted(
+            self.__stats.items(), key=lambda item: (item[0][0], item[0][1] or 0)
+        ):
+            key = "all" if bucket is None else str(bucket)
+            summary.setdefault(direction, {})[key] = stats.to_dict()
+        summary["temperature"] = self.temperature
+        summary["trending"] = sorted(self.__trending)
+        return summary
+
+    def get_state(self):
+        """
+        Statistics to carry across a restart (see Gate.get_state()); built
+        again only after they change, as the gate's state is read each publish
+        """
+        if self.__state is None:
+            self.__state = {
+                "stats": [
+                    [direction, bucket, stats.get_state()]
+                    for (direction, bucket), stats in self.__stats.items()
+                ],
+                "trending": sorted(self.__trending),
+            }
+        return self.__state
+
+    def restore_state(self, state):
+        self.__stats = {}
+        for direction, bucket, stats_state in state.get("stats", ()):
+            stats = TravelStats(self.ewma_alpha)
+            stats.restore_state(stats_state)
+            self.__stats[direction, bucket] = stats
+        self.__trending = set(state.get("trending", ()))
+        self.__current = None
+        self.__state = None
+
+
+def start_temperature_reader(path, monitors, interval=TEMPERATURE_INTERVAL):
+    """
+    Read the temperature from `path` every `interval` seconds in a daemon
+    thread, for the monitors (a 1-wire read takes most of a second - too
+    long for the gate loop). Returns an Event that stops it.
+    """
+
+    def run():
+        while True:
+            try:
+                celsius = read_temperature(path)
+            except (OSError, ValueError) as e:
+                logger.warning("Cannot read temperature from %s: %s", path, e)
+                celsius = None
+            for monitor in monitors:
+                monitor.set_temperature(celsius)
+            if stop.wait(interval):
+                return
+
+    stop = threading.Event()
+    threading.Thread(target=run, name="temperature", daemon=True).start()
+    return stop
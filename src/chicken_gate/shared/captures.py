@@ -0,0 +1,463 @@
+"""
+Camera capture archive: a picture of the coop on every gate event, and a
+timelapse in between.
+
+A CaptureService is an AsyncGate publisher and schedule listener. It takes a
+frame when a gate changes state or the schedule fires, and every `interval`
+seconds otherwise. Frames are grabbed from the RTSP camera on a background
+thread, so a slow camera never holds up a tick.
+
+CaptureArchive keeps the JPEGs in CAPTURE_DIR:
+
+    00000001.seg ...   append-only segments: per frame a 16-byte header
+                       (magic, epoch time, length) and the JPEG
+    index.bin          one fixed 24-byte record per frame (time, segment,
+                       offset, length, reason), in time order
+
+A time lookup is a binary search of the index file - no directory scan and
+no JPEG read until the frame is served. A segment is closed once it reaches
+segment_megabytes; the oldest are deleted (and their index records dropped)
+while the archive exceeds max_megabytes. A lost index is rebuilt from the
+segment headers.
+"""
+
+import contextlib
+import logging
+import os
+import queue
+import re
+import struct
+import threading
+import time
+
+from .config import CAMERA_IP, CAMERA_PASSWORD, CAMERA_USERNAME, CAPTURE_DIR
+
+logger = logging.getLogger("chicken-gate")
+
+# Why a frame was taken (the index stores the position in this tuple)
+REASONS = (
+    "periodic",
+    "schedule_open",
+    "schedule_close",
+    "open",
+    "closed",
+    "opening",
+    "closing",
+    "stopped",
+)
+
+# Defaults of the [capture] settings
+INTERVAL = 600.0  # seconds between timelapse frames
+MIN_GAP = 5.0  # seconds: triggers closer than this to a frame are dropped
+MAX_MEGABYTES = 512
+SEGMENT_MEGABYTES = 16
+QUALITY = 85  # JPEG quality
+
+INDEX_FILE = "index.bin"
+_INDEX = struct.Struct("<dIIIB3x")  # time, segment, offset, length, reason
+_HEADER = struct.Struct("<4sdI")  # magic, time, length
+_MAGIC = b"CGF1"
+_SEGMENT = re.compile(r"^(\d{8})\.seg$")
+_WAKE = object()  # queued by CaptureService.stop()
+
+
+def rtsp_url():
+    return f"rtsp://{CAMERA_USERNAME}:{CAMERA_PASSWORD}@{CAMERA_IP}:554/stream1"
+
+
+def grab_jpeg(url, quality=QUALITY):
+    """One frame of an RTSP stream as JPEG bytes, or None (needs OpenCV)"""
+    import cv2
+
+    capture = cv2.VideoCapture(url)
+    try:
+        if not capture.isOpened():
+            return None
+        ok, frame = capture.read()
+        if not ok:
+            return None
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buffer.tobytes() if ok else None
+    finally:
+        capture.release()
+
+
+class Frame:
+    """An index record: where a frame is and why it was taken"""
+
+    __slots__ = ("t", "segment", "offset", "length", "reason")
+
+    def __init__(self, t, segment, offset, length, reason):
+        self.t = t
+        self.segment = segment
+        self.offset = offset
+        self.length = length
+        self.reason = reason
+
+    def to_dict(self):
+        return {"t": round(self.t, 3), "reason": self.reason, "size": self.length}
+
+
+class CaptureArchive:
+    """Append-only JPEG segments with a fixed-record time index"""
+
+    def __init__(
+        self,
+        directory=CAPTURE_DIR,
+        max_megabytes=MAX_MEGABYTES,
+        segment_megabytes=SEGMENT_MEGABYTES,
+    ):
+        if segment_megabytes <= 0 or max_megabytes < segment_megabytes:
+            raise ValueError("need 0 < segment_megabytes <= max_megabytes")
+        self.directory = directory
+        self.max_bytes = int(max_megabytes * 1024 * 1024)
+        self.segment_bytes = int(segment_megabytes * 1024 * 1024)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.__last_t = None  # time of the last frame, once recovered
+        self.__segment = None  # segment being written
+
+    def path(self, segment):
+        return os.path.join(self.directory, f"{segment:08d}.seg")
+
+    def segments(self):
+        """Numbers of the segment files, oldest first"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(m.group(1)) for m in map(_SEGMENT.match, names) if m)
+
+    # Reading
+
+    def __record(self, f, i):
+        f.seek(i * _INDEX.size)
+        t, segment, offset, length, reason = _INDEX.unpack(f.read(_INDEX.size))
+        return Frame(t, segment, offset, length, REASONS[reason])
+
+    def __bisect(self, f, count, t):
+        """Index of the first record at or after time t"""
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if self.__record(f, middle).t < t:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def __open_index(self):
+        try:
+            f = open(self.index_path, "rb")  # noqa: SIM115 - callers close it
+        except FileNotFoundError:
+            return None, 0
+        return f, os.fstat(f.fileno()).st_size // _INDEX.size
+
+    def nearest(self, t):
+        """The frame taken nearest to epoch time t, or None if there is none"""
+        f, count = self.__open_index()
+        if f is None:
+            return None
+        with f:
+            if count == 0:
+                return None
+            i = self.__bisect(f, count, t)
+            candidates = [self.__record(f, j) for j in (i - 1, i) if 0 <= j < count]
+        return min(candidates, key=lambda frame: abs(frame.t - t))
+
+    def frames(self, start=None, end=None, limit=None):
+        """Frames with start <= t < end, oldest first, at most `limit`"""
+        f, count = self.__open_index()
+        if f is None:
+            return []
+        with f:
+            i = 0 if start is None else self.__bisect(f, count, start)
+            found = []
+            while i < count and (limit is None or len(found) < limit):
+                frame = self.__record(f, i)
+                if end is not None and frame.t >= end:
+                    break
+                found.append(frame)
+                i += 1
+        return found
+
+    def read(self, frame):
+        """The JPEG of a frame; OSError if its segment has gone"""
+        with open(self.path(frame.segment), "rb") as f:
+            f.seek(frame.offset)
+            data = f.read(frame.length)
+        if len(data) != frame.length:
+            raise OSError(f"frame at {frame.t} truncated in segment {frame.segment}")
+        return data
+
+    def stats(self):
+        """Frame count, bytes on disk and the first and last frame times"""
+        stats = {"frames": 0, "first": None, "last": None}
+        stats["bytes"] = sum(os.path.getsize(self.path(s)) for s in self.segments())
+        f, count = self.__open_index()
+        if f is not None:
+            with f:
+                if count:
+                    stats["frames"] = count
+                    stats["first"] = round(self.__record(f, 0).t, 3)
+                    stats["last"] = round(self.__record(f, count - 1).t, 3)
+        return stats
+
+    # Writing (one writer: the gate process's CaptureService)
+
+    def append(self, jpeg, reason, t=None):
+        """Store a JPEG taken at epoch time t (default now); returns its Frame"""
+        t = time.time() if t is None else t
+        if self.__last_t is None:
+            self.__recover()
+        # the index must stay in time order, even if the clock steps back
+        t = max(t, self.__last_t)
+        path = self.path(self.__segment)
+        rotated = os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes
+        if rotated:
+            self.__segment += 1
+            path = self.path(self.__segment)
+        with open(path, "ab") as f:
+            f.write(_HEADER.pack(_MAGIC, t, len(jpeg)))
+            offset = f.tell()
+            f.write(jpeg)
+        # the index record last: a frame is only found once it is whole
+        frame = Frame(t, self.__segment, offset, len(jpeg), reason)
+        with open(self.index_path, "ab") as f:
+            f.write(
+                _INDEX.pack(t, frame.segment, offset, len(jpeg), REASONS.index(reason))
+            )
+        self.__last_t = t
+        if rotated:
+            self.enforce_retention()
+        return frame
+
+    def enforce_retention(self):
+        """Delete the oldest segments while the archive exceeds max_bytes"""
+        segments = self.segments()
+        sizes = {s: os.path.getsize(self.path(s)) for s in segments}
+        total = sum(sizes.values())
+        deleted = set()
+        for segment in segments[:-1]:  # never the one being written
+            if total <= self.max_bytes:
+                break
+            os.remove(self.path(segment))
+            total -= sizes[segment]
+            deleted.add(segment)
+        if deleted:
+            logger.info("Deleted capture segments %s", sorted(deleted))
+            self.__rewrite_index(lambda frame: frame.segment not in deleted)
+
+    def __rewrite_index(self, keep):
+        f, count = self.__open_index()
+        if f is None:
+            return
+        with f:
+            f.seek(0)
+            data = f.read(count * _INDEX.size)
+        temp = self.index_path + ".tmp"
+        with open(temp, "wb") as out:
+            for t, segment, offset, length, reason in _INDEX.iter_unpack(data):
+                if keep(Frame(t, segment, offset, length, reason)):
+                    out.write(_INDEX.pack(t, segment, offset, length, reason))
+        os.replace(temp, self.index_path)
+
+    def __recover(self):
+        """
+        Before the first append: rebuild a lost index, cut a torn index
+        record, and cut the last segment back to the end of its last
+        indexed frame (a frame torn by a crash)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self.segments()
+        try:
+            size = os.path.getsize(self.index_path)
+        except FileNotFoundError:
+            size = None
+        if size is None and segments:
+            self.rebuild_index()
+        elif size is not None and size % _INDEX.size:
+            with open(self.index_path, "rb+") as f:
+                f.truncate(size - size % _INDEX.size)
+        self.__segment = segments[-1] if segments else 1
+        self.__last_t = 0.0
+        end = 0
+        f, count = self.__open_index()
+        if f is not None:
+            with f:
+                if count:
+                    last = self.__record(f, count - 1)
+                    self.__last_t = last.t
+                    if last.segment == self.__segment:
+                        end = last.offset + last.length
+        path = self.path(self.__segment)
+        if os.path.exists(path) and os.path.getsize(path) > end:
+            with open(path, "rb+") as f:
+                f.truncate(end)
+
+    def rebuild_index(self):
+        """Rebuild the index from the segment headers (reasons are lost)"""
+        temp = self.index_path + ".tmp"
+        frames = 0
+        with open(temp, "wb") as out:
+            for segment in self.segments():
+                with open(self.path(segment), "rb") as f:
+                    while True:
+                        header = f.read(_HEADER.size)
+                        if len(header) < _HEADER.size:
+                            break
+                        magic, t, length = _HEADER.unpack(header)
+                        if magic != _MAGIC:
+                            logger.warning("Capture segment %d damaged", segment)
+                            break
+                        offset = f.tell()
+                        if len(f.read(length)) < length:
+                            break  # torn last frame
+                        out.write(_INDEX.pack(t, segment, offset, length, 0))
+                        frames += 1
+        os.replace(temp, self.index_path)
+        logger.warning("Rebuilt the capture index: %d frames", frames)
+
+
+class CaptureService:
+    """
+    Takes frames into a CaptureArchive on gate state changes, schedule events
+    and every `interval` seconds, from a background thread
+    """
+
+    SETTINGS = (
+        "enabled",
+        "interval",
+        "min_gap",
+        "max_megabytes",
+        "segment_megabytes",
+        "quality",
+        "url",
+    )
+
+    def __init__(
+        self,
+        archive,
+        capture=None,
+        interval=INTERVAL,
+        min_gap=MIN_GAP,
+        clock=time.time,
+    ):
+        """`capture()` returns a JPEG or None (default: grab_jpeg of the camera)"""
+        self.archive = archive
+        self.interval = interval
+        self.min_gap = min_gap
+        self.captured = 0
+        self.failures = 0
+        self.__capture = capture or (lambda: grab_jpeg(rtsp_url()))
+        self.__clock = clock
+        self.__states = {}  # gate id -> last published state
+        self.__triggers = queue.Queue(maxsize=16)
+        self.__last = None  # time of the last frame (or attempt)
+        self.__thread = None
+        self.__stop = threading.Event()
+
+    @classmethod
+    def from_settings(cls, settings, directory=CAPTURE_DIR):
+        """Service for a [capture] settings table, or None unless enabled"""
+        unknown = set(settings) - set(cls.SETTINGS)
+        if unknown:
+            raise ValueError(f"unknown [capture] keys: {sorted(unknown)}")
+        settings = dict(settings)
+        if not settings.pop("enabled", False):
+            return None
+        archive = CaptureArchive(
+            directory,
+            settings.pop("max_megabytes", MAX_MEGABYTES),
+            settings.pop("segment_megabytes", SEGMENT_MEGABYTES),
+        )
+        url = settings.pop("url", None) or rtsp_url()
+        quality = settings.pop("quality", QUALITY)
+        return cls(archive, lambda: grab_jpeg(url, quality), **settings)
+
+    def attach(self, runtime):
+        """Take frames on `runtime`'s gate and schedule events"""
+        runtime.add_publisher(self.publish)
+        runtime.add_schedule_listener(self.on_schedule)
+
+    def publish(self, status):
+        state = status["state"]
+        previous = self.__states.get(status["gate_id"])
+        self.__states[status["gate_id"]] = state
+        if previous is not None and state != previous:
+            self.trigger(state)
+
+    def on_schedule(self, gate_id, command):
+        self.trigger("schedule_" + command.lower())
+
+    def trigger(self, reason):
+        """Ask for a frame (dropped if the queue is full)"""
+        with contextlib.suppress(queue.Full):
+            self.__triggers.put_nowait(reason)
+
+    def poll(self, timeout=0.0):
+        """
+        Take the frame that is due: the next trigger (waiting up to `timeout`
+        seconds for one) or the timelapse frame. Returns the Frame or None.
+        """
+        now = self.__clock()
+        due = now if self.__last is None else self.__last + self.interval
+        timeout = min(timeout, max(0.0, due - now))
+        try:
+            if timeout > 0:
+                reason = self.__triggers.get(timeout=timeout)
+            else:
+                reason = self.__triggers.get_nowait()
+        except queue.Empty:
+            reason = None
+        if reason is _WAKE:
+            return None
+        now = self.__clock()
+        if reason is None:
+            if self.__last is not None and now - self.__last < self.interval:
+                return None
+            reason = "periodic"
+        elif self.__last is not None and now - self.__last < self.min_gap:
+            return None
+        return self.__take(reason, now)
+
+    def __take(self, reason, now):
+        self.__last = now
+        try:
+            jpeg = self.__capture()
+        except Exception as e:  # OpenCV and RTSP fail in many ways
+            jpeg = None
+            error = e
+        else:
+            error = "no frame from the camera"
+        if jpeg is None:
+            self.failures += 1
+            log = logger.warning if self.failures == 1 else logger.debug
+            log("Camera capture (%s) failed: %s", reason, error)
+            return None
+        if self.failures:
+            logger.info("Camera capture works again after %d failures", self.failures)
+            self.failures = 0
+        try:
+            frame = self.archive.append(jpeg, reason, now)
+        except OSError as e:
+            logger.error("Cannot archive a camera frame: %s", e)
+            return None
+        self.captured += 1
+        return frame
+
+    def start(self):
+        """Take frames from a daemon thread until stop()"""
+
+        def run():
+            while not self.__stop.is_set():
+                self.poll(timeout=1.0)
+
+        self.__thread = threading.Thread(target=run, name="capture", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop.set()
+        with contextlib.suppress(queue.Full):
+            self.__triggers.put_nowait(_WAKE)
+        if self.__thread is not None:
+            self.__thread.join(timeout=5)
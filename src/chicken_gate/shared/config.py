@@ -2,11 +2,30 @@
 Configuration settings for the chicken gate system.
 """
 
+import os
 from pathlib import Path
 
 # File paths for communication between processes
 STATUS_FILE = "gate_status.json"
 COMMAND_FILE = "gate_cmd.txt"
+# Each gate's diagnostic messages, rewritten only when they change
+DIAGNOSTICS_FILE = "gate_diagnostics.json"
+
+# Relay duty cycle and energy counters (see shared/energy.py)
+ENERGY_FILE = "energy.json"
+
+# Gate events and samples, one file per day (see shared/history.py)
+HISTORY_DIR = "history"
+
+# Camera capture archive (see shared/captures.py)
+CAPTURE_DIR = "captures"
+
+# User settings (TOML) - see chicken-gate.toml.template
+SETTINGS_FILE = "chicken-gate.toml"
+
+# Id of the gate when settings list none ([[gates]]), and of records and
+# commands that do not name a gate
+DEFAULT_GATE_ID = "gate"
 
 # Web interface settings
 DEFAULT_WEB_PORT = 5000
@@ -33,3 +52,40 @@ def get_status_file_path():
 def get_command_file_path():
     """Get the full path to the command file."""
     return PROJECT_ROOT / COMMAND_FILE
+
+
+def get_settings_file_path():
+    """Get the settings file path (CHICKEN_GATE_CONFIG overrides the default)."""
+    return Path(os.getenv("CHICKEN_GATE_CONFIG", PROJECT_ROOT / SETTINGS_FILE))
+
+
+def merge_diagnostics(status, path=DIAGNOSTICS_FILE):
+    """
+    Put a gate's diagnostic messages from `path` into its status read from
+    the status file, which leaves them out; returns the status
+    """
+    if status is None or "diagnostic_messages" in status:
+        return status
+    import json
+
+    try:
+        with open(path) as f:
+            entry = json.load(f).get(status.get("gate_id", DEFAULT_GATE_ID))
+    except (OSError, ValueError, AttributeError):
+        entry = None
+    status["diagnostic_messages"] = entry["messages"] if entry else []
+    return status
+
+
+def load_settings(path=None):
+    """Load user settings from TOML; returns {} if the file does not exist."""
+    path = Path(path) if path is not None else get_settings_file_path()
+    if not path.exists():
+        return {}
+
+    import toml
+
+    try:
+        return toml.load(path)
+    except toml.TomlDecodeError as e:
+        raise ValueError(f"Invalid settings file {path}: {e}") from e
@@ -0,0 +1,301 @@
+"""
+Relay duty cycle and motor energy, for gates on a solar battery.
+
+An EnergyMeter is an AsyncGate publisher: from each gate's published status
+it sees when the relays drive the motor open or closed, and counts per gate
+
+    open_seconds, close_seconds   relay on-time
+    open_starts, close_starts     motor starts
+    reversals                     direction changes without a stop
+    amp_hours, watt_hours         estimated from the [energy] current/voltage
+
+into a CounterStore rolled up by hour, day and month (local time) plus
+lifetime totals. Rows past the retention are dropped, so the store stays a
+few tens of kilobytes; it is saved to ENERGY_FILE at most every
+save_interval seconds while counters change, and nothing is written while
+the gates are idle. In the gate process the file is written on the
+background writer's thread (shared/writer.py), off the event loop. The web
+interface serves it as /api/energy.
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from .config import ENERGY_FILE
+
+logger = logging.getLogger("chicken-gate")
+
+FIELDS = (
+    "open_seconds",
+    "close_seconds",
+    "open_starts",
+    "close_starts",
+    "reversals",
+    "amp_hours",
+    "watt_hours",
+)
+(
+    OPEN_SECONDS,
+    CLOSE_SECONDS,
+    OPEN_STARTS,
+    CLOSE_STARTS,
+    REVERSALS,
+    AMP_HOURS,
+    WATT_HOURS,
+) = range(len(FIELDS))
+
+# Rollup periods: strftime() of the row keys and rows kept
+PERIODS = {
+    "hourly": ("%Y-%m-%dT%H", 48),
+    "daily": ("%Y-%m-%d", 62),
+    "monthly": ("%Y-%m", 24),
+}
+
+VERSION = 1
+
+# Defaults of the [energy] settings
+VOLTAGE = 12.0  # volts at the motor
+OPEN_CURRENT = 2.0  # amps while opening
+CLOSE_CURRENT = 2.0  # amps while closing
+SAVE_INTERVAL = 60.0  # seconds
+
+
+def _row():
+    return [0] * len(FIELDS)
+
+
+def _fields(row):
+    """A counter row as a dict, rounded"""
+    return {
+        name: round(value, 6) if isinstance(value, float) else value
+        for name, value in zip(FIELDS, row)
+    }
+
+
+class CounterStore:
+    """Counters per gate, rolled up by hour, day and month"""
+
+    def __init__(self):
+        # period -> {key: {gate id: row}}
+        self.rollups = {period: {} for period in PERIODS}
+        self.totals = {}  # gate -> row
+
+    def add(self, gate_id, when, field, amount):
+        """Add `amount` to a field of the gate's rows for datetime `when`"""
+        for period, (key_format, keep) in PERIODS.items():
+            rows = self.rollups[period]
+            key = when.strftime(key_format)
+            gates = rows.get(key)
+            if gates is None:
+                gates = rows[key] = {}
+                while len(rows) > keep:
+                    del rows[min(rows)]
+            row = gates.get(gate_id)
+            if row is None:
+                row = gates[gate_id] = _row()
+            row[field] += amount
+        row = self.totals.get(gate_id)
+        if row is None:
+            row = self.totals[gate_id] = _row()
+        row[field] += amount
+
+    def rows(self, period, gate_id):
+        """[(key, fields)] of a gate's rows for a period, oldest first"""
+        rows = self.rollups[period]
+        return [
+            (key, _fields(rows[key][gate_id]))
+            for key in sorted(rows)
+            if gate_id in rows[key]
+        ]
+
+    def row(self, period, key, gate_id):
+        """Fields of one row (zeros if there is none)"""
+        return _fields(self.rollups[period].get(key, {}).get(gate_id) or _row())
+
+    def total(self, gate_id):
+        return _fields(self.totals.get(gate_id) or _row())
+
+    def to_dict(self):
+        """The store as JSON-ready data (rows as lists in FIELDS order)"""
+
+        def compact(row):
+            return [
+                round(value, 6) if isinstance(value, float) else value for value in row
+            ]
+
+        data = {"version": VERSION, "fields": list(FIELDS)}
+        data["totals"] = {gate: compact(row) for gate, row in self.totals.items()}
+        for period, rows in self.rollups.items():
+            data[period] = {
+                key: {gate: compact(row) for gate, row in gates.items()}
+                for key, gates in rows.items()
+            }
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """Inverse of to_dict(); ValueError for data it cannot read"""
+        if not isinstance(data, dict) or data.get("version") != VERSION:
+            raise ValueError("not an energy counter store (version 1)")
+        fields = data.get("fields")
+        if fields != list(FIELDS):
+            raise ValueError(f"unexpected fields {fields}")
+        store = cls()
+        try:
+            store.totals = {gate: list(row) for gate, row in data["totals"].items()}
+            for period in PERIODS:
+                store.rollups[period] = {
+                    key: {gate: list(row) for gate, row in gates.items()}
+                    for key, gates in sorted(data.get(period, {}).items())
+                }
+        except (AttributeError, KeyError, TypeError) as e:
+            raise ValueError(f"malformed energy counter store: {e}") from None
+        return store
+
+    @classmethod
+    def load(cls, path=ENERGY_FILE):
+        """The store saved at `path` (empty if there is none); ValueError if damaged"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls()
+        return cls.from_dict(data)
+
+    def save(self, path=ENERGY_FILE, writer=None):
+        """
+        Write the store atomically (temporary file, fsync, rename); with a
+        writer (shared.writer.BackgroundWriter) on its thread
+        """
+        data = json.dumps(self.to_dict(), separators=(",", ":"))
+        if writer is None:
+            write_file(path, data)
+        else:
+            writer.submit(write_file, path, data)
+
+
+def write_file(path, data):
+    """Replace the file at `path` with the text `data`, atomically"""
+    temp = path + ".tmp"
+    with open(temp, "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+
+class EnergyMeter:
+    """Counts relay on-time, starts, reversals and energy from gate statuses"""
+
+    SETTINGS = ("voltage", "open_current", "close_current", "save_interval")
+
+    def __init__(
+        self,
+        path=ENERGY_FILE,
+        voltage=VOLTAGE,
+        open_current=OPEN_CURRENT,
+        close_current=CLOSE_CURRENT,
+        save_interval=SAVE_INTERVAL,
+        clock=time.monotonic,
+        now=datetime.now,
+        writer=None,
+    ):
+        """writer saves the store on its thread (None: inline, in publish())"""
+        if voltage <= 0 or open_current < 0 or close_current < 0:
+            raise ValueError("voltage must be positive and currents not negative")
+        self.path = path
+        self.voltage = voltage
+        self.current = {"open": open_current, "close": close_current}
+        self.save_interval = save_interval
+        self.saves = 0
+        self.__clock = clock
+        self.__now = now
+        self.__writer = writer
+        self.__running = {}  # gate id -> (direction or None, clock time)
+        self.__dirty_since = None  # first change not yet saved
+        try:
+            self.store = CounterStore.load(path)
+        except (OSError, ValueError) as e:
+            logger.error("Cannot read %s: %s - counting from zero", path, e)
+            if os.path.exists(path):
+                os.replace(path, path + ".bad")
+            self.store = CounterStore()
+
+    @classmethod
+    def from_settings(cls, settings, **kwargs):
+        """Meter for an [energy] settings table"""
+        unknown = set(settings) - set(cls.SETTINGS)
+        if unknown:
+            raise ValueError(f"unknown [energy] keys: {sorted(unknown)}")
+        return cls(**dict(kwargs, **settings))
+
+    def publish(self, status):
+        """AsyncGate publisher: account for the time since the gate's last status"""
+        gate_id = status["gate_id"]
+        if status["is_opening"]:
+            direction = "open"
+        elif status["is_closing"]:
+            direction = "close"
+        else:
+            direction = None
+        now = self.__clock()
+        previous, since = self.__running.get(gate_id, (None, now))
+        if previous is None and direction is None:
+            self.__running[gate_id] = (None, now)
+            return
+        wall = self.__now()
+        if previous is not None:
+            seconds = now - since
+            amps = self.current[previous]
+            field = OPEN_SECONDS if previous == "open" else CLOSE_SECONDS
+            # the rows of the middle of the interval (at most a second or so)
+            middle = wall - timedelta(seconds=seconds / 2)
+            self.store.add(gate_id, middle, field, seconds)
+            self.store.add(gate_id, middle, AMP_HOURS, amps * seconds / 3600)
+            self.store.add(
+                gate_id, middle, WATT_HOURS, amps * self.voltage * seconds / 3600
+            )
+        if direction is not None and direction != previous:
+            field = OPEN_STARTS if direction == "open" else CLOSE_STARTS
+            self.store.add(gate_id, wall, field, 1)
+            if previous is not None:
+                self.store.add(gate_id, wall, REVERSALS, 1)
+        self.__running[gate_id] = (direction, now)
+        if self.__dirty_since is None:
+            self.__dirty_since = now
+        if now - self.__dirty_since >= self.save_interval or direction is None:
+            self.save()
+
+    def save(self):
+        """Save the counters if they changed since the last save"""
+        if self.__dirty_since is None:
+            return
+        try:
+            self.store.save(self.path, self.__writer)
+        except OSError as e:
+            logger.error("Cannot save %s: %s", self.path, e)
+            return
+        self.__dirty_since = None
+        self.saves += 1
+
+    def summary(self, gate_id):
+        """Today's, this month's and lifetime counters, and the last 24 hours' duty cycle"""
+        wall = self.__now()
+        store = self.store
+        since = (wall - timedelta(hours=23)).strftime(PERIODS["hourly"][0])
+        on_seconds = sum(
+            fields["open_seconds"] + fields["close_seconds"]
+            for key, fields in store.rows("hourly", gate_id)
+            if key >= since
+        )
+        return {
+            "today": store.row("daily", wall.strftime(PERIODS["daily"][0]), gate_id),
+            "month": store.row(
+                "monthly", wall.strftime(PERIODS["monthly"][0]), gate_id
+            ),
+            "total": store.total(gate_id),
+            "duty_cycle_24h": round(on_seconds * 100 / 86400, 4),
+        }
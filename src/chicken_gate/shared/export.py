@@ -0,0 +1,262 @@
+"""
+Streaming export of history records as NDJSON, CSV or Parquet.
+
+Each format is a generator of byte chunks over (cursor, record) pairs from
+HistoryStore.scan(), buffering at most CHUNK_SIZE bytes (a Parquet row
+group of ROW_GROUP_SIZE rows), so a year of history goes out of a Pi Zero
+in constant memory. Every row carries the cursor to resume after it.
+gzip_chunks() compresses such a stream as it goes, flushing each chunk so
+whatever part of the download arrives can be decompressed and resumed
+from its last cursor.
+
+Parquet needs pyarrow (pip install chicken-gate[export]).
+"""
+
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime, timezone
+
+CHUNK_SIZE = 64 * 1024
+ROW_GROUP_SIZE = 10000
+GZIP_LEVEL = 6
+
+# CSV and Parquet columns (NDJSON lines keep the records as stored)
+COLUMNS = (
+    "time",
+    "gate_id",
+    "kind",
+    "code",
+    "message",
+    "position",
+    "target_position",
+    "state",
+    "errors",
+    "cursor",
+)
+
+# format -> (media type, file extension); Flask adds charset=utf-8 to text/*
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+NO_PYARROW = "Parquet export needs pyarrow (pip install chicken-gate[export])"
+
+
+class ExportError(Exception):
+    """An export that cannot be made (e.g. Parquet without pyarrow)"""
+
+
+def iso_time(t):
+    """ISO 8601 UTC time of epoch seconds, to the millisecond"""
+    return datetime.fromtimestamp(t, timezone.utc).isoformat(timespec="milliseconds")
+
+
+def limited(rows, limit):
+    """The first `limit` rows (all if limit is None)"""
+    for count, row in enumerate(rows):
+        if limit is not None and count >= limit:
+            return
+        yield row
+
+
+def ndjson_chunks(rows):
+    buffer = []
+    size = 0
+    for cursor, record in rows:
+        line = json.dumps(dict(record, cursor=cursor), separators=(",", ":")) + "\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer).encode()
+            buffer.clear()
+            size = 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+def _columns(cursor, record, time):
+    """A record's COLUMNS values, with `time` for its time"""
+    values = [record.get(column) for column in COLUMNS]
+    values[0] = time
+    values[-1] = cursor
+    return values
+
+
+def csv_chunks(rows):
+    text = io.StringIO()
+    writer = csv.writer(text, lineterminator="\n")
+    writer.writerow(COLUMNS)
+    for cursor, record in rows:
+        writer.writerow(_columns(cursor, record, iso_time(record["t"])))
+        if text.tell() >= CHUNK_SIZE:
+            yield text.getvalue().encode()
+            text.seek(0)
+            text.truncate()
+    if text.tell():
+        yield text.getvalue().encode()
+
+
+class _Sink:
+    """File-like object collecting what pyarrow writes, drained per row group"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parquet_chunks(rows, row_group_size=ROW_GROUP_SIZE):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError(NO_PYARROW) from None
+
+    schema = pa.schema(
+        [
+            ("time", pa.timestamp("ms", tz="UTC")),
+            ("gate_id", pa.string()),
+            ("kind", pa.string()),
+            ("code", pa.string()),
+            ("message", pa.string()),
+            ("position", pa.float64()),
+            ("target_position", pa.float64()),
+            ("state", pa.string()),
+            ("errors", pa.int64()),
+            ("cursor", pa.string()),
+        ]
+    )
+    sink = _Sink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+    group = []
+
+    def row_group():
+        table = pa.table(
+            {name: list(values) for name, values in zip(COLUMNS, zip(*group))},
+            schema=schema,
+        )
+        writer.write_table(table)
+        group.clear()
+        return sink.drain()
+
+    for cursor, record in rows:
+        group.append(_columns(cursor, record, int(record["t"] * 1000)))
+        if len(group) >= row_group_size:
+            yield row_group()
+    if group:
+        yield row_group()
+    writer.close()
+    yield sink.drain()
+
+
+def export_chunks(rows, fmt):
+    """Byte chunks of `rows` in format `fmt` (see FORMATS)"""
+    if fmt == "ndjson":
+        return ndjson_chunks(rows)
+    if fmt == "csv":
+        return csv_chunks(rows)
+    if fmt == "parquet":
+        if not parquet_available():
+            raise ExportError(NO_PYARROW)
+        return parquet_chunks(rows)
+    raise ExportError(f"Unknown format: {fmt} (one of {', '.join(FORMATS)})")
+
+
+def export_stream(
+    store,
+    fmt="ndjson",
+    start=None,
+    end=None,
+    kind=None,
+    gate_id=None,
+    cursor=None,
+    limit=None,
+):
+    """
+    Byte chunks exporting a HistoryStore's records; the arguments are checked
+    here (ValueError, or ExportError for the format) rather than once the
+    stream has started
+    """
+    from .history import KINDS, parse_cursor
+
+    if cursor is not None:
+        parse_cursor(cursor)
+    if kind is not None and kind not in KINDS:
+        raise ValueError(f"Unknown kind: {kind} (one of {', '.join(KINDS)})")
+    if limit is not None and limit < 0:
+        raise ValueError(f"Invalid limit: {limit}")
+    kinds = KINDS if kind is None else (kind,)
+    rows = store.scan(start, end, cursor, kinds, gate_id)
+    return export_chunks(limited(rows, limit), fmt)
+
+
+def last_cursor(path, fmt):
+    """
+    Cursor of the last complete row of an NDJSON or CSV export at `path`
+    (None if it has none); a torn last line is cut off so the export can
+    be resumed by appending to it
+    """
+    if fmt not in ("ndjson", "csv"):
+        raise ExportError(f"Cannot resume a {fmt} export")
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        tail = b""
+        while size > len(tail) and tail.count(b"\n") < 2:
+            start = max(0, size - len(tail) - CHUNK_SIZE)
+            f.seek(start)
+            tail = f.read(size - len(tail) - start) + tail
+        end = tail.rfind(b"\n") + 1
+        if end < len(tail):
+            f.truncate(size - len(tail) + end)
+        lines = tail[:end].splitlines()
+    if not lines:
+        return None
+    line = lines[-1].decode()
+    if fmt == "ndjson":
+        return json.loads(line)["cursor"]
+    cursor = next(csv.reader([line]))[-1]
+    return None if cursor == "cursor" else cursor
+
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """gzip a stream of byte chunks, each flushed as it goes"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,295 @@
+"""
+Gate history on disk: events and samples, for export.
+
+The gate process appends one JSON line per record to a segment file per UTC
+day in HISTORY_DIR ("history/2026-10-19.ndjson"):
+
+    {"t": 1760860800.5, "gate_id": "gate", "kind": "event",
+     "code": "close_received", "message": "gate close command received"}
+    {"t": 1760860801.0, "gate_id": "gate", "kind": "sample",
+     "position": 0.4, "target_position": 100, "state": "closing", "errors": 0}
+
+Events are the gate's diagnostics (commands, state changes, errors).
+Samples record the position and state when the state changes, every
+sample_interval seconds while a gate moves, and every idle_interval seconds
+otherwise. Segments older than retention_days are deleted. With a writer
+(shared.writer.BackgroundWriter) the appends, and the pruning each new day,
+run on its thread, so recording never holds up the event loop.
+
+HistoryStore.scan() reads a time range back as a generator, one line at a
+time, so memory use does not depend on how much is exported. Each record
+comes with a cursor - "<segment date>:<byte offset>" just past it - from
+which a later scan resumes exactly where an interrupted one stopped.
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from .config import HISTORY_DIR
+
+logger = logging.getLogger("chicken-gate")
+
+KINDS = ("event", "sample")
+
+# Defaults of the [history] settings
+RETENTION_DAYS = 400
+SAMPLE_INTERVAL = 10.0  # seconds between samples of a moving gate
+IDLE_INTERVAL = 3600.0  # ...and of an idle one
+
+_SEGMENT = re.compile(r"^(\d{4}-\d{2}-\d{2})\.ndjson$")
+_CURSOR = re.compile(r"^(\d{4}-\d{2}-\d{2}):(\d+)$")
+
+
+def segment_date(t):
+    """UTC date (YYYY-MM-DD) of the segment holding epoch time `t`"""
+    return datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%d")
+
+
+def parse_cursor(cursor):
+    """(segment date, byte offset) of a cursor; ValueError if malformed"""
+    match = _CURSOR.match(cursor or "")
+    if match is None:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return match.group(1), int(match.group(2))
+
+
+def parse_time(text):
+    """
+    Epoch seconds of an ISO 8601 date or date-time (local time unless it
+    has an offset) or of a number; ValueError otherwise
+    """
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        when = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid time: {text!r}") from None
+    return when.timestamp()
+
+
+class HistoryStore:
+    """Append-only daily segments of history records"""
+
+    def __init__(
+        self, directory=HISTORY_DIR, retention_days=RETENTION_DAYS, writer=None
+    ):
+        """writer runs the file operations (None: inline, in append())"""
+        self.directory = directory
+        self.retention_days = retention_days
+        self.appended = 0
+        self.__writer = writer
+        self.__file = None  # used by the writer's thread only
+        self.__date = None  # date of the open segment
+
+    def segments(self):
+        """Dates of the segment files, oldest first"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(m.group(1) for m in map(_SEGMENT.match, names) if m)
+
+    def path(self, date):
+        return os.path.join(self.directory, date + ".ndjson")
+
+    def append(self, record):
+        """Append a record (a dict with "t", "gate_id" and "kind")"""
+        line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+        self.__io(self.__write, segment_date(record["t"]), line)
+        self.appended += 1
+
+    def prune(self, now=None):
+        """Delete segments older than retention_days"""
+        now = time.time() if now is None else now
+        oldest = segment_date(now - self.retention_days * 86400)
+        for date in self.segments():
+            if date >= oldest:
+                break
+            try:
+                os.remove(self.path(date))
+            except OSError as e:
+                logger.warning("Cannot delete history segment %s: %s", date, e)
+
+    def close(self):
+        self.__io(self.__close_file)
+
+    def __io(self, operation, *args):
+        if self.__writer is None:
+            operation(*args)
+        else:
+            self.__writer.submit(operation, *args)
+
+    def __write(self, date, line):
+        if date != self.__date:
+            self.__close_file()
+            os.makedirs(self.directory, exist_ok=True)
+            self.__file = open(self.path(date), "ab")  # noqa: SIM115 - kept open
+            self.__date = date
+            self.prune()
+        self.__file.write(line)
+        self.__file.flush()  # to the OS, a whole line at a time
+
+    def __close_file(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+            self.__date = None
+
+    def scan(self, start=None, end=None, cursor=None, kinds=KINDS, gate_id=None):
+        """
+        (cursor, record) of the records with start <= t < end (epoch
+        seconds, None for no limit) of the given kinds and gate, oldest
+        first, after `cursor` if given
+        """
+        after = parse_cursor(cursor) if cursor is not None else None
+        first = segment_date(start) if start is not None else ""
+        last = segment_date(end) if end is not None else "9999"
+        for date in self.segments():
+            if date < first or date > last or (after and date < after[0]):
+                continue
+            offset = after[1] if after and date == after[0] else 0
+            yield from self.__scan_segment(date, offset, start, end, kinds, gate_id)
+
+    def __scan_segment(self, date, offset, start, end, kinds, gate_id):
+        try:
+            f = open(self.path(date), "rb")  # noqa: SIM115 - closed below
+        except FileNotFoundError:  # pruned meanwhile
+            return
+        with f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    return  # being written
+                offset += len(line)
+                try:
+                    record = json.loads(line)
+                    t = record["t"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if (
+                    (start is None or t >= start)
+                    and (end is None or t < end)
+                    and record.get("kind") in kinds
+                    and (gate_id is None or record.get("gate_id") == gate_id)
+                ):
+                    yield f"{date}:{offset}", record
+
+    def latest(self, count, kinds=KINDS, gate_id=None):
+        """The last `count` records, oldest first (newest segments read first)"""
+        found = deque()
+        for date in reversed(self.segments()):
+            records = self.__scan_segment(date, 0, None, None, kinds, gate_id)
+            newest = deque((record for _, record in records), maxlen=count - len(found))
+            found.extendleft(reversed(newest))
+            if len(found) >= count:
+                break
+        return list(found)
+
+
+class HistoryRecorder:
+    """AsyncGate publisher that records events and samples of each gate"""
+
+    SETTINGS = ("enabled", "retention_days", "sample_interval", "idle_interval")
+
+    def __init__(
+        self,
+        store,
+        sample_interval=SAMPLE_INTERVAL,
+        idle_interval=IDLE_INTERVAL,
+        clock=time.time,
+    ):
+        self.store = store
+        self.sample_interval = sample_interval
+        self.idle_interval = idle_interval
+        self.__clock = clock
+        self.__runtime = None
+        self.__generations = {}  # gate id -> diagnostics generation seen
+        self.__last_event = {}  # gate id -> monotonic time of the last event
+        self.__samples = {}  # gate id -> (time, state) of the last sample
+
+    @classmethod
+    def from_settings(cls, settings, directory=HISTORY_DIR, writer=None):
+        """Recorder for a [history] settings table, or None if disabled"""
+        unknown = set(settings) - set(cls.SETTINGS)
+        if unknown:
+            raise ValueError(f"unknown [history] keys: {sorted(unknown)}")
+        settings = dict(settings)
+        if not settings.pop("enabled", True):
+            return None
+        store = HistoryStore(
+            directory, settings.pop("retention_days", RETENTION_DAYS), writer
+        )
+        return cls(store, **settings)
+
+    def attach(self, runtime):
+        """Record `runtime`'s gates"""
+        self.__runtime = runtime
+        now = time.monotonic()
+        for gate_id in runtime.gate_ids:
+            self.__last_event[gate_id] = now  # what happened before is not news
+        runtime.add_publisher(self.publish)
+
+    def publish(self, status):
+        gate_id = status["gate_id"]
+        now = self.__clock()
+        try:
+            if status["diagnostics_generation"] != self.__generations.get(gate_id):
+                self.__generations[gate_id] = status["diagnostics_generation"]
+                self.__record_events(gate_id)
+            self.__record_sample(gate_id, status, now)
+        except OSError as e:
+            logger.error("Cannot write history: %s", e)
+
+    def __record_events(self, gate_id):
+        from ..gate.diagnostics import format_message
+
+        gate = self.__runtime.driver(gate_id).gate
+        last = self.__last_event.get(gate_id, float("-inf"))
+        offset = time.time() - time.monotonic()
+        for t, code, params in gate.get_diagnostic_records():
+            if t <= last:
+                continue
+            last = t
+            self.store.append(
+                {
+                    "t": round(t + offset, 3),
+                    "gate_id": gate_id,
+                    "kind": "event",
+                    "code": code,
+                    "message": format_message(code, params),
+                }
+            )
+        self.__last_event[gate_id] = last
+
+    def __record_sample(self, gate_id, status, now):
+        state = status["state"]
+        last = self.__samples.get(gate_id)
+        if last is not None:
+            since, last_state = last
+            interval = (
+                self.sample_interval if status["is_moving"] else self.idle_interval
+            )
+            if state == last_state and now - since < interval:
+                return
+        self.__samples[gate_id] = (now, state)
+        self.store.append(
+            {
+                "t": round(now, 3),
+                "gate_id": gate_id,
+                "kind": "sample",
+                "position": round(status["position"], 2),
+                "target_position": status["target_position"],
+                "state": state,
+                "errors": len(status["errors"]),
+            }
+        )
+
+    def close(self):
+        self.store.close()
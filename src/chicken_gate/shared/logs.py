@@ -0,0 +1,312 @@
+"""
+Non-blocking logging for the gate process.
+
+setup_logging() points the root logger at a queue. A logging call on the
+control thread builds the LogRecord, checks the rate limit and puts the
+record on a bounded queue - the message is not formatted (mutable
+arguments are copied, so it still says what they were at the call) and
+nothing is written - so a slow journald or a slow stdout pipe cannot stall the tick
+loop. A listener thread formats the records and writes them: to journald's
+native socket, with structured fields, when running under systemd, and to
+stdout otherwise.
+
+Fields ride along as record attributes:
+
+    logger.info("cmd to open gate", extra={"command": "OPEN"})
+
+becomes GATE_COMMAND=OPEN in the journal (see JOURNAL_FIELDS). Log with
+%-style arguments rather than f-strings: the template is both what gets
+formatted later and the key repeated messages are rate limited on.
+"""
+
+import contextlib
+import copy
+import enum
+import logging
+import logging.handlers
+import os
+import queue
+import socket
+import struct
+import sys
+import time
+
+# Record attributes sent as journal fields
+JOURNAL_FIELDS = {
+    "gate_id": "GATE_ID",
+    "command": "GATE_COMMAND",
+    "position": "GATE_POSITION",
+    "code": "GATE_CODE",
+    "suppressed": "SUPPRESSED",
+}
+
+JOURNAL_SOCKET = "/run/systemd/journal/socket"
+
+# Records waiting for the listener thread; more are dropped and counted
+QUEUE_SIZE = 10000
+
+# Each message template may log RATE_BURST times, refilled over RATE_PERIOD s
+RATE_BURST = 10
+RATE_PERIOD = 60.0
+
+FORMAT = "%(name)s: %(message)s"
+
+# Arguments queued as they are: they cannot change before they are formatted
+_IMMUTABLE = (str, bytes, int, float, type(None), enum.Enum)
+
+_SYSLOG_PRIORITY = {
+    logging.DEBUG: 7,
+    logging.INFO: 6,
+    logging.WARNING: 4,
+    logging.ERROR: 3,
+    logging.CRITICAL: 2,
+}
+
+# The running pipeline (setup_logging)
+_pipeline = None
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per (logger, message template). A record that passes after
+    some were dropped carries the number dropped as record.suppressed.
+    """
+
+    # Forget all buckets if this many templates were seen (f-string messages)
+    MAX_KEYS = 1024
+
+    def __init__(self, burst=RATE_BURST, period=RATE_PERIOD, clock=time.monotonic):
+        super().__init__()
+        self.burst = burst
+        self.rate = burst / period
+        self.suppressed = 0  # total records dropped
+        self.__clock = clock
+        self.__buckets = {}  # key -> [tokens, last update, dropped since]
+
+    def configure(self, burst, period):
+        """Change the limit: `burst` records per template, refilled over `period` s"""
+        self.burst = burst
+        self.rate = burst / period
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = self.__clock()
+        bucket = self.__buckets.get(key)
+        if bucket is None:
+            if len(self.__buckets) >= self.MAX_KEYS:
+                self.__buckets.clear()
+            self.__buckets[key] = [self.burst - 1, now, 0]
+            return True
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            bucket[2] += 1
+            self.suppressed += 1
+            return False
+        bucket[0] = tokens - 1
+        if bucket[2]:
+            record.suppressed = bucket[2]
+            bucket[2] = 0
+        return True
+
+
+class FieldDefaults(logging.Filter):
+    """Set record attributes (e.g. gate_id) that a call left out or passed as None"""
+
+    def __init__(self, **defaults):
+        super().__init__()
+        self.defaults = defaults
+
+    def filter(self, record):
+        for name, value in self.defaults.items():
+            if getattr(record, name, None) is None:
+                setattr(record, name, value)
+        return True
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Queue records unformatted; count those dropped when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The stdlib version formats the message here - leave that to the
+        # listener thread, but snapshot mutable arguments (a status dict, an
+        # error list) that the caller may change before the listener runs
+        args = record.args
+        if not args or (
+            isinstance(args, tuple) and all(isinstance(a, _IMMUTABLE) for a in args)
+        ):
+            return record
+        try:
+            if isinstance(args, tuple):
+                record.args = tuple(
+                    a if isinstance(a, _IMMUTABLE) else copy.copy(a) for a in args
+                )
+            else:  # one mapping, for "%(key)s" templates
+                record.args = copy.copy(args)
+        except Exception:  # cannot be copied: format it now
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class Formatter(logging.Formatter):
+    """FORMAT plus a note of how many repeats the rate limit dropped"""
+
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            text += f" ({suppressed} similar messages suppressed)"
+        return text
+
+
+def encode_journal_fields(fields):
+    """journald native protocol datagram for a dict of fields"""
+    parts = []
+    for key, value in fields.items():
+        data = str(value).encode("utf-8", "replace")
+        if b"\n" in data:
+            # multi-line values are length-prefixed
+            parts.append(
+                key.encode() + b"\n" + struct.pack("<Q", len(data)) + data + b"\n"
+            )
+        else:
+            parts.append(key.encode() + b"=" + data + b"\n")
+    return b"".join(parts)
+
+
+class JournalHandler(logging.Handler):
+    """Send records to journald with JOURNAL_FIELDS as structured fields"""
+
+    def __init__(self, identifier="chicken-gate", path=JOURNAL_SOCKET):
+        super().__init__()
+        self.identifier = identifier
+        self.path = path
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    def emit(self, record):
+        try:
+            fields = {
+                "MESSAGE": self.format(record),
+                "PRIORITY": _SYSLOG_PRIORITY.get(record.levelno, 6),
+                "SYSLOG_IDENTIFIER": self.identifier,
+                "LOGGER": record.name,
+                "CODE_FILE": record.pathname,
+                "CODE_LINE": record.lineno,
+                "CODE_FUNC": record.funcName,
+                "THREAD_NAME": record.threadName,
+            }
+            for name, field in JOURNAL_FIELDS.items():
+                value = getattr(record, name, None)
+                if value is not None:
+                    fields[field] = value
+            self.__socket.sendto(encode_journal_fields(fields), self.path)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.__socket.close()
+        super().close()
+
+
+def journal_available():
+    """True when stdout goes to the journal and its native socket exists"""
+    return bool(os.environ.get("JOURNAL_STREAM")) and os.path.exists(JOURNAL_SOCKET)
+
+
+class LogPipeline:
+    """The root queue handler and the listener thread that drains it"""
+
+    def __init__(self, handler, rate_limit, listener):
+        self.handler = handler
+        self.rate_limit = rate_limit
+        self.listener = listener
+
+    def stats(self):
+        return {
+            "queued": self.handler.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "suppressed": self.rate_limit.suppressed,
+        }
+
+    def stop(self):
+        """Write out the queued records and stop the listener thread"""
+        root = logging.getLogger()
+        if self.handler in root.handlers:
+            root.removeHandler(self.handler)
+        # on a full queue the sentinel cannot go in; the daemon thread just
+        # goes with the process
+        with contextlib.suppress(queue.Full):
+            self.listener.stop()
+        for target in self.listener.handlers:
+            target.close()
+
+
+def setup_logging(
+    gate_id=None,
+    journald="auto",
+    burst=RATE_BURST,
+    period=RATE_PERIOD,
+    level=logging.INFO,
+    targets=None,
+    queue_size=QUEUE_SIZE,
+):
+    """
+    Route all logging through the queue. journald is "auto" (when running
+    under systemd), True or False; targets replaces the output handlers.
+    Returns the LogPipeline; calling again replaces it.
+    """
+    global _pipeline
+    if _pipeline is not None:
+        _pipeline.stop()
+
+    if targets is None:
+        if journald is True or (journald == "auto" and journal_available()):
+            target = JournalHandler()
+        else:
+            target = logging.StreamHandler(sys.stdout)
+        target.setFormatter(Formatter(FORMAT))
+        targets = [target]
+
+    handler = QueueHandler(queue.Queue(queue_size))
+    rate_limit = RateLimitFilter(burst, period)
+    handler.addFilter(rate_limit)
+    if gate_id is not None:
+        handler.addFilter(FieldDefaults(gate_id=gate_id))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(
+        handler.queue, *targets, respect_handler_level=True
+    )
+    listener.start()
+    _pipeline = LogPipeline(handler, rate_limit, listener)
+    return _pipeline
+
+
+def stop_logging():
+    """Flush and stop the pipeline (at exit)"""
+    global _pipeline
+    if _pipeline is not None:
+        _pipeline.stop()
+        _pipeline = None
+
+
+def get_stats():
+    """Queue depth, dropped and rate-limited record counts (None if not set up)"""
+    return _pipeline.stats() if _pipeline is not None else None
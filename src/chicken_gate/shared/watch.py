@@ -0,0 +1,149 @@
+"""
+Change notification for the files the gate processes share.
+
+FileWatcher(paths).wait(timeout) blocks until one of the files is created,
+replaced, changed or deleted, and says which. On Linux their directories
+are watched with inotify, so a status file renamed into place or a command
+file taken by the gate wakes the watcher at once and nothing is read in
+between. Elsewhere (or if inotify is unavailable) the files are stat()ed
+every POLL_INTERVAL seconds.
+
+    watcher = FileWatcher(["gate_status.json"])
+    while True:
+        if watcher.wait(timeout=5):
+            ...  # re-read the status
+"""
+
+import os
+import select
+import struct
+import sys
+import time
+
+# Seconds between stat() checks without inotify
+POLL_INTERVAL = 0.25
+
+# inotify(7) events on the watched directories
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len (then the name)
+
+
+def _stamp(path):
+    """What changes when a file does (None if it does not exist)"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _inotify(directories):
+    """(non-blocking inotify fd, {watch descriptor: directory}), or None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    import ctypes
+
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    watches = {}
+    for directory in directories:
+        wd = libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            os.close(fd)
+            return None
+        watches[wd] = directory
+    return fd, watches
+
+
+class FileWatcher:
+    """Waits for changes to a few files"""
+
+    def __init__(self, paths, poll_interval=POLL_INTERVAL):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.poll_interval = poll_interval
+        self.__stamps = {path: _stamp(path) for path in self.paths}
+        self.__events = set()  # watched files named by inotify events
+        directories = sorted({os.path.dirname(path) for path in self.paths})
+        self.__fd, self.__watches = _inotify(directories) or (None, {})
+
+    @property
+    def notified(self):
+        """Whether changes are notified (inotify) rather than polled for"""
+        return self.__fd is not None
+
+    def changed(self):
+        """The files that changed since the last call, or wait()"""
+        changed = []
+        events, self.__events = self.__events, set()
+        for path in self.paths:
+            stamp = _stamp(path)
+            if stamp != self.__stamps[path] or path in events:
+                self.__stamps[path] = stamp
+                changed.append(path)
+        return changed
+
+    def wait(self, timeout=None):
+        """
+        The files that changed, once any has (timeout in seconds, None for
+        no limit); [] on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self.changed()
+            if changed:
+                return changed
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return []
+            if self.__fd is None:
+                time.sleep(
+                    self.poll_interval
+                    if remaining is None
+                    else min(self.poll_interval, remaining)
+                )
+                continue
+            if select.select([self.__fd], [], [], remaining)[0]:
+                self.__drain()
+
+    def __drain(self):
+        """Note the watched files the pending inotify events name"""
+        try:
+            data = b""
+            while True:
+                data += os.read(self.__fd, 65536)
+        except BlockingIOError:
+            pass
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, _, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            directory = self.__watches.get(wd)
+            if directory is not None and name:
+                self.__events.add(os.path.join(directory, os.fsdecode(name)))
+
+    def close(self):
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,97 @@
+"""
+File writes off the event loop.
+
+Nothing on the AsyncGate loop may wait for the disk: on an SD card a single
+fsync can take hundreds of milliseconds, and every tick, the MQTT keepalive
+and the command wake-ups would wait with it. The publishers that persist
+state (the checkpoint, the energy counters, the history, the status and
+diagnostics files) hand their file operations to a BackgroundWriter
+instead, whose thread runs them in the order they were submitted - like
+the listener thread of the logging queue (shared/logs.py).
+
+    writer = BackgroundWriter()
+    writer.submit(os.fsync, fd)
+    writer.stop()  # runs what is queued, then ends the thread
+"""
+
+import logging
+import queue
+import threading
+
+# Operations waiting for the thread; more are dropped and counted
+QUEUE_SIZE = 1000
+
+# Longest stop() waits for the queued operations (seconds)
+STOP_TIMEOUT = 10.0
+
+logger = logging.getLogger("chicken-gate")
+
+_STOP = object()
+
+
+class BackgroundWriter:
+    """A thread running queued file operations in order"""
+
+    def __init__(self, queue_size=QUEUE_SIZE, name="writer"):
+        self.name = name
+        self.dropped = 0  # operations not queued: the queue was full
+        self.failures = 0  # operations that raised
+        self.__queue = queue.Queue(queue_size)
+        self.__thread = None
+        self.__stopped = False
+
+    def submit(self, operation, *args):
+        """Run operation(*args) on the thread; at once after stop()"""
+        if self.__stopped:
+            self.__run(operation, args)
+            return
+        if self.__thread is None:
+            self.__thread = threading.Thread(
+                target=self.__drain, name=self.name, daemon=True
+            )
+            self.__thread.start()
+        try:
+            self.__queue.put_nowait((operation, args))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Writer queue full - dropped %s", operation.__qualname__)
+
+    def flush(self):
+        """Wait until the operations submitted so far have run"""
+        if self.__thread is not None:
+            self.__queue.join()
+
+    def stop(self):
+        """Run the queued operations and end the thread (at exit)"""
+        self.__stopped = True
+        thread, self.__thread = self.__thread, None
+        if thread is None:
+            return
+        self.__queue.put(_STOP)
+        thread.join(STOP_TIMEOUT)
+        if thread.is_alive():
+            logger.error("Writer still busy after %.0f s - exiting", STOP_TIMEOUT)
+
+    def stats(self):
+        return {
+            "queued": self.__queue.qsize(),
+            "dropped": self.dropped,
+            "failures": self.failures,
+        }
+
+    def __drain(self):
+        while True:
+            item = self.__queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self.__run(*item)
+            finally:
+                self.__queue.task_done()
+
+    def __run(self, operation, args):
+        try:
+            operation(*args)
+        except Exception:
+            self.failures += 1
+            logger.exception("Background write %s failed", operation.__qualname__)
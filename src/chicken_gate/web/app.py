@@ -8,12 +8,33 @@ import json
 import os
 from datetime import datetime
 
-import requests
-from flask import Flask, Response, jsonify, render_template, request
-
-from ..shared.config import CAMERA_IP, CAMERA_PASSWORD, CAMERA_USERNAME
-
-app = Flask(__name__)
+from flask import (
+    Flask,
+    Response,
+    g,
+    has_request_context,
+    jsonify,
+    render_template,
+    request,
+)
+
+from ..shared import memory
+from ..shared.config import (
+    CAMERA_IP,
+    CAMERA_PASSWORD,
+    CAMERA_USERNAME,
+    CAPTURE_DIR,
+    DEFAULT_GATE_ID,
+    DIAGNOSTICS_FILE,
+    ENERGY_FILE,
+    HISTORY_DIR,
+    STATUS_FILE,
+    merge_diagnostics,
+)
+
+# /static/ is served by static_file(), fingerprinted and precompressed
+app = Flask(__name__, static_folder=None)
+app.config["MEMORY_PROFILE"] = "full"
 
 # Camera configuration from shared config
 
@@ -33,16 +54,80 @@ RTSP_URLS = [
 # You can replace this with actual camera integration once you set up proper credentials
 
 
-def read_gate_status():
+def subsystem_enabled(name):
+    """Whether an optional subsystem may be loaded under the memory profile"""
+    return memory.subsystem_enabled(app.config["MEMORY_PROFILE"], name)
+
+
+def read_status_file():
+    """
+    The status file written by main.py, parsed, or None if there is none.
+    Read once per request: the gate list and every gate's status in it come
+    from the same read.
+    """
+    if has_request_context() and "status_file" in g:
+        status = g.status_file
+    else:
+        try:
+            with open(STATUS_FILE) as f:
+                status = json.load(f)
+        except FileNotFoundError:
+            status = None
+        except (OSError, ValueError) as e:
+            status = e
+        if has_request_context():
+            g.status_file = status
+    if isinstance(status, Exception):
+        raise status
+    return status
+
+
+def load_status(gate_id=None, diagnostics=True):
+    """
+    Raw status of a gate (default: the default gate), or None. The status
+    file holds the default gate's status, and every gate's under "gates"
+    when main.py runs several; the diagnostic messages are in a file of
+    their own, read only with `diagnostics`.
+    """
+    backend = app.config.get("GATE_BACKEND")
+    if backend is not None:
+        # single-process mode - latest snapshot published by the gate loop
+        return backend.get_status(gate_id)
+    status = read_status_file()
+    if status is None:
+        return None
+    if gate_id is not None and gate_id != status.get("gate_id", DEFAULT_GATE_ID):
+        status = status.get("gates", {}).get(gate_id)
+    if status is None or not diagnostics:
+        return status
+    return merge_diagnostics(dict(status), DIAGNOSTICS_FILE)
+
+
+def list_gate_ids():
+    """Ids of the gates the gate process runs, the default gate first"""
+    backend = app.config.get("GATE_BACKEND")
+    if backend is not None:
+        return backend.gate_ids()
+    try:
+        status = read_status_file()
+    except (OSError, ValueError):
+        return []
+    if status is None:
+        return []
+    if "gates" in status:
+        return list(status["gates"])
+    return [status.get("gate_id", DEFAULT_GATE_ID)]
+
+
+def read_gate_status(gate_id=None, diagnostics=True):
     """Read current gate status from the status file written by main.py"""
     try:
-        status_file = "gate_status.json"
-        if os.path.exists(status_file):
-            with open(status_file) as f:
-                status = json.load(f)
+        status = load_status(gate_id, diagnostics)
 
+        if status is not None:
             # The new format should have all the fields we need
             return {
+                "gate_id": status.get("gate_id", gate_id or DEFAULT_GATE_ID),
                 "position": status.get("position", 0),
                 "target_position": status.get("target_position", 0),
                 "is_opening": status.get("is_opening", False),
@@ -53,8 +138,12 @@ def read_gate_status():
                 "open_switch_pressed": status.get("open_switch_pressed", False),
                 "errors": status.get("errors", []),
                 "diagnostic_messages": status.get("diagnostic_messages", []),
+                "diagnostics_generation": status.get("diagnostics_generation"),
                 "schedule": status.get("schedule", {}),
                 "schedule_enabled": status.get("schedule_enabled", True),
+                "memory": status.get("memory", {}),
+                "travel": status.get("travel"),
+                "energy": status.get("energy"),
                 "last_updated": status.get("last_updated", datetime.now().isoformat()),
             }
         else:
@@ -93,8 +182,11 @@ def read_gate_status():
         }
 
 
-def send_gate_command(command):
-    """Send a command to the gate by writing to the command file"""
+def send_gate_command(command, gate_id=None):
+    """
+    Send a command to a gate (default: the default gate) by writing to the
+    command file
+    """
     try:
         command_upper = command.upper()
 
@@ -105,6 +197,7 @@ def send_gate_command(command):
             "STOP",
             "RESET",
             "CLEAR_ERRORS",
+            "CLEAR_DIAGNOSTICS",
             "ENABLE_SCHEDULE",
             "DISABLE_SCHEDULE",
         ]
@@ -122,10 +215,17 @@ def send_gate_command(command):
         elif command_upper not in valid_commands:
             return False, f"Unknown command: {command}"
 
+        backend = app.config.get("GATE_BACKEND")
+        if backend is not None:
+            # single-process mode - queue the command for the gate loop
+            if not backend.send_command(command_upper, gate_id):
+                return False, "Gate command queue is full - try again"
+            return True, f"Command '{command_upper}' sent to gate system"
+
         # Write command to file that main.py monitors
         cmd_file = "gate_cmd.txt"
         with open(cmd_file, "w") as f:
-            f.write(command_upper)
+            f.write(command_upper if gate_id is None else f"{gate_id} {command_upper}")
 
         return True, f"Command '{command_upper}' sent to gate system"
 
@@ -135,33 +235,49 @@ def send_gate_command(command):
 
 @app.route("/")
 def index():
-    """Main page with gate control interface"""
-    return render_template("index.html")
+    """Main page with gate control interface (rendered once, with an ETag)"""
+    from . import assets
 
+    shell = assets.page(
+        lambda asset_url: render_template("index.html", asset_url=asset_url),
+        reload=app.debug,
+    )
+    return assets.respond(shell, request, assets.REVALIDATE)
 
-@app.route("/api/status")
-def api_status():
-    """API endpoint to get current gate status"""
-    status = read_gate_status()
-    return jsonify(status)
 
+@app.route("/static/<filename>")
+def static_file(filename):
+    """Dashboard CSS/JS; fingerprinted names are cached for good"""
+    from . import assets
 
-@app.route("/api/schedule")
-def api_schedule():
-    """API endpoint to get schedule information"""
-    status = read_gate_status()
-    schedule_info = status.get("schedule", {})
-    return jsonify(schedule_info)
+    found = assets.bundle(reload=app.debug).get(filename)
+    if found is None:
+        return jsonify({"message": f"Unknown file: {filename}"}), 404
+    asset, immutable = found
+    return assets.respond(
+        asset, request, assets.IMMUTABLE if immutable else assets.REVALIDATE
+    )
 
 
-@app.route("/api/command", methods=["POST"])
-def handle_command():
-    """Handle gate commands from the web interface"""
+def unknown_gate(gate_id):
+    return jsonify({"success": False, "message": f"Unknown gate: {gate_id}"}), 404
+
+
+def status_response(gate_id=None):
+    status = read_gate_status(gate_id)
+    since = request.args.get("diagnostics_since", type=int)
+    if since is not None and since == status.get("diagnostics_generation"):
+        del status["diagnostic_messages"]
+    status["web_memory"] = memory.report(app.config["MEMORY_PROFILE"])
+    return jsonify(status)
+
+
+def command_response(gate_id=None):
     try:
         data = request.get_json()
         command = data.get("command", "").upper()
 
-        success, message = send_gate_command(command)
+        success, message = send_gate_command(command, gate_id)
 
         if success:
             return jsonify({"success": True, "message": message})
@@ -172,11 +288,169 @@ def handle_command():
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+@app.route("/api/status")
+def api_status():
+    """
+    API endpoint to get current gate status (?gate=<id> for another gate
+    than the default). A client that passes the diagnostics_generation it
+    last saw as ?diagnostics_since= only gets the diagnostic messages again
+    when they have changed.
+    """
+    gate_id = request.args.get("gate")
+    if gate_id is not None and gate_id not in list_gate_ids():
+        return unknown_gate(gate_id)
+    return status_response(gate_id)
+
+
+@app.route("/api/gates")
+def api_gates():
+    """The gates the gate process runs, default first, with their position,
+    motion, errors and last update"""
+    gates = []
+    for gate_id in list_gate_ids():
+        status = read_gate_status(gate_id, diagnostics=False)
+        gates.append(
+            {
+                "id": gate_id,
+                "position": status["position"],
+                "target_position": status["target_position"],
+                "is_moving": status["is_moving"],
+                "is_opening": status["is_opening"],
+                "is_closing": status["is_closing"],
+                "open_disabled": status["open_disabled"],
+                "schedule_enabled": status["schedule_enabled"],
+                "errors": status["errors"],
+                "last_updated": status["last_updated"],
+            }
+        )
+    return jsonify({"gates": gates})
+
+
+@app.route("/api/gates/<gate_id>/status")
+def api_gate_status(gate_id):
+    """Status of one gate (same fields and ?diagnostics_since= as /api/status)"""
+    if gate_id not in list_gate_ids():
+        return unknown_gate(gate_id)
+    return status_response(gate_id)
+
+
+@app.route("/api/gates/<gate_id>/command", methods=["POST"])
+def api_gate_command(gate_id):
+    """Send a command to one gate"""
+    if gate_id not in list_gate_ids():
+        return unknown_gate(gate_id)
+    return command_response(gate_id)
+
+
+@app.route("/api/schedule")
+def api_schedule():
+    """API endpoint to get schedule information"""
+    status = read_gate_status()
+    schedule_info = status.get("schedule", {})
+    return jsonify(schedule_info)
+
+
+@app.route("/api/command", methods=["POST"])
+def handle_command():
+    """Handle gate commands from the web interface ("gate": <id> addresses one)"""
+    data = request.get_json(silent=True) or {}
+    gate_id = data.get("gate")
+    if gate_id is not None and gate_id not in list_gate_ids():
+        return unknown_gate(gate_id)
+    return command_response(gate_id)
+
+
 @app.route("/api/history")
 def api_history():
-    """API endpoint to get command history (if implemented later)"""
-    # Placeholder for future command history feature
-    return jsonify({"history": []})
+    """
+    The last ?limit= (default 50, at most 1000) gate events, oldest first,
+    of ?gate=<id> or of all gates
+    """
+    if not subsystem_enabled("history"):
+        return jsonify({"history": [], "disabled": "low-memory profile"})
+    from ..shared.history import HistoryStore
+
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 1000)
+    store = HistoryStore(HISTORY_DIR)
+    events = store.latest(limit, kinds=("event",), gate_id=request.args.get("gate"))
+    return jsonify({"history": events})
+
+
+@app.route("/api/export")
+def api_export():
+    """
+    Stream history records with ?from= <= time < ?to= (ISO 8601 or epoch
+    seconds) as ?format=ndjson (the default), csv or parquet, optionally
+    only ?kind=event or sample, of ?gate=<id>, after ?cursor= and at most
+    ?limit= records. Every row carries the cursor to resume after it.
+    """
+    from ..shared.export import FORMATS, ExportError, export_stream, gzip_chunks
+    from ..shared.history import HistoryStore, parse_time
+    from .server import accepts_gzip
+
+    args = request.args
+    fmt = args.get("format", "ndjson")
+    try:
+        chunks = export_stream(
+            HistoryStore(HISTORY_DIR),
+            fmt,
+            start=parse_time(args["from"]) if "from" in args else None,
+            end=parse_time(args["to"]) if "to" in args else None,
+            kind=args.get("kind"),
+            gate_id=args.get("gate"),
+            cursor=args.get("cursor"),
+            limit=int(args["limit"]) if "limit" in args else None,
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except ExportError as e:
+        status = 501 if fmt in FORMATS else 400
+        return jsonify({"success": False, "message": str(e)}), status
+
+    mimetype, extension = FORMATS[fmt]
+    headers = {
+        "Content-Disposition": f"attachment; filename=chicken-gate-history.{extension}"
+    }
+    # Parquet is compressed already
+    if fmt != "parquet" and accepts_gzip(request.headers.get("Accept-Encoding", "")):
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return Response(chunks, mimetype=mimetype, headers=headers)
+
+
+@app.route("/api/energy")
+def api_energy():
+    """
+    Relay on-time, motor starts and reversals and estimated energy of a gate
+    (?gate=<id>, default the default gate) by ?period=hourly, daily (the
+    default) or monthly, oldest first, with the lifetime totals
+    """
+    from ..shared.energy import PERIODS, CounterStore
+
+    gate_id = request.args.get("gate")
+    gate_ids = list_gate_ids()
+    if gate_id is None:
+        gate_id = gate_ids[0] if gate_ids else DEFAULT_GATE_ID
+    elif gate_id not in gate_ids:
+        return unknown_gate(gate_id)
+    period = request.args.get("period", "daily")
+    if period not in PERIODS:
+        message = f"Unknown period: {period} (one of {', '.join(PERIODS)})"
+        return jsonify({"success": False, "message": message}), 400
+    try:
+        store = CounterStore.load(ENERGY_FILE)
+    except (OSError, ValueError) as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+    rows = [dict(fields, period=key) for key, fields in store.rows(period, gate_id)]
+    return jsonify(
+        {
+            "gate_id": gate_id,
+            "period": period,
+            "rows": rows,
+            "total": store.total(gate_id),
+        }
+    )
 
 
 @app.route("/api/clear_diagnostics", methods=["POST"])
@@ -192,9 +466,13 @@ def api_clear_diagnostics():
 @app.route("/api/camera/snapshot")
 def camera_snapshot():
     """Get a snapshot from the camera using RTSP (if OpenCV available) or placeholder"""
+    if not subsystem_enabled("camera"):
+        return create_rtsp_info_image()
+
     try:
         # Try to import OpenCV - this will fail on Pi Zero
-        import cv2
+        with memory.account("camera"):
+            import cv2
 
         # Use the working RTSP URL with authentication
         rtsp_url = f"rtsp://{CAMERA_USERNAME}:{CAMERA_PASSWORD}@{CAMERA_IP}:554/stream1"
@@ -235,13 +513,28 @@ def camera_snapshot():
     return create_rtsp_info_image()
 
 
+def rtsp_info_text():
+    """Plain-text camera info, for when the placeholder image is unavailable"""
+    return Response(
+        f"RTSP Camera Available at {CAMERA_IP}:554\n"
+        f"Stream: rtsp://chickencam:password@{CAMERA_IP}:554/stream1\n"
+        f"Note: OpenCV not available on Pi Zero\n"
+        f"Use VLC or other RTSP client to view live stream",
+        mimetype="text/plain",
+    )
+
+
 def create_rtsp_info_image():
     """Create an informative image showing RTSP camera is working but OpenCV unavailable"""
+    if not subsystem_enabled("placeholder"):
+        return rtsp_info_text()
+
     try:
         import io
         from datetime import datetime
 
-        from PIL import Image, ImageDraw, ImageFont
+        with memory.account("placeholder"):
+            from PIL import Image, ImageDraw, ImageFont
 
         # Create a simple placeholder image
         width, height = 640, 480
@@ -318,13 +611,7 @@ def create_rtsp_info_image():
 
     except ImportError:
         # If PIL is not available either, return a simple text response
-        return Response(
-            f"RTSP Camera Available at {CAMERA_IP}:554\n"
-            f"Stream: rtsp://chickencam:password@{CAMERA_IP}:554/stream1\n"
-            f"Note: OpenCV not available on Pi Zero\n"
-            f"Use VLC or other RTSP client to view live stream",
-            mimetype="text/plain",
-        )
+        return rtsp_info_text()
     except Exception as e:
         print(f"Error creating RTSP info image: {e}")
         return Response(
@@ -414,6 +701,54 @@ def create_rtsp_info_image():
         )
 
 
+@app.route("/api/camera/archive")
+def camera_archive():
+    """
+    Archived camera frames: ?at=<time> serves the JPEG taken nearest to it,
+    ?from=&to= (either or both) lists the frames between, at most ?limit=
+    (default 500); without either the archive's size and time span. Times
+    are ISO 8601 or epoch seconds.
+    """
+    from ..shared.captures import CaptureArchive
+    from ..shared.history import parse_time
+
+    args = request.args
+    archive = CaptureArchive(CAPTURE_DIR)
+    try:
+        at = parse_time(args["at"]) if "at" in args else None
+        start = parse_time(args["from"]) if "from" in args else None
+        end = parse_time(args["to"]) if "to" in args else None
+        limit = int(args.get("limit", 500))
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    if at is not None:
+        frame = archive.nearest(at)
+        if frame is None:
+            return jsonify({"success": False, "message": "No archived frames"}), 404
+        try:
+            jpeg = archive.read(frame)
+        except OSError as e:  # deleted by the retention since the lookup
+            return jsonify({"success": False, "message": str(e)}), 404
+        taken = datetime.fromtimestamp(frame.t).astimezone().isoformat()
+        headers = {
+            "X-Capture-Time": taken,
+            "X-Capture-Reason": frame.reason,
+            "Cache-Control": "max-age=86400",
+        }
+        return Response(jpeg, mimetype="image/jpeg", headers=headers)
+
+    if start is None and end is None:
+        return jsonify(archive.stats())
+    frames = []
+    for frame in archive.frames(start, end, max(1, min(limit, 5000))):
+        info = frame.to_dict()
+        info["time"] = datetime.fromtimestamp(frame.t).astimezone().isoformat()
+        info["url"] = f"/api/camera/archive?at={info['t']}"
+        frames.append(info)
+    return jsonify({"frames": frames})
+
+
 @app.route("/api/camera/stream")
 def camera_stream():
     """Return static camera info image since OpenCV unavailable on Pi Zero"""
@@ -436,6 +771,12 @@ def camera_stream():
 @app.route("/api/camera/debug")
 def camera_debug():
     """Debug endpoint to test camera connectivity"""
+    if not subsystem_enabled("camera"):
+        return jsonify({"error": "Camera disabled in the low-memory profile"}), 503
+
+    with memory.account("camera_debug"):
+        import requests  # only this route needs it - keep it out of startup
+
     try:
         debug_info = {
             "camera_ip": CAMERA_IP,
@@ -550,6 +891,34 @@ def main():
         print(f"  http://YOUR_PI_IP:{port}")
         print(f"  http://localhost:{port} (if running locally)")
 
+    from ..shared.config import load_settings
+
+    try:
+        settings = load_settings()
+        profile = memory.get_profile(settings, "--low-memory" in sys.argv)
+    except ValueError as e:
+        print(f"{e} - using the full profile")
+        settings = {}
+        profile = "full"
+    app.config["MEMORY_PROFILE"] = profile
+    print(f"Memory profile: {profile}")
+
+    if "--production" in sys.argv:
+        # Thread pool, keep-alive and gzip; stops gracefully on SIGTERM
+        import atexit
+
+        from ..shared import logs
+        from .server import serve
+
+        logs.setup_logging()
+        atexit.register(logs.stop_logging)
+        print("Production server (see [web] in the settings)")
+        try:
+            serve(app, port, settings.get("web", {}))
+        except ValueError as e:
+            sys.exit(f"Invalid [web] settings: {e}")
+        return
+
     # Disable debug mode when running under systemd to prevent restarts
     debug_mode = (port == 5000) and ("INVOCATION_ID" not in os.environ)
 
@@ -0,0 +1,169 @@
+"""
+Dashboard assets: fingerprinted, precompressed and cached in memory.
+
+The files under web/static (the dashboard's CSS and JavaScript) are read on
+first use, named <stem>.<hash>.<ext> after their content and compressed
+with gzip, and with Brotli when the brotli package is installed. A
+fingerprinted URL always means the same bytes, so they are served with a
+year-long immutable cache. A new release changes the hash, and with it the
+URL in the page.
+
+The page shell (templates/index.html) is rendered once, compressed the same
+way and served with an ETag and no-cache. A browser that already has it
+revalidates and gets a 304 of a few hundred bytes.
+"""
+
+import hashlib
+import mimetypes
+import os
+import threading
+import zlib
+from collections import namedtuple
+
+from .server import accepts_encoding
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+STATIC_URL = "/static/"
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Hex digits of the content hash in file names and ETags
+HASH_LENGTH = 10
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# Preferred first
+ENCODINGS = ("br", "gzip")
+
+# content: {encoding or None (identity): bytes}; etag: unquoted, per content
+Asset = namedtuple("Asset", "name content_type etag content")
+
+_lock = threading.Lock()
+_bundle = None
+_page = None  # (asset urls it was rendered with, Asset)
+
+
+def compress(data):
+    """{encoding: bytes} of `data`: identity, gzip and, if available, br"""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    content = {None: data, "gzip": compressor.compress(data) + compressor.flush()}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        content["br"] = brotli.compress(data, quality=BROTLI_QUALITY)
+    return content
+
+
+def make_asset(name, data, content_type):
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    return Asset(name, content_type, digest, compress(data))
+
+
+def fingerprinted(name, digest):
+    """dashboard.css -> dashboard.<digest>.css"""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest}{ext}"
+
+
+class AssetBundle:
+    """The files of a static directory, by plain and fingerprinted name"""
+
+    def __init__(self, directory=STATIC_DIR, prefix=STATIC_URL):
+        self.prefix = prefix
+        self.__assets = {}  # plain name -> Asset
+        self.__names = {}  # fingerprinted name -> plain name
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path):
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            if content_type.startswith("text/") or content_type.endswith("javascript"):
+                content_type += "; charset=utf-8"
+            asset = make_asset(name, data, content_type)
+            self.__assets[name] = asset
+            self.__names[fingerprinted(name, asset.etag)] = name
+
+    def url(self, name):
+        """Fingerprinted URL of a static file (KeyError if there is none)"""
+        return self.prefix + fingerprinted(name, self.__assets[name].etag)
+
+    def urls(self):
+        return tuple(self.url(name) for name in self.__assets)
+
+    def get(self, filename):
+        """
+        (Asset, immutable) for a fingerprinted or plain file name, or None.
+        Plain names (old links, hand-typed URLs) must be revalidated.
+        """
+        name = self.__names.get(filename)
+        if name is not None:
+            return self.__assets[name], True
+        asset = self.__assets.get(filename)
+        return (asset, False) if asset is not None else None
+
+
+def bundle(reload=False):
+    """The static files, loaded on first use (every call if `reload`)"""
+    global _bundle
+    with _lock:
+        if _bundle is None or reload:
+            _bundle = AssetBundle()
+        return _bundle
+
+
+def page(render, reload=False):
+    """
+    The page shell as an Asset. `render(asset_url)` renders it; it is called
+    again only when the static files change (or on every call if `reload`).
+    """
+    global _page
+    assets = bundle(reload)
+    urls = assets.urls()
+    cached = _page
+    if cached is None or cached[0] != urls or reload:
+        html = render(assets.url).encode()
+        cached = _page = (
+            urls,
+            make_asset("index.html", html, "text/html; charset=utf-8"),
+        )
+    return cached[1]
+
+
+def choose_encoding(asset, accept_encoding):
+    """The best encoding of `asset` the client accepts, None for identity"""
+    for encoding in ENCODINGS:
+        if encoding in asset.content and accepts_encoding(accept_encoding, encoding):
+            return encoding
+    return None
+
+
+def variant_etag(asset, encoding):
+    """A strong ETag per encoding: the bytes on the wire differ"""
+    return asset.etag if encoding is None else f"{asset.etag}-{encoding}"
+
+
+def respond(asset, request, cache_control):
+    """
+    A Flask response for `asset`: 304 if the client's copy (in any encoding)
+    is current, otherwise the best encoding it accepts
+    """
+    from flask import Response
+
+    encoding = choose_encoding(asset, request.headers.get("Accept-Encoding", ""))
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    current = [variant_etag(asset, variant) for variant in asset.content]
+    if any(request.if_none_match.contains_weak(etag) for etag in current):
+        response = Response(status=304, headers=headers)
+    else:
+        response = Response(
+            asset.content[encoding], content_type=asset.content_type, headers=headers
+        )
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(variant_etag(asset, encoding))
+    return response
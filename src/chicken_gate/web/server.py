@@ -0,0 +1,788 @@
+"""
+Production HTTP/1.1 server for the web app.
+
+Flask's development server (app.run) starts a thread per request and closes
+every connection. WSGIServer serves the same WSGI app from a fixed pool of
+worker threads, with:
+
+- keep-alive, up to max_keepalive_requests per connection
+- a deadline for the request line and headers (header_timeout), and for
+  reading the body and writing the response (request_timeout)
+- gzip for HTML, JSON and other text responses (GzipMiddleware)
+- a graceful stop: no new connections, requests in flight and already
+  accepted connections are served (up to `grace` seconds), idle keep-alive
+  connections are closed
+
+Accepted connections wait for a worker in a queue of `backlog`; past that
+they get a 503 at once. While connections are waiting, workers close their
+keep-alive connection after the current response, so idle clients cannot
+starve the pool. A response without Content-Length (the camera stream) is
+sent chunked and holds its worker until it ends.
+"""
+
+import contextlib
+import email.utils
+import logging
+import queue
+import signal
+import socket
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from http.client import responses
+from urllib.parse import unquote
+
+THREADS = 8
+BACKLOG = 64
+HEADER_TIMEOUT = 10.0
+REQUEST_TIMEOUT = 30.0
+KEEPALIVE_TIMEOUT = 5.0
+MAX_KEEPALIVE_REQUESTS = 100
+GRACE = 5.0  # inside the units' TimeoutStopSec
+GZIP_MIN_SIZE = 512
+GZIP_LEVEL = 6
+# Compressed bodies of at least this size are kept (the last GZIP_CACHE of
+# them): the dashboard page is the same on every request
+GZIP_CACHE_MIN_SIZE = 4096
+GZIP_CACHE = 8
+
+# Larger request heads get a 431
+MAX_HEAD_SIZE = 16384
+# Unread request bodies up to this size are skipped to keep the connection
+DRAIN_LIMIT = 65536
+# How often the accept loop checks for stop()
+ACCEPT_POLL = 0.5
+# After an error response, how long to read what the client still sends, so
+# closing does not reset the connection before it has read the response
+LINGER = 1.0
+
+COMPRESSIBLE = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "image/svg+xml",
+)
+
+logger = logging.getLogger("chicken-gate-web")
+
+
+class _HttpError(Exception):
+    """A request the server answers itself, with `status`, and then closes"""
+
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+class _ClientGone(Exception):
+    """The client closed the connection or stopped reading/sending"""
+
+
+def accepts_encoding(accept_encoding, coding):
+    """Whether an Accept-Encoding header allows a content coding"""
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        if name.strip().lower() not in (coding, "*"):
+            continue
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                return float(params[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+def accepts_gzip(accept_encoding):
+    """Whether an Accept-Encoding header allows gzip"""
+    return accepts_encoding(accept_encoding, "gzip")
+
+
+class GzipMiddleware:
+    """
+    Gzip text responses (see COMPRESSIBLE) of at least min_size bytes for
+    clients that accept it. Streamed responses (no Content-Length), partial
+    and already encoded ones pass through unchanged.
+    """
+
+    def __init__(self, app, min_size=GZIP_MIN_SIZE, level=GZIP_LEVEL):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self.__cache = OrderedDict()  # body -> compressed body
+        self.__lock = threading.Lock()
+
+    def compress(self, data):
+        if len(data) < GZIP_CACHE_MIN_SIZE:
+            return self.__compress(data)
+        with self.__lock:
+            compressed = self.__cache.get(data)
+            if compressed is not None:
+                self.__cache.move_to_end(data)
+                return compressed
+        compressed = self.__compress(data)
+        with self.__lock:
+            self.__cache[data] = compressed
+            if len(self.__cache) > GZIP_CACHE:
+                self.__cache.popitem(last=False)
+        return compressed
+
+    def __compress(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def __compressible(self, status, headers):
+        if not status.startswith("2") or status[:3] in ("204", "206"):
+            return False
+        fields = {name.lower(): value for name, value in headers}
+        return (
+            fields.get("content-type", "").startswith(COMPRESSIBLE)
+            and "content-encoding" not in fields
+            and "no-transform" not in fields.get("cache-control", "")
+            and int(fields.get("content-length", -1)) >= self.min_size
+        )
+
+    def __call__(self, environ, start_response):
+        if environ["REQUEST_METHOD"] == "HEAD" or not accepts_gzip(
+            environ.get("HTTP_ACCEPT_ENCODING", "")
+        ):
+            return self.app(environ, start_response)
+
+        held = []  # [status, headers] of a response to compress
+        body = []
+        returned = []
+
+        def hold(status, headers, exc_info=None):
+            # an app starting its response while being iterated is passed on
+            if (
+                not returned
+                and exc_info is None
+                and self.__compressible(status, headers)
+            ):
+                held[:] = [status, headers]
+                return body.append
+            held.clear()
+            return start_response(status, headers, exc_info)
+
+        result = self.app(environ, hold)
+        returned.append(True)
+        if not held:
+            return result
+        try:
+            body.extend(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        if not held:  # the app replaced its response while producing it
+            return body
+        status, headers = held
+        data = self.compress(b"".join(body))
+        headers = [
+            (name, weak_etag(value) if name.lower() == "etag" else value)
+            for name, value in headers
+            if name.lower() != "content-length"
+        ]
+        headers += [
+            ("Content-Encoding", "gzip"),
+            ("Content-Length", str(len(data))),
+            ("Vary", "Accept-Encoding"),
+        ]
+        start_response(status, headers)
+        return [data]
+
+
+def weak_etag(etag):
+    """An ETag marked weak: the same resource, in another encoding"""
+    return etag if etag.startswith("W/") else "W/" + etag
+
+
+_date = [0, ""]  # cached Date header: [second, value]
+
+
+def http_date():
+    now = int(time.time())
+    if _date[0] != now:
+        _date[:] = [now, email.utils.formatdate(now, usegmt=True)]
+    return _date[1]
+
+
+class _Connection:
+    """A client socket with a read buffer; every read has a deadline"""
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.buffer = bytearray()
+        self.requests = 0
+
+    def fill(self, deadline):
+        """Read more into the buffer; socket.timeout past the deadline"""
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise socket.timeout("timed out")
+        self.sock.settimeout(timeout)
+        data = self.sock.recv(65536)
+        if not data:
+            raise _ClientGone("connection closed")
+        self.buffer += data
+
+    def read_head(self, deadline):
+        """The request line and headers, without the blank line"""
+        start = 0
+        while True:
+            end = self.buffer.find(b"\r\n\r\n", start)
+            if end > MAX_HEAD_SIZE or (end < 0 and len(self.buffer) > MAX_HEAD_SIZE):
+                raise _HttpError(431)
+            if end >= 0:
+                head = bytes(self.buffer[:end])
+                del self.buffer[: end + 4]
+                return head
+            start = max(0, len(self.buffer) - 3)
+            self.fill(deadline)
+
+    def read(self, size, deadline, line=False):
+        """Up to `size` bytes (up to a newline if `line`), waiting for some"""
+        try:
+            while not self.buffer:
+                self.fill(deadline)
+        except OSError as e:
+            raise _ClientGone(str(e)) from e
+        if line:
+            end = self.buffer.find(b"\n", 0, size)
+            if end >= 0:
+                size = end + 1
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def send(self, data, timeout):
+        try:
+            self.sock.settimeout(timeout)
+            self.sock.sendall(data)
+        except OSError as e:
+            raise _ClientGone(str(e)) from e
+
+    def linger(self):
+        """Stop sending and discard what the client sends, for up to LINGER s"""
+        deadline = time.monotonic() + LINGER
+        with contextlib.suppress(OSError, _ClientGone):
+            self.sock.shutdown(socket.SHUT_WR)
+            for _ in range(16):
+                self.buffer.clear()
+                self.fill(deadline)
+
+    def close(self):
+        with contextlib.suppress(OSError):
+            self.sock.close()
+
+
+class _Input:
+    """wsgi.input: the request body, Content-Length bytes at most"""
+
+    def __init__(self, conn, length, deadline, expect_continue):
+        self.__conn = conn
+        self.remaining = length
+        self.__deadline = deadline
+        self.__expect_continue = expect_continue
+
+    def __read(self, size, line):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        if size <= 0:
+            return b""
+        if self.__expect_continue:
+            self.__expect_continue = False
+            self.__conn.send(b"HTTP/1.1 100 Continue\r\n\r\n", REQUEST_TIMEOUT)
+        data = self.__conn.read(size, self.__deadline, line)
+        self.remaining -= len(data)
+        return data
+
+    def read(self, size=-1):
+        chunks = []
+        if size is None or size < 0:
+            size = self.remaining
+        while size > 0 and self.remaining:
+            data = self.__read(size, False)
+            chunks.append(data)
+            size -= len(data)
+        return b"".join(chunks)
+
+    def readline(self, size=-1):
+        chunks = []
+        if size is None or size < 0:
+            size = self.remaining
+        while size > 0 and self.remaining:
+            data = self.__read(size, True)
+            chunks.append(data)
+            size -= len(data)
+            if data.endswith(b"\n"):
+                break
+        return b"".join(chunks)
+
+    def readlines(self, hint=-1):
+        return list(self)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def drain(self):
+        """Skip what the app left unread; False if the body is too long"""
+        if self.remaining > DRAIN_LIMIT:
+            return False
+        while self.remaining:
+            self.__read(self.remaining, False)
+        return True
+
+
+class _Response:
+    """start_response/write for one request, head and first data in one send"""
+
+    def __init__(self, conn, method, version, keep_alive, busy, timeout):
+        self.conn = conn
+        self.method = method
+        self.version = version
+        self.keep_alive = keep_alive
+        self.busy = busy  # () -> whether to close after this response
+        self.timeout = timeout
+        self.status = None
+        self.headers = None
+        self.head_sent = False
+        self.chunked = False
+        self.length = None  # Content-Length set by the app
+        self.sent = 0
+
+    def start_response(self, status, headers, exc_info=None):
+        if exc_info:
+            try:
+                if self.head_sent:
+                    raise exc_info[1].with_traceback(exc_info[2])
+            finally:
+                exc_info = None
+        elif self.status is not None:
+            raise AssertionError("start_response called twice")
+        self.status = status
+        self.headers = headers
+        return self.write
+
+    def __head(self):
+        code = int(self.status[:3])
+        lines = [f"HTTP/1.1 {self.status}"]
+        for name, value in self.headers:
+            lines.append(f"{name}: {value}")
+            if name.lower() == "content-length":
+                self.length = int(value)
+        bodyless = self.method == "HEAD" or code < 200 or code in (204, 304)
+        if self.length is None and not bodyless:
+            if self.version == "HTTP/1.1":
+                self.chunked = True
+                lines.append("Transfer-Encoding: chunked")
+            else:
+                self.keep_alive = False
+        lines.append(f"Date: {http_date()}")
+        self.keep_alive = self.keep_alive and not self.busy()
+        if not self.keep_alive:
+            lines.append("Connection: close")
+        elif self.version == "HTTP/1.0":
+            lines.append("Connection: keep-alive")
+        self.head_sent = True
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    def write(self, data):
+        if self.status is None:
+            raise AssertionError("write() before start_response")
+        out = b"" if self.head_sent else self.__head()
+        if data and self.method != "HEAD":
+            self.sent += len(data)
+            if self.chunked:
+                out += b"%x\r\n%s\r\n" % (len(data), data)
+            else:
+                out += data
+        if out:
+            self.conn.send(out, self.timeout)
+
+    def finish(self):
+        """End the response; whether the connection can take another"""
+        if not self.head_sent:
+            self.write(b"")
+        if self.chunked:
+            self.conn.send(b"0\r\n\r\n", self.timeout)
+        if self.length is not None and self.method != "HEAD":
+            # a short body would leave the client waiting for the rest
+            self.keep_alive = self.keep_alive and self.sent == self.length
+        return self.keep_alive
+
+
+def parse_head(head):
+    """(method, target, version, [(name, value)]) of a request head"""
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split()
+    if len(parts) != 3:
+        raise _HttpError(400)
+    method, target, version = parts
+    if not version.startswith("HTTP/1."):
+        raise _HttpError(505)
+    headers = []
+    for line in lines[1:]:
+        name, colon, value = line.partition(":")
+        if not colon or not name or name != name.strip() or line[0] in " \t":
+            raise _HttpError(400)
+        headers.append((name, value.strip()))
+    return method, target, version, headers
+
+
+class WSGIServer:
+    """
+    Serve a WSGI app from `threads` worker threads (see the module
+    docstring). serve_forever() runs until stop() - which is safe to call
+    from a signal handler - and returns once the workers have finished.
+    """
+
+    def __init__(
+        self,
+        app,
+        host="0.0.0.0",  # nosec B104
+        port=80,
+        threads=THREADS,
+        backlog=BACKLOG,
+        header_timeout=HEADER_TIMEOUT,
+        request_timeout=REQUEST_TIMEOUT,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        max_keepalive_requests=MAX_KEEPALIVE_REQUESTS,
+        grace=GRACE,
+        gzip_min_size=GZIP_MIN_SIZE,
+    ):
+        if threads < 1 or backlog < 1:
+            raise ValueError("threads and backlog must be at least 1")
+        self.app = app if gzip_min_size is None else GzipMiddleware(app, gzip_min_size)
+        self.threads = threads
+        self.header_timeout = header_timeout
+        self.request_timeout = request_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.max_keepalive_requests = max_keepalive_requests
+        self.grace = grace
+
+        self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.__socket.bind((host, port))
+            self.__socket.listen(max(backlog, 128))
+        except OSError:
+            self.__socket.close()
+            raise
+        self.host = host
+        self.port = self.__socket.getsockname()[1]
+
+        self.__waiting = queue.Queue(backlog)
+        self.__idle = set()  # connections between requests
+        self.__lock = threading.Lock()
+        self.__stopping = threading.Event()
+        self.__stopped = threading.Event()
+        self.__serving = False
+        self.__counts = dict.fromkeys(
+            ("connections", "requests", "reused", "rejected", "timeouts", "errors"), 0
+        )
+
+    @classmethod
+    def from_settings(cls, app, settings, host="0.0.0.0", port=80):  # nosec B104
+        """Server for a [web] settings table"""
+        known = (
+            "threads",
+            "backlog",
+            "header_timeout",
+            "request_timeout",
+            "keepalive_timeout",
+            "max_keepalive_requests",
+            "grace",
+            "gzip_min_size",
+        )
+        unknown = set(settings) - set(known)
+        if unknown:
+            raise ValueError(f"unknown [web] keys: {sorted(unknown)}")
+        return cls(app, host, port, **settings)
+
+    def stats(self):
+        """Counters, and the connections waiting for a worker or idle"""
+        with self.__lock:
+            counts = dict(self.__counts)
+            idle = len(self.__idle)
+        return dict(
+            counts,
+            threads=self.threads,
+            waiting=self.__waiting.qsize(),
+            idle=idle,
+        )
+
+    def __count(self, *names):
+        """Add one to counters (workers update them concurrently)"""
+        with self.__lock:
+            for name in names:
+                self.__counts[name] += 1
+
+    def stop(self):
+        """Ask serve_forever() to finish (safe from a signal handler)"""
+        self.__stopping.set()
+
+    def shutdown(self):
+        """stop() and wait for serve_forever() to return"""
+        self.stop()
+        if self.__serving:
+            # wake the accept loop rather than wait for its next poll
+            host = "127.0.0.1" if self.host in ("", "0.0.0.0") else self.host  # nosec B104
+            with contextlib.suppress(OSError):
+                socket.create_connection((host, self.port), 1).close()
+            self.__stopped.wait()
+        else:
+            self.__socket.close()
+
+    def serve_forever(self):
+        self.__serving = True
+        workers = [
+            threading.Thread(target=self.__work, name=f"web-{i}", daemon=True)
+            for i in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        self.__socket.settimeout(ACCEPT_POLL)
+        try:
+            while not self.__stopping.is_set():
+                try:
+                    sock, address = self.__socket.accept()
+                except socket.timeout:
+                    continue
+                except OSError as e:
+                    # out of file descriptors, or a connection reset at once
+                    logger.warning("accept failed: %s", e)
+                    time.sleep(0.05)
+                    continue
+                if self.__stopping.is_set():
+                    sock.close()
+                    break
+                self.__count("connections")
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                try:
+                    self.__waiting.put_nowait((sock, address))
+                except queue.Full:
+                    self.__reject(sock)
+        finally:
+            self.__socket.close()
+            self.__drain(workers)
+            self.__stopped.set()
+
+    def __reject(self, sock):
+        self.__count("rejected")
+        try:
+            sock.setblocking(False)
+            sock.send(
+                b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\n"
+                b"Content-Length: 0\r\nConnection: close\r\n\r\n"
+            )
+        except OSError:
+            pass
+        sock.close()
+
+    def __drain(self, workers):
+        """Serve the accepted connections, close idle ones, join the workers"""
+        deadline = time.monotonic() + self.grace
+        with self.__lock:
+            for conn in self.__idle:
+                with contextlib.suppress(OSError):
+                    conn.sock.shutdown(socket.SHUT_RDWR)
+        for _ in workers:
+            try:
+                self.__waiting.put(None, timeout=max(0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for worker in workers:
+            worker.join(max(0, deadline - time.monotonic()))
+        busy = sum(worker.is_alive() for worker in workers)
+        if busy:
+            logger.warning("Stopped with %d requests still in progress", busy)
+
+    def __work(self):
+        while True:
+            item = self.__waiting.get()
+            if item is None:
+                return
+            conn = _Connection(*item)
+            try:
+                while self.__handle(conn) and self.__wait_for_request(conn):
+                    pass
+            except Exception:
+                self.__count("errors")
+                logger.exception("Error on a connection from %s", conn.address[0])
+            finally:
+                conn.close()
+
+    def __busy(self):
+        """Whether to close connections after their response"""
+        return self.__stopping.is_set() or not self.__waiting.empty()
+
+    def __wait_for_request(self, conn):
+        """Wait up to keepalive_timeout for the next request on `conn`"""
+        if conn.buffer:
+            return True
+        with self.__lock:
+            if self.__stopping.is_set():
+                return False
+            self.__idle.add(conn)
+        try:
+            conn.fill(time.monotonic() + self.keepalive_timeout)
+            return True
+        except (OSError, _ClientGone):
+            return False
+        finally:
+            with self.__lock:
+                self.__idle.discard(conn)
+
+    def __error(self, conn, status):
+        body = f"{status} {responses.get(status, '')}\n".encode()
+        with contextlib.suppress(_ClientGone):
+            conn.send(
+                b"HTTP/1.1 %d %s\r\nContent-Type: text/plain\r\n"
+                b"Content-Length: %d\r\nConnection: close\r\n\r\n%s"
+                % (status, responses.get(status, "").encode(), len(body), body),
+                self.request_timeout,
+            )
+            conn.linger()
+
+    def __handle(self, conn):
+        """Serve one request; whether the connection stays open"""
+        deadline = time.monotonic() + self.header_timeout
+        try:
+            head = conn.read_head(deadline)
+            method, target, version, headers = parse_head(head)
+        except socket.timeout:
+            self.__count("timeouts")
+            if conn.buffer:
+                self.__error(conn, 408)
+            return False
+        except (OSError, _ClientGone):
+            return False
+        except _HttpError as e:
+            self.__error(conn, e.status)
+            return False
+
+        conn.requests += 1
+        if conn.requests > 1:
+            self.__count("requests", "reused")
+        else:
+            self.__count("requests")
+        try:
+            environ = self.__environ(conn, method, target, version, headers)
+        except _HttpError as e:
+            self.__error(conn, e.status)
+            return False
+
+        tokens = environ.get("HTTP_CONNECTION", "").lower()
+        if version == "HTTP/1.1":
+            keep_alive = "close" not in tokens
+        else:
+            keep_alive = "keep-alive" in tokens
+        keep_alive = (
+            keep_alive
+            and conn.requests < self.max_keepalive_requests
+            and environ["wsgi.input"].remaining <= DRAIN_LIMIT
+        )
+
+        response = _Response(
+            conn, method, version, keep_alive, self.__busy, self.request_timeout
+        )
+        result = None
+        try:
+            result = self.app(environ, response.start_response)
+            for data in result:
+                response.write(data)
+            keep_alive = response.finish()
+        except _ClientGone:
+            return False
+        except Exception:
+            self.__count("errors")
+            logger.exception("Error serving %s %s", method, target)
+            if not response.head_sent:
+                self.__error(conn, 500)
+            return False
+        finally:
+            if hasattr(result, "close"):
+                try:
+                    result.close()
+                except Exception:
+                    logger.exception("Error closing the response to %s", target)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('"%s %s %s" %s', method, target, version, response.status)
+        try:
+            return keep_alive and environ["wsgi.input"].drain()
+        except _ClientGone:
+            return False
+
+    def __environ(self, conn, method, target, version, headers):
+        if "://" in target:  # absolute form, from a proxy
+            target = "/" + target.split("://", 1)[1].partition("/")[2]
+        path, _, query = target.partition("?")
+        environ = {
+            "REQUEST_METHOD": method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": unquote(path, "latin-1"),
+            "QUERY_STRING": query,
+            "SERVER_NAME": self.host,
+            "SERVER_PORT": str(self.port),
+            "SERVER_PROTOCOL": version,
+            "REMOTE_ADDR": conn.address[0],
+            "REMOTE_PORT": str(conn.address[1]),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in headers:
+            key = name.upper().replace("-", "_")
+            if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                key = "HTTP_" + key
+            if key in environ:
+                environ[key] += "," + value
+            else:
+                environ[key] = value
+        if "HTTP_TRANSFER_ENCODING" in environ:
+            raise _HttpError(411)  # chunked request bodies are not supported
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            raise _HttpError(400) from None
+        if length < 0:
+            raise _HttpError(400)
+        expect = environ.get("HTTP_EXPECT", "").lower() == "100-continue"
+        environ["wsgi.input"] = _Input(
+            conn, length, time.monotonic() + self.request_timeout, expect
+        )
+        return environ
+
+
+def serve(app, port, settings=None, host="0.0.0.0"):  # nosec B104
+    """
+    Run `app` under WSGIServer until SIGTERM or SIGINT, then stop gracefully.
+    `settings` is the [web] settings table.
+    """
+    server = WSGIServer.from_settings(app, settings or {}, host, port)
+
+    def stop(signum, frame):
+        logger.info("Signal %d: finishing the requests in progress", signum)
+        server.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info(
+        "Serving on port %d: %d threads, keep-alive %g s",
+        server.port,
+        server.threads,
+        server.keepalive_timeout,
+    )
+    server.serve_forever()
+    return server
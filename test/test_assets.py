@@ -0,0 +1,134 @@
+"""
+Tests for the dashboard's fingerprinted, precompressed static assets.
+"""
+
+import gzip
+import os
+import re
+import sys
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.web import assets
+from chicken_gate.web.assets import AssetBundle, choose_encoding, make_asset
+
+
+@pytest.fixture
+def client():
+    from chicken_gate.web.app import app
+
+    return app.test_client()
+
+
+def asset_urls(html):
+    return re.findall(r'(?:href|src)="(/static/[^"]+)"', html)
+
+
+class TestBundle:
+    """Fingerprinting and encodings"""
+
+    def test_fingerprints_follow_content(self, tmp_path):
+        (tmp_path / "app.css").write_text("body { color: red; }")
+        (tmp_path / "app.js").write_text("let x = 1;")
+        first = AssetBundle(str(tmp_path))
+        (tmp_path / "app.css").write_text("body { color: blue; }")
+        second = AssetBundle(str(tmp_path))
+
+        assert re.fullmatch(r"/static/app\.[0-9a-f]{10}\.css", first.url("app.css"))
+        assert first.url("app.css") != second.url("app.css")
+        assert first.url("app.js") == second.url("app.js")
+        asset, immutable = second.get(second.url("app.css").rsplit("/", 1)[1])
+        assert immutable
+        assert asset.content[None] == b"body { color: blue; }"
+        assert asset.content_type == "text/css; charset=utf-8"
+        # the old fingerprint is gone; the plain name must be revalidated
+        assert second.get(first.url("app.css").rsplit("/", 1)[1]) is None
+        assert second.get("app.css")[1] is False
+
+    def test_encodings(self):
+        asset = make_asset("a.js", b"x" * 1000, "application/javascript")
+        assert gzip.decompress(asset.content["gzip"]) == b"x" * 1000
+        assert choose_encoding(asset, "gzip, deflate") == "gzip"
+        assert choose_encoding(asset, "identity") is None
+        assert choose_encoding(asset, "gzip;q=0") is None
+        if "br" in asset.content:
+            assert choose_encoding(asset, "gzip, br") == "br"
+
+    def test_brotli(self):
+        brotli = pytest.importorskip("brotli")
+        asset = make_asset("a.js", b"y" * 1000, "application/javascript")
+        assert brotli.decompress(asset.content["br"]) == b"y" * 1000
+
+
+class TestDashboard:
+    """The page shell and its assets, through the Flask app"""
+
+    def test_page_links_fingerprinted_assets(self, client):
+        response = client.get("/", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["Cache-Control"] == "no-cache"
+        assert len(response.data) < 3000
+        html = gzip.decompress(response.data).decode()
+        urls = asset_urls(html)
+        assert len(urls) == 2
+        assert "<style>" not in html and "<script>" not in html
+
+        for url in urls:
+            asset = client.get(url)
+            assert asset.status_code == 200
+            assert asset.headers["Cache-Control"] == assets.IMMUTABLE
+        script = client.get(urls[1]).data.decode()
+        assert "function" in script and "/api/status" in script
+
+    def test_schedule_rules_shown(self, client):
+        """The schedule card names the configured rules, not fixed sun events"""
+        html = client.get("/").data.decode()
+        assert 'id="gate-open-rule"' in html and 'id="gate-close-rule"' in html
+        assert "at Sunrise" not in html and "at Dusk" not in html
+        script = client.get(asset_urls(html)[1]).data.decode()
+        assert "schedule.open_rule" in script and "schedule.close_rule" in script
+
+    def test_repeat_load_is_a_304(self, client):
+        first = client.get("/", headers={"Accept-Encoding": "gzip"})
+        again = client.get(
+            "/",
+            headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["ETag"]},
+        )
+        assert again.status_code == 304
+        assert again.data == b""
+        assert again.headers["ETag"] == first.headers["ETag"]
+        head = "".join(f"{name}: {value}\r\n" for name, value in again.headers)
+        assert len(head) < 300
+        # a copy fetched in another encoding is just as current
+        plain = client.get("/", headers={"If-None-Match": first.headers["ETag"]})
+        assert plain.status_code == 304
+
+    def test_rendered_once(self, client):
+        pages = []
+        original = assets.page
+
+        def counting(render, reload=False):
+            def render_counted(asset_url):
+                pages.append(asset_url)
+                return render(asset_url)
+
+            return original(render_counted, reload)
+
+        assets._page = None
+        try:
+            assets.page = counting
+            for _ in range(3):
+                assert client.get("/").status_code == 200
+        finally:
+            assets.page = original
+        assert len(pages) == 1
+
+    def test_unknown_and_plain_names(self, client):
+        assert client.get("/static/dashboard.0000000000.css").status_code == 404
+        assert client.get("/static/missing.js").status_code == 404
+        plain = client.get("/static/dashboard.css")
+        assert plain.status_code == 200
+        assert plain.headers["Cache-Control"] == "no-cache"
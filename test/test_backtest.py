@@ -0,0 +1,98 @@
+"""
+Tests for the year-long schedule backtester.
+"""
+
+import os
+import sys
+import time
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from dateutil import tz
+
+from chicken_gate.gate.backtest import SunTable, backtest, main
+from chicken_gate.gate.rules import ScheduleRules
+
+VANCOUVER = tz.gettz("America/Vancouver")
+
+
+class TestBacktest:
+    """Year-long replay of the schedule"""
+
+    def setup_method(self):
+        self.table = SunTable(2025, zone=VANCOUVER)
+
+    def test_default_schedule_year(self):
+        """Sunrise/dusk scheduling at the gate location has no anomalies"""
+        result = backtest(self.table)
+
+        assert len(result["days"]) == 365
+        assert result["anomalies"] == []
+        stats = result["stats"]
+        assert stats["days_scheduled"] == 365
+        assert stats["open_earliest"] < stats["open_latest"]
+        assert stats["close_earliest"] < stats["close_latest"]
+        # opening at sunrise loses the civil twilight before it every morning
+        assert stats["daylight_lost_morning_hours"] > 100
+        assert stats["open_after_dusk_hours"] == 0
+
+    def test_every_event_fires_exactly_once(self):
+        """Replaying the midnight updates fires each open and close once"""
+        result = backtest(self.table)
+        for record in result["days"]:
+            assert len(record["open_fires"]) == 1
+            assert len(record["close_fires"]) == 1
+
+    def test_clock_time_in_dst_gap_is_reported(self):
+        """02:30 does not exist on spring-forward day; it moves to 03:30"""
+        result = backtest(self.table, ScheduleRules(open_rule="02:30"))
+
+        gaps = [a for a in result["anomalies"] if a["kind"] == "dst_gap"]
+        assert [a["date"] for a in gaps] == ["2025-03-09"]
+        day = next(d for d in result["days"] if d["date"] == "2025-03-09")
+        assert len(day["open_fires"]) == 1
+        assert day["open_fires"][0].hour == 3
+
+    def test_clock_time_in_dst_overlap_fires_once(self):
+        """01:30 happens twice on fall-back day but the gate opens once"""
+        result = backtest(self.table, ScheduleRules(open_rule="01:30"))
+
+        kinds = {a["kind"] for a in result["anomalies"]}
+        assert kinds == {"dst_overlap"}
+        day = next(d for d in result["days"] if d["date"] == "2025-11-02")
+        assert len(day["open_fires"]) == 1
+
+    def test_close_after_midnight_still_fires(self):
+        """A close time past midnight fires once on the next calendar day"""
+        result = backtest(self.table, ScheduleRules(close_rule="dusk + 3h"))
+
+        kinds = {a["kind"] for a in result["anomalies"]}
+        assert kinds == {"other_day"}
+        assert all(len(d["close_fires"]) == 1 for d in result["days"][:-1])
+
+    def test_polar_night_has_no_sunrise(self):
+        """Days without a sunrise are reported instead of crashing"""
+        table = SunTable(
+            2025, latitude=69.65, longitude=18.96, zone=tz.gettz("Europe/Oslo")
+        )
+        result = backtest(table)
+
+        kinds = {a["kind"] for a in result["anomalies"]}
+        assert "no_sunrise" in kinds
+        assert result["stats"]["days_scheduled"] < 365
+
+    def test_year_runs_well_under_a_second(self):
+        start = time.perf_counter()
+        backtest(SunTable(2025, zone=VANCOUVER), ScheduleRules("max(sunrise, 06:30)"))
+        assert time.perf_counter() - start < 1.0
+
+    def test_command_line(self, capsys):
+        assert main(["--year", "2025", "--tz", "America/Vancouver"]) == 0
+        out = capsys.readouterr().out
+        assert "days_scheduled" in out
+        assert "anomalies" in out
+
+    def test_command_line_rejects_bad_rule(self, capsys):
+        assert main(["--open", "sunrise +"]) == 1
+        assert "Invalid rules" in capsys.readouterr().out
@@ -0,0 +1,349 @@
+"""
+Tests for running several gates from one process.
+"""
+
+import asyncio
+import importlib
+import json
+import os
+import sys
+import time
+from unittest.mock import MagicMock, patch
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.gate.bank import (
+    DEFAULT_SPEC,
+    DriverBank,
+    load_gate_specs,
+    policy_allows,
+)
+from chicken_gate.gate.embedded import EmbeddedBackend
+from chicken_gate.gate.gate import Gate
+from chicken_gate.gate.gate_cmd import Cmd
+from chicken_gate.gate.gate_drv_mock import Gate_drv
+from chicken_gate.gate.runtime import ALL_GATES, AsyncGate, split_gate_id
+
+
+def two_gates(**policies):
+    """Runtime with fast gates "front" (default) and "side", both open"""
+    front = Gate_drv(Gate(init_posn=0, open_time=2, close_time=2, gate_id="front"))
+    side = Gate_drv(
+        Gate(init_posn=0, open_time=2, close_time=2, gate_id="side"),
+        closed_switch_pin=3,
+        relay_pins=(5, 6),
+    )
+    runtime = AsyncGate(
+        front,
+        policies.pop("schedule", None),
+        tick_interval=0.01,
+        gate_id="front",
+    )
+    runtime.add_gate(side, "side", **policies)
+    return runtime
+
+
+def run(coro_fn, runtime):
+    async def main():
+        task = asyncio.ensure_future(runtime.run())
+        try:
+            return await coro_fn(runtime)
+        finally:
+            runtime.shutdown()
+            await task
+
+    with patch("chicken_gate.gate.gate.send_email"):
+        return asyncio.run(main())
+
+
+class FakeSchedule:
+    """Fires one command at an epoch time"""
+
+    def __init__(self, at, cmd):
+        self.at = at
+        self.cmd = cmd
+
+    def next_deadline(self):
+        return self.at if self.cmd is not None else time.time() + 3600
+
+    def get_gate_cmd(self, now):
+        if self.cmd is not None and now >= self.at:
+            cmd, self.cmd = self.cmd, None
+            return cmd
+        return None
+
+
+class TestGateSpecs:
+    """[[gates]] settings"""
+
+    def test_default(self):
+        assert load_gate_specs({}) == [DEFAULT_SPEC]
+
+    def test_gates(self):
+        specs = load_gate_specs(
+            {
+                "gates": [
+                    {"id": "front"},
+                    {
+                        "id": "side",
+                        "closed_switch_pin": 3,
+                        "relay_pins": [5, 6],
+                        "open_time": 200,
+                        "schedule": "close",
+                        "schedule_delay": 30,
+                        "doorway_roi": [0.3, 0.5, 0.7, 1],
+                    },
+                ]
+            }
+        )
+        assert [s.gate_id for s in specs] == ["front", "side"]
+        assert specs[0].relay_pins == DEFAULT_SPEC.relay_pins
+        assert specs[1].relay_pins == (5, 6)
+        assert (specs[1].open_time, specs[1].close_time) == (200, 420)
+        assert (specs[1].schedule, specs[1].schedule_delay) == ("close", 30.0)
+        assert specs[1].doorway_roi == (0.3, 0.5, 0.7, 1)
+        assert specs[0].doorway_roi is specs[0].doorway_url is None
+
+    @pytest.mark.parametrize(
+        "gates, error",
+        [
+            ([{"id": "a"}, {"id": "a", "closed_switch_pin": 3}], "used twice"),
+            ([{"id": "a"}, {"id": "b"}], "already used"),
+            ([{"id": "a", "schedule": "sometimes"}], "schedule must be"),
+            ([{"id": "a", "pin": 3}], "unknown"),
+            ([{"closed_switch_pin": 3}], "gate id"),
+            ([{"id": "a b"}], "gate id"),
+            ([{"id": "a", "relay_pins": [4]}], "two pins"),
+            ([{"id": "a", "doorway_roi": [0, 0, 1]}], "doorway_roi"),
+        ],
+    )
+    def test_invalid(self, gates, error):
+        with pytest.raises(ValueError, match=error):
+            load_gate_specs({"gates": gates})
+
+    def test_policies(self):
+        assert policy_allows("follow", Cmd.OPEN)
+        assert policy_allows("follow", Cmd.CLOSE)
+        assert not policy_allows("follow", None)
+        assert not policy_allows("close", Cmd.OPEN)
+        assert policy_allows("open", Cmd.OPEN)
+        assert not policy_allows("manual", Cmd.CLOSE)
+
+    def test_split_gate_id(self):
+        assert split_gate_id("side CLOSE") == ("side", "CLOSE")
+        assert split_gate_id("RESET:50") == (None, "RESET:50")
+
+
+class TestDriverBank:
+    """One pass reads all inputs and writes all relays"""
+
+    def make_drivers(self):
+        gpio = MagicMock()
+        gpio.HIGH, gpio.LOW = 1, 0
+        gpio.input.return_value = 0  # switches released
+        rpi = MagicMock(GPIO=gpio)
+        with patch.dict(sys.modules, {"RPi": rpi, "RPi.GPIO": gpio}):
+            sys.modules.pop("chicken_gate.gate.gate_drv", None)
+            module = importlib.import_module("chicken_gate.gate.gate_drv")
+            sys.modules.pop("chicken_gate.gate.gate_drv", None)
+        drivers = [
+            module.Gate_drv(Gate(), closed_switch_pin=2, relay_pins=(4, 17)),
+            module.Gate_drv(Gate(), closed_switch_pin=3, relay_pins=(5, 6)),
+        ]
+        return drivers, gpio
+
+    def test_relays_written_in_one_call(self):
+        drivers, gpio = self.make_drivers()
+        bank = DriverBank(drivers)
+        bank.tick()  # both stop
+        gpio.output.reset_mock()
+
+        for drv in drivers:
+            drv.close()
+        bank.tick()
+        gpio.output.assert_called_once_with([4, 17, 5, 6], [1, 0, 1, 0])
+        assert bank.relay_writes == 2
+
+        bank.tick()  # no change, no write
+        gpio.output.assert_called_once()
+
+    def test_cleanup_releases_own_pins(self):
+        drivers, gpio = self.make_drivers()
+        drivers[1].cleanup()
+        gpio.cleanup.assert_called_once_with([3, 5, 6])
+
+    def test_single_driver_ticks_itself(self):
+        drv = Gate_drv(Gate(init_posn=0, open_time=2, close_time=2))
+        drv.close()
+        DriverBank([drv]).tick()
+        assert drv.get_relay_states() == {"relay1": False, "relay2": True}
+
+
+class TestMultiGateRuntime:
+    """Commands and status by gate id in one loop"""
+
+    def test_commands_by_gate_id(self):
+        async def scenario(gates):
+            status = await gates.close("side")
+            assert status["gate_id"] == "side"
+            await gates.wait_for_state("closed", timeout=5, gate_id="side")
+            return gates.statuses()
+
+        statuses = run(scenario, two_gates())
+        assert statuses["side"]["state"] == "closed"
+        assert statuses["front"]["state"] == "open"
+
+    def test_default_and_all_gates(self):
+        async def scenario(gates):
+            await gates.close()
+            assert gates.status("side")["state"] == "open"
+            await gates.command("CLOSE", ALL_GATES)
+            await gates.wait_for_state("closed", timeout=5, gate_id="side")
+            return gates.status()
+
+        status = run(scenario, two_gates())
+        assert status["gate_id"] == "front"
+        assert status["state"] in ("closing", "closed")
+
+    def test_unknown_gate(self):
+        runtime = two_gates()
+        with pytest.raises(ValueError):
+            runtime.submit_threadsafe("OPEN", "barn")
+        with pytest.raises(ValueError):
+            runtime.add_gate(runtime.gate_drv, "side")
+
+    def test_schedule_enabled_per_gate(self):
+        async def scenario(gates):
+            await gates.enable_schedule(False, gate_id="side")
+            return gates.schedule_enabled, gates.is_schedule_enabled("side")
+
+        assert run(scenario, two_gates()) == (True, False)
+
+    def test_publishers_get_each_gate(self):
+        published = set()
+        runtime = two_gates()
+        runtime.add_publisher(lambda status: published.add(status["gate_id"]))
+
+        async def scenario(gates):
+            await asyncio.sleep(0.05)
+
+        run(scenario, runtime)
+        assert published == {"front", "side"}
+
+    def test_source_commands_with_gate_id(self):
+        runtime = two_gates()
+        backend = EmbeddedBackend(default_gate="front")
+        runtime.add_command_source(backend.pending_commands)
+        backend.send_command("CLOSE", "side")
+
+        async def scenario(gates):
+            return await gates.wait_for_state("closing", timeout=5, gate_id="side")
+
+        run(scenario, runtime)
+        assert runtime.status("front")["state"] == "open"
+
+    def test_schedule_policy_and_delay(self):
+        schedule = FakeSchedule(time.time() + 0.05, Cmd.CLOSE)
+        runtime = two_gates(schedule=schedule, schedule_delay=0.3)
+
+        async def scenario(gates):
+            await gates.wait_for_state("closing", timeout=5)
+            assert gates.status("side")["state"] == "open"
+            return await gates.wait_for_state("closing", timeout=5, gate_id="side")
+
+        start = time.monotonic()
+        run(scenario, runtime)
+        assert time.monotonic() - start >= 0.3
+
+    def test_policy_ignores_other_command(self):
+        schedule = FakeSchedule(time.time(), Cmd.OPEN)
+        runtime = two_gates(schedule=schedule, schedule_policy="close")
+        runtime.driver("side").reset_posn_to(100)
+
+        async def scenario(gates):
+            await gates.wait_for_state("open", timeout=5)
+            await asyncio.sleep(0.1)
+            return gates.status("side")
+
+        assert run(scenario, runtime)["position"] == 100
+
+
+class TestWebApi:
+    """/api/gates routes"""
+
+    @pytest.fixture
+    def client(self):
+        from chicken_gate.web.app import app
+
+        backend = EmbeddedBackend(default_gate="front")
+        for gate_id, posn in (("front", 0), ("side", 100)):
+            gate = Gate(init_posn=posn, gate_id=gate_id)
+            status = gate.get_status()
+            status["gate_id"] = gate_id
+            backend.snapshot_for(gate_id).publish(status)
+        app.config["GATE_BACKEND"] = backend
+        try:
+            yield app.test_client(), backend
+        finally:
+            app.config.pop("GATE_BACKEND")
+
+    def test_list_gates(self, client):
+        client, _ = client
+        gates = client.get("/api/gates").get_json()["gates"]
+        assert [(g["id"], g["position"]) for g in gates] == [
+            ("front", 0),
+            ("side", 100),
+        ]
+
+    def test_status_by_gate(self, client):
+        client, _ = client
+        assert client.get("/api/gates/side/status").get_json()["position"] == 100
+        assert client.get("/api/status?gate=side").get_json()["gate_id"] == "side"
+        assert client.get("/api/status").get_json()["gate_id"] == "front"
+        assert client.get("/api/gates/barn/status").status_code == 404
+
+    def test_command_by_gate(self, client):
+        client, backend = client
+        response = client.post("/api/gates/side/command", json={"command": "close"})
+        assert response.status_code == 200
+        client.post("/api/command", json={"command": "open", "gate": "front"})
+        client.post("/api/command", json={"command": "stop"})
+        assert list(backend.pending_commands()) == [
+            ("side", "CLOSE"),
+            ("front", "OPEN"),
+            "STOP",
+        ]
+        response = client.post("/api/gates/barn/command", json={"command": "open"})
+        assert response.status_code == 404
+
+    def test_status_file_read_once_per_request(self, tmp_path, monkeypatch):
+        web_app = importlib.import_module("chicken_gate.web.app")
+        statuses = {
+            gate_id: dict(Gate(init_posn=posn).get_status(), gate_id=gate_id)
+            for gate_id, posn in (("front", 0), ("side", 100), ("back", 50))
+        }
+        status_file = tmp_path / "gate_status.json"
+        status_file.write_text(json.dumps(dict(statuses["front"], gates=statuses)))
+        monkeypatch.setattr(web_app, "STATUS_FILE", str(status_file))
+        monkeypatch.setattr(web_app, "DIAGNOSTICS_FILE", str(tmp_path / "none"))
+        opened = []
+
+        def counting_open(path, *args, **kwargs):
+            opened.append(os.path.basename(path))
+            return open(path, *args, **kwargs)
+
+        monkeypatch.setattr(web_app, "open", counting_open, raising=False)
+        client = web_app.app.test_client()
+        gates = client.get("/api/gates").get_json()["gates"]
+        assert [(g["id"], g["position"]) for g in gates] == [
+            ("front", 0),
+            ("side", 100),
+            ("back", 50),
+        ]
+        assert opened == ["gate_status.json"]  # no diagnostics either
+        opened.clear()
+        assert client.get("/api/status?gate=back").get_json()["position"] == 50
+        assert opened.count("gate_status.json") == 1
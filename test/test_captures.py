@@ -0,0 +1,243 @@
+"""
+Tests for the camera capture archive and service.
+"""
+
+import importlib
+import os
+import sys
+import time
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.shared.captures import (
+    INDEX_FILE,
+    CaptureArchive,
+    CaptureService,
+)
+
+T0 = 1760860800.0
+
+
+def jpeg(n, size=1000):
+    """A stand-in JPEG of `size` bytes that says which it is"""
+    data = b"\xff\xd8frame %d " % n
+    return data + b"x" * (size - len(data))
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return CaptureArchive(str(tmp_path / "captures"))
+
+
+def fill(archive, count, step=60.0, size=1000):
+    return [
+        archive.append(jpeg(n, size), "periodic", T0 + n * step) for n in range(count)
+    ]
+
+
+class TestArchive:
+    """Segments, the index and lookups"""
+
+    def test_nearest_and_read(self, archive):
+        fill(archive, 10)
+        frame = archive.nearest(T0 + 5 * 60 + 20)
+        assert frame.t == T0 + 300
+        assert archive.read(frame) == jpeg(5)
+        assert archive.nearest(T0 + 5 * 60 + 40).t == T0 + 360
+        assert archive.nearest(0).t == T0
+        assert archive.nearest(T0 * 2).t == T0 + 540
+
+    def test_range(self, archive):
+        fill(archive, 10)
+        frames = archive.frames(T0 + 120, T0 + 300)
+        assert [f.t for f in frames] == [T0 + 120, T0 + 180, T0 + 240]
+        assert len(archive.frames(limit=4)) == 4
+        assert len(archive.frames(start=T0 + 500)) == 1
+
+    def test_empty(self, archive):
+        assert archive.nearest(T0) is None
+        assert archive.frames() == []
+        assert archive.stats() == {
+            "frames": 0,
+            "first": None,
+            "last": None,
+            "bytes": 0,
+        }
+
+    def test_index_is_compact_and_in_time_order(self, archive):
+        fill(archive, 3)
+        archive.append(jpeg(3), "closed", T0 - 1000)  # clock stepped back
+        size = os.path.getsize(os.path.join(archive.directory, INDEX_FILE))
+        assert size == 4 * 24
+        frames = archive.frames()
+        assert [f.t for f in frames] == sorted(f.t for f in frames)
+        assert frames[-1].reason == "closed"
+
+    def test_rotation_and_retention(self, tmp_path):
+        archive = CaptureArchive(
+            str(tmp_path / "captures"), max_megabytes=0.05, segment_megabytes=0.01
+        )
+        fill(archive, 200, size=1000)  # ~200 KB into 10 KB segments
+        stats = archive.stats()
+        assert stats["bytes"] <= 0.05 * 1024 * 1024 + 11 * 1024
+        segments = archive.segments()
+        assert len(segments) <= 6 and segments[0] > 1
+        # the index holds exactly the frames still on disk
+        frames = archive.frames()
+        assert stats["frames"] == len(frames)
+        assert frames[-1].t == T0 + 199 * 60
+        assert all(archive.read(f).startswith(b"\xff\xd8") for f in frames)
+        assert archive.nearest(T0).t == frames[0].t
+
+    def test_recovery_after_a_crash(self, tmp_path):
+        directory = str(tmp_path / "captures")
+        fill(CaptureArchive(directory), 5)
+        index = os.path.join(directory, INDEX_FILE)
+        with open(index, "ab") as f:
+            f.write(b"\x00" * 10)  # torn index record
+        with open(os.path.join(directory, "00000001.seg"), "ab") as f:
+            f.write(b"CGF1 torn frame")  # frame cut short
+        archive = CaptureArchive(directory)
+        archive.append(jpeg(5), "open", T0 + 300)
+        assert [archive.read(f) for f in archive.frames()] == [
+            jpeg(n) for n in range(6)
+        ]
+        # a lost index is rebuilt from the segments
+        os.remove(index)
+        rebuilt = CaptureArchive(directory)
+        rebuilt.append(jpeg(6), "closed", T0 + 360)
+        assert len(rebuilt.frames()) == 7
+        assert rebuilt.read(rebuilt.nearest(T0 + 300)) == jpeg(5)
+
+    def test_settings_checked(self, tmp_path):
+        with pytest.raises(ValueError):
+            CaptureArchive(str(tmp_path), max_megabytes=1, segment_megabytes=2)
+
+
+class Clock:
+    def __init__(self):
+        self.t = T0
+
+    def __call__(self):
+        return self.t
+
+
+class TestService:
+    """When frames are taken"""
+
+    @pytest.fixture
+    def service(self, archive):
+        self.clock = Clock()
+        self.shots = 0
+
+        def capture():
+            self.shots += 1
+            return jpeg(self.shots)
+
+        return CaptureService(
+            archive, capture, interval=600, min_gap=5, clock=self.clock
+        )
+
+    def test_timelapse(self, service):
+        assert service.poll().reason == "periodic"  # on start
+        self.clock.t += 300
+        assert service.poll() is None
+        self.clock.t += 300
+        assert service.poll().reason == "periodic"
+        assert service.captured == 2
+
+    def test_state_changes_and_schedule(self, service):
+        service.poll()
+        service.publish({"gate_id": "gate", "state": "open"})
+        self.clock.t += 60
+        service.on_schedule("gate", "CLOSE")
+        service.publish({"gate_id": "gate", "state": "closing"})
+        assert service.poll().reason == "schedule_close"
+        assert service.poll() is None  # "closing" within min_gap of it
+        self.clock.t += 400
+        service.publish({"gate_id": "gate", "state": "closed"})
+        service.publish({"gate_id": "gate", "state": "closed"})  # heartbeat
+        assert service.poll().reason == "closed"
+        assert service.poll() is None
+        reasons = [f.reason for f in service.archive.frames()]
+        assert reasons == ["periodic", "schedule_close", "closed"]
+
+    def test_background_thread(self, archive):
+        service = CaptureService(archive, lambda: jpeg(0), min_gap=0)
+
+        def wait_for(count):
+            for _ in range(200):
+                if service.captured == count:
+                    return
+                time.sleep(0.01)
+
+        service.start()
+        try:
+            wait_for(1)  # the first timelapse frame
+            service.trigger("open")
+            wait_for(2)
+        finally:
+            service.stop()
+        assert [f.reason for f in archive.frames()] == ["periodic", "open"]
+
+    def test_failures_are_counted(self, archive):
+        clock = Clock()
+
+        def broken():
+            raise RuntimeError("camera offline")
+
+        service = CaptureService(archive, broken, clock=clock)
+        assert service.poll() is None
+        service.trigger("open")
+        clock.t += 10
+        assert service.poll() is None
+        assert service.failures == 2 and archive.frames() == []
+
+    def test_settings(self, tmp_path):
+        directory = str(tmp_path / "captures")
+        assert CaptureService.from_settings({}, directory) is None
+        service = CaptureService.from_settings(
+            {"enabled": True, "interval": 900, "max_megabytes": 64}, directory
+        )
+        assert service.interval == 900
+        assert service.archive.max_bytes == 64 * 1024 * 1024
+        with pytest.raises(ValueError, match="unknown"):
+            CaptureService.from_settings({"enabled": True, "period": 1}, directory)
+
+
+class TestApi:
+    """/api/camera/archive"""
+
+    @pytest.fixture
+    def client(self, archive, monkeypatch):
+        fill(archive, 10)
+        archive.append(jpeg(10), "closed", T0 + 600)
+        web_app = importlib.import_module("chicken_gate.web.app")
+        monkeypatch.setattr(web_app, "CAPTURE_DIR", archive.directory)
+        return web_app.app.test_client()
+
+    def test_frame_at(self, client):
+        response = client.get(f"/api/camera/archive?at={T0 + 590}")
+        assert response.status_code == 200
+        assert response.mimetype == "image/jpeg"
+        assert response.data == jpeg(10)
+        assert response.headers["X-Capture-Reason"] == "closed"
+
+    def test_range(self, client):
+        frames = client.get(
+            "/api/camera/archive?from=2025-10-19T08:00:00Z&to=2025-10-19T08:03:00Z"
+        ).get_json()["frames"]
+        assert [f["t"] for f in frames] == [T0, T0 + 60, T0 + 120]
+        image = client.get(frames[1]["url"])
+        assert image.data == jpeg(1)
+
+    def test_stats_and_errors(self, client, tmp_path, monkeypatch):
+        stats = client.get("/api/camera/archive").get_json()
+        assert stats["frames"] == 11 and stats["last"] == T0 + 600
+        assert client.get("/api/camera/archive?at=noon").status_code == 400
+        web_app = importlib.import_module("chicken_gate.web.app")
+        monkeypatch.setattr(web_app, "CAPTURE_DIR", str(tmp_path / "none"))
+        assert client.get(f"/api/camera/archive?at={T0}").status_code == 404
@@ -0,0 +1,284 @@
+"""
+Tests for crash-safe state checkpointing and restore.
+"""
+
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.gate import checkpoint
+from chicken_gate.gate.checkpoint import Checkpointer, reconcile, restore
+from chicken_gate.gate.gate import Gate
+from chicken_gate.gate.gate_cmd import Cmd
+from chicken_gate.gate.gate_drv_mock import Gate_drv
+from chicken_gate.gate.main import apply_missed_event
+from chicken_gate.shared.writer import BackgroundWriter
+
+
+def state(position=100, target=100, **fields):
+    return dict(
+        {
+            "position": position,
+            "target_position": target,
+            "motion": "STOP",
+            "open_disabled": False,
+            "manual_stop": False,
+            "errors": [],
+            "schedule_enabled": True,
+        },
+        **fields,
+    )
+
+
+@pytest.fixture
+def wal(tmp_path):
+    return str(tmp_path / "gate_state.wal")
+
+
+class TestFile:
+    """Records, torn writes and compaction"""
+
+    def test_last_record_wins(self, wal):
+        cp = Checkpointer(wal)
+        cp.update(state(100), now=0.0)
+        cp.update(state(100, 0, motion="OPEN"), now=1.0)
+        cp.close()
+        record = Checkpointer(wal).load()
+        assert record["target_position"] == 0
+        assert record["motion"] == "OPEN"
+        assert record["version"] == checkpoint.VERSION
+
+    def test_torn_tail_is_cut_off(self, wal):
+        cp = Checkpointer(wal)
+        cp.update(state(100), now=0.0)
+        cp.update(state(100, 0), now=1.0)
+        cp.close()
+        size = os.path.getsize(wal)
+        with open(wal, "r+b") as f:
+            f.truncate(size - 7)  # crash in the middle of the second write
+
+        cp = Checkpointer(wal)
+        assert cp.load()["target_position"] == 100
+        assert cp.torn_bytes > 0
+        # the next record starts on a clean line
+        cp.update(state(50, 50), now=2.0)
+        cp.close()
+        assert Checkpointer(wal).load()["position"] == 50
+
+    def test_corrupt_record_stops_the_read(self, wal):
+        cp = Checkpointer(wal)
+        cp.update(state(100), now=0.0)
+        cp.update(state(100, 0), now=1.0)
+        cp.close()
+        with open(wal, "rb") as f:
+            lines = f.read().splitlines(keepends=True)
+        with open(wal, "wb") as f:
+            f.write(lines[0] + lines[1].replace(b'"target_position":0', b'"x":1'))
+        assert Checkpointer(wal).load()["target_position"] == 100
+
+    def test_missing_or_empty_file(self, wal):
+        assert Checkpointer(wal).load() is None
+        open(wal, "wb").close()
+        assert Checkpointer(wal).load() is None
+
+    def test_compaction(self, wal):
+        cp = Checkpointer(wal, compact_records=5)
+        for i in range(12):
+            cp.update(state(100, target=i), now=float(i))
+        cp.close()
+        assert cp.compactions == 2
+        with open(wal, "rb") as f:
+            assert len(f.read().splitlines()) < 5
+        assert Checkpointer(wal).load()["target_position"] == 11
+        assert not os.path.exists(wal + ".tmp")
+
+
+class TestWritePolicy:
+    """Only changes are written; fsyncs are batched"""
+
+    def test_idle_writes_nothing(self, wal):
+        cp = Checkpointer(wal)
+        assert cp.update(state(), now=0.0)
+        for i in range(1, 1000):
+            assert not cp.update(state(), now=float(i))
+        assert cp.writes == 1
+        assert cp.fsyncs == 1
+
+    def test_position_rate_limited_while_moving(self, wal):
+        cp = Checkpointer(wal, position_interval=2.0)
+        moving = {"target_position": 0, "motion": "OPEN"}
+        for i in range(100):  # 10 s of ticks
+            cp.update(state(100 - i, **moving), now=i / 10)
+        assert cp.writes == 5
+        # stopping is written at once
+        assert cp.update(state(0, 0), now=10.05)
+
+    def test_fsyncs_are_batched(self, wal):
+        cp = Checkpointer(wal, fsync_interval=5.0)
+        with patch("chicken_gate.gate.checkpoint.os.fsync") as fsync:
+            for i in range(30):  # a change every 0.5 s
+                cp.update(state(100, target=i), now=i / 2)
+            assert cp.writes == 30
+            assert fsync.call_count == 2
+            cp.close()
+            assert fsync.call_count == 3
+
+    def test_unsynced_records_survive_the_process(self, wal):
+        cp = Checkpointer(wal, fsync_interval=60.0)
+        cp.update(state(30, 30), now=0.0)
+        assert cp.fsyncs == 0
+        # not closed: a new process reads what reached the OS
+        assert Checkpointer(wal).load()["position"] == 30
+
+
+class TestWriter:
+    """File operations on the writer's thread"""
+
+    def test_update_does_not_wait_for_the_disk(self, wal):
+        writer = BackgroundWriter()
+        gate = threading.Event()
+        writer.submit(gate.wait, 5)  # a stalled SD card
+        cp = Checkpointer(wal, fsync_interval=0.0, compact_records=3, writer=writer)
+        start = time.monotonic()
+        for i in range(10):
+            cp.update(state(100, target=i), now=float(i))
+        assert time.monotonic() - start < 0.5
+        assert cp.writes == 10 and cp.compactions == 3
+        assert not os.path.exists(wal)  # nothing written yet
+        gate.set()
+        cp.close()
+        writer.stop()
+        assert Checkpointer(wal).load()["target_position"] == 9
+
+
+class TestReconcile:
+    """Checkpoint against the closed switch"""
+
+    def test_agreeing(self):
+        restored, note = reconcile(state(100), switch_pressed=True)
+        assert restored["position"] == 100
+        assert note is None
+        restored, note = reconcile(state(40, 40), switch_pressed=False)
+        assert restored["position"] == 40
+        assert note is None
+
+    def test_switch_pressed_wins(self):
+        restored, note = reconcile(state(20, 20), switch_pressed=True)
+        assert restored["position"] == 100
+        assert "pressed" in note
+
+    def test_closed_without_switch_falls_back(self):
+        restored, note = reconcile(state(100), switch_pressed=False)
+        assert (restored["position"], restored["target_position"]) == (0, 0)
+        assert note is not None
+
+    def test_closing_not_yet_at_switch(self):
+        restored, note = reconcile(state(60, 100, motion="CLOSE"), switch_pressed=False)
+        assert restored["position"] == 60
+        assert note is None
+
+
+class TestRestore:
+    """Restoring into a gate on start"""
+
+    def test_round_trip(self, wal):
+        gate = Gate()
+        gate.reset_posn_to(40)
+        gate.close()
+        gate._Gate__errors.append("gate finished closing but switch not pressed")
+        gate._Gate__open_disabled = True
+        cp = Checkpointer(wal)
+        cp.update(dict(gate.get_state(), schedule_enabled=False))
+        cp.close()
+
+        restored_gate = Gate(open_time=2, close_time=2)
+        drv = Gate_drv(restored_gate)
+        record = restore(Checkpointer(wal), restored_gate, drv.is_switch_pressed())
+        assert record["schedule_enabled"] is False
+        assert restored_gate.get_posn() == 40
+        assert restored_gate.get_errors() == gate.get_errors()
+        status = restored_gate.get_status()
+        assert status["open_disabled"]
+        assert status["diagnostic_messages"][-1].endswith(
+            "state restored from checkpoint - position 40, target 100"
+        )
+        # the interrupted close resumes
+        drv.tick()
+        assert restored_gate.is_closing()
+
+    def test_manual_stop_holds(self, wal):
+        cp = Checkpointer(wal)
+        cp.update(state(50, 100, manual_stop=True))
+        cp.close()
+        gate = Gate(open_time=2, close_time=2)
+        drv = Gate_drv(gate)
+        restore(Checkpointer(wal), gate, drv.is_switch_pressed())
+        drv.tick()
+        assert not gate.is_moving()
+        assert gate.get_posn() == 50
+
+    def test_bad_record_is_ignored(self, wal):
+        cp = Checkpointer(wal)
+        cp.update({"position": 10})
+        cp.close()
+        gate = Gate(init_posn=0)
+        assert restore(Checkpointer(wal), gate, False) is None
+        assert gate.get_posn() == 0
+
+    def test_restore_takes_milliseconds(self, wal):
+        cp = Checkpointer(wal)
+        for i in range(checkpoint.COMPACT_RECORDS):  # the largest file
+            cp.update(state(100, target=i % 100), now=float(i))
+        cp.close()
+        gate = Gate()
+        start = time.perf_counter()
+        assert restore(Checkpointer(wal), gate, True) is not None
+        assert time.perf_counter() - start < 0.05
+
+
+class TestMissedEvent:
+    """An event due while the process was down is applied on start"""
+
+    @pytest.fixture
+    def schedule(self, tmp_path):
+        from chicken_gate.gate.schedule import Schedule
+
+        settings = tmp_path / "chicken-gate.toml"
+        settings.write_text('[schedule]\nopen = "07:00"\nclose = "19:00"\n')
+        return Schedule(settings_path=settings, use_apscheduler=False)
+
+    def at(self, day, hour):
+        return datetime(2026, 3, day, hour).timestamp()
+
+    def test_latest_missed_event(self, schedule):
+        event = schedule.missed_event(self.at(10, 6), self.at(10, 8))
+        assert (event.cmd, event.when.hour) == (Cmd.OPEN, 7)
+        # down across both: the close is the one that counts
+        event = schedule.missed_event(self.at(10, 6), self.at(10, 20))
+        assert (event.cmd, event.day.day) == (Cmd.CLOSE, 10)
+        event = schedule.missed_event(self.at(9, 20), self.at(10, 6))
+        assert event is None
+        # overnight from the day before
+        event = schedule.missed_event(self.at(9, 18), self.at(10, 6))
+        assert (event.cmd, event.day.day) == (Cmd.CLOSE, 9)
+
+    def test_applied_to_the_gate(self, schedule):
+        gate = Gate(open_time=2, close_time=2)
+        drv = Gate_drv(gate)
+        event = apply_missed_event(schedule, drv, self.at(10, 6), self.at(10, 8))
+        assert event.cmd == Cmd.OPEN
+        assert gate.get_status()["target_position"] == 0
+
+    def test_nothing_missed(self, schedule):
+        gate = Gate()
+        drv = Gate_drv(gate, initial_closed_switch=True)
+        assert apply_missed_event(schedule, drv, self.at(10, 8), self.at(10, 9)) is None
+        assert gate.get_status()["target_position"] == 100
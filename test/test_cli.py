@@ -0,0 +1,296 @@
+"""
+Tests for the chicken-gate-ctl command line.
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.gate import cli
+from chicken_gate.gate.cli import (
+    CliError,
+    FileTransport,
+    HttpTransport,
+    follow,
+    parse_batch,
+    run_batch,
+    send,
+    took_effect,
+)
+from chicken_gate.gate.gate import Gate
+from chicken_gate.gate.gate_drv_mock import Gate_drv
+from chicken_gate.gate.runtime import apply_command
+
+
+class SimulatedGate:
+    """
+    A gate process in a thread: takes commands from the command file and
+    writes the status file, like chicken-gate-main --mock but faster
+    """
+
+    def __init__(self, directory, interval=0.01, gate=None):
+        self.directory = str(directory)
+        self.interval = interval
+        gate = Gate(open_time=5, close_time=5) if gate is None else gate
+        self.driver = Gate_drv(gate, True)
+        self.schedule_enabled = True
+        self.commands = []
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+
+    def write_status(self):
+        status = self.driver.gate.get_status()
+        status.update(
+            gate_id="gate",
+            schedule_enabled=self.schedule_enabled,
+            last_updated=datetime.now().isoformat(),
+        )
+        temp_file = os.path.join(self.directory, "gate_status.json.tmp")
+        with open(temp_file, "w") as f:
+            json.dump(status, f)
+        os.replace(temp_file, os.path.join(self.directory, "gate_status.json"))
+
+    def __run(self):
+        cmd_file = os.path.join(self.directory, "gate_cmd.txt")
+        while not self.__stop.wait(self.interval):
+            if os.path.exists(cmd_file):
+                with open(cmd_file) as f:
+                    command = f.read().strip()
+                os.remove(cmd_file)
+                self.commands.append(command)
+                self.schedule_enabled = apply_command(
+                    command, self.driver, self.schedule_enabled
+                )
+            self.driver.tick()
+            self.write_status()
+
+    def __enter__(self):
+        self.write_status()
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.__stop.set()
+        self.__thread.join(5)
+
+
+def status(**fields):
+    base = {
+        "position": 100,
+        "target_position": 100,
+        "is_opening": False,
+        "is_closing": False,
+        "is_moving": False,
+        "errors": [],
+        "diagnostic_messages": [],
+        "schedule_enabled": True,
+    }
+    base.update(fields)
+    return base
+
+
+class TestTookEffect:
+    """What each command's done looks like in the status"""
+
+    @pytest.mark.parametrize(
+        "command, done, not_done",
+        [
+            ("OPEN", status(position=0), status(position=40, is_opening=True)),
+            ("CLOSE", status(), status(position=0)),
+            ("STOP", status(position=40), status(is_moving=True, is_closing=True)),
+            ("RESET:50", status(position=50), status(position=100)),
+            ("CLEAR_ERRORS", status(), status(errors=["Gate stuck"])),
+            (
+                "CLEAR_DIAGNOSTICS",
+                status(),
+                status(diagnostic_messages=["switch bounced"]),
+            ),
+            ("ENABLE_SCHEDULE", status(), status(schedule_enabled=False)),
+            ("DISABLE_SCHEDULE", status(schedule_enabled=False), status()),
+        ],
+    )
+    def test_commands(self, command, done, not_done):
+        assert took_effect(command, done)
+        assert not took_effect(command, not_done)
+
+
+class TestBatch:
+    """Batch files"""
+
+    def test_parse(self):
+        lines = [
+            "# nightly maintenance",
+            "",
+            "disable-schedule",
+            "side close   # the side gate too",
+            "sleep 1.5",
+            "reset:100",
+        ]
+        assert parse_batch(lines) == [
+            (3, None, "DISABLE_SCHEDULE"),
+            (4, "side", "CLOSE"),
+            (5, None, 1.5),
+            (6, None, "RESET:100"),
+        ]
+
+    def test_every_bad_line_is_reported(self):
+        with pytest.raises(CliError) as info:
+            parse_batch(["OPEN", "JUMP", "RESET:150", "sleep", "a b c"], "m.txt")
+        problems = str(info.value).splitlines()
+        assert [p.split(":")[1] for p in problems] == ["2", "3", "4", "5"]
+        assert problems[0] == "m.txt:2: Unknown command: JUMP"
+
+    def test_run_waits_for_each_command(self, tmp_path):
+        out = io.StringIO()
+        with SimulatedGate(tmp_path) as gate:
+            transport = FileTransport(str(tmp_path))
+            steps = parse_batch(["open", "disable-schedule", "stop", "close"])
+            run_batch(transport, steps, wait=True, timeout=10, out=out)
+            transport.close()
+        # none overwritten in the command file slot
+        assert gate.commands == ["OPEN", "DISABLE_SCHEDULE", "STOP", "CLOSE"]
+        assert out.getvalue().splitlines()[-1] == (
+            "line 4: CLOSE sent - closed at 100%, schedule disabled"
+        )
+
+
+class TestFiles:
+    """Commands and status through the gate process's files"""
+
+    def test_send_waits_for_the_slot(self, tmp_path):
+        cmd_file = tmp_path / "gate_cmd.txt"
+        cmd_file.write_text("STOP")
+        threading.Timer(0.2, cmd_file.unlink).start()
+        transport = FileTransport(str(tmp_path))
+        send(transport, "OPEN", "side", timeout=5)
+        assert cmd_file.read_text() == "side OPEN"
+        with pytest.raises(CliError, match="has not taken"):
+            send(transport, "CLOSE", timeout=0.2)
+        assert cmd_file.read_text() == "side OPEN"
+        transport.close()
+
+    def test_wait(self, tmp_path):
+        with SimulatedGate(tmp_path):
+            transport = FileTransport(str(tmp_path))
+            result = send(transport, "OPEN", wait=True, timeout=10)
+            assert result["position"] == 0 and not result["is_moving"]
+            transport.close()
+
+    def test_wait_times_out(self, tmp_path):
+        with SimulatedGate(tmp_path, gate=Gate(open_time=10000)):
+            transport = FileTransport(str(tmp_path))
+            with pytest.raises(CliError, match="did not take effect.*opening"):
+                send(transport, "OPEN", wait=True, timeout=0.5)
+            transport.close()
+
+    def test_wait_needs_a_fresh_status(self, tmp_path):
+        """A status from before the command does not count"""
+        transport = FileTransport(str(tmp_path))
+        stale = status(last_updated=(datetime.now() - timedelta(minutes=1)).isoformat())
+        (tmp_path / "gate_status.json").write_text(json.dumps(stale))
+        threading.Timer(0.1, (tmp_path / "gate_cmd.txt").unlink).start()
+        with pytest.raises(CliError, match="did not take effect"):
+            send(transport, "CLOSE", wait=True, timeout=0.5)
+        transport.close()
+
+    def test_follow(self, tmp_path):
+        out = io.StringIO()
+        with SimulatedGate(tmp_path, interval=0.02) as gate:
+            transport = FileTransport(str(tmp_path))
+            threading.Timer(0.1, gate.driver.open).start()
+            follow(transport, count=3, out=out)
+            transport.close()
+        lines = [line.split(" ", 1)[1] for line in out.getvalue().splitlines()]
+        assert lines[0] == "closed at 100%"
+        assert all(line.startswith("opening at") for line in lines[1:])
+        assert len(set(lines)) == 3
+
+
+class TestMain:
+    """The chicken-gate-ctl entry point"""
+
+    def run(self, *argv):
+        out, err = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            code = cli.main(list(argv))
+        return code, out.getvalue(), err.getvalue()
+
+    def test_send_and_status(self, tmp_path):
+        with SimulatedGate(tmp_path):
+            code, out, _ = self.run("--dir", str(tmp_path), "send", "clear-errors")
+            assert (code, out) == (0, "CLEAR_ERRORS sent\n")
+            time.sleep(0.1)
+            code, out, _ = self.run("--dir", str(tmp_path), "status")
+            assert (code, out) == (0, "closed at 100%\n")
+            code, out, _ = self.run("--dir", str(tmp_path), "status", "--json")
+            assert json.loads(out)["position"] == 100
+
+    def test_errors(self, tmp_path):
+        code, _, err = self.run("--dir", str(tmp_path), "send", "jump")
+        assert (code, err) == (1, "chicken-gate-ctl: Unknown command: JUMP\n")
+        code, out, _ = self.run("--dir", str(tmp_path), "status")
+        assert code == 1 and "no status" in out
+        code, _, err = self.run(
+            "--dir", str(tmp_path), "send", "open", "--gate", "*", "--wait"
+        )
+        assert code == 1 and "one gate" in err
+
+    def test_send_gate_cmd_script(self, tmp_path):
+        """The old script: send_command() returns at once, never overwrites"""
+        sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+        try:
+            from send_gate_cmd import send_command
+        finally:
+            sys.path.pop(0)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            assert send_command("reset:50", tmp_path)
+            start = time.monotonic()
+            assert not send_command("open", tmp_path)  # RESET:50 not taken
+            assert time.monotonic() - start < 1
+            assert not send_command("jump", tmp_path)
+        assert (tmp_path / "gate_cmd.txt").read_text() == "RESET:50"
+        assert (
+            out.getvalue().splitlines()[0] == "Command 'RESET:50' sent to gate process"
+        )
+
+
+class TestWebApi:
+    """--url: the web API of a single-process gate"""
+
+    def test_commands_and_status(self):
+        from chicken_gate.gate.embedded import EmbeddedBackend
+        from chicken_gate.web.app import app
+        from chicken_gate.web.server import WSGIServer
+
+        backend = EmbeddedBackend()
+        backend.snapshot.publish(dict(status(), gate_id="gate"))
+        app.config["GATE_BACKEND"] = backend
+        server = WSGIServer(app, "127.0.0.1", 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            transport = HttpTransport(f"http://127.0.0.1:{server.port}/")
+            send(transport, "CLEAR_DIAGNOSTICS")
+            send(transport, "DISABLE_SCHEDULE", "gate")
+            assert transport.status()["position"] == 100
+            assert transport.gate_ids() == ["gate"]
+            with pytest.raises(CliError, match="Unknown gate|unknown"):
+                send(transport, "OPEN", "side")
+        finally:
+            server.shutdown()
+            thread.join(5)
+            app.config.pop("GATE_BACKEND")
+        assert list(backend.pending_commands()) == [
+            "CLEAR_DIAGNOSTICS",
+            ("gate", "DISABLE_SCHEDULE"),
+        ]
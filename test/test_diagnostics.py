@@ -0,0 +1,214 @@
+"""
+Tests for the structured diagnostics ring buffer.
+"""
+
+import importlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from chicken_gate.gate import main
+from chicken_gate.gate.diagnostics import DiagnosticLog, format_message
+from chicken_gate.gate.embedded import EmbeddedBackend
+from chicken_gate.gate.gate import Gate
+from chicken_gate.shared.writer import BackgroundWriter
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+
+
+class TestDiagnosticLog:
+    """Ring buffer, generation and lazy formatting"""
+
+    def test_keeps_last_records_oldest_first(self):
+        log = DiagnosticLog(capacity=3)
+        for i in range(5):
+            log.append("position_reset", (i,))
+        assert len(log) == 3
+        assert [params for _, _, params in log.records()] == [(2,), (3,), (4,)]
+        assert [m.split(": ", 1)[1] for m in log.messages()] == [
+            "position reset to 2",
+            "position reset to 3",
+            "position reset to 4",
+        ]
+
+    def test_generation_changes_on_append_and_clear(self):
+        log = DiagnosticLog()
+        start = log.generation
+        log.append("close_received")
+        assert log.generation == start + 1
+        log.clear()
+        assert log.generation == start + 2
+        assert log.records() == []
+        assert log.messages() == []
+
+    def test_formats_once_per_generation(self):
+        log = DiagnosticLog()
+        log.append("error", ("switch fault",))
+        with patch(
+            "chicken_gate.gate.diagnostics.format_message", wraps=format_message
+        ) as fmt:
+            first = log.messages()
+            assert log.messages() is first
+            assert fmt.call_count == 1
+            log.append("open_received")
+            assert log.messages() is not first
+            assert fmt.call_count == 3
+        assert first[0].endswith(": ERROR: switch fault")
+
+    def test_append_does_not_format(self):
+        log = DiagnosticLog()
+        with patch("chicken_gate.gate.diagnostics.format_message") as fmt:
+            for _ in range(100):
+                log.append("entering_open")
+        fmt.assert_not_called()
+
+
+class TestGateDiagnostics:
+    """Gate status carries the generation"""
+
+    def test_status_generation(self):
+        gate = Gate(init_posn=0)
+        gate.reset_posn_to(0)  # idle: target is the position
+        status = gate.get_status(diagnostics=False)
+        assert "diagnostic_messages" not in status
+        generation = status["diagnostics_generation"]
+
+        gate.tick()
+        assert gate.get_status(diagnostics=False) == status
+
+        gate.close()
+        assert gate.get_diagnostics_generation() == generation + 1
+        messages = gate.get_status()["diagnostic_messages"]
+        assert messages[-1].endswith("gate close command received")
+        assert gate.get_status()["diagnostic_messages"] is messages
+
+    def test_records_are_structured(self):
+        gate = Gate(init_posn=0)
+        gate.reset_posn_to(50)
+        _, code, params = gate.get_diagnostic_records()[-1]
+        assert (code, params) == ("position_reset", (50,))
+
+    def test_clear(self):
+        gate = Gate()
+        gate.close()
+        gate.clear_diagnostic_messages()
+        assert gate.get_diagnostic_messages() == []
+
+
+class TestStatusApi:
+    """/api/status leaves out diagnostics the client already has"""
+
+    def test_diagnostics_since(self):
+        from chicken_gate.web.app import app
+
+        gate = Gate()
+        gate.close()
+        backend = EmbeddedBackend()
+        backend.snapshot.publish(gate.get_status())
+        generation = gate.get_diagnostics_generation()
+        app.config["GATE_BACKEND"] = backend
+        try:
+            client = app.test_client()
+            status = client.get("/api/status").get_json()
+            assert status["diagnostics_generation"] == generation
+            assert status["diagnostic_messages"]
+
+            since = f"/api/status?diagnostics_since={generation}"
+            assert "diagnostic_messages" not in client.get(since).get_json()
+
+            gate.open()
+            backend.snapshot.publish(gate.get_status())
+            status = client.get(since).get_json()
+            assert status["diagnostic_messages"][-1].endswith("open command received")
+        finally:
+            app.config.pop("GATE_BACKEND")
+
+
+class TestStatusFile:
+    """Two-process mode: the messages are written only when they change"""
+
+    def test_diagnostics_file(self, tmp_path, monkeypatch):
+        status_file = tmp_path / "gate_status.json"
+        diagnostics_file = tmp_path / "gate_diagnostics.json"
+
+        def read(path):
+            try:
+                return json.loads(path.read_text())
+            except (OSError, ValueError):
+                return None
+
+        def wait_for(predicate, timeout=10.0):
+            end = time.monotonic() + timeout
+            while time.monotonic() < end:
+                if predicate():
+                    return True
+                time.sleep(0.05)
+            return False
+
+        env = dict(os.environ, PYTHONPATH=SRC, CHICKEN_GATE_CONFIG=os.devnull)
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "chicken_gate.gate.main", "--mock", "--low-memory"],
+            cwd=tmp_path,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            assert wait_for(lambda: read(status_file) and read(diagnostics_file))
+            first = read(status_file)
+            assert "diagnostic_messages" not in first
+            written = diagnostics_file.stat().st_mtime_ns
+            # heartbeats rewrite the status, not the unchanged messages
+            assert wait_for(
+                lambda: read(status_file)["last_updated"] != first["last_updated"]
+            )
+            assert diagnostics_file.stat().st_mtime_ns == written
+
+            (tmp_path / "gate_cmd.txt").write_text("STOP")
+            assert wait_for(
+                lambda: (
+                    read(diagnostics_file)["gate"]["generation"]
+                    != first["diagnostics_generation"]
+                )
+            )
+            assert read(diagnostics_file)["gate"]["messages"][-1].endswith(
+                "manual stop engaged"
+            )
+
+            web_app = importlib.import_module("chicken_gate.web.app")
+            monkeypatch.setattr(web_app, "STATUS_FILE", str(status_file))
+            monkeypatch.setattr(web_app, "DIAGNOSTICS_FILE", str(diagnostics_file))
+            status = web_app.app.test_client().get("/api/status").get_json()
+            assert status["diagnostic_messages"][-1].endswith("manual stop engaged")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    def test_written_on_the_writer_thread(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        writer = BackgroundWriter()
+        stalled = threading.Event()
+        writer.submit(stalled.wait, 5)  # a stalled SD card
+        statuses = {"gate": {"state": "open"}}
+        diagnostics = {"gate": {"generation": 1, "messages": ["one"]}}
+        start = time.monotonic()
+        main.write_gate_diagnostics(diagnostics, writer)
+        main.write_gate_status(statuses, "gate", writer)
+        assert time.monotonic() - start < 0.5
+        statuses["gate"]["state"] = "closing"  # serialized when submitted
+        assert not (tmp_path / "gate_status.json").exists()
+        stalled.set()
+        writer.stop()
+        assert json.loads((tmp_path / "gate_status.json").read_text()) == {
+            "state": "open"
+        }
+        assert json.loads((tmp_path / "gate_diagnostics.json").read_text()) == (
+            diagnostics
+        )
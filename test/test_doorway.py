@@ -0,0 +1,265 @@
+"""
+Tests for the doorway occupancy check, on synthetic frame sequences.
+"""
+
+import asyncio
+import functools
+import os
+import sys
+import time
+from unittest.mock import patch
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+import pytest
+
+from chicken_gate.gate.bank import load_gate_specs
+from chicken_gate.gate.doorway import DoorwayDetector, DoorwayGuard
+from chicken_gate.gate.gate import Gate
+from chicken_gate.gate.gate_cmd import Cmd
+from chicken_gate.gate.gate_drv_mock import Gate_drv
+from chicken_gate.gate.runtime import AsyncGate
+
+HEIGHT, WIDTH = 720, 1280
+# the doorway: the middle third, lower half of the picture
+ROI = (1 / 3, 0.5, 2 / 3, 1.0)
+
+
+@functools.lru_cache(maxsize=None)
+def scene():
+    """The coop: textured walls and a darker doorway"""
+    y, x = np.mgrid[0:HEIGHT, 0:WIDTH]
+    scene = 90 + 40 * np.sin(x / 37.0) * np.cos(y / 53.0)
+    scene[HEIGHT // 2 :, WIDTH // 3 : 2 * WIDTH // 3] = 50
+    return scene.astype(np.float32)
+
+
+def coop(seed=0, brightness=0):
+    """A BGR frame of the coop, with sensor noise"""
+    rng = np.random.default_rng(seed)
+    noise = rng.standard_normal(scene().shape, dtype=np.float32) * 3
+    scene_ = scene() + brightness + noise
+    gray = np.clip(scene_, 0, 255).astype(np.uint8)
+    return np.dstack([gray, gray, gray])
+
+
+def with_hen(frame, x, y=560, size=120):
+    """A bright hen-sized blob centred at (x, y)"""
+    frame = frame.copy()
+    frame[y - size // 2 : y + size // 2, x - size // 2 : x + size // 2] = 200
+    return frame
+
+
+def sequence(count=5, hen_at=None, brightness=0):
+    """Frames of the coop, a hen at hen_at(i) (x or None) in frame i"""
+    frames = []
+    for i in range(count):
+        frame = coop(seed=i, brightness=brightness)
+        x = hen_at(i) if hen_at else None
+        frames.append(with_hen(frame, x) if x is not None else frame)
+    return frames
+
+
+@pytest.fixture
+def detector():
+    return DoorwayDetector(roi=ROI)
+
+
+class TestDetector:
+    """Motion and presence in the doorway"""
+
+    def test_empty_doorway(self, detector):
+        result = detector.check(sequence())
+        assert not result.occupied
+        assert result.motion < 0.01
+        assert detector.background is not None  # learned from a clear check
+
+    def test_hen_walking_through(self, detector):
+        result = detector.check(sequence(hen_at=lambda i: 480 + 80 * i))
+        assert result.occupied and result.motion > 0.1
+
+    def test_hen_standing_still(self, detector):
+        detector.check(sequence())  # the empty doorway, learned
+        result = detector.check(sequence(hen_at=lambda i: 640))
+        assert result.occupied
+        assert result.motion < 0.02 and result.presence > 0.05
+
+    def test_motion_outside_the_doorway(self, detector):
+        detector.check(sequence())
+        # a hen on the perch at the top left
+        frames = [with_hen(f, 150 + 60 * i, y=150) for i, f in enumerate(sequence())]
+        assert not detector.check(frames).occupied
+
+    def test_dusk_is_not_a_hen(self, detector):
+        detector.check(sequence())
+        assert not detector.check(sequence(brightness=-40)).occupied
+
+    def test_grayscale_frames_and_grid(self, detector):
+        grid = detector.downsample(coop()[:, :, 0])
+        assert grid.shape == (36, 64) and grid.dtype == np.float32
+        assert np.allclose(grid, detector.downsample(coop()), atol=0.01)
+        with pytest.raises(ValueError):
+            detector.check(sequence(count=1))
+
+    def test_settings_checked(self):
+        with pytest.raises(ValueError):
+            DoorwayDetector(roi=(0.5, 0, 0.4, 1))
+        with pytest.raises(ValueError):
+            DoorwayDetector(grid=(1, 64))
+
+    def test_cost(self, detector):
+        """The analysis of five 720p frames is a few ms of NumPy"""
+        frames = sequence(hen_at=lambda i: 480 + 80 * i)
+        detector.check(frames)
+        start = time.perf_counter()
+        for _ in range(10):
+            detector.check(frames)
+        assert (time.perf_counter() - start) / 10 < 0.05
+
+
+class Camera:
+    """grab() for the guard: frame sequences in turn"""
+
+    def __init__(self, *sequences):
+        self.sequences = list(sequences)
+        self.grabs = 0
+
+    def grab(self, count, interval):
+        self.grabs += 1
+        frames = self.sequences.pop(0) if len(self.sequences) > 1 else self.sequences[0]
+        if isinstance(frames, Exception):
+            raise frames
+        return frames[:count]
+
+
+def ask(guard, gate_id="gate"):
+    """The guard's answer once its check has finished"""
+    for _ in range(500):
+        answer = guard(gate_id)
+        if answer != 0.5:
+            return answer
+        time.sleep(0.01)
+    raise AssertionError("check still running")
+
+
+class TestGuard:
+    """Holding and retrying the close"""
+
+    def make(self, *sequences, **settings):
+        camera = Camera(*sequences)
+        return DoorwayGuard(camera.grab, DoorwayDetector(roi=ROI), **settings), camera
+
+    def test_clear_doorway_closes(self):
+        guard, camera = self.make(sequence())
+        assert guard("gate") == 0.5  # holds while the frames come in
+        assert ask(guard) is True
+        assert camera.grabs == 1
+
+    def test_occupied_holds_then_closes(self):
+        walking = sequence(hen_at=lambda i: 480 + 80 * i)
+        guard, camera = self.make(walking, walking, sequence(), retry_delay=30)
+        assert ask(guard) == 30
+        assert ask(guard) == 30
+        assert ask(guard) is True
+        assert camera.grabs == 3
+
+    def test_retries_are_bounded(self):
+        walking = sequence(hen_at=lambda i: 480 + 80 * i)
+        guard, camera = self.make(walking, retry_delay=30, max_retries=2)
+        assert [ask(guard) for _ in range(3)] == [30, 30, True]
+        assert guard.last.occupied
+
+    def test_camera_failure_closes(self):
+        guard, _ = self.make(OSError("no frame from the camera"))
+        assert ask(guard) is True
+
+    def test_settings(self):
+        guard = DoorwayGuard.from_settings(
+            {"enabled": True, "roi": [0.2, 0.5, 0.8, 1], "max_retries": 3}
+        )
+        assert guard.max_retries == 3
+        assert guard.detector.window == (slice(18, 36), slice(12, 51))
+        assert DoorwayGuard.from_settings({"roi": [0, 0, 1, 1]}) is None
+        with pytest.raises(ValueError, match="unknown"):
+            DoorwayGuard.from_settings({"enabled": True, "region": [0, 0, 1, 1]})
+
+    def test_camera_per_gate(self):
+        walking = sequence(hen_at=lambda i: 480 + 80 * i)
+        front, side = Camera(walking), Camera(sequence())
+        guard = DoorwayGuard(
+            cameras={
+                "front": (front.grab, DoorwayDetector(roi=ROI)),
+                "side": (side.grab, DoorwayDetector(roi=ROI)),
+            },
+            retry_delay=30,
+        )
+        assert ask(guard, "front") == 30  # the hen is at the front door
+        assert ask(guard, "side") is True
+        assert ask(guard, "back") is True  # no camera: not checked
+        assert (front.grabs, side.grabs) == (1, 1)
+
+    def test_settings_per_gate(self):
+        specs = load_gate_specs(
+            {
+                "gates": [
+                    {"id": "front", "doorway_roi": [0.2, 0.5, 0.8, 1]},
+                    {"id": "side", "closed_switch_pin": 3, "relay_pins": [5, 6]},
+                ]
+            }
+        )
+        guard = DoorwayGuard.from_settings({"enabled": True}, specs)
+        assert guard.detector is None  # no camera for every gate
+        assert ask(guard, "side") is True
+        with patch("chicken_gate.gate.doorway.grab_frames") as grab:
+            grab.return_value = sequence()
+            assert ask(guard, "front") is True
+        assert grab.call_args.args[1:] == (5, 0.4)
+        with pytest.raises(ValueError, match="doorway_roi"):
+            DoorwayGuard.from_settings({"enabled": True}, specs[1:] * 2)
+
+
+class FakeSchedule:
+    """Closes once, now"""
+
+    def __init__(self):
+        self.cmd = Cmd.CLOSE
+
+    def next_deadline(self):
+        return time.time() + 3600
+
+    def get_gate_cmd(self, now):
+        cmd, self.cmd = self.cmd, None
+        return cmd
+
+
+class TestRuntime:
+    """AsyncGate holding a scheduled close for the check"""
+
+    def test_scheduled_close_is_held(self):
+        answers = [0.05, 0.05, True]
+        asked = []
+
+        def check(gate_id):
+            asked.append(gate_id)
+            return answers.pop(0)
+
+        drv = Gate_drv(Gate(init_posn=0, open_time=2, close_time=2))
+        runtime = AsyncGate(drv, FakeSchedule(), tick_interval=0.01)
+        runtime.set_close_check(check)
+
+        async def main():
+            task = asyncio.ensure_future(runtime.run())
+            try:
+                start = time.monotonic()
+                await runtime.wait_for_state("closing", timeout=5)
+                return time.monotonic() - start
+            finally:
+                runtime.shutdown()
+                await task
+
+        with patch("chicken_gate.gate.gate.send_email"):
+            held = asyncio.run(main())
+        assert asked == ["gate"] * 3
+        assert held >= 0.1
@@ -0,0 +1,159 @@
+"""
+Tests for single-process mode (web interface inside the gate process).
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from chicken_gate.gate.embedded import EmbeddedBackend, start_web
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get_json(port, path, timeout=5):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=timeout) as r:
+        return json.load(r)
+
+
+def post_command(port, command):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/api/command",
+        data=json.dumps({"command": command}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=5) as r:
+        return json.load(r)
+
+
+def wait_for(predicate, timeout=10.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        try:
+            if predicate():
+                return True
+        except OSError:
+            pass
+        time.sleep(0.05)
+    return False
+
+
+class TestEmbeddedBackend:
+    """Snapshot and command queue"""
+
+    def test_snapshot(self):
+        backend = EmbeddedBackend()
+        assert backend.get_status() is None
+        status = {"position": 50}
+        backend.snapshot.publish(status)
+        copy = backend.get_status()
+        assert copy == status
+        copy["web_memory"] = {}
+        assert "web_memory" not in backend.snapshot.get()
+
+    def test_commands_in_order_and_bounded(self):
+        backend = EmbeddedBackend(max_pending=2)
+        assert backend.send_command("OPEN")
+        assert backend.send_command("STOP")
+        assert not backend.send_command("CLOSE")
+        assert list(backend.pending_commands()) == ["OPEN", "STOP"]
+        assert list(backend.pending_commands()) == []
+
+    def test_web_app_uses_backend(self):
+        from chicken_gate.web.app import app
+
+        backend = EmbeddedBackend()
+        backend.snapshot.publish({"position": 42, "is_moving": True})
+        app.config["GATE_BACKEND"] = backend
+        try:
+            client = app.test_client()
+            assert client.get("/api/status").get_json()["position"] == 42
+            response = client.post("/api/command", json={"command": "close"})
+            assert response.get_json()["success"]
+            assert (
+                client.post("/api/command", json={"command": "BOGUS"}).status_code
+                == 400
+            )
+        finally:
+            app.config.pop("GATE_BACKEND")
+        assert list(backend.pending_commands()) == ["CLOSE"]
+
+
+class TestIsolation:
+    """A stalled HTTP client cannot hold up the gate loop"""
+
+    def test_slow_client_does_not_delay_ticks(self):
+        backend = EmbeddedBackend()
+        port = free_port()
+        start_web(backend, port)
+        assert wait_for(lambda: get_json(port, "/api/history") is not None)
+
+        # clients that send half a request and then stall
+        stalled = []
+        for _ in range(4):
+            sock = socket.create_connection(("127.0.0.1", port))
+            sock.sendall(b"GET /api/status HTTP/1.1\r\nHost: x\r\n")
+            stalled.append(sock)
+
+        try:
+            worst = 0.0
+            last = time.perf_counter()
+            for i in range(100):
+                backend.snapshot.publish({"position": i})
+                list(backend.pending_commands())
+                time.sleep(0.01)
+                now = time.perf_counter()
+                worst = max(worst, now - last)
+                last = now
+            assert worst < 0.1
+            assert get_json(port, "/api/status")["position"] == 99
+        finally:
+            for sock in stalled:
+                sock.close()
+
+
+class TestSingleProcessMode:
+    """chicken-gate-main --web end to end with the mock driver"""
+
+    def test_command_reaches_gate(self, tmp_path):
+        port = free_port()
+        env = dict(os.environ, PYTHONPATH=SRC, CHICKEN_GATE_CONFIG=os.devnull)
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "chicken_gate.gate.main", "--mock", "--web"]
+            + ["--port", str(port), "--low-memory"],
+            cwd=tmp_path,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            assert wait_for(lambda: "position" in get_json(port, "/api/status"))
+            assert post_command(port, "DISABLE_SCHEDULE")["success"]
+            assert post_command(port, "CLOSE")["success"]
+            assert wait_for(lambda: get_json(port, "/api/status")["is_closing"])
+            status = get_json(port, "/api/status")
+            assert status["schedule_enabled"] is False
+            assert "web" in status["memory"]["subsystems"]
+            # status goes through memory, not the file
+            assert not (tmp_path / "gate_status.json").exists()
+            # systemctl stop: a clean exit, the checkpoint written out
+            proc.terminate()
+            assert proc.wait(timeout=10) == 0
+            assert (tmp_path / "gate_state.wal").stat().st_size > 0
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
@@ -0,0 +1,212 @@
+"""
+Tests for relay duty cycle and energy accounting.
+"""
+
+import importlib
+import json
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.shared.energy import CounterStore, EnergyMeter
+from chicken_gate.shared.writer import BackgroundWriter
+
+
+class Clock:
+    """Monotonic and wall clocks moved by the test"""
+
+    def __init__(self, start=datetime(2026, 10, 19, 6, 59, 30)):
+        self.seconds = 0.0
+        self.start = start
+
+    def monotonic(self):
+        return self.seconds
+
+    def now(self):
+        return self.start + timedelta(seconds=self.seconds)
+
+
+def status(direction=None, gate_id="gate"):
+    return {
+        "gate_id": gate_id,
+        "is_opening": direction == "open",
+        "is_closing": direction == "close",
+    }
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def meter(tmp_path, clock):
+    return EnergyMeter(
+        str(tmp_path / "energy.json"),
+        voltage=12,
+        open_current=2,
+        close_current=3,
+        clock=clock.monotonic,
+        now=clock.now,
+    )
+
+
+def run(meter, clock, steps):
+    """
+    Publish (seconds later, direction) steps, and the status every second
+    in between as the runtime's heartbeat does
+    """
+    current = None
+    for seconds, direction in steps:
+        for _ in range(int(seconds)):
+            clock.seconds += 1
+            meter.publish(status(current))
+        meter.publish(status(direction))
+        current = direction
+
+
+class TestEnergyMeter:
+    """Counting from published statuses"""
+
+    def test_travels(self, meter, clock):
+        run(meter, clock, [(0, "open"), (60, None), (100, "close"), (90, None)])
+        total = meter.store.total("gate")
+        assert total["open_seconds"] == 60 and total["close_seconds"] == 90
+        assert (total["open_starts"], total["close_starts"]) == (1, 1)
+        assert total["reversals"] == 0
+        assert total["amp_hours"] == pytest.approx((60 * 2 + 90 * 3) / 3600, abs=1e-6)
+        assert total["watt_hours"] == pytest.approx(
+            12 * (60 * 2 + 90 * 3) / 3600, abs=1e-6
+        )
+
+    def test_reversal(self, meter, clock):
+        run(meter, clock, [(0, "open"), (10, "close"), (20, None)])
+        total = meter.store.total("gate")
+        assert total["reversals"] == 1
+        assert (total["open_starts"], total["close_starts"]) == (1, 1)
+        assert (total["open_seconds"], total["close_seconds"]) == (10, 20)
+
+    def test_hour_boundary_splits(self, meter, clock):
+        # 06:59:30 plus 60 s of closing: 30 s in each hour
+        run(meter, clock, [(0, "close"), (60, None)])
+        rows = dict(meter.store.rows("hourly", "gate"))
+        assert rows["2026-10-19T06"]["close_seconds"] == 30
+        assert rows["2026-10-19T07"]["close_seconds"] == 30
+        assert meter.store.rows("daily", "gate")[0][0] == "2026-10-19"
+        assert meter.store.rows("monthly", "gate")[0][1]["close_seconds"] == 60
+
+    def test_gates_are_separate(self, meter, clock):
+        meter.publish(status("open", "side"))
+        clock.seconds += 5
+        meter.publish(status(None, "side"))
+        meter.publish(status(None, "gate"))
+        assert meter.store.total("side")["open_seconds"] == 5
+        assert meter.store.total("gate")["open_seconds"] == 0
+
+    def test_summary(self, meter, clock):
+        run(meter, clock, [(0, "close"), (864, None)])
+        summary = meter.summary("gate")
+        assert summary["today"]["close_seconds"] == 864
+        assert summary["month"]["close_starts"] == 1
+        assert summary["duty_cycle_24h"] == pytest.approx(1.0)
+        clock.seconds += 2 * 86400
+        assert meter.summary("gate")["duty_cycle_24h"] == 0
+        assert meter.summary("gate")["today"]["close_seconds"] == 0
+
+
+class TestPersistence:
+    """The counter store file"""
+
+    def test_saved_on_stop_and_reloaded(self, tmp_path, meter, clock):
+        run(meter, clock, [(0, "open"), (30, None)])
+        assert meter.saves == 1
+        idle_saves = meter.saves
+        run(meter, clock, [(100, None)])
+        assert meter.saves == idle_saves  # nothing written while idle
+        again = EnergyMeter(str(tmp_path / "energy.json"), clock=clock.monotonic)
+        assert again.store.total("gate")["open_seconds"] == 30
+
+    def test_saved_during_long_travels(self, meter, clock):
+        meter.save_interval = 10
+        run(meter, clock, [(0, "close"), (35, "close")])
+        assert meter.saves == 3
+
+    def test_saved_on_the_writer_thread(self, tmp_path, clock):
+        path = tmp_path / "energy.json"
+        writer = BackgroundWriter()
+        gate = threading.Event()
+        writer.submit(gate.wait, 5)  # a stalled SD card
+        meter = EnergyMeter(str(path), clock=clock.monotonic, writer=writer)
+        run(meter, clock, [(0, "open"), (30, None)])
+        assert meter.saves == 1 and not path.exists()
+        gate.set()
+        writer.stop()
+        again = EnergyMeter(str(path), clock=clock.monotonic)
+        assert again.store.total("gate")["open_seconds"] == 30
+
+    def test_retention(self):
+        store = CounterStore()
+        start = datetime(2026, 1, 1)
+        for hour in range(24 * 100):
+            store.add("gate", start + timedelta(hours=hour), 0, 1.0)
+        assert len(store.rollups["hourly"]) == 48
+        assert len(store.rollups["daily"]) == 62
+        assert store.rows("daily", "gate")[-1][0] == "2026-04-10"
+        assert store.total("gate")["open_seconds"] == 2400
+        assert len(json.dumps(store.to_dict())) < 16000
+
+    def test_damaged_file_is_set_aside(self, tmp_path, clock):
+        path = tmp_path / "energy.json"
+        path.write_text('{"version": 1, "fields": ["x"]}')
+        meter = EnergyMeter(str(path), clock=clock.monotonic)
+        assert meter.store.total("gate")["open_seconds"] == 0
+        assert (tmp_path / "energy.json.bad").exists()
+
+    def test_settings(self, tmp_path):
+        path = str(tmp_path / "energy.json")
+        meter = EnergyMeter.from_settings(
+            {"voltage": 24, "close_current": 4}, path=path
+        )
+        assert meter.voltage == 24 and meter.current == {"open": 2.0, "close": 4}
+        with pytest.raises(ValueError, match="unknown"):
+            EnergyMeter.from_settings({"volts": 24}, path=path)
+        with pytest.raises(ValueError):
+            EnergyMeter.from_settings({"voltage": 0}, path=path)
+
+
+class TestApi:
+    """/api/energy"""
+
+    @pytest.fixture
+    def client(self, tmp_path, monkeypatch, meter, clock):
+        from chicken_gate.gate.embedded import EmbeddedBackend
+
+        web_app = importlib.import_module("chicken_gate.web.app")
+
+        run(meter, clock, [(0, "close"), (60, None)])
+        monkeypatch.setattr(web_app, "ENERGY_FILE", meter.path)
+        backend = EmbeddedBackend()
+        backend.snapshot.publish({"gate_id": "gate", "position": 100})
+        monkeypatch.setitem(web_app.app.config, "GATE_BACKEND", backend)
+        return web_app.app.test_client()
+
+    def test_rollups(self, client):
+        data = client.get("/api/energy?period=hourly").get_json()
+        assert data["gate_id"] == "gate"
+        assert [row["period"] for row in data["rows"]] == [
+            "2026-10-19T06",
+            "2026-10-19T07",
+        ]
+        assert data["total"]["close_seconds"] == 60
+        daily = client.get("/api/energy").get_json()
+        assert daily["rows"][0]["close_starts"] == 1
+
+    def test_errors(self, client):
+        assert client.get("/api/energy?period=weekly").status_code == 400
+        assert client.get("/api/energy?gate=side").status_code == 404
@@ -0,0 +1,185 @@
+"""
+Tests for the streaming history export.
+"""
+
+import csv
+import gzip
+import importlib
+import io
+import json
+import os
+import sys
+import zlib
+from datetime import datetime, timezone
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.gate import cli
+from chicken_gate.shared import export
+from chicken_gate.shared.export import (
+    COLUMNS,
+    ExportError,
+    export_stream,
+    gzip_chunks,
+    last_cursor,
+    parquet_available,
+)
+from chicken_gate.shared.history import HistoryStore
+
+# 2026-10-19 00:00:00 UTC
+MIDNIGHT = datetime(2026, 10, 19, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / "history"))
+    for minute in range(0, 3 * 1440, 10):  # three days of samples and events
+        t = MIDNIGHT + minute * 60
+        store.append(
+            {
+                "t": t,
+                "gate_id": "gate",
+                "kind": "sample",
+                "position": minute % 100,
+                "target_position": 100,
+                "state": "closing",
+                "errors": 0,
+            }
+        )
+        if minute % 720 == 0:
+            record = {"t": t, "gate_id": "gate", "kind": "event", "code": "closed"}
+            store.append(dict(record, message='gate closed, "on time"'))
+    store.close()
+    return store
+
+
+def ndjson(chunks):
+    return [json.loads(line) for line in b"".join(chunks).splitlines()]
+
+
+class TestFormats:
+    """NDJSON, CSV and Parquet chunks"""
+
+    def test_ndjson(self, store):
+        rows = ndjson(export_stream(store, "ndjson", kind="event"))
+        assert len(rows) == 6
+        assert rows[0]["message"] == 'gate closed, "on time"'
+        assert all("cursor" in row for row in rows)
+
+    def test_csv(self, store):
+        text = b"".join(export_stream(store, "csv", gate_id="gate")).decode()
+        rows = list(csv.DictReader(io.StringIO(text)))
+        assert list(rows[0]) == list(COLUMNS)
+        assert len(rows) == 3 * 144 + 6
+        assert rows[0]["time"] == "2026-10-19T00:00:00.000+00:00"
+        assert rows[1]["message"] == 'gate closed, "on time"'
+
+    def test_chunks_are_bounded(self, store, monkeypatch):
+        monkeypatch.setattr(export, "CHUNK_SIZE", 1024)
+        for fmt in ("ndjson", "csv"):
+            chunks = list(export_stream(store, fmt))
+            assert len(chunks) > 10
+            assert max(map(len, chunks)) < 1024 + 300  # one line over at most
+
+    def test_range_limit_and_cursor(self, store):
+        start = MIDNIGHT + 86400
+        rows = ndjson(export_stream(store, start=start, end=start + 3600, limit=3))
+        assert [row["t"] for row in rows] == [start, start, start + 600]
+        after = ndjson(export_stream(store, cursor=rows[-1]["cursor"], limit=1))
+        assert after[0]["t"] == start + 1200
+
+    def test_arguments_checked_up_front(self, store):
+        with pytest.raises(ValueError):
+            export_stream(store, cursor="nowhere")
+        with pytest.raises(ValueError):
+            export_stream(store, kind="command")
+        with pytest.raises(ExportError):
+            export_stream(store, "xml")
+
+    def test_gzip_stream_decompresses_as_it_goes(self, store):
+        chunks = list(gzip_chunks(export_stream(store, "ndjson")))
+        whole = gzip.decompress(b"".join(chunks))
+        assert whole == b"".join(export_stream(store, "ndjson"))
+        # a download cut short still yields whole lines up to its last chunk
+        partial = zlib.decompressobj(31).decompress(b"".join(chunks[:-1]))
+        assert partial.endswith(b"\n") and len(partial) == len(whole)
+
+    @pytest.mark.skipif(not parquet_available(), reason="pyarrow not installed")
+    def test_parquet(self, store, monkeypatch):
+        import pyarrow.parquet as pq
+
+        data = b"".join(export.parquet_chunks(store.scan(), row_group_size=100))
+        table = pq.read_table(io.BytesIO(data))
+        assert table.num_rows == 3 * 144 + 6
+        assert table.column_names == list(COLUMNS)
+        assert pq.ParquetFile(io.BytesIO(data)).num_row_groups == 5
+
+    def test_parquet_needs_pyarrow(self, store, monkeypatch):
+        monkeypatch.setattr(export, "parquet_available", lambda: False)
+        with pytest.raises(ExportError, match="pyarrow"):
+            export_stream(store, "parquet")
+
+
+class TestResume:
+    """Picking an interrupted export up from its last row"""
+
+    @pytest.mark.parametrize("fmt", ["ndjson", "csv"])
+    def test_resume_after_a_torn_line(self, store, tmp_path, fmt):
+        full = b"".join(export_stream(store, fmt))
+        path = tmp_path / f"export.{fmt}"
+        path.write_bytes(full[: len(full) // 2])  # cut mid-line
+        transport = cli.FileTransport(str(tmp_path))
+        try:
+            cli.export(transport, {"format": fmt}, str(path), resume=True)
+        finally:
+            transport.close()
+        assert path.read_bytes() == full
+
+    def test_last_cursor(self, tmp_path):
+        path = tmp_path / "export.csv"
+        path.write_text(",".join(COLUMNS) + "\n")
+        assert last_cursor(str(path), "csv") is None
+        with pytest.raises(ExportError):
+            last_cursor(str(path), "parquet")
+
+
+class TestApi:
+    """/api/export and /api/history"""
+
+    @pytest.fixture
+    def client(self, store, monkeypatch):
+        web_app = importlib.import_module("chicken_gate.web.app")
+        monkeypatch.setattr(web_app, "HISTORY_DIR", store.directory)
+        return web_app.app.test_client()
+
+    def test_export_streams(self, client):
+        response = client.get("/api/export?from=2026-10-20T00:00:00Z&kind=event")
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        assert "chicken-gate-history.ndjson" in response.headers["Content-Disposition"]
+        assert response.is_streamed
+        assert len(ndjson([response.data])) == 4
+
+    def test_export_gzip(self, client):
+        response = client.get(
+            "/api/export?format=csv&limit=5", headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["Content-Type"] == "text/csv; charset=utf-8"
+        assert len(gzip.decompress(response.data).splitlines()) == 6
+
+    def test_export_errors(self, client, monkeypatch):
+        assert client.get("/api/export?from=yesterday").status_code == 400
+        assert client.get("/api/export?cursor=x").status_code == 400
+        assert client.get("/api/export?format=xml").status_code == 400
+        assert client.get("/api/export?limit=many").status_code == 400
+        monkeypatch.setattr(export, "parquet_available", lambda: False)
+        assert client.get("/api/export?format=parquet").status_code == 501
+
+    def test_history(self, client):
+        history = client.get("/api/history?limit=2").get_json()["history"]
+        assert [event["code"] for event in history] == ["closed", "closed"]
+        assert history[-1]["t"] == MIDNIGHT + 2 * 86400 + 43200
@@ -0,0 +1,390 @@
+"""
+Tests for the fleet aggregator, against local stand-in chicken-gate-web nodes.
+"""
+
+import asyncio
+import gzip
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+from flask import Flask, Response, jsonify
+from werkzeug.serving import make_server
+
+from chicken_gate.fleet import ConnectionPool, FetchError, FleetAggregator, Node
+from chicken_gate.fleet.aggregator import gate_state, parse_nodes
+
+
+class StandIn:
+    """
+    A Flask server standing in for many nodes: node <name> is served under
+    /<name>, behaving as set in `modes` - "ok", "error" (500), "slow"
+    (answers after 1 s), "legacy" (no /api/gates), "frozen" (last_updated
+    never moves) or "faulty" (a gate with errors and opening disabled).
+    """
+
+    def __init__(self):
+        self.modes = {}
+        self.hits = Counter()
+        app = Flask("stand-in")
+
+        def gate(name, mode):
+            updated = "2026-01-01T00:00:00" if mode == "frozen" else None
+            return {
+                "id": "gate",
+                "position": 100,
+                "target_position": 100,
+                "is_opening": False,
+                "is_closing": False,
+                "open_disabled": mode == "faulty",
+                "schedule_enabled": True,
+                "errors": ["gate finished closing but switch not pressed"]
+                if mode == "faulty"
+                else [],
+                "last_updated": updated or datetime.now().isoformat(),
+            }
+
+        @app.route("/<name>/api/gates")
+        def gates(name):
+            self.hits[name] += 1
+            mode = self.modes.get(name, "ok")
+            if mode == "error":
+                return jsonify({"message": "boom"}), 500
+            if mode == "slow":
+                time.sleep(1.0)
+            if mode == "legacy":
+                return jsonify({"message": "not found"}), 404
+            return jsonify({"gates": [gate(name, mode)]})
+
+        @app.route("/<name>/api/status")
+        def status(name):
+            self.hits[name + "/status"] += 1
+            status = gate(name, "ok")
+            del status["id"]
+            status["position"] = 0
+            return jsonify(status)
+
+        @app.route("/chunked")
+        def chunked():
+            return Response((part for part in (b'{"a": ', b"1}")), mimetype="json")
+
+        @app.route("/gzipped")
+        def gzipped():
+            return Response(
+                gzip.compress(b'{"a": 2}'),
+                headers={"Content-Encoding": "gzip"},
+                mimetype="application/json",
+            )
+
+        self.server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.url = f"http://127.0.0.1:{self.server.port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def node(self, name, mode="ok"):
+        self.modes[name] = mode
+        return Node(name, f"{self.url}/{name}")
+
+    def stop(self):
+        self.server.shutdown()
+
+
+@pytest.fixture
+def stand_in():
+    server = StandIn()
+    yield server
+    server.stop()
+
+
+def poll(fleet, times=1):
+    async def main():
+        for _ in range(times):
+            snapshot = await fleet.poll()
+        await fleet.pool.close()
+        return snapshot
+
+    return asyncio.run(main())
+
+
+async def keep_alive_server(close_after=None):
+    """
+    Raw HTTP/1.1 server that keeps connections open (the Flask development
+    server closes each one), optionally dropping them silently after
+    `close_after` responses. Returns (server, URL).
+    """
+
+    async def handle(reader, writer):
+        served = 0
+        while True:
+            request = await reader.readuntil(b"\r\n\r\n")
+            if not request:
+                break
+            body = b'{"gates": []}'
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                b"Content-Length: %d\r\n\r\n%s" % (len(body), body)
+            )
+            await writer.drain()
+            served += 1
+            if served == close_after:
+                break
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}/api/gates"
+
+
+class TestConnectionPool:
+    """Keep-alive GETs"""
+
+    def test_connections_are_reused(self):
+        async def main():
+            server, url = await keep_alive_server()
+            pool = ConnectionPool()
+            for _ in range(10):
+                assert await pool.get_json(url) == {"gates": []}
+            await pool.close()
+            server.close()
+            return pool.stats()
+
+        stats = asyncio.run(main())
+        assert stats["requests"] == 10
+        assert stats["connections_opened"] == 1
+        assert stats["reused"] == 9
+
+    def test_connection_closed_by_server(self, stand_in):
+        async def main():
+            pool = ConnectionPool()
+            for _ in range(3):
+                await pool.get_json(stand_in.url + "/a/api/gates")
+            await pool.close()
+            return pool.stats()
+
+        # "Connection: close" on every response: nothing kept
+        stats = asyncio.run(main())
+        assert (stats["connections_opened"], stats["idle"]) == (3, 0)
+
+    def test_dropped_keep_alive_connection(self):
+        async def main():
+            server, url = await keep_alive_server(close_after=1)
+            pool = ConnectionPool()
+            results = []
+            for _ in range(3):
+                results.append(await pool.get_json(url))
+            await pool.close()
+            server.close()
+            return results, pool.stats()
+
+        results, stats = asyncio.run(main())
+        assert results == [{"gates": []}] * 3
+        assert stats["connections_opened"] == 3
+
+    def test_chunked_and_gzipped(self, stand_in):
+        async def main():
+            pool = ConnectionPool()
+            chunked = await pool.get_json(stand_in.url + "/chunked")
+            gzipped = await pool.get_json(stand_in.url + "/gzipped")
+            await pool.close()
+            return chunked, gzipped
+
+        assert asyncio.run(main()) == ({"a": 1}, {"a": 2})
+
+    def test_errors(self, stand_in):
+        stand_in.modes.update(slow="slow", bad="error")
+
+        async def main():
+            pool = ConnectionPool()
+            errors = []
+            for url, timeout in (
+                (stand_in.url + "/slow/api/gates", 0.2),
+                (stand_in.url + "/bad/api/gates", 2),
+                ("http://127.0.0.1:1/api/gates", 2),
+            ):
+                with pytest.raises(FetchError) as raised:
+                    await pool.get_json(url, timeout)
+                errors.append(raised.value)
+            await pool.close()
+            return errors
+
+        timeout, http, refused = asyncio.run(main())
+        assert "timed out" in str(timeout)
+        assert http.status == 500
+        assert refused.status is None
+
+    def test_bad_url(self):
+        with pytest.raises(ValueError):
+            asyncio.run(ConnectionPool().get("ftp://example.com/"))
+
+
+class TestAggregator:
+    """Merging, backoff and staleness"""
+
+    def test_fleet_view(self, stand_in):
+        nodes = [
+            stand_in.node("coop1"),
+            stand_in.node("coop2", "faulty"),
+            stand_in.node("coop3", "error"),
+            stand_in.node("coop4", "slow"),
+        ]
+        fleet = FleetAggregator(nodes, interval=5, timeout=0.3)
+        snapshot = poll(fleet)
+
+        states = {node["name"]: node["state"] for node in snapshot["nodes"]}
+        assert states == {
+            "coop1": "online",
+            "coop2": "online",
+            "coop3": "offline",
+            "coop4": "offline",
+        }
+        assert snapshot["summary"]["gates"] == {"closed": 2}
+        assert snapshot["summary"]["alerts"] == {
+            "gate_error": 1,
+            "open_disabled": 1,
+            "node_offline": 2,
+        }
+        coop3 = fleet.node("coop3")
+        assert coop3["failures"] == 1
+        assert "HTTP 500" in coop3["last_error"]
+        assert fleet.node("coop1")["gates"][0]["state"] == "closed"
+
+    def test_failing_node_backs_off(self, stand_in):
+        fleet = FleetAggregator(
+            [stand_in.node("up"), stand_in.node("down", "error")],
+            interval=1,
+            backoff_max=4,
+        )
+        poll(fleet, times=12)
+        assert stand_in.hits["up"] == 12
+        # polls 0, 1, 3, 7, then every 4th: 11
+        assert stand_in.hits["down"] == 5
+
+    def test_recovers(self, stand_in):
+        node = stand_in.node("coop", "error")
+        fleet = FleetAggregator([node], interval=1)
+        poll(fleet)
+        assert fleet.node("coop")["state"] == "offline"
+        stand_in.modes["coop"] = "ok"
+        snapshot = poll(fleet)
+        assert fleet.node("coop")["state"] == "online"
+        assert snapshot["alerts"] == []
+
+    def test_legacy_node(self, stand_in):
+        fleet = FleetAggregator([stand_in.node("old", "legacy")], interval=1)
+        poll(fleet, times=2)
+        gate = fleet.node("old")["gates"][0]
+        assert (gate["id"], gate["state"]) == ("gate", "open")
+        # /api/gates is only tried once
+        assert stand_in.hits["old"] == 1
+        assert stand_in.hits["old/status"] == 2
+
+    def test_staleness(self, stand_in):
+        now = [0.0]
+        fleet = FleetAggregator(
+            [stand_in.node("live"), stand_in.node("frozen", "frozen")],
+            interval=10,
+            stale_after=30,
+            offline_after=100,
+            clock=lambda: now[0],
+        )
+        poll(fleet)
+        assert fleet.node("frozen")["state"] == "online"
+        now[0] = 40.0
+        poll(fleet)
+        # web server answers, gate process stopped updating
+        assert fleet.node("frozen")["state"] == "stale"
+        assert fleet.node("live")["state"] == "online"
+
+        stand_in.modes["live"] = "error"
+        now[0] = 75.0
+        poll(fleet)
+        assert fleet.node("live")["state"] == "stale"
+        now[0] = 145.0
+        poll(fleet)
+        assert fleet.node("live")["state"] == "offline"
+
+    def test_hundreds_of_nodes_in_one_interval(self):
+        servers = [StandIn() for _ in range(4)]
+        try:
+            nodes = [servers[i % len(servers)].node(f"coop{i}") for i in range(400)]
+            fleet = FleetAggregator(nodes, interval=2, concurrency=64)
+            poll(fleet, times=2)
+        finally:
+            for server in servers:
+                server.stop()
+        snapshot = fleet.snapshot()
+        assert snapshot["summary"]["states"]["online"] == 400
+        assert fleet.last_poll_duration < fleet.interval
+
+
+class TestFleetApi:
+    """/api/fleet routes"""
+
+    @pytest.fixture
+    def client(self, stand_in):
+        from chicken_gate.fleet.app import app
+
+        fleet = FleetAggregator(
+            [stand_in.node("coop1"), stand_in.node("coop2", "error")], interval=5
+        )
+        poll(fleet)
+        app.config["FLEET_AGGREGATOR"] = fleet
+        try:
+            yield app.test_client()
+        finally:
+            app.config.pop("FLEET_AGGREGATOR")
+
+    def test_fleet(self, client):
+        fleet = client.get("/api/fleet").get_json()
+        assert fleet["summary"]["nodes"] == 2
+        assert fleet["summary"]["states"]["offline"] == 1
+        offline = client.get("/api/fleet?state=offline").get_json()["nodes"]
+        assert [node["name"] for node in offline] == ["coop2"]
+        assert client.get("/api/fleet?state=sleepy").status_code == 400
+
+    def test_node(self, client):
+        assert client.get("/api/fleet/nodes/coop1").get_json()["state"] == "online"
+        assert client.get("/api/fleet/nodes/coop9").status_code == 404
+
+    def test_alerts(self, client):
+        alerts = client.get("/api/fleet/alerts").get_json()
+        assert alerts["by_kind"] == {"node_offline": 1}
+        assert alerts["alerts"][0]["node"] == "coop2"
+
+
+class TestNodes:
+    """Node settings"""
+
+    def test_parse(self):
+        nodes = parse_nodes(
+            ["http://coop1:5000/", {"url": "http://10.0.0.7", "name": "barn"}]
+        )
+        assert nodes == [
+            Node("coop1:5000", "http://coop1:5000"),
+            Node("barn", "http://10.0.0.7"),
+        ]
+
+    @pytest.mark.parametrize(
+        "entries",
+        [
+            ["coop1:5000"],
+            [{"url": "http://a", "port": 1}],
+            ["http://a", {"url": "http://b", "name": "a"}],
+        ],
+    )
+    def test_invalid(self, entries):
+        with pytest.raises(ValueError):
+            parse_nodes(entries)
+
+    def test_gate_state(self):
+        assert gate_state({"position": 0}) == "open"
+        assert gate_state({"position": 100}) == "closed"
+        assert gate_state({"position": 40}) == "partial"
+        assert gate_state({"position": 40, "is_closing": True}) == "closing"
@@ -0,0 +1,139 @@
+"""
+Cross-check of the vectorized FleetSim against the scalar Gate state machine.
+"""
+
+import os
+import random
+import sys
+from unittest.mock import patch
+
+import pytest
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+np = pytest.importorskip("numpy")
+
+from chicken_gate.gate.fleet_sim import FleetSim  # noqa: E402
+from chicken_gate.gate.gate import Gate  # noqa: E402
+from chicken_gate.gate.gate_cmd import Cmd  # noqa: E402
+
+
+def assert_same_state(sim, gates):
+    """Every gate in the fleet must match its scalar twin exactly"""
+    for i, gate in enumerate(gates):
+        assert sim.posn[i] == gate.get_posn(), f"gate {i} position"
+        assert sim.motion_cmd[i] == gate.get_cmd().value, f"gate {i} command"
+        status = gate.get_status()
+        assert sim.posn_cmd[i] == status["target_position"], f"gate {i} target"
+        assert sim.open_disabled[i] == status["open_disabled"], f"gate {i} disabled"
+        assert sorted(sim.error_messages(i)) == sorted(gate.get_errors())
+
+
+class TestFleetSimEquivalence:
+    """FleetSim must reproduce Gate.tick() transitions bit for bit"""
+
+    def test_random_commands_and_switches(self):
+        """Random command and switch sequences give identical transitions"""
+        rng = random.Random(1234)
+        n = 40
+        open_times = [rng.uniform(5, 30) for _ in range(n)]
+        close_times = [rng.uniform(5, 30) for _ in range(n)]
+        init = [rng.choice([0, 100, rng.uniform(0, 100)]) for _ in range(n)]
+
+        with patch("chicken_gate.gate.gate.send_email") as mock_email:
+            gates = [
+                Gate(
+                    init_posn=init[i],
+                    open_time=open_times[i],
+                    close_time=close_times[i],
+                )
+                for i in range(n)
+            ]
+            sim = FleetSim(
+                n, init_posn=init, open_time=open_times, close_time=close_times
+            )
+
+            for _ in range(3000):
+                for i, gate in enumerate(gates):
+                    action = rng.random()
+                    if action < 0.01:
+                        gate.open()
+                        sim.open(np.arange(n) == i)
+                    elif action < 0.02:
+                        gate.close()
+                        sim.close(np.arange(n) == i)
+                    elif action < 0.023:
+                        gate.stop()
+                        sim.stop(np.arange(n) == i)
+                    elif action < 0.025:
+                        gate.clear_errors()
+                        sim.clear_errors(np.arange(n) == i)
+                    elif action < 0.026:
+                        posn = rng.uniform(-10, 110)
+                        gate.reset_posn_to(posn)
+                        sim.reset_posn_to(posn, np.arange(n) == i)
+                    elif action < 0.04:
+                        pressed = rng.random() < 0.5
+                        gate.set_closed_switch(pressed)
+                        sim.set_closed_switch(pressed, np.arange(n) == i)
+                    elif action < 0.042:
+                        pressed = rng.random() < 0.2
+                        gate.set_open_switch(pressed)
+                        sim.set_open_switch(pressed, np.arange(n) == i)
+
+                elapsed = rng.choice([0.1, 0.1, 0.5, 1.0])
+                for gate in gates:
+                    gate.tick(elapsed_time=elapsed)
+                sim.tick(elapsed_time=elapsed)
+
+                assert_same_state(sim, gates)
+
+            assert int(sim.alert_count.sum()) == mock_email.call_count
+
+    def test_schedule_day_matches_scalar_gates(self):
+        """A simulated day matches scalar gates ticked at the same instants"""
+        n = 6
+        open_s = np.array([21600, 21660, 21600, 22000, 25000, 21600], dtype=float)
+        close_s = np.array([70000, 70060, 71000, 70000, 72000, 69000], dtype=float)
+
+        with patch("chicken_gate.gate.gate.send_email"):
+            sim = FleetSim(n, open_time=60, close_time=80)
+            sim.run_days(open_s, close_s, days=1, elapsed_time=1.0)
+
+            gates = [Gate(open_time=60, close_time=80) for _ in range(n)]
+            for t in range(86400):
+                for i, gate in enumerate(gates):
+                    if t == close_s[i]:
+                        gate.close()
+                    if t == open_s[i]:
+                        gate.open()
+                    gate.set_closed_switch(gate.get_posn() >= 95)
+                    gate.tick(elapsed_time=1.0)
+
+        assert_same_state(sim, gates)
+        assert all(gate.get_cmd() == Cmd.STOP for gate in gates)
+        assert np.all(sim.posn == 100)
+
+
+class TestFleetSimScheduling:
+    """Idle-skipping schedule runs"""
+
+    def test_idle_ticks_are_skipped(self):
+        """Only gates that are moving are ticked"""
+        sim = FleetSim(100, open_time=60, close_time=60)
+        gate_ticks = sim.run_days(21600, 72000, days=2, elapsed_time=1.0)
+
+        # two opens and two closes of ~60 s each, far below 2 * 86400 per gate
+        assert 100 * 200 < gate_ticks < 100 * 300
+        assert np.all(sim.errors == 0)
+
+    def test_open_disabled_gates_do_not_keep_fleet_busy(self):
+        """A gate that cannot open must not force ticking the whole day"""
+        sim = FleetSim(3, open_time=60, close_time=60)
+        sim.open()
+        sim.open_disabled[0] = True
+        sim.tick()
+        assert sim.posn_cmd[0] < sim.posn[0]
+        gate_ticks = sim.run_days(60000, 80000, days=1, elapsed_time=1.0)
+        assert gate_ticks < 3 * 1000
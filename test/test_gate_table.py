@@ -0,0 +1,228 @@
+"""
+Equivalence of the table-driven Gate state machine with the original
+if/elif implementation of Gate.tick(), kept here as the reference.
+"""
+
+import os
+import random
+import sys
+from unittest.mock import patch
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.gate.diagnostics import format_message
+from chicken_gate.gate.gate import (
+    CLOSED_WITHOUT_SWITCH,
+    OPENED_WITH_SWITCH,
+    SWITCH_BELOW_90,
+    TRANSITION_RULES,
+    Gate,
+    Transition,
+    compile_transitions,
+    iter_keys,
+    table_index,
+)
+from chicken_gate.gate.gate_cmd import Cmd
+
+
+def reference_control(s):
+    """
+    The control half of the original Gate.tick(), on a dict of its state.
+    Returns (diagnostics, alerts) in the order the original produced them.
+    """
+    diagnostics, alerts = [], []
+
+    def alert(msg):
+        diagnostics.append(f"ERROR: {msg}")
+        alerts.append(msg)
+
+    if s["manual_stop"]:
+        if s["motion"] != Cmd.STOP:
+            diagnostics.append("gate entering STOP state (manual stop)")
+        s["motion"] = Cmd.STOP
+        return diagnostics, alerts
+
+    if s["posn_cmd"] < s["posn"]:
+        if s["open_disabled"]:
+            s["motion"] = Cmd.STOP
+        else:
+            if s["motion"] is not Cmd.OPEN:
+                diagnostics.append("gate entering OPEN state")
+            s["motion"] = Cmd.OPEN
+            if s["posn"] < 90 and s["closed_switch"]:
+                alert(SWITCH_BELOW_90)
+                s["open_disabled"] = True
+                s["motion"] = Cmd.STOP
+    elif s["posn_cmd"] > s["posn"]:
+        if s["motion"] is not Cmd.CLOSE:
+            diagnostics.append("gate entering CLOSE state")
+        s["motion"] = Cmd.CLOSE
+    else:
+        if s["motion"] is not Cmd.STOP:
+            diagnostics.append("gate entering STOP state")
+            if s["motion"] == Cmd.CLOSE and not s["closed_switch"]:
+                alert(CLOSED_WITHOUT_SWITCH)
+            if s["motion"] == Cmd.OPEN and s["closed_switch"]:
+                alert(OPENED_WITH_SWITCH)
+        s["motion"] = Cmd.STOP
+    return diagnostics, alerts
+
+
+def reference_tick(s, elapsed_time, open_rate, close_rate):
+    """The original Gate.tick() position update followed by the control"""
+    if s["closed_switch"]:
+        s["posn"] = max(90, s["posn"])
+    if s["open_switch"]:
+        s["posn"] = 0
+    else:
+        if s["motion"] == Cmd.OPEN:
+            s["posn"] -= elapsed_time * open_rate
+        if s["motion"] == Cmd.CLOSE:
+            s["posn"] += elapsed_time * close_rate
+        s["posn"] = min(max(s["posn"], 0), 100)
+    return reference_control(s)
+
+
+def key_state(key):
+    """A reference state dict that produces a table key"""
+    posn = 50 if key["below_90"] else 95
+    offset = {Cmd.OPEN: -10, Cmd.CLOSE: 10, Cmd.STOP: 0}[key["target"]]
+    return {
+        "motion": key["motion"],
+        "posn": posn,
+        "posn_cmd": posn + offset,
+        "closed_switch": key["closed_switch"],
+        "open_disabled": key["open_disabled"],
+        "manual_stop": key["manual_stop"],
+    }
+
+
+class TestTransitionTable:
+    """The compiled table against the original control logic, key by key"""
+
+    @pytest.mark.parametrize("key", iter_keys(), ids=str)
+    def test_every_key_matches_reference(self, key):
+        state = key_state(key)
+        diagnostics, alerts = reference_control(state)
+
+        motion, value, effects, disable_open = compile_transitions()[
+            table_index(
+                key["motion"].value,
+                key["target"].value,
+                key["closed_switch"],
+                key["open_disabled"],
+                key["manual_stop"],
+                key["below_90"],
+            )
+        ]
+        assert motion == state["motion"]
+        assert value == motion.value
+        assert [format_message(code, params) for code, params, _ in effects] == (
+            diagnostics
+        )
+        assert [a for _, _, a in effects if a is not None] == alerts
+        assert disable_open == (state["open_disabled"] and not key["open_disabled"])
+
+    def test_incomplete_rules_are_rejected(self):
+        with pytest.raises(ValueError, match="No transition rule"):
+            compile_transitions(TRANSITION_RULES[:-1])
+
+    def test_rules_are_data(self):
+        rules = ((({}, Transition(Cmd.STOP, (), False))),)
+        table = compile_transitions(rules)
+        assert len(table) == 144
+        assert all(entry == (Cmd.STOP, 0, (), False) for entry in table)
+
+
+class TestSimulationEquivalence:
+    """Random command and switch sequences through Gate and the reference"""
+
+    def run_sequence(self, seed, ticks=3000):
+        rng = random.Random(seed)
+        open_time, close_time = rng.choice([(2, 2), (10, 14), (310, 420)])
+        init_posn = rng.choice([0, 50, 100, 91.5])
+        gate = Gate(init_posn, open_time, close_time)
+        ref = {
+            "motion": Cmd.STOP,
+            "posn": init_posn,
+            "posn_cmd": 100,
+            "closed_switch": False,
+            "open_switch": False,
+            "open_disabled": False,
+            "manual_stop": False,
+        }
+        ref_errors, ref_diagnostics, ref_emails = [], [], []
+
+        with patch("chicken_gate.gate.gate.send_email") as send_email:
+            for _ in range(ticks):
+                event = rng.random()
+                if event < 0.01:
+                    gate.open()
+                    ref["manual_stop"] = False
+                    if not ref["open_disabled"]:
+                        ref["posn_cmd"] = 0
+                elif event < 0.02:
+                    gate.close()
+                    ref["manual_stop"] = False
+                    ref["posn_cmd"] = 100
+                elif event < 0.025:
+                    gate.stop()
+                    ref["manual_stop"] = True
+                    ref["motion"] = Cmd.STOP
+                elif event < 0.028:
+                    gate.clear_errors()
+                    ref_errors.clear()
+                    ref["open_disabled"] = False
+                elif event < 0.03:
+                    posn = rng.choice([0, 50, 100])
+                    gate.reset_posn_to(posn)
+                    ref["posn"] = ref["posn_cmd"] = posn
+
+                # the switch mostly follows the position, sometimes it is faulty
+                closed = (
+                    ref["posn"] >= 95 if rng.random() > 0.02 else rng.random() < 0.5
+                )
+                opened = rng.random() < 0.002
+                gate.set_closed_switch(closed)
+                gate.set_open_switch(opened)
+                ref["closed_switch"], ref["open_switch"] = closed, opened
+
+                elapsed = rng.choice([0.1, 0.1, 0.1, 1.0, 0.0])
+                gate.tick(elapsed)
+                diagnostics, alerts = reference_tick(
+                    ref, elapsed, 100 / open_time, 100 / close_time
+                )
+                ref_diagnostics.extend(diagnostics)
+                ref_emails.extend(alerts)
+                ref_errors.extend(a for a in alerts if a not in ref_errors)
+
+                assert gate.get_posn() == ref["posn"]
+                assert gate.get_cmd() == ref["motion"]
+                assert gate.get_errors() == ref_errors
+                assert gate.get_status()["open_disabled"] == ref["open_disabled"]
+            emails = [c.args[0] for c in send_email.call_args_list]
+        assert emails == ref_emails
+        tick_diagnostics = [
+            m.split(": ", 1)[1]
+            for m in gate.get_diagnostic_messages()
+            if "entering" in m or "ERROR" in m
+        ]
+        tail = len(ref_diagnostics) - len(tick_diagnostics)
+        assert tick_diagnostics == ref_diagnostics[tail:]
+
+    @pytest.mark.parametrize("seed", range(20))
+    def test_random_sequence(self, seed):
+        self.run_sequence(seed)
+
+
+class TestSlots:
+    """Gate has no per-instance __dict__"""
+
+    def test_no_instance_dict(self):
+        gate = Gate()
+        assert not hasattr(gate, "__dict__")
+        with pytest.raises(AttributeError):
+            gate.unexpected = 1
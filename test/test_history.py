@@ -0,0 +1,195 @@
+"""
+Tests for the gate history store and recorder.
+"""
+
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.gate.gate import Gate
+from chicken_gate.gate.runtime import gate_state
+from chicken_gate.shared.history import (
+    HistoryRecorder,
+    HistoryStore,
+    parse_cursor,
+    parse_time,
+    segment_date,
+)
+from chicken_gate.shared.writer import BackgroundWriter
+
+# 2026-10-19 00:00:00 UTC
+MIDNIGHT = datetime(2026, 10, 19, tzinfo=timezone.utc).timestamp()
+
+
+def sample(t, gate_id="gate", position=0):
+    return {"t": t, "gate_id": gate_id, "kind": "sample", "position": position}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / "history"))
+
+
+class TestStore:
+    """Daily segments, scans and cursors"""
+
+    def test_segments_by_utc_day(self, store):
+        for hours in (-1, 1, 25):
+            store.append(sample(MIDNIGHT + hours * 3600))
+        store.close()
+        assert store.segments() == ["2026-10-18", "2026-10-19", "2026-10-20"]
+        assert segment_date(MIDNIGHT) == "2026-10-19"
+
+    def test_scan_range_kind_and_gate(self, store):
+        for minute in range(10):
+            store.append(
+                sample(MIDNIGHT + minute * 60, "gate" if minute % 2 else "side")
+            )
+        store.append({"t": MIDNIGHT + 30, "gate_id": "gate", "kind": "event"})
+        times = [r["t"] for _, r in store.scan(MIDNIGHT + 60, MIDNIGHT + 300)]
+        assert times == [MIDNIGHT + m * 60 for m in range(1, 5)]
+        side = [r for _, r in store.scan(gate_id="side", kinds=("sample",))]
+        assert len(side) == 5
+        assert [r["kind"] for _, r in store.scan(kinds=("event",))] == ["event"]
+
+    def test_cursor_resumes_across_segments(self, store):
+        for hours in range(0, 72, 6):
+            store.append(sample(MIDNIGHT + hours * 3600))
+        rows = list(store.scan())
+        cursor = rows[4][0]
+        assert parse_cursor(cursor)[0] == "2026-10-20"
+        resumed = [r for _, r in store.scan(cursor=cursor)]
+        assert resumed == [r for _, r in rows[5:]]
+        assert list(store.scan(cursor=rows[-1][0])) == []
+
+    def test_torn_and_bad_lines(self, store):
+        store.append(sample(MIDNIGHT))
+        store.close()
+        with open(store.path("2026-10-19"), "ab") as f:
+            f.write(b"not json\n")
+            f.write(b'{"t": 1, "gate_id"')  # being written
+        assert len(list(store.scan())) == 1
+
+    def test_latest(self, store):
+        for hours in range(0, 48, 2):
+            store.append(sample(MIDNIGHT + hours * 3600, position=hours))
+        latest = store.latest(3)
+        assert [r["position"] for r in latest] == [42, 44, 46]
+        assert len(store.latest(100)) == 24
+
+    def test_retention(self, tmp_path):
+        store = HistoryStore(str(tmp_path / "history"), retention_days=2)
+        for days in range(5):
+            store.append(sample(MIDNIGHT + days * 86400))
+        store.prune(now=MIDNIGHT + 4 * 86400)
+        assert store.segments() == ["2026-10-21", "2026-10-22", "2026-10-23"]
+
+    def test_appends_on_the_writer_thread(self, tmp_path):
+        writer = BackgroundWriter()
+        gate = threading.Event()
+        writer.submit(gate.wait, 5)  # a stalled SD card
+        store = HistoryStore(
+            str(tmp_path / "history"), retention_days=3650, writer=writer
+        )
+        old = tmp_path / "history" / "2000-01-01.ndjson"
+        old.parent.mkdir()
+        old.write_text("")
+        for hours in (1, 25):
+            store.append(sample(MIDNIGHT + hours * 3600))
+        assert store.appended == 2
+        assert store.segments() == ["2000-01-01"]  # nothing written or pruned yet
+        gate.set()
+        store.close()
+        writer.stop()
+        assert store.segments() == ["2026-10-19", "2026-10-20"]
+        assert len(list(store.scan())) == 2
+
+    def test_parsing(self):
+        assert parse_time("1760832000") == 1760832000
+        assert parse_time("2026-10-19T00:00:00Z") == MIDNIGHT
+        with pytest.raises(ValueError):
+            parse_time("yesterday")
+        with pytest.raises(ValueError):
+            parse_cursor("2026-10-19")
+
+
+class Runtime:
+    """The AsyncGate methods the recorder uses"""
+
+    def __init__(self, gate):
+        self.gate = gate
+        self.gate_ids = ["gate"]
+        self.publishers = []
+
+    def driver(self, gate_id):
+        return self
+
+    def add_publisher(self, publisher):
+        self.publishers.append(publisher)
+
+    def publish(self):
+        status = dict(self.gate.get_status(diagnostics=False), gate_id="gate")
+        status["state"] = gate_state(status)
+        for publisher in self.publishers:
+            publisher(status)
+
+
+class TestRecorder:
+    """Events and samples from published statuses"""
+
+    @pytest.fixture
+    def setup(self, store):
+        clock = [MIDNIGHT]
+        recorder = HistoryRecorder(
+            store, sample_interval=10, idle_interval=3600, clock=lambda: clock[0]
+        )
+        runtime = Runtime(Gate(init_posn=0, close_time=100))
+        recorder.attach(runtime)
+        return runtime, clock, store
+
+    def test_samples(self, setup):
+        runtime, clock, store = setup
+        runtime.publish()  # first status
+        runtime.gate.close()
+        for _ in range(30):
+            clock[0] += 1
+            runtime.gate.tick(1)
+            runtime.publish()
+        samples = [r for _, r in store.scan(kinds=("sample",))]
+        assert [r["state"] for r in samples] == ["open"] + ["closing"] * 3
+        assert [r["position"] for r in samples[1:]] == [0, 10, 20]  # every 10 s
+        runtime.gate.stop()
+        for _ in range(600):
+            clock[0] += 1
+            runtime.publish()  # stopped at 30%: idle from here
+        samples = [r for _, r in store.scan(kinds=("sample",))]
+        assert [r["state"] for r in samples[4:]] == ["stopped"]
+
+    def test_events(self, setup):
+        runtime, clock, store = setup
+        runtime.gate.close()
+        runtime.publish()
+        runtime.publish()
+        events = [r for _, r in store.scan(kinds=("event",))]
+        assert events and all(e["gate_id"] == "gate" for e in events)
+        assert any("close" in e["message"] for e in events)
+        assert abs(events[0]["t"] - datetime.now().timestamp()) < 60
+        count = len(events)
+        runtime.gate.stop()
+        runtime.publish()
+        assert len(list(store.scan(kinds=("event",)))) > count
+
+    def test_settings(self, tmp_path):
+        directory = str(tmp_path / "history")
+        recorder = HistoryRecorder.from_settings({"sample_interval": 5}, directory)
+        assert recorder.sample_interval == 5
+        assert recorder.store.directory == directory
+        assert HistoryRecorder.from_settings({"enabled": False}, directory) is None
+        with pytest.raises(ValueError, match="unknown"):
+            HistoryRecorder.from_settings({"interval": 5}, directory)
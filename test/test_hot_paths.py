@@ -0,0 +1,82 @@
+"""
+Tests for the hot-path benchmark suite (benchmarks/hot_paths.py).
+"""
+
+import contextlib
+import importlib.util
+import json
+import os
+import sys
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+BENCHMARK = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "hot_paths.py")
+
+
+@pytest.fixture(scope="module")
+def hot_paths():
+    spec = importlib.util.spec_from_file_location("hot_paths", BENCHMARK)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def result(ops, alloc):
+    return {"ops_per_sec": ops, "alloc_bytes": alloc}
+
+
+class TestCompare:
+    """Regression thresholds"""
+
+    def test_within_threshold(self, hot_paths):
+        baseline = {"tick": result(1000, 100)}
+        assert hot_paths.compare({"tick": result(800, 125)}, baseline, 25) == []
+        assert hot_paths.compare({"tick": result(5000, 0)}, baseline, 25) == []
+
+    def test_slower(self, hot_paths):
+        baseline = {"tick": result(1000, 100)}
+        (problem,) = hot_paths.compare({"tick": result(700, 100)}, baseline, 25)
+        assert problem.startswith("tick: 700 ops/s is 30% slower")
+        assert hot_paths.compare({"tick": result(700, 100)}, baseline, 40) == []
+
+    def test_allocates_more(self, hot_paths):
+        baseline = {"tick": result(1000, 1000)}
+        slack = hot_paths.ALLOC_SLACK
+        assert hot_paths.compare({"tick": result(1000, 1250 + slack)}, baseline) == []
+        (problem,) = hot_paths.compare({"tick": result(1000, 1251 + slack)}, baseline)
+        assert "allocates" in problem
+
+    def test_cases_without_baseline_pass(self, hot_paths):
+        assert hot_paths.compare({"new": result(1, 10**6)}, {}) == []
+
+
+class TestSuite:
+    """The cases themselves, offline with the mock driver"""
+
+    def test_every_case_runs(self, hot_paths, tmp_path):
+        cwd = os.getcwd()
+        with contextlib.ExitStack() as stack:
+            cases = hot_paths.cases(stack, str(tmp_path))
+            for _, fn in cases:
+                fn()
+            assert (tmp_path / "gate_cmd.txt").read_text() == "OPEN"
+        assert os.getcwd() == cwd
+        names = [name for name, _ in cases]
+        assert len(names) == len(set(names)) >= 15
+
+    def test_measure(self, hot_paths):
+        results = hot_paths.measure(["Gate.tick"], repeat=1)
+        assert list(results) == ["Gate.tick (idle)"]
+        assert results["Gate.tick (idle)"]["ops_per_sec"] > 0
+        assert results["Gate.tick (idle)"]["alloc_bytes"] >= 0
+
+    def test_baselines_cover_every_case(self, hot_paths, tmp_path):
+        with contextlib.ExitStack() as stack:
+            names = {name for name, _ in hot_paths.cases(stack, str(tmp_path))}
+        baselines = json.loads(hot_paths.BASELINE_FILE.read_text())
+        assert baselines
+        for entry in baselines.values():
+            assert set(entry["cases"]) == names
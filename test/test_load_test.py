@@ -0,0 +1,78 @@
+"""
+Tests for the web API load test's scheduling and accounting
+(benchmarks/load_test.py).
+"""
+
+import collections
+import importlib.util
+import logging
+import os
+import sys
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.gate.gate import Gate
+from chicken_gate.gate.gate_drv_mock import Gate_drv
+from chicken_gate.gate.runtime import apply_command
+
+BENCHMARK = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "load_test.py")
+
+
+@pytest.fixture(scope="module")
+def load_test():
+    spec = importlib.util.spec_from_file_location("load_test", BENCHMARK)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TestMix:
+    """Request kinds in proportion"""
+
+    def test_parse(self, load_test):
+        assert load_test.parse_mix(["status=3", "command=1"]) == {
+            "status": 0.75,
+            "command": 0.25,
+        }
+        assert load_test.parse_mix(["camera"]) == {"camera": 1.0}
+        with pytest.raises(ValueError):
+            load_test.parse_mix(["history=1"])
+        with pytest.raises(ValueError):
+            load_test.parse_mix(["status=0"])
+
+    def test_schedule_interleaves(self, load_test):
+        kinds = load_test.schedule({"status": 0.9, "command": 0.1}, 100)
+        assert collections.Counter(kinds) == {"status": 90, "command": 10}
+        # spread out, not bunched at one end
+        assert kinds.index("command") < 10
+        assert "command" in kinds[90:]
+
+    def test_percentile(self, load_test):
+        ordered = list(range(1, 101))
+        assert load_test.percentile(ordered, 0.5) == 51
+        assert load_test.percentile(ordered, 0.99) == 100
+        assert load_test.percentile([7], 0.95) == 7
+
+
+class TestCommandAccounting:
+    """Commands accepted by the web app against those the gate applied"""
+
+    def test_counts_the_gate_log(self, load_test, caplog):
+        """APPLIED matches what apply_command() logs"""
+        driver = Gate_drv(Gate(), initial_closed_switch=True)
+        commands = sorted(load_test.APPLIED.values())
+        with caplog.at_level(logging.INFO, logger="chicken-gate"):
+            for command in commands:
+                apply_command(command, driver, True)
+        lines = [f"{r.name}: {r.getMessage()}\n" for r in caplog.records]
+        applied = load_test.count_applied(lines)
+        assert applied == collections.Counter(commands)
+
+    def test_lost_and_duplicated(self, load_test):
+        accepted = collections.Counter(OPEN=5, CLOSE=5)
+        applied = collections.Counter(OPEN=2, CLOSE=6, STOP=1)
+        assert load_test.command_accounting(accepted, applied) == (3, 2)
+        assert load_test.command_accounting(accepted, accepted) == (0, 0)
@@ -0,0 +1,216 @@
+"""
+Tests for the queue-based logging pipeline.
+"""
+
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.gate.gate import Gate
+from chicken_gate.shared import logs
+
+
+class ListHandler(logging.Handler):
+    """Collects (record, formatted text, thread name); optionally slow"""
+
+    def __init__(self, delay=0.0, gate=None):
+        super().__init__()
+        self.setFormatter(logs.Formatter(logs.FORMAT))
+        self.delay = delay
+        self.gate = gate
+        self.items = []
+
+    def emit(self, record):
+        if self.gate is not None:
+            self.gate.wait()
+        time.sleep(self.delay)
+        self.items.append(
+            (record, self.format(record), threading.current_thread().name)
+        )
+
+
+@pytest.fixture
+def pipeline_root():
+    """Restore the root logger (pytest's capture handlers) after each test"""
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield root
+    logs.stop_logging()
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+class TestNonBlocking:
+    """The calling thread only queues records"""
+
+    def test_slow_sink_does_not_block_caller(self, pipeline_root):
+        sink = ListHandler(delay=0.02)
+        logs.setup_logging(targets=[sink], burst=1000)
+        log = logging.getLogger("test-slow")
+
+        start = time.perf_counter()
+        for i in range(50):
+            log.info("message %d", i)
+        elapsed = time.perf_counter() - start
+        assert elapsed < 0.25  # the sink alone needs 1 s
+
+        logs.stop_logging()  # drains the queue
+        assert [text for _, text, _ in sink.items][-1] == "test-slow: message 49"
+        assert len(sink.items) == 50
+
+    def test_formatting_happens_on_listener_thread(self, pipeline_root):
+        formatted_on = []
+
+        class Arg:
+            def __str__(self):
+                formatted_on.append(threading.current_thread())
+                return "arg"
+
+        sink = ListHandler()
+        logs.setup_logging(targets=[sink])
+        logging.getLogger("test-lazy").info("value %s", Arg())
+        logs.stop_logging()
+        assert sink.items[0][1] == "test-lazy: value arg"
+        assert formatted_on and threading.main_thread() not in formatted_on
+
+    def test_mutable_arguments_are_snapshot(self, pipeline_root):
+        blocked = threading.Event()
+        sink = ListHandler(gate=blocked)
+        logs.setup_logging(targets=[sink])
+        log = logging.getLogger("test-snapshot")
+        status = {"state": "closing"}
+        errors = []
+        log.info("status %s, errors %s", status, errors)
+        log.info("state %(state)s", status)
+        status["state"] = "closed"  # the control thread moves on
+        errors.append("gate finished closing but closed switch is not pressed")
+        blocked.set()
+        logs.stop_logging()
+        assert [text for _, text, _ in sink.items] == [
+            "test-snapshot: status {'state': 'closing'}, errors []",
+            "test-snapshot: state closing",
+        ]
+
+    def test_full_queue_drops_and_counts(self, pipeline_root):
+        blocked = threading.Event()
+        sink = ListHandler(gate=blocked)
+        pipeline = logs.setup_logging(targets=[sink], queue_size=2, burst=1000)
+        log = logging.getLogger("test-full")
+        for i in range(10):
+            log.info("message %d", i)
+        stats = pipeline.stats()
+        assert stats["dropped"] >= 7
+        blocked.set()
+
+    def test_per_call_cost_is_flat(self, pipeline_root):
+        """Cost per call does not grow with the sink's latency or the arguments"""
+        blocked = threading.Event()
+
+        class Discard(logging.Handler):
+            def emit(self, record):
+                blocked.wait()
+
+        logs.setup_logging(targets=[Discard()], burst=10**6)
+        log = logging.getLogger("test-cost")
+        big = tuple(range(100000))  # repr would take milliseconds
+
+        calls = 2000
+        start = time.perf_counter()
+        for i in range(calls):
+            log.info("value %s %d", big, i)
+        per_call = (time.perf_counter() - start) / calls
+        blocked.set()
+        assert per_call < 0.0005
+
+
+class TestRateLimit:
+    """Repetitive messages are limited per template"""
+
+    def test_burst_then_suppressed_count(self, pipeline_root):
+        now = [0.0]
+        limit = logs.RateLimitFilter(burst=3, period=3.0, clock=lambda: now[0])
+
+        def record(msg="gate %s", args=("x",)):
+            return logging.LogRecord("t", logging.INFO, __file__, 1, msg, args, None)
+
+        passed = [limit.filter(record()) for _ in range(10)]
+        assert passed.count(True) == 3
+        assert limit.suppressed == 7
+
+        assert limit.filter(record("other %s"))  # separate template
+
+        now[0] += 1.0  # one token back
+        rec = record()
+        assert limit.filter(rec)
+        assert rec.suppressed == 7
+        assert logs.Formatter(logs.FORMAT).format(rec) == (
+            "t: gate x (7 similar messages suppressed)"
+        )
+
+    def test_pipeline_applies_limit(self, pipeline_root):
+        sink = ListHandler()
+        pipeline = logs.setup_logging(targets=[sink], burst=5)
+        log = logging.getLogger("test-limit")
+        for _ in range(100):
+            log.info("switch bounced")
+        logs.stop_logging()
+        assert len(sink.items) == 5
+        assert pipeline.stats()["suppressed"] == 95
+
+
+class TestJournal:
+    """journald native protocol"""
+
+    def test_encode_fields(self):
+        data = logs.encode_journal_fields({"MESSAGE": "a\nb", "GATE_ID": "coop"})
+        assert data.startswith(b"MESSAGE\n\x03\x00\x00\x00\x00\x00\x00\x00a\nb\n")
+        assert data.endswith(b"GATE_ID=coop\n")
+
+    def test_structured_fields(self, tmp_path):
+        path = str(tmp_path / "journal.sock")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        server.bind(path)
+        server.settimeout(5)
+        handler = logs.JournalHandler(path=path)
+        handler.setFormatter(logs.Formatter(logs.FORMAT))
+        record = logging.LogRecord(
+            "chicken-gate", logging.WARNING, __file__, 10, "cmd %s", ("OPEN",), None
+        )
+        record.command = "OPEN"
+        record.position = 42.5
+        record.gate_id = "coop"
+        try:
+            handler.emit(record)
+            lines = server.recv(65536).decode().splitlines()
+        finally:
+            handler.close()
+            server.close()
+        assert "MESSAGE=chicken-gate: cmd OPEN" in lines
+        assert "PRIORITY=4" in lines
+        assert "GATE_COMMAND=OPEN" in lines
+        assert "GATE_POSITION=42.5" in lines
+        assert "GATE_ID=coop" in lines
+
+
+class TestGateFields:
+    """Gate diagnostics carry code, position and the default gate id"""
+
+    def test_diagnostic_record_fields(self, pipeline_root):
+        sink = ListHandler()
+        logs.setup_logging(gate_id="coop", targets=[sink])
+        gate = Gate(init_posn=30)
+        gate.close()
+        logs.stop_logging()
+        record = sink.items[-1][0]
+        assert record.code == "close_received"
+        assert record.position == 30
+        assert record.gate_id == "coop"
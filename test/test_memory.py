@@ -0,0 +1,106 @@
+"""
+Tests for memory profiles, RSS accounting and the low-memory services.
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.shared import memory
+
+
+class TestProfiles:
+    """Choosing a profile and what it loads"""
+
+    def test_default_is_full(self):
+        assert memory.get_profile() == "full"
+        assert memory.get_profile({"memory": {}}) == "full"
+
+    def test_settings_and_flag(self):
+        assert memory.get_profile({"memory": {"profile": "low"}}) == "low"
+        assert memory.get_profile({}, low_memory=True) == "low"
+
+    def test_unknown_profile(self):
+        with pytest.raises(ValueError):
+            memory.get_profile({"memory": {"profile": "tiny"}})
+
+    def test_low_profile_disables_optional_subsystems(self):
+        for name in ("apscheduler", "camera", "placeholder", "history"):
+            assert memory.subsystem_enabled("full", name)
+            assert not memory.subsystem_enabled("low", name)
+        assert memory.subsystem_enabled("low", "schedule")
+
+
+class TestAccounting:
+    """Per-subsystem RSS and heap figures"""
+
+    def test_account_records_first_load_only(self):
+        with memory.account("test-subsystem"):
+            data = [bytearray(1024) for _ in range(100)]
+        first = memory.report()["subsystems"]["test-subsystem"]
+        assert first["heap_blocks"] >= 100
+
+        with memory.account("test-subsystem"):
+            data += [bytearray(1024) for _ in range(100)]
+        assert memory.report()["subsystems"]["test-subsystem"] == first
+
+    def test_report(self):
+        usage = memory.report("low")
+        assert usage["profile"] == "low"
+        assert usage["rss_kb"] > 0
+        assert usage["peak_rss_kb"] >= usage["rss_kb"]
+        assert usage["heap_blocks"] > 0
+
+
+class TestLowMemorySchedule:
+    """Schedule without APScheduler"""
+
+    def test_recompiles_after_midnight(self, tmp_path):
+        from chicken_gate.gate.schedule import Schedule
+
+        schedule = Schedule(
+            settings_path=tmp_path / "chicken-gate.toml", use_apscheduler=False
+        )
+        # past the end of the yesterday..tomorrow timeline compiled at startup
+        later = datetime.now().date() + timedelta(days=3)
+        noon = datetime.combine(later, datetime.min.time()) + timedelta(hours=12)
+
+        schedule.get_gate_cmd(noon.timestamp())
+        event = schedule.get_schedule_info()["next_event"]
+        assert event is not None
+        assert datetime.fromisoformat(event["time"]).timestamp() > noon.timestamp()
+        schedule.shutdown()
+
+
+class TestLowMemoryWeb:
+    """Web routes under the low-memory profile"""
+
+    def setup_method(self):
+        from chicken_gate.web.app import app
+
+        self.app = app
+        app.config["MEMORY_PROFILE"] = "low"
+        self.client = app.test_client()
+
+    def teardown_method(self):
+        self.app.config["MEMORY_PROFILE"] = "full"
+
+    def test_status_reports_web_memory(self):
+        data = self.client.get("/api/status").get_json()
+        assert data["web_memory"]["profile"] == "low"
+        assert data["web_memory"]["rss_kb"] > 0
+
+    def test_camera_routes_skip_optional_modules(self):
+        response = self.client.get("/api/camera/snapshot")
+        assert response.mimetype == "text/plain"
+        assert self.client.get("/api/camera/debug").status_code == 503
+
+    def test_history_disabled(self):
+        data = self.client.get("/api/history").get_json()
+        assert data["history"] == []
+        assert "disabled" in data
@@ -0,0 +1,388 @@
+"""
+Tests for the MQTT bridge, against a local broker stand-in.
+"""
+
+import asyncio
+import json
+import os
+import struct
+import sys
+import time
+from unittest.mock import patch
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.gate import mqtt
+from chicken_gate.gate.gate import Gate
+from chicken_gate.gate.gate_drv_mock import Gate_drv
+from chicken_gate.gate.mqtt import MqttBridge, command_gate_id, status_topics
+from chicken_gate.gate.runtime import AsyncGate
+
+
+class Broker:
+    """
+    MQTT 3.1.1 broker stand-in: one level of "+" wildcards, retained
+    messages, QoS 0/1 and wills. Records every PUBLISH it receives.
+    """
+
+    def __init__(self, stall=False):
+        self.stall = stall  # accept connections but never answer
+        self.retained = {}
+        self.received = []  # (topic, payload, retain)
+        self.clients = []  # [writer, subscriptions]
+        self.connects = 0
+        self.server = None
+        self.port = None
+
+    async def start(self, port=0):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        for writer, _ in self.clients:
+            writer.transport.abort()
+        self.clients = []
+        await asyncio.sleep(0.05)
+
+    async def handle(self, reader, writer):
+        if self.stall:
+            await asyncio.sleep(3600)
+        client = [writer, []]
+        will = None
+        try:
+            kind, _, body = await mqtt.read_packet(reader)
+            assert kind == mqtt.CONNECT
+            will = self.parse_will(body)
+            self.connects += 1
+            self.clients.append(client)
+            writer.write(mqtt.packet(mqtt.CONNACK, b"\x00\x00"))
+            while True:
+                kind, flags, body = await mqtt.read_packet(reader)
+                if kind == mqtt.PUBLISH:
+                    topic, payload, qos, retain, packet_id = mqtt.parse_publish(
+                        flags, body
+                    )
+                    if qos:
+                        writer.write(
+                            mqtt.packet(mqtt.PUBACK, struct.pack("!H", packet_id))
+                        )
+                    self.route(topic, payload, retain)
+                elif kind == mqtt.SUBSCRIBE:
+                    offset = 2
+                    while offset < len(body):
+                        topic, offset = mqtt.decode_string(body, offset)
+                        offset += 1
+                        client[1].append(topic)
+                        for name, payload in self.retained.items():
+                            if self.matches(topic, name):
+                                writer.write(
+                                    mqtt.publish_packet(name, payload, 0, True)
+                                )
+                    writer.write(mqtt.packet(mqtt.SUBACK, body[:2] + b"\x00"))
+                elif kind == mqtt.PINGREQ:
+                    writer.write(mqtt.packet(mqtt.PINGRESP))
+                elif kind == mqtt.DISCONNECT:
+                    will = None
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        if client in self.clients:
+            self.clients.remove(client)
+        if will is not None:
+            self.route(*will, True)
+        writer.close()
+
+    @staticmethod
+    def parse_will(body):
+        _, offset = mqtt.decode_string(body)
+        flags = body[offset + 1]
+        _, offset = mqtt.decode_string(body, offset + 4)  # client id
+        if not flags & 0x04:
+            return None
+        topic, offset = mqtt.decode_string(body, offset)
+        payload, _ = mqtt.decode_string(body, offset)
+        return topic, payload.encode()
+
+    @staticmethod
+    def matches(pattern, topic):
+        pattern, topic = pattern.split("/"), topic.split("/")
+        return len(pattern) == len(topic) and all(
+            p in ("+", t) for p, t in zip(pattern, topic)
+        )
+
+    def route(self, topic, payload, retain):
+        self.received.append((topic, payload.decode(), retain))
+        if retain:
+            self.retained[topic] = payload
+        for writer, subscriptions in self.clients:
+            if any(self.matches(pattern, topic) for pattern in subscriptions):
+                writer.write(mqtt.publish_packet(topic, payload))
+
+    def published(self, topic):
+        """Payloads received on a topic, in order"""
+        return [payload for name, payload, _ in self.received if name == topic]
+
+
+def fast_gate(gate_id="gate"):
+    gate = Gate(init_posn=0, open_time=2, close_time=2, gate_id=gate_id)
+    return Gate_drv(gate)
+
+
+def bridge_for(broker, **kwargs):
+    kwargs.setdefault("reconnect_min", 0.05)
+    return MqttBridge("127.0.0.1", broker.port, client_id="test", **kwargs)
+
+
+async def until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def run(scenario):
+    with patch("chicken_gate.gate.gate.send_email"):
+        return asyncio.run(scenario())
+
+
+class TestPackets:
+    """Encoding"""
+
+    @pytest.mark.parametrize(
+        "length, encoded",
+        [
+            (0, b"\x00"),
+            (127, b"\x7f"),
+            (128, b"\x80\x01"),
+            (16383, b"\xff\x7f"),
+            (16384, b"\x80\x80\x01"),
+        ],
+    )
+    def test_remaining_length(self, length, encoded):
+        assert mqtt.encode_length(length) == encoded
+
+    def test_publish_round_trip(self):
+        data = mqtt.publish_packet("a/b", "x" * 300, qos=1, retain=True, packet_id=7)
+
+        async def read():
+            reader = asyncio.StreamReader()
+            reader.feed_data(data)
+            return await mqtt.read_packet(reader)
+
+        kind, flags, body = asyncio.run(read())
+        assert kind == mqtt.PUBLISH
+        assert mqtt.parse_publish(flags, body) == ("a/b", b"x" * 300, 1, True, 7)
+
+    def test_topics(self):
+        status = {
+            "gate_id": "side",
+            "position": 42.4,
+            "state": "closing",
+            "errors": [],
+            "schedule_enabled": False,
+        }
+        topics = status_topics("coop", status, {"gate_open_time": "07:00"})
+        assert topics["coop/side/position"] == "42"
+        assert topics["coop/side/state"] == "closing"
+        assert json.loads(topics["coop/side/schedule"])["enabled"] is False
+        assert json.loads(topics["coop/side/schedule"])["open"] == "07:00"
+
+    def test_command_topics(self):
+        assert command_gate_id("coop", "coop/command") is None
+        assert command_gate_id("coop", "coop/side/command") == "side"
+        for topic in ("coop/side/state", "other/side/command", "coop/a/b/command"):
+            with pytest.raises(ValueError):
+                command_gate_id("coop", topic)
+
+    def test_settings(self):
+        bridge = MqttBridge.from_settings({"host": "broker", "prefix": "coop/"})
+        assert (bridge.host, bridge.port, bridge.prefix) == ("broker", 1883, "coop")
+        with pytest.raises(ValueError):
+            MqttBridge.from_settings({"port": 1883})
+        with pytest.raises(ValueError):
+            MqttBridge.from_settings({"host": "broker", "qos": 2})
+
+
+class TestBridge:
+    """Against the broker stand-in"""
+
+    def test_retained_change_only_status(self):
+        async def scenario():
+            broker = await Broker().start()
+            runtime = AsyncGate(fast_gate(), tick_interval=0.01, publish_interval=0.05)
+            bridge = bridge_for(broker)
+            bridge.attach(runtime)
+            tasks = [
+                asyncio.ensure_future(runtime.run()),
+                asyncio.ensure_future(bridge.run()),
+            ]
+            await until(lambda: broker.published("chicken-gate/gate/state"))
+            await asyncio.sleep(0.3)  # several heartbeats
+            await runtime.close()
+            await runtime.wait_for_state("closed", timeout=5)
+            await until(
+                lambda: broker.published("chicken-gate/gate/state")[-1] == "closed"
+            )
+            bridge.stop()
+            runtime.shutdown()
+            await asyncio.gather(*tasks)
+            await broker.stop()
+            return broker
+
+        broker = run(scenario)
+        assert broker.published("chicken-gate/gate/state") == [
+            "open",
+            "closing",
+            "closed",
+        ]
+        positions = broker.published("chicken-gate/gate/position")
+        assert positions[0] == "0" and positions[-1] == "100"
+        assert all(a != b for a, b in zip(positions, positions[1:]))
+        assert broker.published("chicken-gate/gate/errors") == ["[]"]
+        assert broker.published("chicken-gate/availability") == ["online", "offline"]
+        assert all(retain for _, _, retain in broker.received)
+        assert broker.retained["chicken-gate/gate/state"] == b"closed"
+
+    def test_commands(self):
+        async def scenario():
+            broker = await Broker().start()
+            # left on the broker from before: not acted on at subscribe
+            broker.retained["chicken-gate/command"] = b"CLOSE"
+            runtime = AsyncGate(fast_gate("front"), tick_interval=0.01, gate_id="front")
+            runtime.add_gate(fast_gate("side"), "side")
+            bridge = bridge_for(broker)
+            bridge.attach(runtime)
+            tasks = [
+                asyncio.ensure_future(runtime.run()),
+                asyncio.ensure_future(bridge.run()),
+            ]
+            await until(lambda: broker.clients and broker.clients[0][1])
+            broker.route("chicken-gate/side/command", b"close", False)
+            await runtime.wait_for_state("closing", timeout=5, gate_id="side")
+            broker.route("chicken-gate/command", b"RESET:40", False)
+            await until(lambda: runtime.status()["position"] == 40)
+            # ignored: unknown command, unknown gate
+            broker.route("chicken-gate/command", b"FLY", False)
+            broker.route("chicken-gate/barn/command", b"OPEN", False)
+            await asyncio.sleep(0.1)
+            bridge.stop()
+            runtime.shutdown()
+            await asyncio.gather(*tasks)
+            await broker.stop()
+            return runtime, bridge
+
+        runtime, bridge = run(scenario)
+        assert runtime.status("front")["state"] == "stopped"
+        assert bridge.commands == 2
+
+    def test_buffers_while_broker_is_down(self):
+        async def scenario():
+            broker = await Broker().start()
+            port = broker.port
+            await broker.stop()  # nothing listening yet
+
+            runtime = AsyncGate(fast_gate(), tick_interval=0.01)
+            bridge = bridge_for(broker, max_pending=3, reconnect_max=0.2)
+            bridge.attach(runtime)
+            tasks = [
+                asyncio.ensure_future(runtime.run()),
+                asyncio.ensure_future(bridge.run()),
+            ]
+            await runtime.close()
+            await runtime.wait_for_state("closed", timeout=5)
+            await asyncio.sleep(0.1)
+            stats = bridge.stats()
+
+            broker = await Broker().start(port)
+            await until(lambda: bridge.connected and not bridge.stats()["pending"])
+            await asyncio.sleep(0.1)
+            bridge.stop()
+            runtime.shutdown()
+            await asyncio.gather(*tasks)
+            await broker.stop()
+            return broker, stats
+
+        broker, stats = run(scenario)
+        assert not stats["connected"]
+        assert stats["pending"] <= 3
+        assert stats["dropped"] > 0
+        # only the latest value of each topic, once
+        assert broker.published("chicken-gate/gate/state") == ["closed"]
+        assert broker.published("chicken-gate/gate/position") == ["100"]
+
+    def test_reconnect_republishes(self):
+        async def scenario():
+            broker = await Broker().start()
+            runtime = AsyncGate(fast_gate(), tick_interval=0.01)
+            bridge = bridge_for(broker)
+            bridge.attach(runtime)
+            tasks = [
+                asyncio.ensure_future(runtime.run()),
+                asyncio.ensure_future(bridge.run()),
+            ]
+            await until(lambda: broker.published("chicken-gate/gate/state"))
+            port = broker.port
+            await broker.stop()
+            # restarted without its retained messages
+            broker = await Broker().start(port)
+            await until(lambda: "chicken-gate/gate/state" in broker.retained)
+            bridge.stop()
+            runtime.shutdown()
+            await asyncio.gather(*tasks)
+            await broker.stop()
+            return broker, bridge
+
+        broker, bridge = run(scenario)
+        assert broker.retained["chicken-gate/gate/position"] == b"0"
+        assert bridge.connects == 2
+
+    def test_will_on_lost_connection(self):
+        async def scenario():
+            broker = await Broker().start()
+            runtime = AsyncGate(fast_gate(), tick_interval=0.01)
+            bridge = bridge_for(broker)
+            bridge.attach(runtime)
+            tasks = [
+                asyncio.ensure_future(runtime.run()),
+                asyncio.ensure_future(bridge.run()),
+            ]
+            await until(lambda: bridge.connected)
+            tasks[1].cancel()  # the process dies without a DISCONNECT
+            await asyncio.gather(tasks[1], return_exceptions=True)
+            await until(
+                lambda: broker.retained["chicken-gate/availability"] == b"offline"
+            )
+            runtime.shutdown()
+            await tasks[0]
+            await broker.stop()
+
+        run(scenario)
+
+    def test_stalled_broker_never_blocks_the_tick(self):
+        async def scenario():
+            broker = await Broker(stall=True).start()
+            runtime = AsyncGate(fast_gate(), tick_interval=0.01)
+            bridge = bridge_for(broker, connect_timeout=0.2)
+            bridge.attach(runtime)
+            tasks = [
+                asyncio.ensure_future(runtime.run()),
+                asyncio.ensure_future(bridge.run()),
+            ]
+            start = time.monotonic()
+            await runtime.close()
+            await runtime.wait_for_state("closed", timeout=5)
+            elapsed = time.monotonic() - start
+            bridge.stop()
+            runtime.shutdown()
+            await asyncio.gather(*tasks)
+            broker.server.close()
+            return elapsed, bridge
+
+        elapsed, bridge = run(scenario)
+        assert elapsed < 3.0  # a 2 s close, on time
+        assert bridge.connects == 0
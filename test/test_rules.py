@@ -0,0 +1,271 @@
+"""
+Tests for the declarative schedule rules and the next-event timeline.
+"""
+
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+from dateutil import tz
+
+from chicken_gate.gate.gate_cmd import Cmd
+from chicken_gate.gate.rules import (
+    Override,
+    RuleError,
+    ScheduleRules,
+    Timeline,
+    compile_expression,
+)
+
+ZONE = tz.gettz("America/Vancouver")
+DAY = date(2025, 6, 2)  # a Monday
+
+
+def sun_times(day=DAY):
+    def at(hour, minute):
+        return datetime(day.year, day.month, day.day, hour, minute, tzinfo=ZONE)
+
+    return {
+        "dawn": at(4, 30),
+        "sunrise": at(5, 10),
+        "noon": at(13, 15),
+        "sunset": at(21, 15),
+        "dusk": at(21, 55),
+    }
+
+
+def evaluate(source, day=DAY, times=None, notes=None):
+    return compile_expression(source).evaluate(
+        day, times or sun_times(day), ZONE, notes
+    )
+
+
+class TestExpressions:
+    """Parsing and evaluating rule expressions"""
+
+    def test_sun_event(self):
+        assert evaluate("sunrise") == sun_times()["sunrise"]
+
+    def test_offsets(self):
+        """Durations in hours, minutes and seconds shift an event"""
+        assert evaluate("sunrise + 10min").strftime("%H:%M") == "05:20"
+        assert evaluate("dusk - 90min").strftime("%H:%M") == "20:25"
+        assert evaluate("sunset + 90s").strftime("%H:%M:%S") == "21:16:30"
+
+    def test_clock_time(self):
+        assert evaluate("06:30").strftime("%H:%M") == "06:30"
+
+    def test_max_min_clamp(self):
+        assert evaluate("max(sunrise, 06:30)").strftime("%H:%M") == "06:30"
+        assert evaluate("min(dusk, 21:00)").strftime("%H:%M") == "21:00"
+        assert evaluate("clamp(sunrise, 06:00, 07:00)").strftime("%H:%M") == "06:00"
+        assert evaluate("clamp(noon, 06:00, 07:00)").strftime("%H:%M") == "07:00"
+
+    def test_compiled_expressions_are_cached(self):
+        assert compile_expression("dusk + 5min") is compile_expression("dusk + 5min")
+
+    @pytest.mark.parametrize(
+        "source",
+        [
+            "",
+            "sunrise +",
+            "moonrise",
+            "sunrise + sunset",
+            "10min",
+            "clamp(sunrise, 06:00)",
+            "25:00",
+            "(dusk",
+        ],
+    )
+    def test_invalid_rules(self, source):
+        with pytest.raises(RuleError):
+            compile_expression(source)
+
+    def test_dst_gap_note(self):
+        """A clock time skipped by spring-forward moves past the gap"""
+        notes = []
+        when = evaluate("02:30", day=date(2025, 3, 9), notes=notes)
+        assert when.strftime("%H:%M") == "03:30"
+        assert [n["kind"] for n in notes] == ["dst_gap"]
+
+
+class TestOverrides:
+    """Weekday and seasonal overrides"""
+
+    def test_weekday_override(self):
+        rules = ScheduleRules(
+            overrides=[{"days": ["sat", "sun"], "open": "max(sunrise, 08:00)"}]
+        )
+        assert rules.rules_for(DAY) == ("sunrise", "dusk")
+        assert rules.rules_for(DAY + timedelta(days=5)) == (
+            "max(sunrise, 08:00)",
+            "dusk",
+        )
+
+    def test_season_override(self):
+        rules = ScheduleRules(overrides=[{"season": "winter", "close": "sunset"}])
+        assert rules.rules_for(date(2025, 1, 15))[1] == "sunset"
+        assert rules.rules_for(DAY)[1] == "dusk"
+
+    def test_span_wraps_over_new_year(self):
+        override = Override({"start": "12-15", "end": "01-15", "open": "07:00"})
+        assert override.matches(date(2025, 12, 20))
+        assert override.matches(date(2026, 1, 10))
+        assert not override.matches(date(2026, 1, 20))
+
+    def test_later_override_wins(self):
+        rules = ScheduleRules(
+            overrides=[{"open": "07:00"}, {"days": ["mon"], "open": "08:00"}]
+        )
+        assert rules.rules_for(DAY)[0] == "08:00"
+
+    @pytest.mark.parametrize(
+        "settings",
+        [
+            {"days": ["sat"]},
+            {"days": ["someday"], "open": "07:00"},
+            {"season": "monsoon", "open": "07:00"},
+            {"start": "13-01", "open": "07:00"},
+            {"open": "sunrise +"},
+            {"weekdays": ["sat"], "open": "07:00"},
+        ],
+    )
+    def test_invalid_overrides(self, settings):
+        with pytest.raises(RuleError):
+            Override(settings)
+
+    def test_from_settings(self):
+        rules = ScheduleRules.from_settings(
+            {
+                "schedule": {
+                    "open": "sunrise + 10min",
+                    "close": "dusk",
+                    "override": [{"days": ["sun"], "open": "08:00"}],
+                }
+            }
+        )
+        assert rules.open_rule == "sunrise + 10min"
+        assert len(rules.overrides) == 1
+        assert ScheduleRules.from_settings({}).fingerprint() == (
+            ScheduleRules().fingerprint()
+        )
+
+
+class TestCompileDay:
+    """Compiling a day's rules into events"""
+
+    def test_events_in_time_order(self):
+        events = ScheduleRules().compile_day(DAY, sun_times(), ZONE)
+        assert [e.cmd for e in events] == [Cmd.OPEN, Cmd.CLOSE]
+        assert [e.job for e in events] == ["open", "close"]
+        assert events[0].at == sun_times()["sunrise"].timestamp()
+        assert all(e.day == DAY for e in events)
+
+    def test_missing_sun_event(self):
+        """No event is produced for a sun event that does not happen"""
+        times = dict(sun_times(), sunrise=None)
+        notes = []
+        events = ScheduleRules().compile_day(DAY, times, ZONE, notes)
+        assert [e.job for e in events] == ["close"]
+        assert notes == [{"date": "2025-06-02", "job": "open", "kind": "no_sunrise"}]
+
+
+class TestTimeline:
+    """Next-event lookup"""
+
+    def setup_method(self):
+        rules = ScheduleRules()
+        events = []
+        for offset in range(3):
+            day = DAY + timedelta(days=offset)
+            events.extend(rules.compile_day(day, sun_times(day), ZONE))
+        self.timeline = Timeline(reversed(events))
+        self.events = events
+
+    def test_sorted(self):
+        assert [e.at for e in self.timeline] == sorted(e.at for e in self.events)
+
+    def test_next_event(self):
+        first, second = self.events[0], self.events[1]
+        assert self.timeline.next_event(first.at - 1) is first
+        assert self.timeline.next_event(first.at) is second
+        assert self.timeline.next_event(self.events[-1].at) is None
+        assert Timeline().next_event(0) is None
+
+    def test_events_between(self):
+        start, end = self.events[0].at, self.events[3].at
+        assert self.timeline.events_between(start, end) == self.events[1:4]
+
+
+class TestSchedule:
+    """Schedule firing from the compiled timeline"""
+
+    def setup_method(self):
+        from chicken_gate.gate.schedule import Schedule
+
+        self.Schedule = Schedule
+
+    def test_fires_next_event_once(self, tmp_path):
+        schedule = self.Schedule(settings_path=tmp_path / "chicken-gate.toml")
+        try:
+            now = datetime.now().timestamp()
+            assert schedule.get_gate_cmd(now) == Cmd.NONE
+            event = schedule.get_schedule_info()["next_event"]
+            at = datetime.fromisoformat(event["time"]).timestamp()
+
+            assert schedule.get_gate_cmd(at - 1) is None
+            assert schedule.get_gate_cmd(at) == Cmd[event["command"]]
+            assert schedule.get_gate_cmd(at + 1) is None
+        finally:
+            schedule.shutdown()
+
+    def test_clock_jump_fires_latest_event(self, tmp_path):
+        settings = tmp_path / "chicken-gate.toml"
+        schedule = self.Schedule(settings_path=settings)
+        try:
+            now = datetime.now().timestamp()
+            schedule.get_gate_cmd(now)
+            first = schedule.get_schedule_info()["next_event"]
+            first_at = datetime.fromisoformat(first["time"]).timestamp()
+            schedule.get_gate_cmd(first_at)
+            second = schedule.get_schedule_info()["next_event"]
+            second_at = datetime.fromisoformat(second["time"]).timestamp()
+            assert first["command"] != second["command"]
+        finally:
+            schedule.shutdown()
+
+        # a fresh schedule whose clock jumps over both events at once
+        schedule = self.Schedule(settings_path=settings)
+        try:
+            schedule.get_gate_cmd(now)
+            assert schedule.get_gate_cmd(second_at + 60) == Cmd[second["command"]]
+            assert schedule.get_gate_cmd(second_at + 61) is None
+        finally:
+            schedule.shutdown()
+
+    def test_reloads_changed_rules(self, tmp_path):
+        settings = tmp_path / "chicken-gate.toml"
+        settings.write_text('[schedule]\nopen = "sunrise"\n')
+        schedule = self.Schedule(settings_path=settings)
+        try:
+            assert schedule.get_schedule_info()["open_rule"] == "sunrise"
+
+            settings.write_text('[schedule]\nopen = "max(sunrise, 07:00)"\n')
+            os.utime(settings, (1, 1))
+            now = datetime.now().timestamp() + 60
+            schedule.get_gate_cmd(now)
+            info = schedule.get_schedule_info()
+            assert info["open_rule"] == "max(sunrise, 07:00)"
+            assert info["gate_open_time"] >= "07:00"
+
+            # an invalid edit keeps the previous rules
+            settings.write_text('[schedule]\nopen = "sunrise +"\n')
+            os.utime(settings, (2, 2))
+            schedule.get_gate_cmd(now + 60)
+            assert schedule.get_schedule_info()["open_rule"] == "max(sunrise, 07:00)"
+        finally:
+            schedule.shutdown()
@@ -0,0 +1,266 @@
+"""
+Tests for the asyncio gate runtime.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.gate.gate import Gate
+from chicken_gate.gate.gate_cmd import Cmd
+from chicken_gate.gate.gate_drv_mock import Gate_drv
+from chicken_gate.gate.runtime import AsyncGate, check_command, gate_state
+
+
+def make_runtime(schedule=None, **kwargs):
+    """Fast gate (20 ticks of travel) starting open, ticking every 10 ms"""
+    drv = Gate_drv(Gate(init_posn=0, open_time=2, close_time=2))
+    kwargs.setdefault("tick_interval", 0.01)
+    return AsyncGate(drv, schedule, **kwargs)
+
+
+def run(coro_fn, runtime):
+    """Run coro_fn(runtime) alongside runtime.run() and return its result"""
+
+    async def main():
+        task = asyncio.ensure_future(runtime.run())
+        try:
+            return await coro_fn(runtime)
+        finally:
+            runtime.shutdown()
+            await task
+
+    with patch("chicken_gate.gate.gate.send_email"):
+        return asyncio.run(main())
+
+
+class FakeSchedule:
+    """Fires one command at an epoch time"""
+
+    def __init__(self, at, cmd):
+        self.at = at
+        self.cmd = cmd
+        self.polls = 0
+
+    def next_deadline(self):
+        return self.at if self.cmd is not None else time.time() + 3600
+
+    def get_gate_cmd(self, now):
+        self.polls += 1
+        if self.cmd is not None and now >= self.at:
+            cmd, self.cmd = self.cmd, None
+            return cmd
+        return None
+
+
+class TestCommands:
+    """Awaitable commands"""
+
+    def test_close_and_wait(self):
+        async def scenario(gate):
+            status = await gate.close()
+            assert status["state"] == "closing"
+            status = await gate.wait_for_state("closed", timeout=5)
+            assert status["position"] == 100
+            return status
+
+        assert run(scenario, make_runtime())["state"] == "closed"
+
+    def test_stop_holds_position(self):
+        async def scenario(gate):
+            await gate.close()
+            await gate.wait_for_state(lambda s: s["position"] > 20, timeout=5)
+            status = await gate.stop()
+            await asyncio.sleep(0.1)
+            assert gate.status()["position"] == status["position"]
+            assert gate.status()["state"] == "stopped"
+
+        run(scenario, make_runtime())
+
+    def test_schedule_flag(self):
+        async def scenario(gate):
+            status = await gate.enable_schedule(False)
+            assert status["schedule_enabled"] is False
+
+        run(scenario, make_runtime())
+
+    def test_invalid_commands(self):
+        with pytest.raises(ValueError):
+            check_command("JUMP")
+        with pytest.raises(ValueError):
+            check_command("RESET:150")
+        with pytest.raises(ValueError):
+            check_command("OPEN:3")
+        assert check_command(" reset:50 ") == "RESET:50"
+
+    def test_wait_for_state_timeout(self):
+        async def scenario(gate):
+            with pytest.raises(asyncio.TimeoutError):
+                await gate.wait_for_state("closed", timeout=0.05)
+
+        run(scenario, make_runtime())
+
+    def test_unknown_state(self):
+        async def scenario(gate):
+            with pytest.raises(ValueError):
+                await gate.wait_for_state("ajar")
+
+        run(scenario, make_runtime())
+
+    def test_threadsafe_submit(self):
+        async def scenario(gate):
+            threading.Thread(target=gate.submit_threadsafe, args=("CLOSE",)).start()
+            return await gate.wait_for_state("closing", timeout=5)
+
+        assert run(scenario, make_runtime())["is_closing"]
+
+
+class TestWatch:
+    """Status change notifications"""
+
+    def test_watch_yields_changes(self):
+        async def scenario(gate):
+            seen = []
+
+            async def collect():
+                async for status in gate.watch():
+                    seen.append(status["state"])
+                    if status["state"] == "closed":
+                        return
+
+            watcher = asyncio.ensure_future(collect())
+            await asyncio.sleep(0)
+            await gate.close()
+            await asyncio.wait_for(watcher, 5)
+            return seen
+
+        seen = run(scenario, make_runtime())
+        assert seen[0] == "open"
+        assert "closing" in seen
+        assert seen[-1] == "closed"
+
+    def test_publishers_called_on_change(self):
+        published = []
+        runtime = make_runtime(publish_interval=60)
+        runtime.add_publisher(lambda status: published.append(status["state"]))
+
+        async def scenario(gate):
+            await gate.close()
+            await gate.wait_for_state("closed", timeout=5)
+            await asyncio.sleep(0.05)
+
+        run(scenario, runtime)
+        assert "closing" in published
+        assert published[-1] == "closed"
+
+
+class TestAlerts:
+    """Alert emails do not block the loop"""
+
+    def test_slow_mail_server(self):
+        sent = []
+
+        def slow_send_email(body, subject=None):
+            time.sleep(0.5)  # SMTP handshake with a slow server
+            sent.append(body)
+
+        async def heartbeat(gaps):
+            last = time.monotonic()
+            while True:
+                await asyncio.sleep(0.01)
+                now = time.monotonic()
+                gaps.append(now - last)
+                last = now
+
+        async def main(gate):
+            task = asyncio.ensure_future(gate.run())
+            gaps = []
+            beat = asyncio.ensure_future(heartbeat(gaps))
+            try:
+                # closed without the closed switch: an alert email and an error
+                gate.driver().set_switch_state(closed_pressed=False)
+                await gate.close()
+                status = await gate.wait_for_state("closed", timeout=5)
+                await asyncio.sleep(0.1)
+                return status, max(gaps)
+            finally:
+                beat.cancel()
+                gate.shutdown()
+                await task
+
+        with patch("chicken_gate.gate.gate.send_email", slow_send_email):
+            status, longest_gap = asyncio.run(main(make_runtime()))
+        assert status["errors"]
+        assert longest_gap < 0.25  # the loop kept running while the mail went out
+        assert sent == status["errors"]  # delivered before asyncio.run() returned
+
+
+class TestSleeping:
+    """The loop sleeps when nothing is pending"""
+
+    def test_idle_gate_does_not_tick(self):
+        async def scenario(gate):
+            await asyncio.sleep(0.05)
+            ticks = gate.ticks
+            await asyncio.sleep(0.3)
+            return gate.ticks - ticks
+
+        assert run(scenario, make_runtime(idle_poll=None)) == 0
+
+    def test_idle_poll(self):
+        async def scenario(gate):
+            ticks = gate.ticks
+            await asyncio.sleep(0.3)
+            return gate.ticks - ticks
+
+        assert 2 <= run(scenario, make_runtime(idle_poll=0.05)) <= 8
+
+    def test_wakes_for_schedule_deadline(self):
+        schedule = FakeSchedule(time.time() + 0.2, Cmd.CLOSE)
+
+        async def scenario(gate):
+            return await gate.wait_for_state("closing", timeout=5)
+
+        start = time.monotonic()
+        run(scenario, make_runtime(schedule, idle_poll=None))
+        assert 0.15 <= time.monotonic() - start < 1.0
+        assert schedule.polls <= 5
+
+    def test_schedule_listener(self):
+        schedule = FakeSchedule(time.time(), Cmd.CLOSE)
+        fired = []
+
+        async def scenario(gate):
+            gate.add_schedule_listener(lambda *args: fired.append(args))
+            return await gate.wait_for_state("closing", timeout=5)
+
+        run(scenario, make_runtime(schedule, gate_id="front"))
+        assert fired == [("front", "CLOSE")]
+
+    def test_disabled_schedule_is_not_polled(self):
+        schedule = FakeSchedule(time.time(), Cmd.CLOSE)
+
+        async def scenario(gate):
+            await gate.enable_schedule(False)
+            await asyncio.sleep(0.1)
+            return gate.status()
+
+        assert run(scenario, make_runtime(schedule))["state"] in ("open", "closing")
+
+
+class TestGateState:
+    def test_states(self):
+        base = {"is_opening": False, "is_closing": False, "position": 50}
+        assert gate_state(base) == "stopped"
+        assert gate_state(dict(base, position=0)) == "open"
+        assert gate_state(dict(base, position=100)) == "closed"
+        assert gate_state(dict(base, is_opening=True)) == "opening"
+        assert gate_state(dict(base, is_closing=True)) == "closing"
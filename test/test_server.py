@@ -0,0 +1,373 @@
+"""
+Tests for the production WSGI server.
+"""
+
+import contextlib
+import gzip
+import http.client
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.web.server import GzipMiddleware, WSGIServer, accepts_gzip
+
+
+def text_app(environ, start_response):
+    """/slow sleeps, /stream sends chunks, /boom raises; anything else echoes"""
+    path = environ["PATH_INFO"]
+    if path == "/boom":
+        raise RuntimeError("boom")
+    if path == "/slow":
+        time.sleep(float(environ["QUERY_STRING"] or 0.3))
+    if path == "/stream":
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return iter([b"one ", b"two ", b"three"])
+    body = json.dumps(
+        {
+            "method": environ["REQUEST_METHOD"],
+            "path": path,
+            "query": environ["QUERY_STRING"],
+            "body": environ["wsgi.input"].read().decode(),
+            "padding": "x" * int(environ.get("HTTP_X_PADDING", 0)),
+        }
+    ).encode()
+    start_response(
+        "200 OK",
+        [("Content-Type", "application/json"), ("Content-Length", str(len(body)))],
+    )
+    return [body]
+
+
+@contextlib.contextmanager
+def running(app=text_app, **kwargs):
+    server = WSGIServer(app, "127.0.0.1", 0, **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        thread.join(5)
+
+
+def connect(server):
+    return http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+
+
+def raw(server, data, timeout=5):
+    """Send raw bytes; everything the server answers until it closes"""
+    with socket.create_connection(("127.0.0.1", server.port), timeout) as sock:
+        sock.sendall(data)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+
+class TestRequests:
+    """HTTP/1.1 over kept-alive connections"""
+
+    def test_keep_alive(self):
+        with running() as server:
+            conn = connect(server)
+            for i in range(5):
+                conn.request("GET", f"/a/b%20c?i={i}")
+                response = conn.getresponse()
+                data = json.loads(response.read())
+                assert (data["path"], data["query"]) == ("/a/b c", f"i={i}")
+                assert response.getheader("Connection") is None
+            conn.close()
+            stats = server.stats()
+        assert (stats["connections"], stats["requests"], stats["reused"]) == (1, 5, 4)
+
+    def test_counts_from_many_workers(self):
+        """No update is lost while the workers count at once"""
+
+        def client():
+            conn = connect(server)
+            for _ in range(50):
+                conn.request("GET", "/")
+                conn.getresponse().read()
+            conn.close()
+
+        with running(threads=8) as server:
+            clients = [threading.Thread(target=client) for _ in range(8)]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join(30)
+            stats = server.stats()
+        assert stats["requests"] == 400
+        # a busy pool closes kept-alive connections: each first request is new
+        assert stats["reused"] == 400 - stats["connections"]
+
+    def test_post_and_stream(self):
+        with running() as server:
+            conn = connect(server)
+            conn.request("POST", "/cmd", body=b'{"command": "OPEN"}')
+            assert (
+                json.loads(conn.getresponse().read())["body"] == '{"command": "OPEN"}'
+            )
+            conn.request("GET", "/stream")
+            response = conn.getresponse()
+            assert response.getheader("Transfer-Encoding") == "chunked"
+            assert response.read() == b"one two three"
+            conn.request("HEAD", "/x")
+            assert conn.getresponse().read() == b""
+            conn.request("GET", "/x")
+            assert conn.getresponse().status == 200
+            conn.close()
+            assert server.stats()["connections"] == 1
+
+    def test_unread_body_is_skipped(self):
+        def ignore_body(environ, start_response):
+            start_response("204 No Content", [])
+            return []
+
+        with running(ignore_body) as server:
+            conn = connect(server)
+            for _ in range(2):
+                conn.request("POST", "/", body=b"x" * 1000)
+                response = conn.getresponse()
+                assert (response.status, response.read()) == (204, b"")
+            conn.close()
+            assert server.stats()["connections"] == 1
+
+    def test_http_10_closes(self):
+        with running() as server:
+            response = raw(server, b"GET /old HTTP/1.0\r\n\r\n")
+        assert response.startswith(b"HTTP/1.1 200 OK")
+        assert b"Connection: close" in response
+        assert response.endswith(b'"padding": ""}')
+
+    def test_max_keepalive_requests(self):
+        with running(max_keepalive_requests=3) as server:
+            conn = connect(server)
+            for _ in range(7):
+                conn.request("GET", "/")
+                conn.getresponse().read()
+            conn.close()
+            assert server.stats()["connections"] == 3
+
+    @pytest.mark.parametrize(
+        "request_bytes, status",
+        [
+            (b"NONSENSE\r\n\r\n", b"400"),
+            (b"GET / HTTP/2.0\r\n\r\n", b"505"),
+            (b"GET / HTTP/1.1\r\nBad header\r\n\r\n", b"400"),
+            (b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n", b"411"),
+            (b"GET / HTTP/1.1\r\nX: " + b"x" * 20000 + b"\r\n\r\n", b"431"),
+            (b"GET /boom HTTP/1.1\r\n\r\n", b"500"),
+        ],
+    )
+    def test_errors(self, request_bytes, status):
+        with running() as server:
+            response = raw(server, request_bytes)
+        assert response.split()[1] == status
+        assert b"Connection: close" in response
+
+
+class TestGzip:
+    """Compression of text responses"""
+
+    def test_compressed(self):
+        with running() as server:
+            conn = connect(server)
+            conn.request(
+                "GET", "/", headers={"Accept-Encoding": "gzip", "X-Padding": "4000"}
+            )
+            response = conn.getresponse()
+            body = response.read()
+            assert response.getheader("Content-Encoding") == "gzip"
+            assert response.getheader("Vary") == "Accept-Encoding"
+            assert int(response.getheader("Content-Length")) == len(body) < 1000
+            assert json.loads(gzip.decompress(body))["padding"] == "x" * 4000
+            conn.close()
+
+    @pytest.mark.parametrize(
+        "headers",
+        [
+            {"X-Padding": "4000"},  # client does not accept gzip
+            {"Accept-Encoding": "gzip;q=0", "X-Padding": "4000"},
+            {"Accept-Encoding": "gzip"},  # too small to bother
+        ],
+    )
+    def test_not_compressed(self, headers):
+        with running() as server:
+            conn = connect(server)
+            conn.request("GET", "/", headers=headers)
+            response = conn.getresponse()
+            assert response.getheader("Content-Encoding") is None
+            assert json.loads(response.read())["method"] == "GET"
+            conn.close()
+
+    def test_streams_and_etags(self):
+        def app(environ, start_response):
+            if environ["PATH_INFO"] == "/stream":
+                return text_app(environ, start_response)
+            start_response(
+                "200 OK",
+                [
+                    ("Content-Type", "text/html"),
+                    ("Content-Length", "600"),
+                    ("ETag", '"abc"'),
+                ],
+            )
+            return [b"<" * 600]
+
+        environ = {"REQUEST_METHOD": "GET", "HTTP_ACCEPT_ENCODING": "gzip, br"}
+        started = []
+        middleware = GzipMiddleware(app)
+        body = b"".join(
+            middleware(dict(environ, PATH_INFO="/"), lambda *a: started.append(a))
+        )
+        assert gzip.decompress(body) == b"<" * 600
+        assert dict(started[0][1])["ETag"] == 'W/"abc"'
+        stream = middleware(dict(environ, PATH_INFO="/stream"), lambda *a: None)
+        assert b"".join(stream) == b"one two three"
+
+    def test_large_bodies_are_compressed_once(self):
+        middleware = GzipMiddleware(text_app)
+        page = b"<p>dashboard</p>" * 1000
+        first = middleware.compress(page)
+        assert middleware.compress(bytes(page)) is first
+        assert gzip.decompress(first) == page
+
+    def test_accepts_gzip(self):
+        assert accepts_gzip("gzip, deflate, br")
+        assert accepts_gzip("br;q=1.0, gzip;q=0.8")
+        assert accepts_gzip("*")
+        assert not accepts_gzip("gzip;q=0, identity")
+        assert not accepts_gzip("deflate")
+
+
+class TestLimits:
+    """Timeouts, the bounded pool and the graceful stop"""
+
+    def test_header_timeout(self):
+        with running(header_timeout=0.3) as server:
+            start = time.monotonic()
+            response = raw(server, b"GET / HTTP/1.1\r\nHost: slow")
+            elapsed = time.monotonic() - start
+            assert server.stats()["timeouts"] == 1
+        assert response.startswith(b"HTTP/1.1 408")
+        assert elapsed < 2
+
+    def test_idle_keep_alive_is_closed(self):
+        with running(keepalive_timeout=0.2) as server:
+            sock = socket.create_connection(("127.0.0.1", server.port), 5)
+            sock.sendall(b"GET / HTTP/1.1\r\n\r\n")
+            time.sleep(0.5)
+            data = sock.recv(65536)
+            assert data.startswith(b"HTTP/1.1 200")
+            assert sock.recv(65536) == b""  # closed after the idle timeout
+            sock.close()
+
+    def test_full_pool_rejects(self):
+        with running(threads=1, backlog=1) as server:
+            threads = []
+            statuses = []
+
+            def get():
+                conn = connect(server)
+                conn.request("GET", "/slow?0.5")
+                statuses.append(conn.getresponse().status)
+                conn.close()
+
+            for _ in range(4):
+                threads.append(threading.Thread(target=get))
+                threads[-1].start()
+                time.sleep(0.05)
+            for thread in threads:
+                thread.join()
+            assert server.stats()["rejected"] >= 1
+        assert sorted(statuses)[:2] == [200, 200]
+        assert 503 in statuses
+
+    def test_busy_pool_closes_keep_alive(self):
+        with running(threads=1) as server:
+            first = connect(server)
+            first.request("GET", "/slow?0.3")
+            time.sleep(0.1)
+            second = connect(server)  # waits for the only worker
+            second.request("GET", "/")
+            response = first.getresponse()
+            assert response.getheader("Connection") == "close"
+            response.read()
+            assert second.getresponse().status == 200
+            first.close()
+            second.close()
+
+    def test_graceful_stop(self):
+        server = WSGIServer(text_app, "127.0.0.1", 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        idle = connect(server)
+        idle.request("GET", "/")
+        idle.getresponse().read()
+        busy = connect(server)
+        busy.request("GET", "/slow?0.5")
+        time.sleep(0.1)
+
+        start = time.monotonic()
+        server.shutdown()
+        response = busy.getresponse()
+        assert (response.status, response.getheader("Connection")) == (200, "close")
+        assert 0.2 < time.monotonic() - start < 3
+        thread.join(1)
+        assert not thread.is_alive()
+        with pytest.raises(OSError):
+            connect(server).request("GET", "/")
+        with pytest.raises((http.client.HTTPException, OSError)):
+            idle.request("GET", "/")
+            idle.getresponse()
+
+    def test_settings(self):
+        server = WSGIServer.from_settings(text_app, {"threads": 2}, "127.0.0.1", 0)
+        assert server.threads == 2
+        server.shutdown()
+        with pytest.raises(ValueError):
+            WSGIServer.from_settings(text_app, {"workers": 2}, "127.0.0.1", 0)
+
+
+class TestWebApp:
+    """The Flask app behind the production server"""
+
+    def test_status_and_command(self):
+        from chicken_gate.gate.embedded import EmbeddedBackend
+        from chicken_gate.web.app import app
+
+        backend = EmbeddedBackend()
+        backend.snapshot.publish({"gate_id": "gate", "position": 100})
+        app.config["GATE_BACKEND"] = backend
+        try:
+            with running(app) as server:
+                conn = connect(server)
+                conn.request("GET", "/", headers={"Accept-Encoding": "gzip"})
+                response = conn.getresponse()
+                assert response.getheader("Content-Encoding") == "gzip"
+                assert b"<html" in gzip.decompress(response.read()).lower()
+                conn.request("GET", "/api/status")
+                assert json.loads(conn.getresponse().read())["position"] == 100
+                conn.request(
+                    "POST",
+                    "/api/command",
+                    body=json.dumps({"command": "close"}),
+                    headers={"Content-Type": "application/json"},
+                )
+                assert json.loads(conn.getresponse().read())["success"] is True
+                conn.close()
+                assert server.stats()["reused"] == 2
+        finally:
+            app.config.pop("GATE_BACKEND")
+        assert list(backend.pending_commands()) == ["CLOSE"]
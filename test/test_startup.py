@@ -0,0 +1,66 @@
+"""
+Tests that heavy dependencies stay out of the entry points' import path.
+"""
+
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.gate import gate as gate_module
+from chicken_gate.gate.main import load_driver
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+
+
+def modules_loaded_by(module, candidates):
+    """Import `module` in a fresh interpreter; return which candidates it loaded"""
+    code = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {candidates!r} if m in sys.modules))"
+    )
+    env = dict(os.environ, PYTHONPATH=SRC)
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    return [m for m in result.stdout.strip().split(",") if m]
+
+
+class TestLazyImports:
+    """Entry points import quickly"""
+
+    @pytest.mark.parametrize(
+        "module",
+        ["chicken_gate.gate", "chicken_gate.gate.main", "chicken_gate.gate.schedule"],
+    )
+    def test_gate_modules(self, module):
+        heavy = ["apscheduler", "astral", "smtplib", "ssl", "toml", "RPi"]
+        assert modules_loaded_by(module, heavy) == []
+
+    def test_web_app(self):
+        assert modules_loaded_by("chicken_gate.web.app", ["requests", "PIL"]) == []
+
+    def test_email_loaded_on_first_alert(self):
+        """Gate alerts still reach email_me.send_email"""
+        with patch(
+            "chicken_gate.gate.email_me.send_email", return_value=True
+        ) as mock_send:
+            assert gate_module.send_email("body", "subject") is True
+        mock_send.assert_called_once_with("body", "subject")
+
+
+class TestDriverSelection:
+    def test_mock_driver(self):
+        """--mock selects the simulated driver"""
+        from chicken_gate.gate.gate_drv_mock import Gate_drv
+
+        assert load_driver(mock=True) is Gate_drv
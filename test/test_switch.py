@@ -0,0 +1,177 @@
+"""
+Tests for the closed switch debounce filter and edge-driven drivers.
+"""
+
+import asyncio
+import importlib
+import os
+import sys
+import threading
+from unittest.mock import MagicMock, patch
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from chicken_gate.gate.gate import Gate
+from chicken_gate.gate.gate_drv_mock import Gate_drv
+from chicken_gate.gate.runtime import AsyncGate
+from chicken_gate.gate.switch import SwitchDebouncer
+
+
+class TestSwitchDebouncer:
+    """Stable-time debounce"""
+
+    def test_bounce_settles_after_stable_time(self):
+        switch = SwitchDebouncer(0.05)
+        for i, level in enumerate([True, False, True, False, True]):
+            switch.edge(level, 1.0 + i * 0.001)
+        assert switch.level is False
+        assert switch.deadline() == 1.004 + 0.05
+        assert not switch.update(1.03)
+        assert switch.update(1.06)
+        assert switch.level is True
+        assert switch.last_change == 1.06
+        assert switch.edges == 5
+        assert switch.deadline() is None
+
+    def test_glitch_is_filtered(self):
+        switch = SwitchDebouncer(0.05)
+        switch.edge(True, 1.0)
+        switch.edge(False, 1.01)
+        assert switch.deadline() is None
+        assert not switch.update(2.0)
+        assert switch.level is False
+        assert switch.filtered == 1
+
+    def test_repeated_level_is_not_an_edge(self):
+        switch = SwitchDebouncer(0.05, level=True)
+        assert not switch.edge(True, 1.0)
+        assert switch.edges == 0
+
+    def test_zero_debounce(self):
+        switch = SwitchDebouncer(0.0)
+        switch.edge(True, 1.0)
+        assert switch.update(1.0)
+        assert switch.level is True
+
+
+class TestMockEdges:
+    """The mock driver emulates the GPIO edge callbacks"""
+
+    def make_driver(self, debounce):
+        now = [100.0]
+        drv = Gate_drv(
+            Gate(init_posn=0, open_time=2, close_time=2),
+            debounce=debounce,
+            clock=lambda: now[0],
+        )
+        return drv, now
+
+    def test_listener_called_per_edge(self):
+        drv, now = self.make_driver(0.05)
+        calls = []
+        drv.on_switch_event(lambda: calls.append(now[0]))
+        drv.bounce([True, False, True], start=now[0])
+        assert len(calls) == 3
+        assert drv.switch_stats == {"edges": 3, "filtered": 1}
+
+    def test_bounce_reaches_gate_once_settled(self):
+        drv, now = self.make_driver(0.05)
+        drv.set_switch_state(closed_pressed=True)
+        drv.bounce([False, True], start=now[0])
+        now[0] += 0.02
+        drv.tick()
+        assert not drv.gate.get_status()["closed_switch_pressed"]
+        assert drv.switch_deadline() == 100.051
+        now[0] += 0.04
+        drv.tick()
+        assert drv.gate.get_status()["closed_switch_pressed"]
+
+    def test_set_switch_state_without_debounce_is_immediate(self):
+        drv, _ = self.make_driver(0.0)
+        drv.set_switch_state(closed_pressed=True)
+        assert drv.is_switch_pressed()
+        assert drv.switch_deadline() is None
+
+
+class TestRuntimeEdges:
+    """The runtime sleeps while idle and wakes on switch edges"""
+
+    def test_idle_gate_does_not_tick(self):
+        drv = Gate_drv(Gate(init_posn=0, open_time=2, close_time=2))
+        runtime = AsyncGate(drv, tick_interval=0.01)
+
+        async def main():
+            task = asyncio.ensure_future(runtime.run())
+            await asyncio.sleep(0.05)
+            ticks = runtime.ticks
+            await asyncio.sleep(0.3)
+            runtime.shutdown()
+            await task
+            return ticks, runtime.ticks
+
+        first, last = asyncio.run(main())
+        assert first == last == 1
+
+    def test_edge_from_gpio_thread_wakes_runtime(self):
+        gate = Gate(init_posn=100, open_time=2, close_time=2)
+        drv = Gate_drv(gate, initial_closed_switch=True, debounce=0.05)
+        drv.set_switch_state(closed_pressed=True)  # no auto-simulated switch
+        runtime = AsyncGate(drv, tick_interval=0.01)
+
+        async def main():
+            task = asyncio.ensure_future(runtime.run())
+            await asyncio.sleep(0.05)
+            ticks = runtime.ticks
+
+            # the switch is released with contact bounce
+            bounce = threading.Thread(target=drv.bounce, args=([False, True, False],))
+            bounce.start()
+            status = await runtime.wait_for_state(
+                lambda s: not s["closed_switch_pressed"], timeout=2
+            )
+            await asyncio.sleep(0.1)
+            runtime.shutdown()
+            await task
+            return status, runtime.ticks - ticks
+
+        with patch("chicken_gate.gate.gate.send_email"):
+            status, ticks = asyncio.run(main())
+        assert not status["closed_switch_pressed"]
+        assert ticks == 1  # one tick when the bounce settled, none polling
+
+
+class TestRealDriverEdges:
+    """The hardware driver registers a GPIO edge callback"""
+
+    def make_driver(self, pin_level):
+        gpio = MagicMock()
+        gpio.HIGH, gpio.LOW = 1, 0
+        gpio.input.side_effect = lambda pin: pin_level[0]
+        rpi = MagicMock(GPIO=gpio)
+        with patch.dict(sys.modules, {"RPi": rpi, "RPi.GPIO": gpio}):
+            sys.modules.pop("chicken_gate.gate.gate_drv", None)
+            module = importlib.import_module("chicken_gate.gate.gate_drv")
+            sys.modules.pop("chicken_gate.gate.gate_drv", None)
+        drv = module.Gate_drv(Gate(), debounce=0.05)
+        args, kwargs = gpio.add_event_detect.call_args
+        assert args == (drv.CLOSED_SWITCH_PIN, gpio.BOTH)
+        return drv, gpio, kwargs["callback"]
+
+    def test_edge_callback_is_debounced(self):
+        pin_level = [0]  # switch not pressed
+        drv, gpio, callback = self.make_driver(pin_level)
+        woken = []
+        drv.on_switch_event(lambda: woken.append(True))
+
+        pin_level[0] = 1
+        callback(drv.CLOSED_SWITCH_PIN)
+        assert woken == [True]
+        assert not drv.is_switch_pressed()
+        settle = drv.switch_deadline()
+        assert not drv.update_switch(settle - 0.01)
+        assert drv.update_switch(settle)
+        assert drv.is_switch_pressed()
+
+        drv.cleanup()
+        gpio.remove_event_detect.assert_called_once_with(drv.CLOSED_SWITCH_PIN)
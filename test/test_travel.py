@@ -0,0 +1,313 @@
+"""
+Tests for motor travel-time statistics and calibration.
+"""
+
+import os
+import random
+import statistics
+import sys
+from unittest.mock import patch
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+import pytest
+
+from chicken_gate.gate.checkpoint import decode_record, encode_record
+from chicken_gate.gate.gate import Gate
+from chicken_gate.gate.gate_drv_mock import Gate_drv
+from chicken_gate.gate.main import build_gate_status
+from chicken_gate.gate.travel import (
+    P2Quantile,
+    TravelMonitor,
+    TravelStats,
+    bucket_of,
+    read_temperature,
+)
+
+
+class TestStatistics:
+    """Streaming statistics against the exact ones"""
+
+    @pytest.mark.parametrize("p", [0.5, 0.9, 0.95])
+    def test_p2_quantile(self, p):
+        rng = random.Random(1)
+        samples = [rng.gauss(420, 20) for _ in range(5000)]
+        quantile = P2Quantile(p)
+        for x in samples:
+            quantile.add(x)
+        assert quantile.value() == pytest.approx(np.percentile(samples, p * 100), abs=2)
+
+    def test_few_samples(self):
+        quantile = P2Quantile(0.5)
+        assert quantile.value() is None
+        for x in (30, 10, 20):
+            quantile.add(x)
+        assert quantile.value() == 20
+
+    def test_welford_and_ewma(self):
+        samples = [400, 410, 430, 420, 415, 470]
+        stats = TravelStats(alpha=0.5)
+        for x in samples:
+            stats.add(x)
+        assert stats.count == 6
+        assert stats.mean == pytest.approx(statistics.mean(samples))
+        assert stats.variance == pytest.approx(statistics.variance(samples))
+        ewma = samples[0]
+        for x in samples[1:]:
+            ewma += 0.5 * (x - ewma)
+        assert stats.ewma == pytest.approx(ewma)
+        assert (stats.min, stats.max) == (400, 470)
+
+    def test_state_round_trip(self):
+        stats = TravelStats()
+        for x in range(100):
+            stats.add(float(x))
+        copy = TravelStats()
+        copy.restore_state(decode_record(encode_record(stats.get_state())[:-1]))
+        copy.add(50.0)
+        stats.add(50.0)
+        assert copy.to_dict() == stats.to_dict()
+
+    def test_buckets_and_temperature_files(self, tmp_path):
+        assert bucket_of(None, 10) is None
+        assert (bucket_of(-3.5, 10), bucket_of(9.9, 10), bucket_of(10, 10)) == (
+            -10,
+            0,
+            10,
+        )
+        w1 = tmp_path / "w1_slave"
+        w1.write_text("72 01 4b 46 7f ff 0e 10 57 : crc=57 YES\n72 01 t=23125\n")
+        assert read_temperature(str(w1)) == 23.125
+        w1.write_text("72 01 4b 46 7f ff 0e 10 57 : crc=00 NO\n72 01 t=23125\n")
+        with pytest.raises(ValueError):
+            read_temperature(str(w1))
+        sysfs = tmp_path / "temp"
+        sysfs.write_text("-4500\n")
+        assert read_temperature(str(sysfs)) == -4.5
+
+
+def run_travel(driver, command, ticks=10000):
+    """Command the gate and tick the mock driver until it stops"""
+    command()
+    for _ in range(ticks):
+        driver.tick()
+        if not driver.gate.is_moving():
+            return
+    raise AssertionError("gate still moving")
+
+
+class Motor:
+    """The real gate: moves at its own rates and presses the closed switch"""
+
+    def __init__(self, gate, open_time=100, close_time=100, switch_at=95):
+        self.gate = gate
+        self.posn = gate.get_posn()
+        self.open_rate = 100 / open_time
+        self.close_rate = 100 / close_time
+        self.switch_at = switch_at
+
+    def run(self, command, elapsed=0.1):
+        command()
+        for _ in range(100000):
+            self.gate.set_closed_switch(self.posn >= self.switch_at)
+            self.gate.tick(elapsed)
+            if self.gate.is_closing():
+                self.posn = min(100, self.posn + elapsed * self.close_rate)
+            elif self.gate.is_opening():
+                self.posn = max(0, self.posn - elapsed * self.open_rate)
+            else:
+                return
+        raise AssertionError("gate still moving")
+
+
+class TestGateTravel:
+    """Travels timed against the closed switch of the mock driver"""
+
+    def make(self, close_time=100, **settings):
+        travel = TravelMonitor(**settings)
+        gate = Gate(open_time=100, close_time=close_time, travel=travel)
+        return Gate_drv(gate, True), travel
+
+    def test_full_close_is_timed(self):
+        driver, travel = self.make()
+        run_travel(driver, driver.open)
+        run_travel(driver, driver.close)
+        stats = travel.stats("close")
+        # the mock presses the switch at 95%: 95 s of travel at 1%/s
+        assert stats.count == 1
+        assert stats.mean == pytest.approx(100, abs=0.2)
+        assert travel.stats("open") is None  # no open switch fitted
+
+    def test_partial_and_interrupted_travels(self):
+        driver, travel = self.make()
+        run_travel(driver, driver.open)
+        driver.reset_posn_to(40)
+        run_travel(driver, driver.close)  # 40 -> 95: counted
+        assert travel.stats("close").count == 1
+        run_travel(driver, driver.open)
+        driver.reset_posn_to(80)
+        run_travel(driver, driver.close)  # 80 -> 95: too short
+        driver.reset_posn_to(0)
+        driver.close()
+        for _ in range(300):
+            driver.tick()
+        driver.stop()  # stopped short of the switch
+        for _ in range(10):
+            driver.tick()
+        assert travel.stats("close").count == 1
+
+    def test_temperature_buckets(self):
+        driver, travel = self.make(bucket_width=10)
+        for celsius in (-5, 3, 25):
+            travel.set_temperature(celsius)
+            run_travel(driver, driver.open)
+            run_travel(driver, driver.close)
+        assert travel.stats("close").count == 3
+        assert travel.stats("close", -10).count == 1
+        assert travel.stats("close", 0).count == 1
+        assert set(travel.to_dict()["close"]) == {"all", "-10", "0", "20"}
+
+    def test_calibration(self):
+        # the motor takes 150 s to close; the gate was told 100 s
+        travel = TravelMonitor(calibrate=True, min_samples=1, ewma_alpha=0.5)
+        gate = Gate(init_posn=0, open_time=100, close_time=100, travel=travel)
+        motor = Motor(gate, close_time=150)
+        motor.run(gate.close)
+        # ran out before the switch: counted as an overrun, at least 105 s
+        assert gate.get_errors()
+        assert travel.stats("close").overruns == 1
+        assert gate.get_travel_times()[1] == pytest.approx(100 / 0.95, abs=0.2)
+        for _ in range(20):
+            motor.run(gate.open)
+            motor.run(gate.close)
+        assert gate.get_travel_times()[1] == pytest.approx(150, abs=1)
+        assert gate.get_travel_times()[0] == 100  # nothing measured
+
+    def test_calibration_is_bounded(self):
+        travel = TravelMonitor(calibrate=True, min_samples=1, max_adjust_percent=20)
+        gate = Gate(close_time=100, travel=travel)
+        travel.start("close", 0.0, 0.0)
+        # 950 s to the switch at 95%: far beyond 120% of nominal
+        assert travel.finish("close", 950.0).seconds == pytest.approx(1000)
+        assert travel.calibrated_time("close") == pytest.approx(120)
+        assert gate.get_travel_times()[1] == 100  # calibrated when the gate sees it
+
+    def test_trend_alert(self):
+        travel = TravelMonitor(min_samples=5, trend_percent=10, ewma_alpha=0.5)
+        gate = Gate(travel=travel)
+        now = 0.0
+        alerts = []
+
+        def travel_of(seconds):
+            nonlocal now
+            travel.start("close", now, 0.0)
+            now += seconds * 0.95
+            return travel.finish("close", now)
+
+        for _ in range(20):
+            assert travel_of(400).trend is None
+        for _ in range(5):
+            alerts.append(travel_of(520).trend)
+        raised = [a for a in alerts if a is not None]
+        assert len(raised) == 1  # once, not on every travel
+        direction, percent, ewma, mean = raised[0]
+        assert direction == "close" and percent > 10 and ewma > mean
+        assert travel.to_dict()["trending"] == ["close"]
+        # cleared once the long-run mean catches up
+        for _ in range(100):
+            assert travel_of(520).trend is None
+        assert travel.to_dict()["trending"] == []
+        assert gate.travel is travel
+
+    def test_trend_raises_a_diagnostic(self):
+        driver, travel = self.make(min_samples=2, trend_percent=5, ewma_alpha=1)
+        with patch("chicken_gate.gate.gate.send_email") as send_email:
+            run_travel(driver, driver.open)
+            run_travel(driver, driver.close)
+            run_travel(driver, driver.open)
+            driver.gate.set_travel_times(close_time=70)  # the motor speeds up
+            run_travel(driver, driver.close)
+        assert send_email.call_count == 1
+        assert "close travel time trending -" in send_email.call_args[0][0]
+        assert any(
+            "trending" in message for message in driver.gate.get_diagnostic_messages()
+        )
+
+    def test_trend_goes_to_the_alert_sink(self):
+        driver, travel = self.make(min_samples=2, trend_percent=5, ewma_alpha=1)
+        alerts = []
+        driver.gate.set_alert_sink(alerts.append)
+        with patch("chicken_gate.gate.gate.send_email") as send_email:
+            run_travel(driver, driver.open)
+            run_travel(driver, driver.close)
+            run_travel(driver, driver.open)
+            driver.gate.set_travel_times(close_time=70)
+            run_travel(driver, driver.close)
+        assert not send_email.called
+        assert len(alerts) == 1 and "close travel time trending -" in alerts[0]
+
+    def test_state_survives_a_restart(self):
+        driver, travel = self.make(calibrate=True, min_samples=1)
+        run_travel(driver, driver.open)
+        run_travel(driver, driver.close)
+        state = decode_record(encode_record(driver.gate.get_state())[:-1])
+
+        restored = Gate(
+            open_time=100,
+            close_time=300,
+            travel=TravelMonitor(calibrate=True, min_samples=1),
+        )
+        restored.restore_state(state)
+        assert restored.travel.stats("close").count == 1
+        # calibrated from the restored statistics
+        assert restored.get_travel_times()[1] == pytest.approx(150)
+
+    def test_gate_without_monitor(self):
+        gate = Gate()
+        assert gate.travel is None
+        assert "travel" not in gate.get_state()
+
+
+class TestSettings:
+    """The [travel] settings table and the status"""
+
+    def test_from_settings(self):
+        travel = TravelMonitor.from_settings(
+            {"calibrate": True, "trend_percent": 15, "temperature_file": "/x"}
+        )
+        assert travel.calibrate and travel.trend_percent == 15
+        with pytest.raises(ValueError, match="unknown"):
+            TravelMonitor.from_settings({"calibrated": True})
+        with pytest.raises(ValueError):
+            TravelMonitor.from_settings({"ewma_alpha": 0})
+
+    def test_status(self):
+        class Schedule:
+            def get_schedule_info(self):
+                return {}
+
+        gate = Gate(open_time=200, travel=TravelMonitor())
+        status = build_gate_status(gate, Schedule(), True)
+        assert status["travel"]["open_time"] == 200
+        assert status["travel"]["trending"] == []
+        assert "travel" not in build_gate_status(Gate(), Schedule(), True)
+
+    def test_api_status(self):
+        from chicken_gate.gate.embedded import EmbeddedBackend
+        from chicken_gate.web.app import app
+
+        class Schedule:
+            def get_schedule_info(self):
+                return {}
+
+        backend = EmbeddedBackend()
+        status = build_gate_status(Gate(travel=TravelMonitor()), Schedule(), True)
+        backend.snapshot.publish(dict(status, gate_id="gate"))
+        app.config["GATE_BACKEND"] = backend
+        try:
+            response = app.test_client().get("/api/status")
+        finally:
+            app.config.pop("GATE_BACKEND")
+        assert response.get_json()["travel"]["close_time"] == 420
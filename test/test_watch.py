@@ -0,0 +1,76 @@
+"""
+Tests for file change notification.
+"""
+
+import os
+import sys
+import threading
+import time
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from chicken_gate.shared import watch
+from chicken_gate.shared.watch import FileWatcher
+
+
+@pytest.fixture(params=["notified", "polled"])
+def make_watcher(request, monkeypatch):
+    if request.param == "polled":
+        monkeypatch.setattr(watch, "_inotify", lambda directories: None)
+
+    watchers = []
+
+    def make(paths):
+        watchers.append(FileWatcher([str(p) for p in paths], poll_interval=0.02))
+        return watchers[-1]
+
+    yield make
+    for watcher in watchers:
+        watcher.close()
+
+
+def later(delay, action):
+    timer = threading.Timer(delay, action)
+    timer.start()
+    return timer
+
+
+class TestFileWatcher:
+    """Created, replaced and deleted files wake the watcher"""
+
+    def test_replace_by_rename(self, tmp_path, make_watcher):
+        status = tmp_path / "status.json"
+        status.write_text("{}")
+        watcher = make_watcher([status])
+
+        def replace():
+            (tmp_path / "status.tmp").write_text('{"position": 5}')
+            os.replace(tmp_path / "status.tmp", status)
+
+        later(0.05, replace)
+        start = time.monotonic()
+        assert watcher.wait(5) == [str(status)]
+        assert time.monotonic() - start < 1
+        assert watcher.changed() == []
+
+    def test_created_and_deleted(self, tmp_path, make_watcher):
+        command = tmp_path / "cmd.txt"
+        watcher = make_watcher([command, tmp_path / "other.json"])
+        later(0.05, lambda: command.write_text("OPEN"))
+        assert watcher.wait(5) == [str(command)]
+        later(0.05, command.unlink)
+        assert watcher.wait(5) == [str(command)]
+
+    def test_timeout_and_unwatched_files(self, tmp_path, make_watcher):
+        watcher = make_watcher([tmp_path / "status.json"])
+        later(0.02, lambda: (tmp_path / "unrelated").write_text("x"))
+        start = time.monotonic()
+        assert watcher.wait(0.2) == []
+        assert 0.15 < time.monotonic() - start < 2
+
+    def test_notified_on_linux(self, tmp_path):
+        with FileWatcher([str(tmp_path / "a")]) as watcher:
+            assert watcher.notified == sys.platform.startswith("linux")
@@ -0,0 +1,54 @@
+"""
+Tests for the background writer thread.
+"""
+
+import os
+import sys
+import threading
+
+# Add src to Python path for testing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from chicken_gate.shared.writer import BackgroundWriter
+
+
+class TestWriter:
+    """Queued operations run in order on one thread"""
+
+    def test_in_order_on_the_thread(self):
+        writer = BackgroundWriter()
+        done = []
+        for i in range(100):
+            writer.submit(lambda i: done.append((i, threading.current_thread())), i)
+        writer.flush()
+        assert [i for i, _ in done] == list(range(100))
+        assert {thread.name for _, thread in done} == {"writer"}
+        writer.stop()
+
+    def test_stop_runs_what_is_queued(self):
+        writer = BackgroundWriter()
+        gate = threading.Event()
+        done = []
+        writer.submit(gate.wait, 5)
+        writer.submit(done.append, 1)
+        gate.set()
+        writer.stop()
+        assert done == [1]
+        writer.submit(done.append, 2)  # after stop: inline
+        assert done == [1, 2]
+
+    def test_failures_and_a_full_queue(self):
+        writer = BackgroundWriter(queue_size=2)
+        gate = threading.Event()
+        writer.submit(gate.wait, 5)
+
+        def broken():
+            raise OSError("disk full")
+
+        for _ in range(5):
+            writer.submit(broken)
+        gate.set()
+        writer.stop()
+        stats = writer.stats()
+        assert stats["failures"] + stats["dropped"] == 5
+        assert stats["dropped"] >= 3